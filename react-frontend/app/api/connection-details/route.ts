@@ -1,4 +1,4 @@
-import { NextResponse } from 'next/server';
+import { type NextRequest, NextResponse } from 'next/server';
 import { AccessToken, type AccessTokenOptions, type VideoGrant } from 'livekit-server-sdk';
 import { RoomConfiguration } from '@livekit/protocol';
 
@@ -10,6 +10,12 @@ const LIVEKIT_URL = process.env.LIVEKIT_URL;
 // don't cache the results
 export const revalidate = 0;
 
+// Stable per-device patient id, issued as the participant identity the agent keys its
+// persisted records by (see src/store.py). HttpOnly, so only this route can set it.
+const PATIENT_COOKIE = 'tracking_patient';
+const PATIENT_COOKIE_MAX_AGE = 60 * 60 * 24 * 365 * 2;
+const UUID_PATTERN = /^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$/;
+
 export type ConnectionDetails = {
   serverUrl: string;
   roomName: string;
@@ -17,7 +23,7 @@ export type ConnectionDetails = {
   participantToken: string;
 };
 
-export async function POST(req: Request) {
+export async function POST(req: NextRequest) {
   try {
     if (LIVEKIT_URL === undefined) {
       throw new Error('LIVEKIT_URL is not defined');
@@ -35,7 +41,9 @@ export async function POST(req: Request) {
 
     // Generate participant token
     const participantName = 'user';
-    const participantIdentity = `voice_assistant_user_${Math.floor(Math.random() * 10_000)}`;
+    const cookie = req.cookies.get(PATIENT_COOKIE)?.value;
+    const patientId = cookie && UUID_PATTERN.test(cookie) ? cookie : crypto.randomUUID();
+    const participantIdentity = `patient-${patientId}`;
     const roomName = `voice_assistant_room_${Math.floor(Math.random() * 10_000)}`;
 
     const participantToken = await createParticipantToken(
@@ -54,7 +62,15 @@ export async function POST(req: Request) {
     const headers = new Headers({
       'Cache-Control': 'no-store',
     });
-    return NextResponse.json(data, { headers });
+    const response = NextResponse.json(data, { headers });
+    response.cookies.set(PATIENT_COOKIE, patientId, {
+      httpOnly: true,
+      secure: process.env.NODE_ENV === 'production',
+      sameSite: 'strict',
+      maxAge: PATIENT_COOKIE_MAX_AGE,
+      path: '/',
+    });
+    return response;
   } catch (error) {
     if (error instanceof Error) {
       console.error(error);
@@ -78,6 +94,9 @@ function createParticipantToken(
     canPublish: true,
     canPublishData: true,
     canSubscribe: true,
+    // lets the client advertise its tracking codecs and timezone through participant
+    // attributes, the agent doesn't trust them for who the patient is
+    canUpdateOwnMetadata: true,
   };
   at.addGrant(grant);
 
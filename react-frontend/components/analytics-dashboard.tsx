@@ -1,18 +1,25 @@
 'use client';
 
 import { useState, useEffect } from 'react';
-import { Room } from 'livekit-client';
+import { type RemoteParticipant, Room, RoomEvent } from 'livekit-client';
 import { Calendar, Download, Settings } from 'lucide-react';
 import { MetricCards } from './metric-cards';
 import { TrendCharts } from './trend-charts';
 import { LiveUpdatesFeed } from './live-updates-feed';
-import type { 
-  TrackingData, 
-  AgentTrackingMessage, 
-  PainAssessment, 
-  SleepQuality, 
-  MoodAssessment 
+import type {
+  TrackingData,
+  AgentTrackingMessage,
+  TrendPeriod,
+  TrendSeries,
 } from '@/lib/tracking-types';
+import {
+  TRACKING_CODEC_ATTRIBUTE,
+  TRACKING_CODECS,
+  TRACKING_TIMEZONE_ATTRIBUTE,
+  TRACKING_TRENDS_RPC,
+} from '@/lib/tracking-types';
+import { syncTrackingHistory, upsertTrackingRecord } from '@/lib/tracking-sync';
+import { decodeTrackingPacket } from '@/lib/tracking-wire';
 
 interface AnalyticsDashboardProps {
   room: Room | null;
@@ -26,7 +33,8 @@ export function AnalyticsDashboard({ room, sessionStarted }: AnalyticsDashboardP
     moodAssessments: [],
   });
 
-  const [selectedPeriod, setSelectedPeriod] = useState<'7d' | '30d' | '90d'>('7d');
+  const [selectedPeriod, setSelectedPeriod] = useState<TrendPeriod>('7d');
+  const [trends, setTrends] = useState<TrendSeries | null>(null);
   const [latestUpdate, setLatestUpdate] = useState<string>('');
 
   // Load data from localStorage on mount
@@ -81,45 +89,29 @@ export function AnalyticsDashboard({ room, sessionStarted }: AnalyticsDashboardP
     }
     
     function setupDataListeners() {
-      const handleDataReceived = (payload: Uint8Array) => {
-        try {
-          const messageText = new TextDecoder().decode(payload);
-          const message = JSON.parse(messageText) as AgentTrackingMessage;
-          if (message.type && message.data) {
-            const newEntry = {
-              ...message.data,
-              id: `${message.type}-${Date.now()}`,
-              timestamp: new Date(),
-            };
+      const applyMessage = (message: AgentTrackingMessage) => {
+        if (!message.type || !message.data) return;
 
-            setTrackingData(prevData => {
-              switch (message.type) {
-                case 'pain_assessment':
-                  setLatestUpdate('New pain assessment recorded');
-                  return {
-                    ...prevData,
-                    painAssessments: [...prevData.painAssessments, newEntry as PainAssessment],
-                  };
-                case 'sleep_quality':
-                  setLatestUpdate('Sleep quality logged');
-                  return {
-                    ...prevData,
-                    sleepQuality: [...prevData.sleepQuality, newEntry as SleepQuality],
-                  };
-                case 'mood_assessment':
-                  setLatestUpdate('Mood assessment updated');
-                  return {
-                    ...prevData,
-                    moodAssessments: [...prevData.moodAssessments, newEntry as MoodAssessment],
-                  };
-                default:
-                  return prevData;
-              }
-            });
+        setTrackingData(prevData => upsertTrackingRecord(prevData, message, new Date()));
+        switch (message.type) {
+          case 'pain_assessment':
+            setLatestUpdate('New pain assessment recorded');
+            break;
+          case 'sleep_quality':
+            setLatestUpdate('Sleep quality logged');
+            break;
+          case 'mood_assessment':
+            setLatestUpdate('Mood assessment updated');
+            break;
+        }
+
+        // Clear the update message after 3 seconds
+        setTimeout(() => setLatestUpdate(''), 3000);
+      };
 
-            // Clear the update message after 3 seconds
-            setTimeout(() => setLatestUpdate(''), 3000);
-          }
+      const handleDataReceived = (payload: Uint8Array) => {
+        try {
+          decodeTrackingPacket(payload).forEach(applyMessage);
         } catch (error) {
           console.error('Failed to parse agent message:', error);
         }
@@ -127,6 +119,15 @@ export function AnalyticsDashboard({ room, sessionStarted }: AnalyticsDashboardP
 
       // Set up data listener for agent messages
       room.on('dataReceived', handleDataReceived);
+
+      // Tell the agent which tracking codecs we can decode and our timezone,
+      // it falls back to JSON and UTC otherwise
+      room.localParticipant
+        .setAttributes({
+          [TRACKING_CODEC_ATTRIBUTE]: TRACKING_CODECS,
+          [TRACKING_TIMEZONE_ATTRIBUTE]: Intl.DateTimeFormat().resolvedOptions().timeZone,
+        })
+        .catch((error) => console.warn('Failed to set tracking attributes:', error));
       
       // Return cleanup function
       return () => {
@@ -140,6 +141,64 @@ export function AnalyticsDashboard({ room, sessionStarted }: AnalyticsDashboardP
     }
   }, [room]);
 
+  // Catch up on records stored while this dashboard was away (other devices,
+  // earlier sessions): the agent sends only what changed since the last sync
+  useEffect(() => {
+    if (!room || !sessionStarted) return;
+
+    let synced = false;
+    const sync = (participant: RemoteParticipant) => {
+      if (synced || !participant.isAgent) return;
+      synced = true;
+      syncTrackingHistory(room, participant.identity, (records) =>
+        setTrackingData((prevData) =>
+          records.reduce(
+            (data, record) => upsertTrackingRecord(data, record, new Date(record.ts * 1000)),
+            prevData
+          )
+        )
+      ).catch((error) => {
+        synced = false;
+        console.warn('Failed to sync tracking history:', error);
+      });
+    };
+
+    room.remoteParticipants.forEach(sync);
+    room.on(RoomEvent.ParticipantConnected, sync);
+    return () => {
+      room.off(RoomEvent.ParticipantConnected, sync);
+    };
+  }, [room, sessionStarted]);
+
+  // Trend series come pre-bucketed from the agent's daily rollups, refetched
+  // when the period changes or new records arrive. The charts fall back to the
+  // local records while there is no agent to ask.
+  useEffect(() => {
+    if (!room || !sessionStarted) return;
+
+    let cancelled = false;
+    // give the agent's store a moment to commit the records that just arrived
+    const timer = setTimeout(async () => {
+      const agent = Array.from(room.remoteParticipants.values()).find((p) => p.isAgent);
+      if (!agent) return;
+      try {
+        const response = await room.localParticipant.performRpc({
+          destinationIdentity: agent.identity,
+          method: TRACKING_TRENDS_RPC,
+          payload: JSON.stringify({ period: selectedPeriod }),
+        });
+        if (!cancelled) setTrends(JSON.parse(response) as TrendSeries);
+      } catch (error) {
+        console.warn('Failed to fetch trends from the agent:', error);
+      }
+    }, 500);
+
+    return () => {
+      cancelled = true;
+      clearTimeout(timer);
+    };
+  }, [room, sessionStarted, selectedPeriod, trackingData]);
+
   // Get latest and previous values for trend comparison
   const latestPain = trackingData.painAssessments[trackingData.painAssessments.length - 1];
   const previousPain = trackingData.painAssessments[trackingData.painAssessments.length - 2];
@@ -299,6 +358,7 @@ export function AnalyticsDashboard({ room, sessionStarted }: AnalyticsDashboardP
             <TrendCharts 
               trackingData={trackingData}
               selectedPeriod={selectedPeriod}
+              trends={trends}
             />
           </div>
           
@@ -32,10 +32,14 @@ export function LiveUpdatesFeed({
   // Add new updates when data changes
   useEffect(() => {
     const newUpdates: LiveUpdate[] = [];
+    // Records the agent completed after extracting them from the transcript
+    const changed = new Map<string, LiveUpdate['data']>();
 
     if (latestPain) {
       const existingPain = updates.find(u => u.type === 'pain_assessment' && u.data.id === latestPain.id);
-      if (!existingPain) {
+      if (existingPain) {
+        if (existingPain.data !== latestPain) changed.set(existingPain.id, latestPain);
+      } else {
         newUpdates.push({
           id: `pain-${latestPain.id}`,
           type: 'pain_assessment',
@@ -48,7 +52,9 @@ export function LiveUpdatesFeed({
 
     if (latestSleep) {
       const existingSleep = updates.find(u => u.type === 'sleep_quality' && u.data.id === latestSleep.id);
-      if (!existingSleep) {
+      if (existingSleep) {
+        if (existingSleep.data !== latestSleep) changed.set(existingSleep.id, latestSleep);
+      } else {
         newUpdates.push({
           id: `sleep-${latestSleep.id}`,
           type: 'sleep_quality',
@@ -61,7 +67,9 @@ export function LiveUpdatesFeed({
 
     if (latestMood) {
       const existingMood = updates.find(u => u.type === 'mood_assessment' && u.data.id === latestMood.id);
-      if (!existingMood) {
+      if (existingMood) {
+        if (existingMood.data !== latestMood) changed.set(existingMood.id, latestMood);
+      } else {
         newUpdates.push({
           id: `mood-${latestMood.id}`,
           type: 'mood_assessment',
@@ -72,6 +80,10 @@ export function LiveUpdatesFeed({
       }
     }
 
+    if (changed.size > 0) {
+      setUpdates(prev => prev.map(u => ({ ...u, data: changed.get(u.id) ?? u.data })));
+    }
+
     if (newUpdates.length > 0) {
       setUpdates(prev => [...newUpdates, ...prev].slice(0, 10)); // Keep last 10 updates
       setShowNewUpdate(true);
@@ -144,7 +156,7 @@ export function LiveUpdatesFeed({
         return (
           <div>
             <p className="font-medium text-gray-800">
-              Quality {sleep.sleepQuality}/10 - {sleep.hoursSlept}h sleep
+              Quality {sleep.sleepQuality ?? '-'}/10 - {sleep.hoursSlept ?? '-'}h sleep
             </p>
             {sleep.wakeUps !== undefined && (
               <p className="text-sm text-gray-600">{sleep.wakeUps} wake-ups</p>
@@ -160,10 +172,10 @@ export function LiveUpdatesFeed({
         return (
           <div>
             <p className="font-medium text-gray-800">
-              Mood {mood.moodRating}/10, Energy {mood.energyLevel}/10
+              Mood {mood.moodRating ?? '-'}/10, Energy {mood.energyLevel ?? '-'}/10
             </p>
             <p className="text-sm text-gray-600">
-              Activities: {mood.dailyActivitiesCompletion}/10, Social: {mood.socialEngagement}/10
+              Activities: {mood.dailyActivitiesCompletion ?? '-'}/10, Social: {mood.socialEngagement ?? '-'}/10
             </p>
             {mood.emotionalCoping && (
               <p className="text-xs text-gray-500 mt-1">Coping: {mood.emotionalCoping}</p>
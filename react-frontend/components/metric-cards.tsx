@@ -143,7 +143,7 @@ export function MetricCards({
           {latestSleep && (
             <div className="mt-2 space-y-1">
               <p className="text-sm text-gray-600">
-                <span className="font-medium">Duration:</span> {latestSleep.hoursSlept}h
+                <span className="font-medium">Duration:</span> {latestSleep.hoursSlept ?? '-'}h
               </p>
               {latestSleep.wakeUps !== undefined && (
                 <p className="text-sm text-gray-600">
@@ -199,13 +199,13 @@ export function MetricCards({
           {latestMood && (
             <div className="mt-2 space-y-1">
               <p className="text-sm text-gray-600">
-                <span className="font-medium">Energy:</span> {latestMood.energyLevel}/10
+                <span className="font-medium">Energy:</span> {latestMood.energyLevel ?? '-'}/10
               </p>
               <p className="text-sm text-gray-600">
-                <span className="font-medium">Activities:</span> {latestMood.dailyActivitiesCompletion}/10
+                <span className="font-medium">Activities:</span> {latestMood.dailyActivitiesCompletion ?? '-'}/10
               </p>
               <p className="text-sm text-gray-600">
-                <span className="font-medium">Social:</span> {latestMood.socialEngagement}/10
+                <span className="font-medium">Social:</span> {latestMood.socialEngagement ?? '-'}/10
               </p>
               {latestMood.emotionalCoping && (
                 <p className="text-sm text-gray-500">
@@ -1,62 +1,99 @@
 'use client';
 
 import { LineChart, Line, XAxis, YAxis, CartesianGrid, Tooltip, ResponsiveContainer, AreaChart, Area } from 'recharts';
-import { format, subDays, startOfDay } from 'date-fns';
-import type { TrackingData } from '@/lib/tracking-types';
+import { addDays, differenceInCalendarDays, format, startOfDay, subDays } from 'date-fns';
+import type { TrackingData, TrendPeriod, TrendSeries } from '@/lib/tracking-types';
 
 interface TrendChartsProps {
   trackingData: TrackingData;
-  selectedPeriod: '7d' | '30d' | '90d';
+  selectedPeriod: TrendPeriod;
+  // Series bucketed by the agent, the charts fall back to local data without them
+  trends?: TrendSeries | null;
 }
 
-export function TrendCharts({ trackingData, selectedPeriod }: TrendChartsProps) {
-  
-  // Prepare chart data
-  const prepareChartData = () => {
-    const days = selectedPeriod === '7d' ? 7 : selectedPeriod === '30d' ? 30 : 90;
-    const chartData = [];
-    
-    for (let i = days - 1; i >= 0; i--) {
-      const date = startOfDay(subDays(new Date(), i));
-      const dateStr = format(date, 'MM/dd');
-      const fullDate = format(date, 'MMM dd, yyyy');
-      
-      // Find entries for this day
-      const dayPain = trackingData.painAssessments.filter(
-        p => format(new Date(p.timestamp), 'MM/dd') === dateStr
-      );
-      const daySleep = trackingData.sleepQuality.filter(
-        s => format(new Date(s.timestamp), 'MM/dd') === dateStr
-      );
-      const dayMood = trackingData.moodAssessments.filter(
-        m => format(new Date(m.timestamp), 'MM/dd') === dateStr
-      );
-      
-      // Calculate averages for the day
-      const avgPain = dayPain.length > 0 
-        ? dayPain.reduce((sum, p) => sum + p.painLevel, 0) / dayPain.length 
-        : null;
-      const avgSleep = daySleep.length > 0 
-        ? daySleep.reduce((sum, s) => sum + s.sleepQuality, 0) / daySleep.length 
-        : null;
-      const avgMood = dayMood.length > 0 
-        ? dayMood.reduce((sum, m) => sum + m.moodRating, 0) / dayMood.length 
-        : null;
-      
-      chartData.push({
-        date: dateStr,
-        fullDate,
-        pain: avgPain ? Math.round(avgPain * 10) / 10 : null,
-        sleep: avgSleep ? Math.round(avgSleep * 10) / 10 : null,
-        mood: avgMood ? Math.round(avgMood * 10) / 10 : null,
-        painCount: dayPain.length,
-        sleepCount: daySleep.length,
-        moodCount: dayMood.length,
-      });
-    }
-    
-    return chartData;
+interface ChartPoint {
+  date: string;
+  fullDate: string;
+  pain: number | null;
+  sleep: number | null;
+  mood: number | null;
+  painCount: number;
+  sleepCount: number;
+  moodCount: number;
+}
+
+const PERIOD_DAYS: Record<TrendPeriod, number> = { '7d': 7, '30d': 30, '90d': 90 };
+
+const CHART_METRICS = {
+  pain: 'pain_assessment.painLevel',
+  sleep: 'sleep_quality.sleepQuality',
+  mood: 'mood_assessment.moodRating',
+} as const;
+
+const round = (value: number | null | undefined) =>
+  value === null || value === undefined ? null : Math.round(value * 10) / 10;
+
+function chartDays(start: Date, days: number) {
+  return Array.from({ length: days }, (_, i) => {
+    const date = addDays(start, i);
+    return { date: format(date, 'MM/dd'), fullDate: format(date, 'MMM dd, yyyy') };
+  });
+}
+
+function chartDataFromTrends(trends: TrendSeries): ChartPoint[] {
+  const [year, month, day] = trends.start.split('-').map(Number);
+  const points = (key: keyof typeof CHART_METRICS) => trends.series[CHART_METRICS[key]];
+  return chartDays(new Date(year, month - 1, day), trends.days).map((labels, i) => ({
+    ...labels,
+    pain: round(points('pain')?.mean[i]),
+    sleep: round(points('sleep')?.mean[i]),
+    mood: round(points('mood')?.mean[i]),
+    painCount: points('pain')?.count[i] ?? 0,
+    sleepCount: points('sleep')?.count[i] ?? 0,
+    moodCount: points('mood')?.count[i] ?? 0,
+  }));
+}
+
+// One pass over the records into per-day buckets, for when the agent isn't there
+function chartDataFromRecords(trackingData: TrackingData, days: number): ChartPoint[] {
+  const start = startOfDay(subDays(new Date(), days - 1));
+  const buckets = Array.from({ length: days }, () => ({
+    pain: { sum: 0, count: 0 },
+    sleep: { sum: 0, count: 0 },
+    mood: { sum: 0, count: 0 },
+  }));
+  const add = (timestamp: Date, key: 'pain' | 'sleep' | 'mood', value?: number) => {
+    const i = differenceInCalendarDays(new Date(timestamp), start);
+    // Records extracted from the transcript may not have a rating yet
+    if (i < 0 || i >= days || value === undefined) return;
+    buckets[i][key].sum += value;
+    buckets[i][key].count += 1;
   };
+  trackingData.painAssessments.forEach((p) => add(p.timestamp, 'pain', p.painLevel));
+  trackingData.sleepQuality.forEach((s) => add(s.timestamp, 'sleep', s.sleepQuality));
+  trackingData.moodAssessments.forEach((m) => add(m.timestamp, 'mood', m.moodRating));
+
+  const mean = ({ sum, count }: { sum: number; count: number }) =>
+    count > 0 ? round(sum / count) : null;
+  return chartDays(start, days).map((labels, i) => ({
+    ...labels,
+    pain: mean(buckets[i].pain),
+    sleep: mean(buckets[i].sleep),
+    mood: mean(buckets[i].mood),
+    painCount: buckets[i].pain.count,
+    sleepCount: buckets[i].sleep.count,
+    moodCount: buckets[i].mood.count,
+  }));
+}
+
+export function TrendCharts({ trackingData, selectedPeriod, trends }: TrendChartsProps) {
+  const days = PERIOD_DAYS[selectedPeriod];
+
+  // Prepare chart data
+  const prepareChartData = () =>
+    trends && trends.days === days
+      ? chartDataFromTrends(trends)
+      : chartDataFromRecords(trackingData, days);
 
   const chartData = prepareChartData();
 
@@ -0,0 +1,78 @@
+import type { Room } from 'livekit-client';
+import {
+  type AgentTrackingMessage,
+  type SyncedTrackingRecord,
+  TRACKING_SYNC_RPC,
+  TRACKING_SYNC_STORAGE_KEY,
+  type TrackingData,
+  type TrackingSyncChunk,
+} from './tracking-types';
+
+const RECORD_LISTS = {
+  pain_assessment: 'painAssessments',
+  sleep_quality: 'sleepQuality',
+  mood_assessment: 'moodAssessments',
+} as const satisfies Record<AgentTrackingMessage['type'], keyof TrackingData>;
+
+// Adds a record, or updates the one with the same id (records the agent
+// completes later, or that arrive both live and through a sync)
+export function upsertTrackingRecord(
+  data: TrackingData,
+  message: AgentTrackingMessage,
+  timestamp: Date
+): TrackingData {
+  const list = RECORD_LISTS[message.type];
+  if (!list) return data;
+
+  const id =
+    message.id ?? `${message.type}-${Date.now()}-${Math.random().toString(36).slice(2, 8)}`;
+  const entries: { id: string }[] = data[list];
+  const index = entries.findIndex((entry) => entry.id === id);
+  const updated = [...entries];
+  if (index === -1) {
+    updated.push({ ...message.data, id, timestamp });
+  } else {
+    updated[index] = { ...entries[index], ...message.data };
+  }
+  return { ...data, [list]: updated };
+}
+
+interface SyncState {
+  store: string | null;
+  after: number;
+}
+
+function loadSyncState(): SyncState {
+  try {
+    const saved = JSON.parse(localStorage.getItem(TRACKING_SYNC_STORAGE_KEY) ?? 'null');
+    if (saved && typeof saved.after === 'number') return saved;
+  } catch {
+    // start over
+  }
+  return { store: null, after: 0 };
+}
+
+// Fetches the records the agent stored since the last sync, in chunks, and
+// hands each chunk to `apply` before moving the high-water mark past it
+export async function syncTrackingHistory(
+  room: Room,
+  agentIdentity: string,
+  apply: (records: SyncedTrackingRecord[]) => void
+): Promise<number> {
+  let state = loadSyncState();
+  let synced = 0;
+  for (;;) {
+    const response = await room.localParticipant.performRpc({
+      destinationIdentity: agentIdentity,
+      method: TRACKING_SYNC_RPC,
+      payload: JSON.stringify(state),
+    });
+    const chunk = JSON.parse(response) as TrackingSyncChunk;
+    if (chunk.records.length > 0) apply(chunk.records);
+    synced += chunk.records.length;
+
+    state = { store: chunk.store, after: chunk.next };
+    localStorage.setItem(TRACKING_SYNC_STORAGE_KEY, JSON.stringify(state));
+    if (!chunk.more) return synced;
+  }
+}
@@ -1,4 +1,5 @@
-// Simple tracking data types for the therapist agent
+// Simple tracking data types for the therapist agent, re-declaring the record
+// types of src/records.py: keep field names and ranges in step with it
 
 export interface PainAssessment {
   id: string;
@@ -10,11 +11,13 @@ export interface PainAssessment {
   copingStrategies?: string;
 }
 
+// Records the agent extracted from the transcript on its own may lack the values
+// the patient didn't mention, until the agent completes them (see src/extraction.py)
 export interface SleepQuality {
   id: string;
   timestamp: Date;
-  sleepQuality: number;
-  hoursSlept: number;
+  sleepQuality?: number;
+  hoursSlept?: number;
   sleepOnsetMinutes?: number;
   wakeUps?: number;
   sleepFactors?: string;
@@ -23,10 +26,10 @@ export interface SleepQuality {
 export interface MoodAssessment {
   id: string;
   timestamp: Date;
-  moodRating: number;
-  energyLevel: number;
-  dailyActivitiesCompletion: number;
-  socialEngagement: number;
+  moodRating?: number;
+  energyLevel?: number;
+  dailyActivitiesCompletion?: number;
+  socialEngagement?: number;
   emotionalCoping?: string;
 }
 
@@ -38,5 +41,107 @@ export interface TrackingData {
 
 export interface AgentTrackingMessage {
   type: 'pain_assessment' | 'sleep_quality' | 'mood_assessment';
+  // Record id, a later message with the same id updates the record
+  id?: string;
   data: any;
 }
+
+export interface AgentTrackingBatch {
+  type: 'batch';
+  messages: AgentTrackingMessage[];
+}
+
+// A single data-channel packet from the agent: one message or a batch of them
+export type AgentTrackingPacket = AgentTrackingMessage | AgentTrackingBatch;
+
+// Compact binary wire format, mirrors the schema registry in src/wire.py.
+// Field order is part of the format: changing it requires a new TRACKING_WIRE_VERSION.
+export const TRACKING_WIRE_MAGIC = 0xa7;
+export const TRACKING_WIRE_VERSION = 2;
+export const TRACKING_CODEC_ATTRIBUTE = 'tracking.codecs';
+export const TRACKING_CODECS = `bin${TRACKING_WIRE_VERSION},json`;
+
+// The patient's IANA timezone, the agent rolls records up per local day
+export const TRACKING_TIMEZONE_ATTRIBUTE = 'tracking.timezone';
+
+// Per-day trend series served by the agent from its daily rollups (see src/trends.py)
+export const TRACKING_TRENDS_RPC = 'tracking.trends';
+
+// Delta sync of the agent's tracking history (see src/sync.py). The high-water
+// mark of the last sync is kept in localStorage under TRACKING_SYNC_STORAGE_KEY.
+export const TRACKING_SYNC_RPC = 'tracking.sync';
+export const TRACKING_SYNC_STORAGE_KEY = 'therapist-tracking-sync';
+
+export interface SyncedTrackingRecord extends AgentTrackingMessage {
+  id: string;
+  seq: number;
+  // seconds since the epoch
+  ts: number;
+}
+
+export interface TrackingSyncChunk {
+  store: string;
+  records: SyncedTrackingRecord[];
+  next: number;
+  more: boolean;
+}
+
+export type TrendPeriod = '7d' | '30d' | '90d';
+
+export interface TrendPoints {
+  count: number[];
+  mean: (number | null)[];
+  min: (number | null)[];
+  max: (number | null)[];
+}
+
+export interface TrendSeries {
+  start: string;
+  days: number;
+  // keyed by `${messageType}.${field}`, e.g. 'pain_assessment.painLevel'
+  series: Record<string, TrendPoints>;
+}
+
+export type WireFieldKind = 'u8' | 'u16' | 'centi' | 'str';
+
+export interface WireMessageSchema {
+  typeId: number;
+  type: AgentTrackingMessage['type'];
+  fields: [name: string, kind: WireFieldKind][];
+}
+
+export const TRACKING_WIRE_SCHEMA: WireMessageSchema[] = [
+  {
+    typeId: 1,
+    type: 'pain_assessment',
+    fields: [
+      ['painLevel', 'u8'],
+      ['location', 'str'],
+      ['quality', 'str'],
+      ['triggers', 'str'],
+      ['copingStrategies', 'str'],
+    ],
+  },
+  {
+    typeId: 2,
+    type: 'sleep_quality',
+    fields: [
+      ['sleepQuality', 'u8'],
+      ['hoursSlept', 'centi'],
+      ['sleepOnsetMinutes', 'u16'],
+      ['wakeUps', 'u8'],
+      ['sleepFactors', 'str'],
+    ],
+  },
+  {
+    typeId: 3,
+    type: 'mood_assessment',
+    fields: [
+      ['moodRating', 'u8'],
+      ['energyLevel', 'u8'],
+      ['dailyActivitiesCompletion', 'u8'],
+      ['socialEngagement', 'u8'],
+      ['emotionalCoping', 'str'],
+    ],
+  },
+];
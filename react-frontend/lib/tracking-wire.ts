@@ -0,0 +1,78 @@
+import {
+  type AgentTrackingMessage,
+  type AgentTrackingPacket,
+  TRACKING_WIRE_MAGIC,
+  TRACKING_WIRE_SCHEMA,
+  TRACKING_WIRE_VERSION,
+  type WireMessageSchema,
+} from './tracking-types';
+
+const schemasById = new Map<number, WireMessageSchema>(
+  TRACKING_WIRE_SCHEMA.map((schema) => [schema.typeId, schema])
+);
+const textDecoder = new TextDecoder();
+
+// Values of numeric fields a record doesn't have yet
+const ABSENT = { u8: 0xff, u16: 0xffff, centi: 0xffff } as const;
+
+function decodeBinaryMessages(payload: Uint8Array): AgentTrackingMessage[] {
+  const view = new DataView(payload.buffer, payload.byteOffset, payload.byteLength);
+  let pos = 2;
+
+  const readVarint = () => {
+    let value = 0;
+    let shift = 0;
+    for (;;) {
+      if (pos >= payload.length) throw new Error('Truncated varint');
+      const byte = payload[pos++];
+      value += (byte & 0x7f) * 2 ** shift;
+      if (byte < 0x80) return value;
+      shift += 7;
+    }
+  };
+
+  const readString = () => {
+    const length = readVarint();
+    if (pos + length > payload.length) throw new Error('Truncated string');
+    const value = textDecoder.decode(payload.subarray(pos, pos + length));
+    pos += length;
+    return value;
+  };
+
+  const count = readVarint();
+  const messages: AgentTrackingMessage[] = [];
+  for (let i = 0; i < count; i++) {
+    const schema = schemasById.get(payload[pos++]);
+    if (!schema) throw new Error(`Unknown tracking message type at byte ${pos - 1}`);
+
+    const id = readString();
+    const data: Record<string, string | number> = {};
+    for (const [name, kind] of schema.fields) {
+      if (kind === 'str') {
+        data[name] = readString();
+        continue;
+      }
+      const value = kind === 'u8' ? view.getUint8(pos) : view.getUint16(pos, true);
+      pos += kind === 'u8' ? 1 : 2;
+      if (value !== ABSENT[kind]) {
+        data[name] = kind === 'centi' ? value / 100 : value;
+      }
+    }
+    messages.push(id ? { type: schema.type, id, data } : { type: schema.type, data });
+  }
+  return messages;
+}
+
+// Decodes a data-channel packet from the agent, either binary or JSON
+export function decodeTrackingPacket(payload: Uint8Array): AgentTrackingMessage[] {
+  if (payload[0] === TRACKING_WIRE_MAGIC) {
+    if (payload[1] !== TRACKING_WIRE_VERSION) {
+      throw new Error(`Unsupported tracking wire version ${payload[1]}`);
+    }
+    return decodeBinaryMessages(payload);
+  }
+
+  const packet = JSON.parse(textDecoder.decode(payload)) as AgentTrackingPacket;
+  // The agent coalesces messages from the same turn into one batch packet
+  return packet.type === 'batch' ? packet.messages : [packet];
+}
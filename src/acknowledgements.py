@@ -0,0 +1,77 @@
+"""Short spoken acknowledgements of tracking tool calls.
+
+After a tracking tool runs the patient hears nothing until the LLM has read
+the tool result and the first sentence of its reply is synthesized. With
+acknowledgements on, the tool queues a short phrase ("Thanks, I've noted
+that.") from pre-synthesized audio as soon as it has recorded the data. It
+plays while the LLM writes the reply, which follows it in the speech queue.
+
+The phrases are synthesized once per voice into the process' audio cache, see
+tts_cache.py. Until a phrase is cached it is not spoken, a tool call never
+waits on synthesis.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+
+from livekit.agents import AgentSession, tts
+
+from tts_cache import AudioCache, play
+
+logger = logging.getLogger("agent")
+
+ACKNOWLEDGEMENTS_ENV = "TOOL_ACKNOWLEDGEMENTS"
+
+# by tool, short enough to finish before the LLM's reply is ready
+ACKNOWLEDGEMENTS = {
+    "log_pain_assessment": "Thanks, I've noted that.",
+    "track_sleep_quality": "Got it, I've logged your sleep.",
+    "assess_mood_and_functioning": "Thank you, I've noted how you're doing.",
+}
+
+
+class Acknowledger:
+    """Speaks the acknowledgement of a tool from cached audio."""
+
+    def __init__(self, tts_: tts.TTS, voice: str, cache: AudioCache) -> None:
+        self._tts = tts_
+        self._voice = voice
+        self._cache = cache
+        self._warming: asyncio.Task[None] | None = None
+
+    def start(self) -> None:
+        """Synthesize the phrases missing from the cache in the background."""
+        if self._warming is None or self._warming.done():
+            self._warming = asyncio.create_task(self._warm())
+
+    async def aclose(self) -> None:
+        if self._warming is not None:
+            self._warming.cancel()
+            await asyncio.gather(self._warming, return_exceptions=True)
+
+    def acknowledge(self, session: AgentSession, tool: str) -> str | None:
+        """Queue the acknowledgement of ``tool``, returns the phrase if it is spoken."""
+        text = ACKNOWLEDGEMENTS.get(tool)
+        if text is None:
+            return None
+
+        frames = self._cache.get(self._voice, text)
+        if frames is None:
+            self.start()
+            return None
+
+        # the tool result tells the LLM what was said, see Therapist._acknowledge
+        session.say(text, audio=play(frames), add_to_chat_ctx=False)
+        return text
+
+    async def _warm(self) -> None:
+        for text in ACKNOWLEDGEMENTS.values():
+            if (self._voice, text) in self._cache:
+                continue
+            try:
+                await self._cache.synthesize(self._tts, self._voice, text)
+            except Exception as e:
+                logger.warning("failed to synthesize acknowledgement %r: %s", text, e)
+                return
@@ -1,5 +1,10 @@
+import asyncio
 import logging
-import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Optional
 
 from dotenv import load_dotenv
 from livekit.agents import (
@@ -7,24 +12,72 @@ from livekit.agents import (
     Agent,
     AgentFalseInterruptionEvent,
     AgentSession,
+    FunctionToolsExecutedEvent,
     JobContext,
     JobProcess,
     MetricsCollectedEvent,
     RoomInputOptions,
     RunContext,
+    UserInputTranscribedEvent,
     WorkerOptions,
     cli,
     metrics,
+    utils,
+)
+from livekit.agents.llm import (
+    ChatContext,
+    ChatMessage,
+    ToolError,
+    function_tool,
+    is_function_tool,
 )
-from livekit.agents.llm import function_tool
-from livekit.plugins import deepgram, noise_cancellation, openai, silero
-from livekit.plugins.turn_detector.multilingual import MultilingualModel
 
-from prompts import THERAPIST_PROMPT
+from acknowledgements import ACKNOWLEDGEMENTS_ENV, Acknowledger
+from analytics import HISTORY_DAYS, DailyMetrics, patient_facts
+from audio_input import AudioProfiler, select_noise_cancellation
+from coalescing import CoalescerStats, Submission, TrackingCoalescer
+from components import ComponentCache
+from context import ContextManager
+from density import DENSITY_ENV, high_density_options
+from extraction import extract_metrics
+from latency import LatencyProfiler, serve_latency_metrics
+from logs import install as install_logging
+from logs import log_metrics
+from loop_monitor import LoopMonitor
+from prompts import (
+    ACKNOWLEDGED_NOTE,
+    EXTRACTED_METRICS_NOTE,
+    PROMPT_SECTIONS,
+    SAFETY_REFERRAL_NOTE,
+    THERAPIST_PROMPT,
+    GuidanceTopic,
+)
+from publisher import TrackingPublisher
+from records import (
+    InvalidRecordError,
+    MoodAssessment,
+    PainAssessment,
+    RecordBuffer,
+    SleepQuality,
+    TrackingRecord,
+    record_from_data,
+)
+from reports import SessionData, submit_report
+from safety import SafetyMonitor
+from startup import PROFILE_COMMAND, import_worker_plugins, profile_startup
+from store import (
+    TrackingStore,
+    patient_id_for,
+    patient_timezone_for,
+)
+from sync import register_sync_rpc
+from trends import register_trends_rpc
+from wire import NegotiatedEncoder
 
 logger = logging.getLogger("agent")
 
-load_dotenv(".env.local")
+# longest period the tracking summary covers, the LLM chooses the days
+MAX_SUMMARY_DAYS = 365
 
 
 class Therapist(Agent):
@@ -32,11 +85,122 @@ class Therapist(Agent):
         super().__init__(
             instructions=THERAPIST_PROMPT,
         )
-        self._room = None  # Will be set when session starts
+        # Will be set when session starts
+        self._publisher = None
+        self._store = None
+        self._participant = None
+        self._acknowledger = None
+        self._safety = None
+        # every record of the session, for its report
+        self._records = RecordBuffer()
+        # Repeated records of a type update one record, identical ones aren't written, see coalescing.py
+        self._coalescer = TrackingCoalescer(self._write)
     
-    def set_room(self, room):
-        """Set the room reference for function tools to use"""
-        self._room = room
+    @property
+    def records(self) -> RecordBuffer:
+        """The records tracked during this session"""
+        return self._records
+
+    def tracked_records(self) -> list[tuple[float, TrackingRecord]]:
+        """``(ts, record)`` of every record of the session as it stands, held back writes included"""
+        records = {record_id: (ts, record) for record_id, ts, record in self._records}
+        records.update((record_id, (ts, record)) for record_id, ts, record in self._coalescer.pending())
+        return sorted(records.values(), key=lambda r: r[0])
+
+    @property
+    def tracking_stats(self) -> CoalescerStats:
+        """How many tracking records were written, merged or suppressed"""
+        return self._coalescer.stats
+
+    def flush_tracking(self) -> None:
+        """Write the records the rate limit is still holding back"""
+        self._coalescer.flush()
+
+    def set_publisher(self, publisher: TrackingPublisher):
+        """Set the data-channel publisher for function tools to use"""
+        self._publisher = publisher
+
+    def set_store(self, store: TrackingStore):
+        """Set the persistent tracking store for function tools to use"""
+        self._store = store
+
+    def set_participant(self, participant):
+        """Set the patient participant whose records the tools track"""
+        self._participant = participant
+
+    def set_acknowledger(self, acknowledger: Acknowledger):
+        """Set the acknowledger that speaks for tracking tools while the LLM replies"""
+        self._acknowledger = acknowledger
+
+    def set_safety_monitor(self, safety: SafetyMonitor):
+        """Set the monitor whose safety referrals the LLM is told about"""
+        self._safety = safety
+
+    def _acknowledge(self, context: RunContext, tool: str) -> str:
+        """Speak the tool's acknowledgement, returns the note to add to the tool result"""
+        if self._acknowledger is None or context.speech_handle.interrupted:
+            return ""
+        phrase = self._acknowledger.acknowledge(context.session, tool)
+        if phrase is None:
+            return ""
+        return " " + ACKNOWLEDGED_NOTE.format(phrase=phrase)
+
+    def _record(self, record: TrackingRecord, ts: Optional[float] = None, confirmation: Optional[str] = None) -> Submission:
+        """Persist a tracking record and queue it for the frontend, without waiting on I/O
+
+        A record of the same type written moments ago that this one refines,
+        e.g. extracted from the transcript, is completed instead of adding
+        another one. Values the record lacks keep what was recorded before.
+        """
+        return self._coalescer.submit(record, ts=ts, confirmation=confirmation)
+
+    def _write(self, record: TrackingRecord, record_id: str, ts: float) -> None:
+        message_type = record.MESSAGE_TYPE
+        self._records.add(record, ts, record_id)
+
+        # the one canonical dict, published and persisted as is
+        data = record.to_data()
+
+        if self._publisher is None:
+            logger.warning("No publisher set, %s not sent to frontend", message_type)
+        else:
+            self._publisher.publish({"type": message_type, "id": record_id, "data": data})
+
+        if self._store is None or self._participant is None:
+            logger.warning("No store or participant set, %s not persisted", message_type)
+        else:
+            self._store.append(
+                patient_id_for(self._participant),
+                message_type,
+                data,
+                ts,
+                record_id,
+                tz=patient_timezone_for(self._participant),
+            )
+
+    async def on_user_turn_completed(self, turn_ctx: ChatContext, new_message: ChatMessage) -> None:
+        """Record ratings the patient stated plainly before the LLM runs, see extraction.py"""
+        # A referral spoken by the safety fast path during this turn, see safety.py
+        if self._safety is not None and (referral := self._safety.take_referral()):
+            turn_ctx.add_message(role="system", content=SAFETY_REFERRAL_NOTE.format(referral=referral))
+
+        extractions = extract_metrics(new_message.text_content or "")
+        if not extractions:
+            return
+
+        for extraction in extractions:
+            self._record(record_from_data(extraction.message_type, extraction.data), time.time())
+            logger.info("Extracted %s from transcript: %s", extraction.message_type, extraction.describe())
+
+        # Only this request sees the note, so the LLM doesn't spend a tool round trip
+        # on values that are already recorded. It changes the request, so a preemptive
+        # generation started for this turn is discarded.
+        turn_ctx.add_message(
+            role="system",
+            content=EXTRACTED_METRICS_NOTE.format(
+                recorded="\n".join(f"- {e.tool}: {e.describe()}" for e in extractions)
+            ),
+        )
 
     # all functions annotated with @function_tool will be passed to the LLM when this
     # agent is active
@@ -69,33 +233,34 @@ class Therapist(Agent):
             coping_strategies: Optional. Current pain management strategies being used (e.g., "heat therapy", "medication", "breathing exercises")
         """
 
-        logger.info(f"Logging pain assessment: Level {pain_level}, Location: {pain_location}, Quality: {pain_quality}")
-
-        assessment_data = {
-            "painLevel": pain_level,
-            "location": pain_location,
-            "quality": pain_quality,
-            "triggers": triggers,
-            "copingStrategies": coping_strategies,
-        }
-
-        # Send data to frontend via room data channel
+        # Out of range values go back to the LLM before anything is persisted, see records.py
         try:
-            message = {
-                "type": "pain_assessment",
-                "data": assessment_data
-            }
-            await self._room.local_participant.publish_data(
-                json.dumps(message).encode(),
-                reliable=True
+            assessment = PainAssessment(
+                pain_level=pain_level,
+                location=pain_location,
+                quality=pain_quality,
+                triggers=triggers,
+                coping_strategies=coping_strategies,
             )
-        except Exception as e:
-            logger.error(f"❌ Failed to send pain assessment to frontend: {e}")
+        except InvalidRecordError as e:
+            raise ToolError(f"Pain assessment not recorded: {e}") from e
 
-        return f"Pain assessment recorded successfully. Level: {pain_level}/10, Location: {pain_location}, Quality: {pain_quality}. This information will be available for your healthcare provider review."
+        logger.info("Logging pain assessment: Level %s, Location: %s, Quality: %s", pain_level, pain_location, pain_quality)
+
+        # Persist and send data to frontend via room data channel, off the tool-call path
+        recorded = self._record(
+            assessment,
+            confirmation=f"Pain assessment recorded successfully. Level: {pain_level}/10, Location: {pain_location}, Quality: {pain_quality}. This information will be available for your healthcare provider review.",
+        )
+        if recorded.duplicate:
+            return recorded.confirmation
+
+        # Spoken while the LLM writes its reply, see acknowledgements.py
+        acknowledged = self._acknowledge(context, "log_pain_assessment")
+        return f"{recorded.confirmation}{acknowledged}"
 
     @function_tool
-    async def track_sleep_quality(self, context: RunContext, sleep_quality: int, hours_slept: float, sleep_onset_minutes: int = 0, wake_ups: int = 0, sleep_factors: str = ""):
+    async def track_sleep_quality(self, context: RunContext, sleep_quality: int, hours_slept: float, sleep_onset_minutes: Optional[int] = None, wake_ups: Optional[int] = None, sleep_factors: str = ""):
         """Use this tool to monitor sleep patterns and quality for patients with chronic pain and sleep disorders.
 
         Sleep tracking is essential for understanding the relationship between pain, sleep, and overall wellbeing.
@@ -103,35 +268,37 @@ class Therapist(Agent):
         Args:
             sleep_quality: Overall sleep quality rating on a scale of 1-10 (1 = very poor, 10 = excellent)
             hours_slept: Total hours of sleep obtained (e.g., 6.5, 7.0)
-            sleep_onset_minutes: Optional. Minutes it took to fall asleep (default: 0 if not specified)
-            wake_ups: Optional. Number of times awakened during the night (default: 0)
+            sleep_onset_minutes: Optional. Minutes it took to fall asleep, leave out if the patient didn't say
+            wake_ups: Optional. Number of times awakened during the night, leave out if the patient didn't say
             sleep_factors: Optional. Factors that affected sleep (e.g., "pain flare", "anxiety", "medication change", "good sleep hygiene")
         """
 
-        logger.info(f"Tracking sleep quality: {sleep_quality}/10, Hours: {hours_slept}, Wake-ups: {wake_ups}")
-
-        sleep_data = {
-            "sleepQuality": sleep_quality,
-            "hoursSlept": hours_slept,
-            "sleepOnsetMinutes": sleep_onset_minutes,
-            "wakeUps": wake_ups,
-            "sleepFactors": sleep_factors,
-        }
-
-        # Send data to frontend via room data channel
         try:
-            message = {
-                "type": "sleep_quality",
-                "data": sleep_data
-            }
-            await self._room.local_participant.publish_data(
-                json.dumps(message).encode(),
-                reliable=True
+            sleep = SleepQuality(
+                sleep_quality=sleep_quality,
+                hours_slept=hours_slept,
+                sleep_onset_minutes=sleep_onset_minutes,
+                wake_ups=wake_ups,
+                sleep_factors=sleep_factors,
             )
-        except Exception as e:
-            logger.error(f"❌ Failed to send sleep quality to frontend: {e}")
+        except InvalidRecordError as e:
+            raise ToolError(f"Sleep data not recorded: {e}") from e
+
+        logger.info("Tracking sleep quality: %s/10, Hours: %s, Wake-ups: %s", sleep_quality, hours_slept, wake_ups)
+
+        # Omitted values are left out of the record, so values extracted from the
+        # transcript earlier aren't overwritten when the record is completed
+        woke = f" Wake-ups: {wake_ups}." if wake_ups is not None else ""
+        # Persist and send data to frontend via room data channel, off the tool-call path
+        recorded = self._record(
+            sleep,
+            confirmation=f"Sleep data recorded successfully. Quality: {sleep_quality}/10, Duration: {hours_slept} hours.{woke} This information helps track your sleep patterns and their relationship to pain management.",
+        )
+        if recorded.duplicate:
+            return recorded.confirmation
 
-        return f"Sleep data recorded successfully. Quality: {sleep_quality}/10, Duration: {hours_slept} hours, Wake-ups: {wake_ups}. This information helps track your sleep patterns and their relationship to pain management."
+        acknowledged = self._acknowledge(context, "track_sleep_quality")
+        return f"{recorded.confirmation}{acknowledged}"
 
     @function_tool
     async def assess_mood_and_functioning(self, context: RunContext, mood_rating: int, energy_level: int, daily_activities_completion: int, social_engagement: int, emotional_coping: str = ""):
@@ -147,58 +314,127 @@ class Therapist(Agent):
             emotional_coping: Optional. Current emotional coping strategies being used (e.g., "mindfulness", "talking to friends", "journaling", "therapy techniques")
         """
 
-        logger.info(f"Assessing mood and functioning: Mood {mood_rating}/10, Energy {energy_level}/10, Activities {daily_activities_completion}/10")
-
-        functioning_data = {
-            "moodRating": mood_rating,
-            "energyLevel": energy_level,
-            "dailyActivitiesCompletion": daily_activities_completion,
-            "socialEngagement": social_engagement,
-            "emotionalCoping": emotional_coping,
-        }
-
-        # Send data to frontend via room data channel
         try:
-            message = {
-                "type": "mood_assessment",
-                "data": functioning_data
-            }
-            await self._room.local_participant.publish_data(
-                json.dumps(message).encode(),
-                reliable=True
+            functioning = MoodAssessment(
+                mood_rating=mood_rating,
+                energy_level=energy_level,
+                daily_activities_completion=daily_activities_completion,
+                social_engagement=social_engagement,
+                emotional_coping=emotional_coping,
             )
-        except Exception as e:
-            logger.error(f"❌ Failed to send mood assessment to frontend: {e}")
+        except InvalidRecordError as e:
+            raise ToolError(f"Mood and functioning assessment not recorded: {e}") from e
+
+        logger.info("Assessing mood and functioning: Mood %s/10, Energy %s/10, Activities %s/10", mood_rating, energy_level, daily_activities_completion)
+
+        # Persist and send data to frontend via room data channel, off the tool-call path
+        recorded = self._record(
+            functioning,
+            confirmation=f"Mood and functioning assessment recorded. Mood: {mood_rating}/10, Energy: {energy_level}/10, Daily activities: {daily_activities_completion}/10, Social engagement: {social_engagement}/10. This holistic view supports your comprehensive care plan.",
+        )
+        if recorded.duplicate:
+            return recorded.confirmation
+
+        acknowledged = self._acknowledge(context, "assess_mood_and_functioning")
+        return f"{recorded.confirmation}{acknowledged}"
+
+    @function_tool
+    async def get_guidance(self, context: RunContext, topic: GuidanceTopic):
+        """Use this tool to look up detailed guidance that is not part of your instructions: sample responses, supportive closing lines, evidence-based techniques, or what to note for session and weekly summaries.
+
+        Args:
+            topic: The guidance to look up, see ON-DEMAND GUIDANCE in your instructions
+        """
+
+        logger.info("Retrieving guidance: %s", topic)
 
-        return f"Mood and functioning assessment recorded. Mood: {mood_rating}/10, Energy: {energy_level}/10, Daily activities: {daily_activities_completion}/10, Social engagement: {social_engagement}/10. This holistic view supports your comprehensive care plan."
+        return PROMPT_SECTIONS[topic]
+
+    @function_tool
+    async def get_tracking_summary(self, context: RunContext, days: int = 7):
+        """Use this tool to look up the patient's tracked pain, sleep and mood history, for example for the weekly summary or when the patient asks how they have been doing lately.
+
+        Args:
+            days: Optional. Number of past days to summarize, from 1 to 365 (default: 7)
+        """
+
+        days = min(max(days, 1), MAX_SUMMARY_DAYS)
+        logger.info("Summarizing tracking data for the last %s days", days)
+
+        if self._store is None or self._participant is None:
+            return "Tracking history is not available right now."
+
+        # Daily rollups as arrays, patterns are looked for in a longer history, see analytics.py
+        today = datetime.now(patient_timezone_for(self._participant)).date()
+        start = today - timedelta(days=max(days, HISTORY_DAYS) - 1)
+        rollups = await self._store.rollups(
+            patient_id_for(self._participant), start.isoformat(), today.isoformat()
+        )
+        daily = DailyMetrics.from_rollups(rollups, start, (today - start).days + 1)
+        summary = daily.last(days).summary(0) if rollups else {}
+        if not summary:
+            return f"No pain, sleep or mood records in the last {days} days."
+
+        parts = []
+        for kind, entry in summary.items():
+            averages = ", ".join(f"{name} {value}" for name, value in entry["averages"].items())
+            parts.append(f"{kind}: {entry['count']} records, averages {averages}")
+        result = f"Last {days} days - " + "; ".join(parts)
+        if facts := patient_facts(daily, 0):
+            result += ". Patterns: " + "; ".join(facts)
+        return result
 
 
 def prewarm(proc: JobProcess):
-    proc.userdata["vad"] = silero.VAD.load()
+    # Log records are formatted and sent to the main process by a background
+    # thread instead of the event loop, see logs.py
+    install_logging()
+    # Load models and build provider clients before a job is assigned, so a new
+    # room doesn't pay for them on its time to first audio
+    proc.userdata["components"] = ComponentCache.load()
 
 
 async def entrypoint(ctx: JobContext):
+    # Imported at prewarm with the rest of the pipeline's plugins, see startup.py
+    from livekit.plugins.turn_detector.multilingual import MultilingualModel
+
     # Logging setup
     # Add any other context you want in all log entries here
     ctx.log_context_fields = {
         "room": ctx.room.name,
+        "job_id": ctx.job.id,
     }
 
+    # Components were built at prewarm, see components.py. Open the provider
+    # connections in the background while the session starts.
+    components: ComponentCache = ctx.proc.userdata["components"]
+    session_started = time.time()
+    warmup = asyncio.create_task(components.warm_connections())
+    # Phrases of the prompt's templates that aren't cached yet are synthesized
+    # once, later sessions play them from the cache, see tts_cache.py
+    phrases = asyncio.create_task(components.tts.fill())
+    ctx.add_shutdown_callback(lambda: utils.aio.cancel_and_wait(phrases))
+
+    # Times each stage of the audio input chain per frame, with its backlog and
+    # dropped frames, see audio_input.py
+    audio_profiler = AudioProfiler()
+
     # Set up a voice AI pipeline using OpenAI, Cartesia, Deepgram, and the LiveKit turn detector
     session = AgentSession(
         # A Large Language Model (LLM) is your agent's brain, processing user input and generating a response
         # See all providers at https://docs.livekit.io/agents/integrations/llm/
-        llm=openai.LLM(model="gpt-4o-mini"),
+        llm=components.llm,
         # Speech-to-text (STT) is your agent's ears, turning the user's speech into text that the LLM can understand
         # See all providers at https://docs.livekit.io/agents/integrations/stt/
-        stt=deepgram.STT(model="nova-3", language="multi"),
+        stt=components.stt,
         # Text-to-speech (TTS) is your agent's voice, turning the LLM's text into speech that the user can hear
         # See all providers at https://docs.livekit.io/agents/integrations/tts/
-        tts=deepgram.TTS(model="aura-2-andromeda-en"),
+        tts=components.tts,
         # VAD and turn detection are used to determine when the user is speaking and when the agent should respond
         # See more at https://docs.livekit.io/agents/build/turns
-        turn_detection=MultilingualModel(),
-        vad=ctx.proc.userdata["vad"],
+        # The turn detector model itself runs in the worker's shared inference process
+        turn_detection=audio_profiler.turn_detection(MultilingualModel()),
+        vad=audio_profiler.vad(components.vad),
         # allow the LLM to generate a response while waiting for the end of turn
         # See more at https://docs.livekit.io/agents/build/audio/#preemptive-generation
         preemptive_generation=True,
@@ -220,15 +456,52 @@ async def entrypoint(ctx: JobContext):
     # Metrics collection, to measure pipeline performance
     # For more information, see https://docs.livekit.io/agents/build/metrics/
     usage_collector = metrics.UsageCollector()
+    # Joins the per-stage metrics of each user turn into one end-to-end latency record
+    latency_profiler = LatencyProfiler()
+    # Samples how late the event loop runs, with the stack of whatever stalls it,
+    # exported with the turn latencies, see loop_monitor.py
+    loop_monitor = LoopMonitor(
+        tool_names=[name for name, value in vars(Therapist).items() if is_function_tool(value)],
+        on_lag=latency_profiler.on_loop_lag,
+    )
+    loop_monitor.start()
+    ctx.add_shutdown_callback(loop_monitor.aclose)
 
     @session.on("metrics_collected")
     def _on_metrics_collected(ev: MetricsCollectedEvent):
-        metrics.log_metrics(ev.metrics)
+        # Sampled and formatted off the event loop, see logs.py
+        log_metrics(ev.metrics)
         usage_collector.collect(ev.metrics)
+        latency_profiler.on_metrics(ev.metrics)
+
+    # Red flags in interim transcripts get the safety protocol's referral from
+    # cached audio as soon as the patient pauses, ahead of the LLM, see safety.py
+    safety = SafetyMonitor(
+        session,
+        components.audio_cache,
+        components.tts.voice,
+        on_referral=latency_profiler.on_safety_referral,
+    )
+    ctx.add_shutdown_callback(safety.aclose)
+
+    @session.on("user_input_transcribed")
+    def _on_user_input_transcribed(ev: UserInputTranscribedEvent):
+        safety.on_transcript(ev.transcript)
+
+    @session.on("function_tools_executed")
+    def _on_function_tools_executed(ev: FunctionToolsExecutedEvent):
+        latency_profiler.on_tools_executed(ev)
 
     async def log_usage():
         summary = usage_collector.get_summary()
-        logger.info(f"Usage: {summary}")
+        logger.info("Usage: %s", summary)
+        logger.info("Turn latency: %s", latency_profiler.summary())
+        logger.info("Event loop: %s", loop_monitor.summary())
+        logger.info("Audio input: %s", audio_profiler.summary())
+        audio_profiler.detach()
+        await latency_profiler.awrite_snapshot()
+        for stage, router in components.routers.items():
+            logger.info("%s backends: %s", stage.upper(), router.summary())
 
     ctx.add_shutdown_callback(log_usage)
 
@@ -240,25 +513,116 @@ async def entrypoint(ctx: JobContext):
     # # Start the avatar and wait for it to join
     # await avatar.start(session, room=ctx.room)
 
-    # Create the agent and set the room reference
+    # Tracking messages are published by a background task so tool calls never
+    # wait on the data channel. Packets use the compact binary format once every
+    # client has advertised support for it, JSON otherwise.
+    publisher = TrackingPublisher(ctx.room, encoder=NegotiatedEncoder(ctx.room))
+    publisher.start()
+    ctx.add_shutdown_callback(publisher.aclose)
+
+    # Records are also persisted agent-side so history queries don't depend on the client
+    store = TrackingStore(os.getenv("TRACKING_DB_PATH", "tracking.db"))
+    patient = None
+
+    async def close_store_and_report():
+        if patient is not None:
+            # Records still held back by the rate limit, see coalescing.py
+            agent.flush_tracking()
+            logger.info("Tracking records: %s", agent.tracking_stats)
+        await store.aclose()
+        if patient is None:
+            return
+        # Built and written by a background thread from the session's records,
+        # teardown takes the snapshot and waits for the write, see reports.py
+        await submit_report(
+            SessionData(
+                room=ctx.room.name,
+                patient_id=patient_id_for(patient),
+                started=session_started,
+                ended=time.time(),
+                today=datetime.now(patient_timezone_for(patient)).date().isoformat(),
+                transcript=tuple(
+                    (item.role, item.text_content)
+                    for item in session.history.items
+                    if item.type == "message" and item.role in ("user", "assistant") and item.text_content
+                ),
+                store_path=store.path,
+                records=agent.records,
+            )
+        )
+
+    ctx.add_shutdown_callback(close_store_and_report)
+    # The dashboard's trend charts are served from daily rollups kept by the store
+    register_trends_rpc(ctx.room, store)
+    # Reconnecting dashboards fetch only the records they missed, see sync.py
+    register_sync_rpc(ctx.room, store)
+
+    # Create the agent and give it the publisher and store
     agent = Therapist()
-    agent.set_room(ctx.room)
+    agent.set_publisher(publisher)
+    agent.set_store(store)
+    agent.set_safety_monitor(safety)
+
+    # Tracking tools can speak a short cached acknowledgement while the LLM
+    # writes its reply to the tool result, see acknowledgements.py
+    if os.getenv(ACKNOWLEDGEMENTS_ENV) == "1":
+        acknowledger = Acknowledger(
+            components.tts, components.tts.voice, components.audio_cache
+        )
+        acknowledger.start()
+        ctx.add_shutdown_callback(acknowledger.aclose)
+        agent.set_acknowledger(acknowledger)
+
+    # Keeps the history re-sent with every LLM request within a token budget by
+    # summarizing older turns in the background, see context.py
+    context_manager = ContextManager(
+        session, agent, components.summary_llm, records=agent.tracked_records
+    )
+    context_manager.start()
+    ctx.add_shutdown_callback(context_manager.aclose)
     
+    # LiveKit Cloud enhanced noise cancellation by default
+    # - If self-hosting, set NOISE_CANCELLATION=webrtc or none
+    # - For telephony applications, use `bvc-telephony` for best results
+    noise_cancellation = audio_profiler.noise_cancellation(select_noise_cancellation())
+
     # Start the session, which initializes the voice pipeline and warms up the models
     await session.start(
         agent=agent,
         room=ctx.room,
-        room_input_options=RoomInputOptions(
-            # LiveKit Cloud enhanced noise cancellation
-            # - If self-hosting, omit this parameter
-            # - For telephony applications, use `BVCTelephony` for best results
-            noise_cancellation=noise_cancellation.BVC(),
-        ),
+        room_input_options=RoomInputOptions(noise_cancellation=noise_cancellation),
     )
 
     # Join the room and connect to the user
     await ctx.connect()
 
+    # Records are keyed by the patient, the identity the frontend issued its token for
+    patient = await ctx.wait_for_participant()
+    agent.set_participant(patient)
+    ctx.log_context_fields = {
+        **ctx.log_context_fields,
+        "patient": patient_id_for(patient),
+    }
+
+    await warmup
+
 
 if __name__ == "__main__":
-    cli.run_app(WorkerOptions(entrypoint_fnc=entrypoint, prewarm_fnc=prewarm))
+    # Job processes inherit the environment, they don't need to read it again
+    load_dotenv(".env.local")
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    if command == PROFILE_COMMAND:
+        sys.exit(profile_startup(sys.argv[2:]))
+
+    # Per-stage turn latency percentiles of all jobs of this worker, see latency.py
+    if port := os.getenv("LATENCY_METRICS_PORT"):
+        serve_latency_metrics(int(port))
+
+    options = WorkerOptions(entrypoint_fnc=entrypoint, prewarm_fnc=prewarm)
+    # Shared models and measured admission control, see density.py
+    if os.getenv(DENSITY_ENV) == "high":
+        options = high_density_options(options)
+
+    # Only the plugins of the configured pipeline, and only where they're used
+    import_worker_plugins(options, command)
+    cli.run_app(options)
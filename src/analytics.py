@@ -0,0 +1,308 @@
+"""How a patient's pain, sleep and mood relate, computed on NumPy arrays.
+
+``DailyMetrics`` holds the daily means of every tracked metric as one
+``(patients, days, metrics)`` array, NaN where nothing was tracked, built from
+the store's daily rollups. Every analysis works on the whole array at once, so
+one patient or a whole clinic's worth cost the same handful of array
+operations:
+
+- ``rolling_mean``: mean over a trailing window of days,
+- ``trend_slopes``: least-squares change per day,
+- ``lagged_correlation``: Pearson correlation of one metric against another a
+  number of days later, e.g. pain during the day against the sleep reported the
+  next morning,
+- ``anomalies``: days far outside the patient's trailing mean.
+
+``patient_facts`` turns the results for one patient into short sentences the
+LLM can use as they are (see ``Therapist.get_tracking_summary``).
+"""
+
+from __future__ import annotations
+
+import math
+from collections.abc import Sequence
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Any
+
+import numpy as np
+
+from store import DailyRollup
+
+# trailing window of rolling means and anomaly baselines, in days
+WINDOW = 7
+# days of history patterns are looked for in, even for a shorter summary
+HISTORY_DAYS = 28
+# days with data a slope or correlation needs to mean anything
+MIN_DAYS = 5
+# how far from the trailing mean, in standard deviations, a day is an anomaly
+ANOMALY_Z = 2.0
+# and at least this far in points, so a steady 5 doesn't make a 6 stand out
+ANOMALY_MIN_DEVIATION = 2.0
+# correlations weaker than this aren't reported
+MIN_CORRELATION = 0.5
+# total change over the period, in points, that counts as a trend
+MIN_TREND_CHANGE = 1.0
+
+METRIC_NAMES = {
+    "pain_assessment.painLevel": "pain level",
+    "sleep_quality.sleepQuality": "sleep quality",
+    "sleep_quality.hoursSlept": "hours slept",
+    "mood_assessment.moodRating": "mood",
+    "mood_assessment.energyLevel": "energy level",
+}
+
+# (metric, metric days later, lag, how to say it). Sleep is reported in the
+# morning, so it's about the night before the day it is recorded on.
+CORRELATIONS = (
+    (
+        "sleep_quality.sleepQuality",
+        "pain_assessment.painLevel",
+        0,
+        "after nights with better sleep quality, pain level tends to be {direction}",
+    ),
+    (
+        "pain_assessment.painLevel",
+        "sleep_quality.sleepQuality",
+        1,
+        "after days with more pain, the next night's sleep quality tends to be"
+        " {direction}",
+    ),
+    (
+        "sleep_quality.sleepQuality",
+        "mood_assessment.moodRating",
+        0,
+        "after nights with better sleep quality, mood tends to be {direction}",
+    ),
+    (
+        "pain_assessment.painLevel",
+        "mood_assessment.moodRating",
+        0,
+        "on days with more pain, mood tends to be {direction}",
+    ),
+)
+
+
+@dataclass(frozen=True)
+class DailyMetrics:
+    """Daily means of tracked metrics, ``(patients, days, metrics)``."""
+
+    patients: tuple[str, ...]
+    metrics: tuple[str, ...]
+    start: date
+    means: np.ndarray
+    # records behind every mean, 0 where the mean is NaN
+    counts: np.ndarray
+
+    @classmethod
+    def from_rollups(
+        cls,
+        rollups: Sequence[DailyRollup],
+        start: date,
+        days: int,
+        metrics: Sequence[str] | None = None,
+    ) -> DailyMetrics:
+        """Arrays of ``rollups`` for the ``days`` from ``start``, of any number of patients.
+
+        ``metrics`` (``kind.metric``) default to every metric in ``rollups``.
+        """
+        names = [f"{r.kind}.{r.metric}" for r in rollups]
+        patients = tuple(sorted({r.patient_id for r in rollups}))
+        metrics = tuple(metrics) if metrics is not None else tuple(sorted(set(names)))
+
+        means = np.full((len(patients), days, len(metrics)), np.nan)
+        counts = np.zeros(means.shape, dtype=np.int64)
+        if not rollups:
+            return cls(patients, metrics, start, means, counts)
+
+        patient_index = {p: i for i, p in enumerate(patients)}
+        metric_index = {m: i for i, m in enumerate(metrics)}
+        p = np.array([patient_index[r.patient_id] for r in rollups])
+        m = np.array([metric_index.get(name, -1) for name in names])
+        d = np.array([date.fromisoformat(r.day).toordinal() for r in rollups])
+        d -= start.toordinal()
+        total = np.array([r.total for r in rollups], dtype=np.float64)
+        count = np.array([r.count for r in rollups], dtype=np.int64)
+
+        keep = (m >= 0) & (d >= 0) & (d < days)
+        p, d, m = p[keep], d[keep], m[keep]
+        means[p, d, m] = total[keep] / count[keep]
+        counts[p, d, m] = count[keep]
+        return cls(patients, metrics, start, means, counts)
+
+    @property
+    def days(self) -> int:
+        return self.means.shape[1]
+
+    def last(self, days: int) -> DailyMetrics:
+        """The last ``days`` of the period."""
+        days = min(days, self.days)
+        return DailyMetrics(
+            self.patients,
+            self.metrics,
+            self.start + timedelta(days=self.days - days),
+            self.means[:, self.days - days :],
+            self.counts[:, self.days - days :],
+        )
+
+    def summary(self, patient: int) -> dict[str, dict[str, Any]]:
+        """Records and average of every metric per record kind of ``patient``."""
+        counts = self.counts[patient].sum(axis=0)
+        totals = np.nansum(self.means[patient] * self.counts[patient], axis=0)
+        summary: dict[str, dict[str, Any]] = {}
+        for i, metric in enumerate(self.metrics):
+            if not counts[i]:
+                continue
+            kind, name = metric.split(".", 1)
+            entry = summary.setdefault(kind, {"count": 0, "averages": {}})
+            # records of a kind have the same fields, mostly
+            entry["count"] = max(entry["count"], int(counts[i]))
+            entry["averages"][name] = round(float(totals[i] / counts[i]), 1)
+        return summary
+
+
+def rolling_mean(values: np.ndarray, window: int = WINDOW) -> np.ndarray:
+    """Mean of the trailing ``window`` days including each day, along axis 1.
+
+    Days without data are skipped, the result is NaN only where the whole
+    window is empty.
+    """
+    valid = ~np.isnan(values)
+    sums, counts = _trailing(np.where(valid, values, 0.0), valid, window, shift=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(counts > 0, sums / counts, np.nan)
+
+
+def trend_slopes(values: np.ndarray, min_days: int = MIN_DAYS) -> np.ndarray:
+    """Least-squares change per day along axis 1, NaN with fewer than ``min_days`` days."""
+    valid = ~np.isnan(values)
+    shape = [1] * values.ndim
+    shape[1] = values.shape[1]
+    x = np.arange(values.shape[1], dtype=np.float64).reshape(shape)
+    n = valid.sum(axis=1, keepdims=True)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean_x = np.where(valid, x, 0.0).sum(axis=1, keepdims=True) / n
+        mean_y = np.where(valid, values, 0.0).sum(axis=1, keepdims=True) / n
+        dx = np.where(valid, x - mean_x, 0.0)
+        dy = np.where(valid, values - mean_y, 0.0)
+        slopes = (dx * dy).sum(axis=1) / (dx * dx).sum(axis=1)
+    return np.where(n.squeeze(axis=1) >= min_days, slopes, np.nan)
+
+
+def lagged_correlation(
+    x: np.ndarray, y: np.ndarray, lag: int = 0, min_days: int = MIN_DAYS
+) -> tuple[np.ndarray, np.ndarray]:
+    """Pearson correlation of ``x`` on each day with ``y`` ``lag`` days later.
+
+    ``x`` and ``y`` are ``(patients, days)``. Returns the correlation per
+    patient, NaN with fewer than ``min_days`` pairs or no variation, and the
+    number of pairs.
+    """
+    if lag:
+        x, y = x[:, :-lag], y[:, lag:]
+    valid = ~np.isnan(x) & ~np.isnan(y)
+    n = valid.sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean_x = np.where(valid, x, 0.0).sum(axis=1, keepdims=True) / n[:, None]
+        mean_y = np.where(valid, y, 0.0).sum(axis=1, keepdims=True) / n[:, None]
+        dx = np.where(valid, x - mean_x, 0.0)
+        dy = np.where(valid, y - mean_y, 0.0)
+        r = (dx * dy).sum(axis=1) / np.sqrt(
+            (dx * dx).sum(axis=1) * (dy * dy).sum(axis=1)
+        )
+    return np.where(n >= min_days, r, np.nan), n
+
+
+def anomalies(
+    values: np.ndarray,
+    window: int = WINDOW,
+    z: float = ANOMALY_Z,
+    min_deviation: float = ANOMALY_MIN_DEVIATION,
+    min_days: int = MIN_DAYS - 1,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Days far from the mean of the ``window`` days before them, along axis 1.
+
+    Returns the flags and the trailing means they were compared with. A day
+    needs ``min_days`` days of data in its window to be judged.
+    """
+    valid = ~np.isnan(values)
+    filled = np.where(valid, values, 0.0)
+    sums, counts = _trailing(filled, valid, window, shift=1)
+    squares, _ = _trailing(filled * filled, valid, window, shift=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = sums / counts
+        std = np.sqrt(np.maximum(squares / counts - mean * mean, 0.0))
+        deviation = np.abs(values - mean)
+        flags = (
+            valid
+            & (counts >= min_days)
+            & (deviation >= min_deviation)
+            & (deviation >= z * std)
+        )
+    return flags, np.where(counts > 0, mean, np.nan)
+
+
+def patient_facts(daily: DailyMetrics, patient: int) -> list[str]:
+    """What stands out in the data of ``patient``, as short sentences."""
+    facts = []
+    index = {metric: i for i, metric in enumerate(daily.metrics)}
+    values = daily.means[patient : patient + 1]
+
+    slopes = trend_slopes(values)[0]
+    for metric, name in METRIC_NAMES.items():
+        if metric not in index or math.isnan(slopes[index[metric]]):
+            continue
+        change = slopes[index[metric]] * (daily.days - 1)
+        if abs(change) >= MIN_TREND_CHANGE:
+            direction = "up" if change > 0 else "down"
+            facts.append(
+                f"{name} went {direction} by about {abs(change):.1f} points"
+                f" over the last {daily.days} days"
+            )
+
+    for x_metric, y_metric, lag, template in CORRELATIONS:
+        if x_metric not in index or y_metric not in index:
+            continue
+        r, n = lagged_correlation(
+            values[:, :, index[x_metric]], values[:, :, index[y_metric]], lag
+        )
+        if not math.isnan(r[0]) and abs(r[0]) >= MIN_CORRELATION:
+            direction = "higher" if r[0] > 0 else "lower"
+            facts.append(
+                template.format(direction=direction)
+                + f" (r={r[0]:.2f} over {n[0]} days)"
+            )
+
+    flags, baseline = anomalies(values)
+    # only recent days are news
+    recent = max(daily.days - 3, 0)
+    for d, m in zip(*np.nonzero(flags[0, recent:])):
+        metric = daily.metrics[m]
+        if metric not in METRIC_NAMES:
+            continue
+        day = daily.start + timedelta(days=int(recent + d))
+        value = values[0, recent + d, m]
+        usual = baseline[0, recent + d, m]
+        direction = "high" if value > usual else "low"
+        facts.append(
+            f"{METRIC_NAMES[metric]} of {value:g} on {day.isoformat()} was unusually"
+            f" {direction} (usually about {usual:.1f})"
+        )
+    return facts
+
+
+def _trailing(
+    values: np.ndarray, valid: np.ndarray, window: int, shift: int
+) -> tuple[np.ndarray, np.ndarray]:
+    """Sums and counts of the ``window`` days ending ``shift`` days before each day."""
+    days = values.shape[1]
+    pad = [(0, 0)] * values.ndim
+    pad[1] = (1, 0)
+    sums = np.pad(np.cumsum(values, axis=1), pad)
+    counts = np.pad(np.cumsum(valid, axis=1), pad)
+    end = np.clip(np.arange(days) + 1 - shift, 0, days)
+    begin = np.clip(end - window, 0, days)
+    return (
+        np.take(sums, end, axis=1) - np.take(sums, begin, axis=1),
+        np.take(counts, end, axis=1) - np.take(counts, begin, axis=1),
+    )
@@ -0,0 +1,316 @@
+"""The audio input chain of a room, and what each stage of it costs.
+
+The patient's microphone goes through noise cancellation as frames are
+decoded, then silero VAD, and at the end of every utterance the turn detector
+decides whether the patient is done. All of it runs for every room, so it
+decides how many rooms a node fits.
+
+``NOISE_CANCELLATION`` picks the first stage:
+
+- ``bvc`` (default) / ``bvc-telephony`` / ``nc``: LiveKit Cloud's models,
+  applied by the native SDK before frames reach Python.
+- ``webrtc``: WebRTC's noise suppression, in this process and far cheaper.
+- ``none``.
+
+``AudioProfiler`` wraps the stages of a session and records per stage the
+frames it processed, the time per frame (per inference window for the VAD,
+per prediction for the turn detector), its backlog and the frames it dropped:
+
+- ``noise_cancellation``: only when it runs in Python (``webrtc``), the
+  native models can't be timed per frame. Dropped frames failed to process
+  and were passed on as they were.
+- ``vad``: the backlog is the audio pushed that wasn't run through the model
+  yet, in seconds.
+- ``turn_detection``: calls, not frames, its time includes the round trip to
+  the worker's inference process.
+
+``tests/audio_bench.py`` pushes WAV files through the same chain offline and
+reports the CPU time per second of audio of every stage.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import time
+from collections.abc import AsyncIterator
+from typing import Any
+
+from livekit import rtc
+from livekit.agents import llm, vad
+
+from latency import QUANTILES, LatencyHistogram
+
+logger = logging.getLogger("agent")
+
+NOISE_CANCELLATION_ENV = "NOISE_CANCELLATION"
+NOISE_CANCELLATION_OPTIONS = ("bvc", "bvc-telephony", "nc", "webrtc", "none")
+DEFAULT_NOISE_CANCELLATION = "bvc"
+
+# WebRTC's audio processing takes frames of exactly 10ms
+_APM_FRAMES_PER_SECOND = 100
+
+
+def select_noise_cancellation(
+    name: str | None = None,
+) -> rtc.NoiseCancellationOptions | rtc.FrameProcessor[rtc.AudioFrame] | None:
+    """The noise cancellation ``name`` stands for, ``NOISE_CANCELLATION`` by default."""
+    if name is None:
+        name = os.getenv(NOISE_CANCELLATION_ENV, DEFAULT_NOISE_CANCELLATION)
+    if name not in NOISE_CANCELLATION_OPTIONS:
+        logger.warning(
+            "unknown %s=%r, using %s",
+            NOISE_CANCELLATION_ENV,
+            name,
+            DEFAULT_NOISE_CANCELLATION,
+        )
+        name = DEFAULT_NOISE_CANCELLATION
+    if name == "none":
+        return None
+    if name == "webrtc":
+        return WebRTCNoiseSuppression()
+
+    # Imported at prewarm with the rest of the pipeline's plugins, see startup.py
+    from livekit.plugins import noise_cancellation
+
+    if name == "bvc-telephony":
+        return noise_cancellation.BVCTelephony()
+    if name == "nc":
+        return noise_cancellation.NC()
+    return noise_cancellation.BVC()
+
+
+class WebRTCNoiseSuppression(rtc.FrameProcessor[rtc.AudioFrame]):
+    """WebRTC's noise suppression and high-pass filter, run on every frame."""
+
+    def __init__(self) -> None:
+        self._apm = rtc.AudioProcessingModule(
+            noise_suppression=True, high_pass_filter=True
+        )
+        self._enabled = True
+
+    @property
+    def enabled(self) -> bool:
+        return self._enabled
+
+    @enabled.setter
+    def enabled(self, value: bool) -> None:
+        self._enabled = value
+
+    def _process(self, frame: rtc.AudioFrame) -> rtc.AudioFrame:
+        data = bytearray(frame.data.cast("B"))
+        step = frame.sample_rate // _APM_FRAMES_PER_SECOND * frame.num_channels * 2
+        # a trailing part shorter than 10ms is left as it is
+        for start in range(0, len(data) - step + 1, step):
+            chunk = rtc.AudioFrame(
+                data[start : start + step],
+                frame.sample_rate,
+                frame.num_channels,
+                frame.sample_rate // _APM_FRAMES_PER_SECOND,
+            )
+            self._apm.process_stream(chunk)
+            data[start : start + step] = chunk.data.cast("B")
+        return rtc.AudioFrame(
+            data, frame.sample_rate, frame.num_channels, frame.samples_per_channel
+        )
+
+    def _close(self) -> None:
+        pass
+
+
+class StageStats:
+    """What one stage of the audio input chain processed, and the time it took."""
+
+    def __init__(self) -> None:
+        self.frames = 0
+        self.audio_seconds = 0.0
+        # per frame, inference window or prediction
+        self.times = LatencyHistogram()
+        self.backlog = 0.0
+        self.max_backlog = 0.0
+        self.dropped = 0
+
+    def record_backlog(self, backlog: float) -> None:
+        self.backlog = backlog
+        self.max_backlog = max(self.max_backlog, backlog)
+
+    def summary(self) -> dict[str, Any]:
+        return {
+            "frames": self.frames,
+            "audio_s": round(self.audio_seconds, 2),
+            "time_ms": {
+                **{
+                    f"p{round(q * 100)}": round(self.times.percentile(q) * 1000, 3)
+                    for q in QUANTILES
+                },
+                "max": round(self.times.max * 1000, 3),
+            },
+            # seconds of processing per second of audio
+            "load": round(self.times.total / self.audio_seconds, 4)
+            if self.audio_seconds
+            else None,
+            "max_backlog": round(self.max_backlog, 3),
+            "dropped": self.dropped,
+        }
+
+
+class _ProfiledFrameProcessor(rtc.FrameProcessor[rtc.AudioFrame]):
+    def __init__(
+        self, processor: rtc.FrameProcessor[rtc.AudioFrame], stats: StageStats
+    ) -> None:
+        self._processor = processor
+        self._stats = stats
+
+    @property
+    def enabled(self) -> bool:
+        return self._processor.enabled
+
+    @enabled.setter
+    def enabled(self, value: bool) -> None:
+        self._processor.enabled = value
+
+    def _on_stream_info_updated(self, **kwargs: Any) -> None:
+        self._processor._on_stream_info_updated(**kwargs)
+
+    def _on_stream_info_cleared(self) -> None:
+        self._processor._on_stream_info_cleared()
+
+    def _on_credentials_updated(self, **kwargs: Any) -> None:
+        self._processor._on_credentials_updated(**kwargs)
+
+    def _on_credentials_cleared(self) -> None:
+        self._processor._on_credentials_cleared()
+
+    def _process(self, frame: rtc.AudioFrame) -> rtc.AudioFrame:
+        started = time.perf_counter()
+        try:
+            processed = self._processor._process(frame)
+        except Exception:
+            # the stream passes the frame on as it is
+            self._stats.dropped += 1
+            raise
+        self._stats.times.record(time.perf_counter() - started)
+        self._stats.frames += 1
+        self._stats.audio_seconds += frame.duration
+        return processed
+
+    def _close(self) -> None:
+        self._processor._close()
+
+
+class _ProfiledVADStream:
+    def __init__(self, stream: vad.VADStream, stats: StageStats) -> None:
+        self._stream = stream
+        self._stats = stats
+        self._pushed = 0.0
+
+    def push_frame(self, frame: rtc.AudioFrame) -> None:
+        self._stream.push_frame(frame)
+        self._pushed += frame.duration
+        self._stats.frames += 1
+        self._stats.audio_seconds += frame.duration
+
+    def flush(self) -> None:
+        self._stream.flush()
+
+    def end_input(self) -> None:
+        self._stream.end_input()
+
+    async def aclose(self) -> None:
+        await self._stream.aclose()
+
+    def __aiter__(self) -> AsyncIterator[vad.VADEvent]:
+        return self
+
+    async def __anext__(self) -> vad.VADEvent:
+        ev = await self._stream.__anext__()
+        if ev.type == vad.VADEventType.INFERENCE_DONE:
+            self._stats.times.record(ev.inference_duration)
+            # the event's timestamp is the audio run through the model so far
+            self._stats.record_backlog(max(self._pushed - ev.timestamp, 0.0))
+        return ev
+
+
+class _ProfiledVAD(vad.VAD):
+    def __init__(self, inner: vad.VAD, stats: StageStats) -> None:
+        super().__init__(capabilities=inner.capabilities)
+        self._inner = inner
+        self._stats = stats
+        self._label = inner._label
+        inner.on("metrics_collected", self._forward_metrics)
+
+    def stream(self) -> vad.VADStream:
+        return _ProfiledVADStream(self._inner.stream(), self._stats)  # type: ignore[return-value]
+
+    def detach(self) -> None:
+        self._inner.off("metrics_collected", self._forward_metrics)
+
+    def _forward_metrics(self, metrics: Any) -> None:
+        self.emit("metrics_collected", metrics)
+
+
+class _ProfiledTurnDetector:
+    def __init__(self, detector: Any, stats: StageStats) -> None:
+        self._detector = detector
+        self._stats = stats
+
+    async def unlikely_threshold(self, language: str | None) -> float | None:
+        return await self._detector.unlikely_threshold(language)
+
+    async def supports_language(self, language: str | None) -> bool:
+        return await self._detector.supports_language(language)
+
+    async def predict_end_of_turn(
+        self, chat_ctx: llm.ChatContext, *, timeout: float | None = None
+    ) -> float:
+        started = time.perf_counter()
+        try:
+            return await self._detector.predict_end_of_turn(chat_ctx, timeout=timeout)
+        except Exception:
+            self._stats.dropped += 1
+            raise
+        finally:
+            self._stats.times.record(time.perf_counter() - started)
+            self._stats.frames += 1
+
+
+class AudioProfiler:
+    """Records the cost of a session's audio input stages, see the module docstring.
+
+    Wrap every stage before the session starts and ``detach`` it when it ends.
+    """
+
+    def __init__(self) -> None:
+        self.stages: dict[str, StageStats] = {}
+        self._vads: list[_ProfiledVAD] = []
+
+    def noise_cancellation(
+        self,
+        option: rtc.NoiseCancellationOptions
+        | rtc.FrameProcessor[rtc.AudioFrame]
+        | None,
+    ) -> rtc.NoiseCancellationOptions | rtc.FrameProcessor[rtc.AudioFrame] | None:
+        if not isinstance(option, rtc.FrameProcessor):
+            # applied natively, or not at all
+            return option
+        return _ProfiledFrameProcessor(option, self._stage("noise_cancellation"))
+
+    def vad(self, inner: vad.VAD) -> vad.VAD:
+        profiled = _ProfiledVAD(inner, self._stage("vad"))
+        self._vads.append(profiled)
+        return profiled
+
+    def turn_detection(self, detector: Any) -> Any:
+        return _ProfiledTurnDetector(detector, self._stage("turn_detection"))
+
+    def summary(self) -> dict[str, dict[str, Any]]:
+        return {name: stats.summary() for name, stats in self.stages.items()}
+
+    def detach(self) -> None:
+        """Stop forwarding the metrics of the shared VAD to this session."""
+        for profiled in self._vads:
+            profiled.detach()
+        self._vads.clear()
+
+    def _stage(self, name: str) -> StageStats:
+        return self.stages.setdefault(name, StageStats())
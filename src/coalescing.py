@@ -0,0 +1,203 @@
+"""Per-session dedup and rate limiting of tracking records.
+
+The prompt has the LLM call the tracking tools as soon as pain, sleep or mood
+comes up, so a conversation often calls the same tool several times with the
+same or slightly refined values. Every write is a data-channel message and a
+re-render of the dashboard. ``TrackingCoalescer`` sits in front of the writes:
+
+- a record that refines one of its type submitted less than ``window``
+  seconds ago (``TRACKING_COALESCE_WINDOW_S``, default 60), i.e. none of the
+  values both have differ, updates that record instead of adding another one.
+  Values the new record lacks are kept. This is also how the LLM completes a
+  record extracted from the transcript. A record that contradicts it, like
+  neck pain 4 after lower-back pain 7, is a separate report and written as one.
+- a record that doesn't change anything is a duplicate. Nothing is written,
+  the tool returns the confirmation of the first call and no acknowledgement
+  is spoken again.
+- writes of each message type go through a token bucket, ``COALESCE_RATE``
+  per second in bursts of up to ``COALESCE_BURST``. A write over the limit is
+  held back until a token is available, later updates merge into it.
+
+``stats`` counts what was suppressed, it is logged with the session's usage.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+import uuid
+from collections.abc import Callable, Iterator
+from dataclasses import dataclass
+
+from logs import RateSampler
+from records import TrackingRecord
+
+logger = logging.getLogger("agent")
+
+COALESCE_WINDOW_ENV = "TRACKING_COALESCE_WINDOW_S"
+
+DEFAULT_COALESCE_WINDOW = 60.0
+# writes per second and message type, and the burst allowed: a record extracted
+# from the transcript and the tool call completing it go out right away
+COALESCE_RATE = 0.2
+COALESCE_BURST = 3.0
+
+
+@dataclass
+class CoalescerStats:
+    submitted: int = 0
+    written: int = 0
+    # submissions that updated an earlier record instead of adding one
+    merged: int = 0
+    # submissions that changed nothing, never written
+    duplicates: int = 0
+    # writes held back by the rate limit
+    deferred: int = 0
+
+
+@dataclass(frozen=True)
+class Submission:
+    record_id: str
+    # the record as written, merged with the earlier values
+    record: TrackingRecord
+    duplicate: bool
+    # what the tool returns, the first call's confirmation for a duplicate
+    confirmation: str | None
+
+
+class _Entry:
+    __slots__ = ("confirmation", "first_submitted", "record", "record_id", "ts")
+
+    def __init__(
+        self,
+        record_id: str,
+        ts: float,
+        record: TrackingRecord,
+        confirmation: str | None,
+        first_submitted: float,
+    ) -> None:
+        self.record_id = record_id
+        self.ts = ts
+        self.record = record
+        self.confirmation = confirmation
+        self.first_submitted = first_submitted
+
+
+def coalesce_window() -> float:
+    """The coalescing window in seconds, from ``COALESCE_WINDOW_ENV``."""
+    raw = os.getenv(COALESCE_WINDOW_ENV)
+    try:
+        return float(raw) if raw else DEFAULT_COALESCE_WINDOW
+    except ValueError:
+        logger.warning("invalid %s=%r, using the default", COALESCE_WINDOW_ENV, raw)
+        return DEFAULT_COALESCE_WINDOW
+
+
+class TrackingCoalescer:
+    """Merges a session's records per message type before they are written.
+
+    Args:
+        write: Writes ``(record, record_id, ts)``, called on the event loop.
+        window: Seconds after a record's first submission that later ones
+            update it.
+        rate: Writes per second and message type.
+        burst: Writes of a message type allowed at once.
+    """
+
+    def __init__(
+        self,
+        write: Callable[[TrackingRecord, str, float], None],
+        *,
+        window: float | None = None,
+        rate: float = COALESCE_RATE,
+        burst: float = COALESCE_BURST,
+    ) -> None:
+        self.stats = CoalescerStats()
+        self._write = write
+        self._window = coalesce_window() if window is None else window
+        self._limiter = RateSampler(rate, burst)
+        self._retry_after = 1 / rate
+        # records of the window by message type, latest last
+        self._entries: dict[str, list[_Entry]] = {}
+        # held back writes by record id
+        self._held: dict[str, tuple[_Entry, asyncio.TimerHandle]] = {}
+
+    def submit(
+        self,
+        record: TrackingRecord,
+        *,
+        ts: float | None = None,
+        confirmation: str | None = None,
+    ) -> Submission:
+        """Write ``record``, or merge it into a record of the window it refines."""
+        self.stats.submitted += 1
+        now = time.monotonic()
+        message_type = record.MESSAGE_TYPE
+        entries = [
+            entry
+            for entry in self._entries.get(message_type, ())
+            if now - entry.first_submitted < self._window
+        ]
+        self._entries[message_type] = entries
+        entry = next((e for e in reversed(entries) if record.refines(e.record)), None)
+        if entry is not None:
+            merged = record.completed(entry.record)
+            if merged == entry.record:
+                self.stats.duplicates += 1
+                return Submission(
+                    entry.record_id,
+                    entry.record,
+                    True,
+                    entry.confirmation or confirmation,
+                )
+            self.stats.merged += 1
+            entry.record = merged
+            entry.confirmation = confirmation or entry.confirmation
+        else:
+            entry = _Entry(
+                uuid.uuid4().hex[:12],
+                time.time() if ts is None else ts,
+                record,
+                confirmation,
+                now,
+            )
+            entries.append(entry)
+
+        if entry.record_id not in self._held:
+            if self._limiter.allow(message_type) is None:
+                self.stats.deferred += 1
+                self._hold(entry)
+            else:
+                self._write_entry(entry)
+        return Submission(entry.record_id, entry.record, False, entry.confirmation)
+
+    def pending(self) -> Iterator[tuple[str, float, TrackingRecord]]:
+        """``(record_id, ts, record)`` of the writes held back by the rate limit."""
+        for entry, _ in self._held.values():
+            yield entry.record_id, entry.ts, entry.record
+
+    def flush(self) -> None:
+        """Write the records held back by the rate limit now."""
+        for entry, timer in list(self._held.values()):
+            timer.cancel()
+            del self._held[entry.record_id]
+            self._write_entry(entry)
+
+    def _hold(self, entry: _Entry) -> None:
+        timer = asyncio.get_running_loop().call_later(
+            self._retry_after, self._write_held, entry
+        )
+        self._held[entry.record_id] = (entry, timer)
+
+    def _write_held(self, entry: _Entry) -> None:
+        if self._limiter.allow(entry.record.MESSAGE_TYPE) is None:
+            self._hold(entry)
+            return
+        del self._held[entry.record_id]
+        self._write_entry(entry)
+
+    def _write_entry(self, entry: _Entry) -> None:
+        self.stats.written += 1
+        self._write(entry.record, entry.record_id, entry.ts)
@@ -0,0 +1,316 @@
+"""Process-level cache of the voice pipeline components.
+
+``prewarm`` runs in every job process before a job is assigned to it, so
+everything built here - model weights, provider clients and their connection
+pools, resolved provider hostnames - is off the time-to-first-audio path of the
+room the process ends up serving.
+
+Plugins are imported here too, only those of the configured pipeline (see
+``pipeline_plugins``), rather than by every process that imports the agent.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import importlib
+import logging
+import os
+import socket
+import sys
+import time
+from collections.abc import Iterator, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
+from urllib.parse import urlparse
+
+import httpx
+import openai as openai_sdk
+from livekit.agents import stt, tts
+
+from prompts import PROMPT_CACHE_KEY, SPOKEN_TEMPLATES
+from routing import (
+    LLM_BACKENDS_ENV,
+    STT_BACKENDS_ENV,
+    TTS_BACKENDS_ENV,
+    BackendSpec,
+    RoutedLLM,
+    RoutedTTS,
+    Router,
+    parse_backends,
+)
+from tts_cache import TTS_CACHE_DIR_ENV, AudioCache, CachedTTS
+
+if TYPE_CHECKING:
+    from livekit.plugins import openai, silero
+
+logger = logging.getLogger("agent")
+
+LLM_MODEL = "gpt-4o-mini"
+STT_MODEL = "nova-3"
+TTS_MODEL = "aura-2-andromeda-en"
+
+PROVIDER_HOSTS = ("api.openai.com", "api.deepgram.com")
+
+# plugins of every pipeline: the VAD, the turn detector, noise cancellation of
+# the room input and the OpenAI LLM that summarizes the chat context
+BASE_PLUGINS = (
+    "livekit.plugins.silero",
+    "livekit.plugins.turn_detector.multilingual",
+    "livekit.plugins.noise_cancellation",
+    "livekit.plugins.openai",
+)
+PROVIDER_PLUGINS = {
+    "openai": "livekit.plugins.openai",
+    "deepgram": "livekit.plugins.deepgram",
+}
+
+
+class ComponentCache:
+    """Pipeline components shared by every job that runs in this process."""
+
+    vad: silero.VAD
+    llm: openai.LLM | RoutedLLM
+    summary_llm: openai.LLM
+    llm_client: openai_sdk.AsyncClient
+    llm_http: httpx.AsyncClient
+    stt: stt.STT
+    tts: CachedTTS
+    audio_cache: AudioCache
+
+    def __init__(self) -> None:
+        self.timings: dict[str, float] = {}
+        # stages with several backends, see routing.py
+        self.routers: dict[str, Router] = {}
+
+    @classmethod
+    def load(cls) -> ComponentCache:
+        cache = cls()
+        start = time.perf_counter()
+
+        # DNS lookups run while the models load
+        with ThreadPoolExecutor(max_workers=len(PROVIDER_HOSTS)) as pool:
+            lookups = [pool.submit(_resolve, host) for host in PROVIDER_HOSTS]
+
+            with cache._timed("plugins"):
+                # already imported by the fork server, see startup.py
+                import_plugins()
+            with cache._timed("vad"):
+                from livekit.plugins import silero
+
+                # already loaded by the fork server in high-density mode, see density.py
+                shared = sys.modules.get("shared_models")
+                cache.vad = shared.vad if shared else silero.VAD.load()
+            with cache._timed("turn_detector"):
+                _preload_turn_detector()
+            with cache._timed("llm"):
+                from livekit.plugins import openai
+
+                # own the HTTP client so its pool can be warmed once the job starts
+                cache.llm_http = httpx.AsyncClient(
+                    timeout=httpx.Timeout(connect=15.0, read=5.0, write=5.0, pool=5.0),
+                    follow_redirects=True,
+                    limits=httpx.Limits(
+                        max_connections=50,
+                        max_keepalive_connections=50,
+                        keepalive_expiry=120,
+                    ),
+                )
+                cache.llm_client = openai_sdk.AsyncClient(
+                    max_retries=0, http_client=cache.llm_http
+                )
+                # several backends are routed by latency and health, see routing.py
+                specs = parse_backends(
+                    os.getenv(LLM_BACKENDS_ENV, ""), f"openai:{LLM_MODEL}"
+                )
+                backends = [cache._llm_backend(spec) for spec in specs]
+                labels = [str(spec) for spec in specs]
+                if len(backends) == 1:
+                    cache.llm = backends[0]
+                else:
+                    cache.llm = RoutedLLM(backends, labels=labels)
+                    cache.routers["llm"] = cache.llm.router
+                # separate instance for chat context summaries, see context.py
+                cache.summary_llm = openai.LLM(model=LLM_MODEL, client=cache.llm_client)
+            with cache._timed("stt"):
+                backends = [
+                    _stt_backend(spec)
+                    for spec in parse_backends(
+                        os.getenv(STT_BACKENDS_ENV, ""), f"deepgram:{STT_MODEL}"
+                    )
+                ]
+                # a continuous stream can't be hedged, only switched when it fails
+                cache.stt = (
+                    backends[0]
+                    if len(backends) == 1
+                    else stt.FallbackAdapter(backends, vad=cache.vad)
+                )
+            with cache._timed("tts"):
+                # phrases spoken in every session are synthesized once and kept
+                # on disk, the ones cached by earlier runs are loaded right away
+                cache.audio_cache = AudioCache(
+                    directory=os.getenv(TTS_CACHE_DIR_ENV, "tts-cache")
+                )
+                specs = parse_backends(
+                    os.getenv(TTS_BACKENDS_ENV, ""), f"deepgram:{TTS_MODEL}"
+                )
+                backends = [_tts_backend(spec) for spec in specs]
+                if len(backends) == 1:
+                    inner = backends[0]
+                else:
+                    inner = RoutedTTS(backends, labels=[str(spec) for spec in specs])
+                    cache.routers["tts"] = inner.router
+                cache.tts = CachedTTS(
+                    inner,
+                    specs[0].model,
+                    cache.audio_cache,
+                    SPOKEN_TEMPLATES,
+                )
+                cached = cache.tts.preload()
+                logger.debug("%d of %d phrases cached", cached, len(cache.tts.phrases))
+
+            cache.timings["dns"] = max(f.result() for f in lookups)
+
+        cache.timings["total"] = time.perf_counter() - start
+        logger.info(
+            "prewarm done in %.0fms (%s)",
+            cache.timings["total"] * 1000,
+            ", ".join(
+                f"{k} {v * 1000:.0f}ms"
+                for k, v in cache.timings.items()
+                if k != "total"
+            ),
+        )
+        return cache
+
+    async def warm_connections(self) -> None:
+        """Open pooled TLS connections to the providers from the job's event loop.
+
+        HTTP clients bind their pools to the loop they first run on, which
+        doesn't exist yet at prewarm. Run this as a background task as soon as
+        the job starts, it must not delay the session.
+        """
+        start = time.perf_counter()
+        origin = f"https://{urlparse(str(self.llm_client.base_url)).hostname}"
+        try:
+            # any response, even a 401/404, leaves a kept-alive connection in the pool
+            await self.llm_http.head(origin, timeout=3.0)
+        except httpx.HTTPError as e:
+            logger.debug("failed to warm LLM connection: %s", e)
+            return
+        self.timings["llm_connection"] = time.perf_counter() - start
+        logger.debug(
+            "LLM connection warmed in %.0fms", self.timings["llm_connection"] * 1000
+        )
+
+    def _llm_backend(self, spec: BackendSpec) -> openai.LLM:
+        if spec.provider != "openai":
+            raise ValueError(f"unsupported LLM provider {spec.provider!r}")
+        from livekit.plugins import openai
+
+        if spec.base_url:
+            # any OpenAI-compatible endpoint
+            return openai.LLM(model=spec.model, base_url=spec.base_url)
+        # every session shares the static prompt prefix, see prompts.py
+        return openai.LLM(
+            model=spec.model,
+            client=self.llm_client,
+            prompt_cache_key=PROMPT_CACHE_KEY,
+        )
+
+    @contextlib.contextmanager
+    def _timed(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = time.perf_counter() - start
+
+
+def pipeline_plugins() -> list[str]:
+    """Plugin modules of the pipeline configured by the ``*_BACKENDS`` variables."""
+    plugins = list(BASE_PLUGINS)
+    for env, default in (
+        (LLM_BACKENDS_ENV, f"openai:{LLM_MODEL}"),
+        (STT_BACKENDS_ENV, f"deepgram:{STT_MODEL}"),
+        (TTS_BACKENDS_ENV, f"deepgram:{TTS_MODEL}"),
+    ):
+        for spec in parse_backends(os.getenv(env, ""), default):
+            # unsupported providers are reported when the backend is built
+            module = PROVIDER_PLUGINS.get(spec.provider)
+            if module and module not in plugins:
+                plugins.append(module)
+    return plugins
+
+
+def import_plugins(modules: Sequence[str] | None = None) -> None:
+    """Import ``modules``, by default the pipeline's plugins.
+
+    Must run on the main thread, livekit only registers plugins imported there.
+    """
+    for module in modules if modules is not None else pipeline_plugins():
+        importlib.import_module(module)
+
+
+def _preload_turn_detector() -> None:
+    # The turn detector model runs in the worker's shared inference process and
+    # MultilingualModel() needs the job context, so it can't be built here. What
+    # it does per job is import the HF hub client and read its languages config,
+    # do that now so constructing it in the entrypoint is cheap.
+    from huggingface_hub import hf_hub_download
+    from livekit.plugins.turn_detector import base as turn_detector_base
+
+    try:
+        hf_hub_download(
+            turn_detector_base.HG_MODEL,
+            "languages.json",
+            revision=turn_detector_base.MODEL_REVISIONS["multilingual"],
+            local_files_only=True,
+        )
+    except Exception as e:
+        logger.warning("turn detector files not found, run download-files: %s", e)
+
+
+def _stt_backend(spec: BackendSpec) -> stt.STT:
+    if spec.provider == "deepgram":
+        from livekit.plugins import deepgram
+
+        if spec.base_url:
+            return deepgram.STT(
+                model=spec.model, language="multi", base_url=spec.base_url
+            )
+        return deepgram.STT(model=spec.model, language="multi")
+    if spec.provider == "openai":
+        from livekit.plugins import openai
+
+        if spec.base_url:
+            return openai.STT(model=spec.model, base_url=spec.base_url)
+        return openai.STT(model=spec.model)
+    raise ValueError(f"unsupported STT provider {spec.provider!r}")
+
+
+def _tts_backend(spec: BackendSpec) -> tts.TTS:
+    if spec.provider == "deepgram":
+        from livekit.plugins import deepgram
+
+        if spec.base_url:
+            return deepgram.TTS(model=spec.model, base_url=spec.base_url)
+        return deepgram.TTS(model=spec.model)
+    if spec.provider == "openai":
+        from livekit.plugins import openai
+
+        # synthesizes whole sentences, the adapter splits the streamed text
+        if spec.base_url:
+            backend = openai.TTS(model=spec.model, base_url=spec.base_url)
+        else:
+            backend = openai.TTS(model=spec.model)
+        return tts.StreamAdapter(tts=backend)
+    raise ValueError(f"unsupported TTS provider {spec.provider!r}")
+
+
+def _resolve(host: str) -> float:
+    start = time.perf_counter()
+    try:
+        socket.getaddrinfo(host, 443, type=socket.SOCK_STREAM)
+    except OSError as e:
+        logger.debug("could not pre-resolve %s: %s", host, e)
+    return time.perf_counter() - start
@@ -0,0 +1,249 @@
+"""Bounded chat context for long sessions.
+
+Every LLM request re-sends the whole chat history, so without a bound the
+time-to-first-token and the cost of a turn grow with the length of the session.
+``ContextManager`` keeps the history of the agent within a token budget: once it
+grows past ``max_tokens``, the oldest turns are folded into a running summary
+until it is back under ``target_tokens``.
+
+Summaries are produced incrementally (previous summary plus the turns being
+dropped) by a background task, the reply that triggered it is never delayed.
+Tracked values are not left to the summarizer, the records of the session
+written before the cut are pinned verbatim as compact facts, so the model keeps
+the exact values recorded, whether by a tool or from the transcript (see
+extraction.py).
+
+Compacting rewrites the start of the history and so invalidates the provider's
+prefix cache for it (the static prompt and tools stay cached). The gap between
+``max_tokens`` and ``target_tokens`` keeps compactions rare.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+import time
+from collections.abc import Callable, Iterable, Sequence
+
+from livekit.agents import Agent, AgentSession, ConversationItemAddedEvent, llm
+
+from records import TrackingRecord
+
+logger = logging.getLogger("agent")
+
+SUMMARY_ITEM_ID = "therapist.context_summary"
+
+SUMMARY_INSTRUCTIONS = """
+You maintain the running summary of a supportive conversation between a patient
+with chronic pain or sleep difficulties and their AI therapy companion.
+Update the summary with the new part of the conversation. Keep what matters for
+the rest of the session: how the patient is feeling, concerns and goals they
+shared, coping strategies that were suggested and how they responded, and any
+safety concerns. Write at most 150 words of plain prose, no lists or headings.
+Do not repeat numeric ratings, they are tracked separately.
+""".strip()
+
+# rough but stable, the budget only needs to be consistent across turns
+_CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(items: Sequence[llm.ChatItem]) -> int:
+    chars = 0
+    for item in items:
+        if item.type == "message":
+            chars += len(item.text_content or "")
+        elif item.type == "function_call":
+            chars += len(item.name) + len(item.arguments)
+        elif item.type == "function_call_output":
+            chars += len(item.output)
+    return chars // _CHARS_PER_TOKEN
+
+
+class ContextManager:
+    """Keeps an agent's chat history within a token budget.
+
+    Args:
+        session: Session whose conversation is tracked.
+        agent: Agent whose chat context is compacted.
+        summary_llm: LLM that writes the summaries. Use a separate instance
+            from the session's, so its metrics aren't attributed to user turns.
+        max_tokens: History size, excluding the instructions, that triggers a
+            compaction.
+        target_tokens: History size a compaction aims for.
+        min_recent_turns: User turns that are always kept verbatim.
+        records: Returns the session's tracking records as ``(ts, record)``,
+            those of the compacted turns are kept as facts instead of summarized.
+    """
+
+    def __init__(
+        self,
+        session: AgentSession,
+        agent: Agent,
+        summary_llm: llm.LLM,
+        *,
+        max_tokens: int = 3000,
+        target_tokens: int = 1500,
+        min_recent_turns: int = 3,
+        records: Callable[[], Iterable[tuple[float, TrackingRecord]]] | None = None,
+    ) -> None:
+        self._session = session
+        self._agent = agent
+        self._llm = summary_llm
+        self._max_tokens = max_tokens
+        self._target_tokens = target_tokens
+        self._min_recent_turns = min_recent_turns
+        self._records = records
+        self._task: asyncio.Task[None] | None = None
+        self.summary = ""
+        self.facts: list[str] = []
+        self.compactions = 0
+
+    def start(self) -> None:
+        self._session.on("conversation_item_added", self._on_item_added)
+
+    async def aclose(self) -> None:
+        self._session.off("conversation_item_added", self._on_item_added)
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+
+    @property
+    def history_tokens(self) -> int:
+        return estimate_tokens(self._history(self._agent.chat_ctx.items))
+
+    async def compact(self) -> bool:
+        """Fold the oldest turns into the summary, returns whether anything changed."""
+        items = self._agent.chat_ctx.items
+        history = self._history(items)
+        cut = self._cut_index(history)
+        if cut is None:
+            return False
+
+        start = time.perf_counter()
+        before = estimate_tokens(history)
+        dropped = history[:cut]
+        summary = await self._summarize(dropped)
+
+        # the conversation went on while the summary was written, keep all of it
+        current = self._agent.chat_ctx.copy()
+        first_kept = history[cut].id
+        index = next(
+            (i for i, item in enumerate(current.items) if item.id == first_kept), None
+        )
+        if index is None:
+            return False
+
+        self.summary = summary
+        self.facts = self._pinned_facts(before=current.items[index].created_at)
+        header = [
+            item
+            for item in current.items[:index]
+            if item.type == "message"
+            and item.role == "system"
+            and item.id != SUMMARY_ITEM_ID
+        ]
+        # dated right before the first kept item, so inserts by time stay ordered
+        summary_message = self._summary_message(
+            created_at=current.items[index].created_at - 1e-3
+        )
+        new_ctx = llm.ChatContext([*header, summary_message, *current.items[index:]])
+        await self._agent.update_chat_ctx(new_ctx)
+
+        self.compactions += 1
+        logger.info(
+            "compacted chat context from ~%d to ~%d tokens in %.0fms",
+            before,
+            self.history_tokens,
+            (time.perf_counter() - start) * 1000,
+        )
+        return True
+
+    def _on_item_added(self, ev: ConversationItemAddedEvent) -> None:
+        if ev.item.type != "message" or ev.item.role != "assistant":
+            return
+        if self._task is not None and not self._task.done():
+            return
+        if self.history_tokens <= self._max_tokens:
+            return
+        self._task = asyncio.create_task(self._compact_task())
+
+    async def _compact_task(self) -> None:
+        try:
+            await self.compact()
+        except Exception as e:
+            # keep the full history, the next turn retries
+            logger.warning("failed to compact chat context: %s", e)
+
+    def _history(self, items: Sequence[llm.ChatItem]) -> list[llm.ChatItem]:
+        # everything but the instructions and the summary itself
+        return [
+            item
+            for item in items
+            if not (item.type == "message" and item.role == "system")
+        ]
+
+    def _cut_index(self, history: list[llm.ChatItem]) -> int | None:
+        # only cut in front of a user message, so calls stay with their outputs
+        user_turns = [
+            i
+            for i, item in enumerate(history)
+            if item.type == "message" and item.role == "user"
+        ]
+        candidates = user_turns[: len(user_turns) - self._min_recent_turns + 1]
+        candidates = [i for i in candidates if i > 0]
+        if not candidates:
+            return None
+        for i in candidates:
+            if estimate_tokens(history[i:]) <= self._target_tokens:
+                return i
+        return candidates[-1]
+
+    async def _summarize(self, items: list[llm.ChatItem]) -> str:
+        lines = [
+            f"{'Patient' if item.role == 'user' else 'Companion'}: {item.text_content}"
+            for item in items
+            if item.type == "message" and item.text_content
+        ]
+        if not lines:
+            return self.summary
+
+        chat_ctx = llm.ChatContext.empty()
+        chat_ctx.add_message(role="system", content=SUMMARY_INSTRUCTIONS)
+        chat_ctx.add_message(
+            role="user",
+            content=(
+                f"Summary so far:\n{self.summary or '(none)'}\n\n"
+                "Conversation to add:\n" + "\n".join(lines)
+            ),
+        )
+        parts: list[str] = []
+        async with self._llm.chat(chat_ctx=chat_ctx) as stream:
+            async for chunk in stream:
+                if chunk.delta and chunk.delta.content:
+                    parts.append(chunk.delta.content)
+        return "".join(parts).strip() or self.summary
+
+    def _pinned_facts(self, *, before: float) -> list[str]:
+        # rebuilt from the records as they are now, so values completed after
+        # their turn was compacted are up to date too
+        if self._records is None:
+            return []
+        return [
+            f"{record.MESSAGE_TYPE}: {record.describe()}"
+            for ts, record in self._records()
+            if ts < before
+        ]
+
+    def _summary_message(self, *, created_at: float) -> llm.ChatMessage:
+        content = "Summary of the earlier part of this session:\n" + (
+            self.summary or "(nothing notable)"
+        )
+        if self.facts:
+            content += "\n\nRecorded earlier in this session:\n" + "\n".join(
+                f"- {fact}" for fact in self.facts
+            )
+        return llm.ChatMessage(
+            id=SUMMARY_ITEM_ID, role="system", content=[content], created_at=created_at
+        )
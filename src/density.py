@@ -0,0 +1,311 @@
+"""High-density worker mode.
+
+Packs as many therapy sessions onto one node as its CPU and memory allow,
+instead of the default worker settings that assume little about the hardware:
+
+- Read-only models are shared. The fork server that job processes are forked
+  from preloads ``shared_models`` (the VAD) and the pipeline's plugins, so
+  every job process shares those pages copy-on-write. The turn detector already
+  runs in the worker's shared inference process.
+- Load is reported from measurements. ``SessionLoadMonitor`` samples the CPU
+  and proportional memory (PSS) of the whole worker process tree, learns what
+  one session costs on top of the idle baseline, and reports the load of the
+  worker as the share of the sessions that fit its budget, or of the budget
+  itself if the measurements say it is already used up.
+- Admission control. Job requests are rejected once the next session would
+  not fit, even if the server dispatched it before it saw the last load update.
+
+Enable it with ``WORKER_DENSITY=high``. The budgets and the initial per-session
+estimates can be tuned to the hardware through the ``DENSITY_*`` variables, see
+``DensityConfig``.
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import logging
+import math
+import os
+import threading
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+
+import psutil
+from livekit.agents import JobRequest, Plugin, Worker, WorkerOptions
+from livekit.agents.utils.hw import get_cpu_monitor
+
+from startup import PreloadPlugin
+
+logger = logging.getLogger("agent")
+
+DENSITY_ENV = "WORKER_DENSITY"
+
+# imported by the fork server before job processes are forked
+PRELOAD_MODULES = "shared_models", "components"
+
+_MB = 1024 * 1024
+
+
+@dataclass(frozen=True)
+class DensityConfig:
+    """Capacity budget of a high-density worker.
+
+    Args:
+        cpu_budget: Share of the node's CPUs sessions may use.
+        memory_budget: Share of the node's memory sessions may use.
+        session_cpu: CPUs one session uses, until it has been measured.
+        session_memory_mb: Memory one session uses, until it has been measured.
+        max_sessions: Hard cap on concurrent sessions, 0 for none.
+        idle_processes: Prewarmed processes kept ready for new sessions.
+    """
+
+    cpu_budget: float = 0.8
+    memory_budget: float = 0.8
+    session_cpu: float = 0.15
+    session_memory_mb: float = 150.0
+    max_sessions: int = 0
+    idle_processes: int = 2
+
+    @classmethod
+    def from_env(cls) -> DensityConfig:
+        defaults = cls()
+        return cls(
+            cpu_budget=float(os.getenv("DENSITY_CPU_BUDGET", defaults.cpu_budget)),
+            memory_budget=float(
+                os.getenv("DENSITY_MEMORY_BUDGET", defaults.memory_budget)
+            ),
+            session_cpu=float(os.getenv("DENSITY_SESSION_CPU", defaults.session_cpu)),
+            session_memory_mb=float(
+                os.getenv("DENSITY_SESSION_MEMORY_MB", defaults.session_memory_mb)
+            ),
+            max_sessions=int(os.getenv("DENSITY_MAX_SESSIONS", defaults.max_sessions)),
+            idle_processes=int(
+                os.getenv("DENSITY_IDLE_PROCESSES", defaults.idle_processes)
+            ),
+        )
+
+
+class SessionLoadMonitor:
+    """Measured load of a worker, in terms of sessions it can still host.
+
+    Args:
+        config: Capacity budget.
+        sample: Returns the CPUs and bytes of memory the worker process tree
+            currently uses, defaults to measuring it with psutil.
+        cpu_count: CPUs of the node (or its cgroup), detected by default.
+        memory_total: Memory of the node (or its cgroup), detected by default.
+        memory_interval: Seconds between memory samples, reading the PSS of
+            every process is more expensive than its CPU time.
+    """
+
+    # weight of a new measurement in the per-session estimates
+    SMOOTHING = 0.2
+
+    def __init__(
+        self,
+        config: DensityConfig,
+        *,
+        sample: Callable[[bool], tuple[float, int | None]] | None = None,
+        cpu_count: float | None = None,
+        memory_total: int | None = None,
+        memory_interval: float = 5.0,
+    ) -> None:
+        self._config = config
+        self._sample = sample or _ProcessTreeSampler()
+        self._cpu_capacity = (cpu_count or get_cpu_monitor().cpu_count()) * (
+            config.cpu_budget
+        )
+        self._memory_capacity = (memory_total or _memory_total()) * config.memory_budget
+        self._memory_interval = memory_interval
+        self._last_memory_sample = -math.inf
+        self._lock = threading.Lock()
+
+        self.active = 0
+        self.admitted = 0
+        self.cpu_used = 0.0
+        self.memory_used = 0
+        self.baseline_cpu = 0.0
+        self.baseline_memory: int | None = None
+        self.session_cpu = config.session_cpu
+        self.session_memory = config.session_memory_mb * _MB
+
+    @property
+    def max_sessions(self) -> int:
+        """Sessions that fit the budget with the current per-session estimates."""
+        baseline_memory = self.baseline_memory or 0
+        fit = min(
+            (self._cpu_capacity - self.baseline_cpu) / self.session_cpu,
+            (self._memory_capacity - baseline_memory) / self.session_memory,
+        )
+        fit = max(int(fit), 1)
+        return min(fit, self._config.max_sessions) if self._config.max_sessions else fit
+
+    def update(self, active: int) -> float:
+        """Take a sample with ``active`` sessions running and return the load."""
+        now = time.monotonic()
+        with_memory = now - self._last_memory_sample >= self._memory_interval
+        cpu, memory = self._sample(with_memory)
+        if memory is not None:
+            self._last_memory_sample = now
+
+        with self._lock:
+            self.active = active
+            # sessions admitted since the last sample are running now
+            self.admitted = 0
+            self.cpu_used = cpu
+            if memory is not None:
+                self.memory_used = memory
+
+            if active == 0:
+                self.baseline_cpu = _smooth(self.baseline_cpu, cpu)
+                if memory is not None:
+                    self.baseline_memory = (
+                        memory
+                        if self.baseline_memory is None
+                        else int(_smooth(self.baseline_memory, memory))
+                    )
+            else:
+                per_session_cpu = max(cpu - self.baseline_cpu, 0.0) / active
+                self.session_cpu = max(_smooth(self.session_cpu, per_session_cpu), 0.01)
+                if memory is not None and self.baseline_memory is not None:
+                    per_session_memory = max(memory - self.baseline_memory, 0) / active
+                    self.session_memory = max(
+                        _smooth(self.session_memory, per_session_memory), _MB
+                    )
+            return self._load()
+
+    def load(self) -> float:
+        with self._lock:
+            return self._load()
+
+    def admit(self) -> bool:
+        """Reserve room for one more session, False if it wouldn't fit."""
+        with self._lock:
+            if self._load() >= 1.0:
+                return False
+            self.admitted += 1
+            return True
+
+    def _load(self) -> float:
+        # sessions admitted since the last sample aren't in the measurements yet
+        cpu = self.cpu_used + self.admitted * self.session_cpu
+        memory = self.memory_used + self.admitted * self.session_memory
+        load = max(
+            (self.active + self.admitted) / self.max_sessions,
+            cpu / self._cpu_capacity,
+            memory / self._memory_capacity,
+        )
+        return min(load, 1.0)
+
+
+class _ProcessTreeSampler:
+    """CPU and PSS of this process and all of its descendants."""
+
+    def __init__(self) -> None:
+        self._root = psutil.Process()
+        self._procs: dict[int, psutil.Process] = {}
+
+    def __call__(self, with_memory: bool) -> tuple[float, int | None]:
+        procs = [self._root, *self._root.children(recursive=True)]
+        alive: dict[int, psutil.Process] = {}
+        cpu = 0.0
+        memory = 0
+        for proc in procs:
+            # keep the Process objects, cpu_percent is relative to the last call
+            proc = self._procs.get(proc.pid, proc)
+            try:
+                cpu += proc.cpu_percent(None) / 100
+                if with_memory:
+                    memory += _pss(proc)
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+            alive[proc.pid] = proc
+        self._procs = alive
+        return cpu, memory if with_memory else None
+
+
+def _pss(proc: psutil.Process) -> int:
+    # shared pages are split between the processes sharing them, RSS would
+    # count the shared models once per process
+    info = proc.memory_full_info()
+    return getattr(info, "pss", info.rss)
+
+
+def _memory_total() -> int:
+    total = psutil.virtual_memory().total
+    try:
+        with open("/sys/fs/cgroup/memory.max") as f:
+            limit = f.read().strip()
+    except OSError:
+        return total
+    return min(total, int(limit)) if limit.isdigit() else total
+
+
+def _smooth(estimate: float, sample: float) -> float:
+    return estimate + SessionLoadMonitor.SMOOTHING * (sample - estimate)
+
+
+_monitor: SessionLoadMonitor | None = None
+
+
+def _get_monitor() -> SessionLoadMonitor:
+    global _monitor
+    if _monitor is None:
+        _monitor = SessionLoadMonitor(DensityConfig.from_env())
+    return _monitor
+
+
+def _load_fnc(worker: Worker) -> float:
+    monitor = _get_monitor()
+    load = monitor.update(len(worker.active_jobs))
+    logger.debug(
+        "worker load %.2f, %d/%d sessions, %.2f cpus and %.0fMB per session",
+        load,
+        monitor.active,
+        monitor.max_sessions,
+        monitor.session_cpu,
+        monitor.session_memory / _MB,
+    )
+    return load
+
+
+async def _request_fnc(req: JobRequest) -> None:
+    monitor = _get_monitor()
+    if not monitor.admit():
+        logger.info(
+            "rejecting job %s, worker is at capacity (%d sessions)",
+            req.id,
+            monitor.active,
+        )
+        await req.reject()
+        return
+    await req.accept()
+
+
+def high_density_options(
+    options: WorkerOptions, config: DensityConfig | None = None
+) -> WorkerOptions:
+    """Options for a worker that hosts as many sessions as the node fits.
+
+    Must be called in the worker's main process before it starts.
+    """
+    config = config or DensityConfig.from_env()
+    global _monitor
+    _monitor = SessionLoadMonitor(config)
+
+    if options.multiprocessing_context == "forkserver":
+        for package in PRELOAD_MODULES:
+            Plugin.register_plugin(PreloadPlugin(package))
+    else:
+        logger.warning("models can only be shared with the forkserver context")
+
+    return dataclasses.replace(
+        options,
+        load_fnc=_load_fnc,
+        request_fnc=_request_fnc,
+        # the load is already relative to the budget
+        load_threshold=1.0,
+        num_idle_processes=config.idle_processes,
+        job_memory_warn_mb=config.session_memory_mb * 2,
+    )
@@ -0,0 +1,231 @@
+"""Deterministic fast path for tracking metrics stated in a transcript.
+
+Logging a rating through a tool costs an extra LLM round trip before the spoken
+reply. Most ratings are stated plainly though ("my pain is a 7", "I got six
+hours of sleep"), so a small grammar pulls those out of the final transcript
+before the LLM runs. The agent records and publishes them right away and tells
+the LLM what was recorded, the LLM only calls the tool to add details.
+
+The grammar prefers precision over recall: anything it misses is still up to
+the LLM, a wrong value would be recorded without anyone asking for it.
+"""
+
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from typing import Any
+
+from records import RECORD_TYPES, InvalidRecordError
+
+_NUMBER_WORDS = {
+    "zero": 0,
+    "one": 1,
+    "two": 2,
+    "three": 3,
+    "four": 4,
+    "five": 5,
+    "six": 6,
+    "seven": 7,
+    "eight": 8,
+    "nine": 9,
+    "ten": 10,
+    "eleven": 11,
+    "twelve": 12,
+}
+_COUNT_WORDS = {**_NUMBER_WORDS, "once": 1, "twice": 2, "no": 0}
+
+_NUMBER_ALTERNATIVES = r"\d{1,2}(?:\.\d)?|" + "|".join(_NUMBER_WORDS)
+_NUMBER = rf"(?P<n>{_NUMBER_ALTERNATIVES})"
+_HALF = r"(?P<half>\s+and\s+a\s+half)?"
+# a few words between the subject and the value, e.g. "pain's been about a 7"
+_FILLER = (
+    r"(?:\s*'s|\s+(?:is|was|been|has|at|about|around|like|maybe|probably|really|"
+    r"pretty|a|an|of|level|rating|right\s+now|today|now|i'd|say|rate|it|would|be|"
+    r"sitting|solid))*"
+)
+_OUT_OF_TEN = r"\s*(?:/|out\s+of|on\s+a\s+scale\s+of)\s*(?:10|ten)\b"
+# a number followed by one of these is a duration or count, not a rating
+_NOT_A_RATING = (
+    r"(?!\s*(?:%|percent|days?|weeks?|months?|years?|hours?|hrs?|mins?|minutes?|"
+    r"times?|pills?|mg|am|pm|o'clock)\b)"
+)
+# "a 6, no, more like a 7"
+_CORRECTION = (
+    r"(?:,?\s+(?:no|actually|sorry|or)\b,?(?:\s+(?:more|like|maybe|probably|"
+    rf"make|it|a|an))*\s+(?P<fix>{_NUMBER_ALTERNATIVES})\b{_NOT_A_RATING})?"
+)
+
+_RATINGS = {
+    ("pain_assessment", "painLevel"): r"\bpain(?:\s+level)?",
+    ("sleep_quality", "sleepQuality"): r"\bsleep(?:\s+quality)?",
+    ("mood_assessment", "moodRating"): r"\bmood",
+    ("mood_assessment", "energyLevel"): r"\benergy(?:\s+level)?",
+}
+_RATING_PATTERNS = {
+    key: (
+        re.compile(
+            subject + _FILLER + r"\s+" + _NUMBER + r"\b" + _NOT_A_RATING + _CORRECTION
+        ),
+        # with an explicit scale the value may be further from its subject,
+        # as in "my sleep was terrible, maybe a 3 out of 10"
+        re.compile(subject + r"(?:[\s,]+[a-z']+){0,5}?[\s,]+" + _NUMBER + _OUT_OF_TEN),
+    )
+    for key, subject in _RATINGS.items()
+}
+
+# the hours must be next to a word about sleep: "I got 2 hours of work done"
+# isn't sleep, "I got 6 hours of sleep" is
+_HOURS_SLEPT = (
+    re.compile(
+        r"\b(?:slept|sleep)\b(?:\s+(?:for|about|around|maybe|only|just|"
+        r"like|a\s+solid|roughly|barely))*\s+"
+        + _NUMBER
+        + _HALF
+        + r"\s*(?:hours?|hrs?)\b"
+    ),
+    re.compile(_NUMBER + _HALF + r"\s*(?:hours?|hrs?)\s+(?:of\s+)?sleep\b"),
+)
+_WAKE_UPS = re.compile(
+    r"\bwoke(?:\s+up)?\s+"
+    + r"(?P<n>\d{1,2}|"
+    + "|".join(_COUNT_WORDS)
+    + r")(?:\s+times?)?\b(?=\s+(?:times?|last|during|in|overnight|that)|[\s.,!?]*$)"
+)
+
+# a statement about something other than the present, leave it to the LLM
+_HYPOTHETICAL = re.compile(
+    r"\b(?:if|when(?:ever)?|would|could|should|usually|normally|goal|want|hope|"
+    r"used\s+to|last\s+(?:week|month|year))\b"
+)
+# pain and mood are recorded as the patient feels now, a rating from earlier
+# in the day ("my pain was a 9 yesterday") is left to the LLM too
+_EARLIER = re.compile(
+    r"\b(?:yesterday|earlier|this\s+morning|last\s+night|the\s+other\s+day)\b"
+)
+_CURRENT_STATE = frozenset({"pain_assessment", "mood_assessment"})
+_CLAUSES = re.compile(r"[.!?;]+|\bbut\b")
+
+PAIN_LOCATIONS = (
+    "lower back",
+    "upper back",
+    "back",
+    "neck",
+    "shoulders",
+    "shoulder",
+    "hips",
+    "hip",
+    "knees",
+    "knee",
+    "head",
+    "legs",
+    "joints",
+    "stomach",
+    "feet",
+    "hands",
+    "widespread",
+)
+PAIN_QUALITIES = (
+    "sharp",
+    "dull",
+    "burning",
+    "throbbing",
+    "aching",
+    "stabbing",
+    "shooting",
+    "tingling",
+    "cramping",
+)
+_LOCATION = re.compile(r"\b(" + "|".join(PAIN_LOCATIONS) + r")\b")
+_QUALITY = re.compile(r"\b(" + "|".join(PAIN_QUALITIES) + r")\b")
+
+# tool that records each message type, so the LLM can be told which to skip
+TOOLS = {
+    "pain_assessment": "log_pain_assessment",
+    "sleep_quality": "track_sleep_quality",
+    "mood_assessment": "assess_mood_and_functioning",
+}
+
+
+@dataclass(frozen=True)
+class Extraction:
+    """Tracking values of one message type stated in a transcript."""
+
+    message_type: str
+    data: dict[str, Any]
+
+    @property
+    def tool(self) -> str:
+        return TOOLS[self.message_type]
+
+    def describe(self) -> str:
+        return ", ".join(f"{name} {value}" for name, value in self.data.items())
+
+
+def extract_metrics(text: str) -> list[Extraction]:
+    """Ratings, hours slept and wake-ups stated in ``text``.
+
+    Only values of the tools' data fields are returned, keyed like the records
+    the tools write. When a value is stated more than once the last one wins,
+    so corrections ("a 6, no, more like a 7") are picked up.
+    """
+    found: dict[str, dict[str, Any]] = {}
+    for clause in _CLAUSES.split(text.lower()):
+        if _HYPOTHETICAL.search(clause):
+            continue
+        earlier = _EARLIER.search(clause) is not None
+
+        for (message_type, field), patterns in _RATING_PATTERNS.items():
+            if earlier and message_type in _CURRENT_STATE:
+                continue
+            for pattern in patterns:
+                for match in pattern.finditer(clause):
+                    value = _number(match)
+                    if value is not None and _valid(message_type, field, value):
+                        found.setdefault(message_type, {})[field] = value
+
+        for pattern in _HOURS_SLEPT:
+            for match in pattern.finditer(clause):
+                value = _number(match)
+                if value is not None and 0 < value <= 16:
+                    found.setdefault("sleep_quality", {})["hoursSlept"] = value
+
+        for match in _WAKE_UPS.finditer(clause):
+            count = match.group("n")
+            found.setdefault("sleep_quality", {})["wakeUps"] = (
+                int(count) if count.isdigit() else _COUNT_WORDS[count]
+            )
+
+        pain = found.get("pain_assessment")
+        if pain is not None and "painLevel" in pain:
+            if location := _LOCATION.search(clause):
+                pain.setdefault("location", location.group(1))
+            if quality := _QUALITY.search(clause):
+                pain.setdefault("quality", quality.group(1))
+
+    # wake-ups alone don't make a sleep record worth writing
+    sleep = found.get("sleep_quality")
+    if sleep is not None and sleep.keys() == {"wakeUps"}:
+        del found["sleep_quality"]
+    return [Extraction(message_type, data) for message_type, data in found.items()]
+
+
+def _valid(message_type: str, name: str, value: float) -> bool:
+    field = next(f for f in RECORD_TYPES[message_type].FIELDS if f.name == name)
+    try:
+        field.check(value)
+    except InvalidRecordError:
+        return False
+    return True
+
+
+def _number(match: re.Match[str]) -> float | None:
+    groups = match.groupdict()
+    raw = groups.get("fix") or groups["n"]
+    try:
+        value = float(raw) if raw[0].isdigit() else float(_NUMBER_WORDS[raw])
+    except (KeyError, ValueError):
+        return None
+    if groups.get("half"):
+        value += 0.5
+    return int(value) if value == int(value) else value
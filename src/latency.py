@@ -0,0 +1,466 @@
+"""Per-turn latency profiling for the voice pipeline.
+
+``LatencyProfiler`` joins the metrics the session emits during one user turn
+(end of utterance, transcription, LLM, TTS, tool calls) into a ``TurnLatency``
+record, including the end-to-end delay between the user stopping to speak and
+the first agent audio and how many of the turn's prompt tokens were served from
+the provider's prefix cache. Every stage feeds a log-linear ("HDR-style")
+histogram so percentiles stay accurate to ~1.5% without keeping every sample.
+Safety referrals spoken by the fast path in safety.py are a stage of their own,
+its count is the number of red flags acted on. So is the lag of the job's event
+loop, sampled by loop_monitor.py.
+
+Job processes periodically write their histograms to a per-worker snapshot
+directory, from a thread so the file I/O never stalls the event loop the
+metrics arrive on. ``serve_latency_metrics`` runs in the worker's main process,
+merges the snapshots and exposes p50/p95/p99 in Prometheus text format.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import math
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+from livekit.agents import metrics
+from livekit.agents.voice import FunctionToolsExecutedEvent
+
+if TYPE_CHECKING:
+    from safety import RedFlag
+
+logger = logging.getLogger("agent")
+
+METRICS_DIR_ENV = "LATENCY_METRICS_DIR"
+QUANTILES = (0.5, 0.95, 0.99)
+STAGES = (
+    "e2e",
+    "eou",
+    "transcription",
+    "llm_ttft",
+    "tts_ttfb",
+    "tools",
+    "safety",
+    "loop_lag",
+)
+
+# sub-buckets per power of two, bounds the relative error to 1/128
+_SUB_BUCKETS = 64
+# values are recorded in microseconds, anything below lands in bucket 0
+_MIN_VALUE_US = 1.0
+
+
+class LatencyHistogram:
+    """Sparse log-linear histogram of durations in seconds."""
+
+    def __init__(self) -> None:
+        self.counts: dict[int, int] = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float) -> None:
+        if seconds < 0 or math.isnan(seconds):
+            return
+        key = self._bucket(seconds * 1e6)
+        self.counts[key] = self.counts.get(key, 0) + 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(q * self.count))
+        seen = 0
+        for key in sorted(self.counts):
+            seen += self.counts[key]
+            if seen >= rank:
+                return min(self._value(key) / 1e6, self.max)
+        return self.max
+
+    def merge(self, other: LatencyHistogram) -> None:
+        for key, n in other.counts.items():
+            self.counts[key] = self.counts.get(key, 0) + n
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "counts": self.counts,
+            "count": self.count,
+            "total": self.total,
+            "max": self.max,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> LatencyHistogram:
+        hist = cls()
+        hist.counts = {int(k): v for k, v in data["counts"].items()}
+        hist.count = data["count"]
+        hist.total = data["total"]
+        hist.max = data["max"]
+        return hist
+
+    @staticmethod
+    def _bucket(value_us: float) -> int:
+        if value_us < _MIN_VALUE_US:
+            return 0
+        mantissa, exponent = math.frexp(value_us)
+        return exponent * _SUB_BUCKETS + int((mantissa - 0.5) * 2 * _SUB_BUCKETS)
+
+    @staticmethod
+    def _value(key: int) -> float:
+        if key == 0:
+            return 0.0
+        exponent, sub = divmod(key, _SUB_BUCKETS)
+        # midpoint of the bucket
+        return math.ldexp(0.5 + (sub + 0.5) / (2 * _SUB_BUCKETS), exponent)
+
+
+@dataclass
+class TurnLatency:
+    """Latency breakdown of one user turn, in seconds."""
+
+    speech_id: str | None = None
+    user_stopped_at: float = 0.0
+    eou_delay: float = 0.0
+    transcription_delay: float = 0.0
+    llm_ttft: float | None = None
+    llm_calls: int = 0
+    prompt_tokens: int = 0
+    prompt_cached_tokens: int = 0
+    tool_calls: int = 0
+    tool_time: float = 0.0
+    tts_ttfb: float | None = None
+    e2e: float | None = None
+
+
+@dataclass
+class _HistogramSet:
+    stages: dict[str, LatencyHistogram] = field(
+        default_factory=lambda: {s: LatencyHistogram() for s in STAGES}
+    )
+
+    def merge(self, other: _HistogramSet) -> None:
+        for stage, hist in other.stages.items():
+            self.stages.setdefault(stage, LatencyHistogram()).merge(hist)
+
+    def record(self, stage: str, seconds: float) -> None:
+        self.stages[stage].record(seconds)
+
+
+# every session of this process, this is what the snapshots export
+_process_histograms = _HistogramSet()
+
+
+class LatencyProfiler:
+    """Joins a session's metrics events into per-turn latency records.
+
+    Feed it every ``metrics_collected`` and ``function_tools_executed`` event.
+    A turn starts with the end-of-utterance metrics and is complete once the
+    first TTS audio of the reply was produced, tool round trips included.
+    """
+
+    def __init__(self, *, snapshot_interval: float = 10.0) -> None:
+        self.histograms = _HistogramSet()
+        self.turns: deque[TurnLatency] = deque(maxlen=1000)
+        self._current: TurnLatency | None = None
+        self._snapshot_interval = snapshot_interval
+        self._last_snapshot = 0.0
+        self._snapshot_due = False
+        self._snapshot_task: asyncio.Task[None] | None = None
+        self.prompt_tokens = 0
+        self.prompt_cached_tokens = 0
+
+    def on_metrics(self, m: metrics.AgentMetrics) -> None:
+        if isinstance(m, metrics.EOUMetrics):
+            self._current = TurnLatency(
+                speech_id=m.speech_id,
+                user_stopped_at=m.last_speaking_time,
+                eou_delay=m.end_of_utterance_delay,
+                transcription_delay=m.transcription_delay,
+            )
+        elif self._current is None:
+            return
+        elif isinstance(m, metrics.LLMMetrics):
+            self._current.llm_calls += 1
+            self._current.prompt_tokens += m.prompt_tokens
+            self._current.prompt_cached_tokens += m.prompt_cached_tokens
+            if self._current.llm_ttft is None:
+                self._current.llm_ttft = m.ttft
+        elif isinstance(m, metrics.TTSMetrics) and not m.cancelled:
+            # TTS metrics are emitted once synthesis is done
+            first_audio_at = m.timestamp - m.duration + m.ttfb
+            self._current.tts_ttfb = m.ttfb
+            self._current.e2e = first_audio_at - self._current.user_stopped_at
+            self._complete(self._current)
+            self._current = None
+
+    def on_tools_executed(self, ev: FunctionToolsExecutedEvent) -> None:
+        if self._current is None or not ev.function_calls:
+            return
+        outputs = [o for o in ev.function_call_outputs if o is not None]
+        started = min(c.created_at for c in ev.function_calls)
+        finished = max((o.created_at for o in outputs), default=ev.created_at)
+        self._current.tool_calls += len(ev.function_calls)
+        self._current.tool_time += max(0.0, finished - started)
+
+    def on_safety_referral(self, flag: RedFlag, response_time: float) -> None:
+        """Record the time from the patient's pause to the first audio of a referral."""
+        self.histograms.record("safety", response_time)
+        _process_histograms.record("safety", response_time)
+        logger.info(
+            "safety referral",
+            extra={
+                "safety_referral": {"category": flag.category, "e2e": response_time}
+            },
+        )
+        # red flags are rare, export them right away
+        self._schedule_snapshot()
+
+    def on_loop_lag(self, lag: float) -> None:
+        """Record how late the event loop ran a callback scheduled on time."""
+        self.histograms.record("loop_lag", lag)
+        _process_histograms.record("loop_lag", lag)
+
+    @property
+    def prompt_cache_hit_rate(self) -> float:
+        """Share of the prompt tokens of completed turns served from the provider's cache."""
+        return (
+            self.prompt_cached_tokens / self.prompt_tokens
+            if self.prompt_tokens
+            else 0.0
+        )
+
+    def summary(self) -> dict[str, dict[str, float]]:
+        summary = _summarize(self.histograms)
+        if self.prompt_tokens:
+            summary["prompt"] = {
+                "tokens": self.prompt_tokens,
+                "cached_tokens": self.prompt_cached_tokens,
+                "cache_hit_rate": round(self.prompt_cache_hit_rate, 4),
+            }
+        return summary
+
+    def write_snapshot(self, directory: str | None = None) -> None:
+        """Write the histograms of all sessions in this process for the worker's endpoint.
+
+        Blocks on the file I/O, on the event loop use ``awrite_snapshot``.
+        """
+        directory = directory or os.environ.get(METRICS_DIR_ENV)
+        if not directory:
+            return
+        _write_histograms(Path(directory) / f"{os.getpid()}.json", _process_histograms)
+        self._last_snapshot = time.monotonic()
+
+    async def awrite_snapshot(self) -> None:
+        """Write the histograms like ``write_snapshot``, with the file I/O in a thread."""
+        self._schedule_snapshot()
+        if self._snapshot_task is not None:
+            await self._snapshot_task
+
+    def _schedule_snapshot(self) -> None:
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            # not on an event loop, there is nothing to stall
+            try:
+                self.write_snapshot()
+            except OSError as e:
+                logger.warning("failed to write latency snapshot: %s", e)
+            return
+        # one write at a time, a write asked for meanwhile follows it
+        self._snapshot_due = True
+        if self._snapshot_task is None or self._snapshot_task.done():
+            self._snapshot_task = asyncio.create_task(self._write_snapshots())
+
+    async def _write_snapshots(self) -> None:
+        while self._snapshot_due:
+            self._snapshot_due = False
+            directory = os.environ.get(METRICS_DIR_ENV)
+            if not directory:
+                return
+            # serialized here, the histograms are only updated on this loop
+            text = _dump_histograms(_process_histograms)
+            self._last_snapshot = time.monotonic()
+            try:
+                await asyncio.to_thread(
+                    _write_text, Path(directory) / f"{os.getpid()}.json", text
+                )
+            except OSError as e:
+                logger.warning("failed to write latency snapshot: %s", e)
+
+    def _complete(self, turn: TurnLatency) -> None:
+        self.turns.append(turn)
+        self.prompt_tokens += turn.prompt_tokens
+        self.prompt_cached_tokens += turn.prompt_cached_tokens
+        samples = [("eou", turn.eou_delay), ("transcription", turn.transcription_delay)]
+        if turn.llm_ttft is not None:
+            samples.append(("llm_ttft", turn.llm_ttft))
+        if turn.tts_ttfb is not None:
+            samples.append(("tts_ttfb", turn.tts_ttfb))
+        if turn.tool_calls:
+            samples.append(("tools", turn.tool_time))
+        if turn.e2e is not None:
+            samples.append(("e2e", turn.e2e))
+        for stage, seconds in samples:
+            self.histograms.record(stage, seconds)
+            _process_histograms.record(stage, seconds)
+
+        logger.info("turn latency", extra={"turn_latency": asdict(turn)})
+        if time.monotonic() - self._last_snapshot >= self._snapshot_interval:
+            self._schedule_snapshot()
+
+
+def _summarize(histograms: _HistogramSet) -> dict[str, dict[str, float]]:
+    return {
+        stage: {
+            "count": hist.count,
+            **{f"p{round(q * 100)}": round(hist.percentile(q), 4) for q in QUANTILES},
+        }
+        for stage, hist in histograms.stages.items()
+        if hist.count
+    }
+
+
+def _load_snapshot(path: Path) -> _HistogramSet:
+    data = json.loads(path.read_text())
+    return _HistogramSet({s: LatencyHistogram.from_dict(h) for s, h in data.items()})
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def collect_snapshots(directory: str) -> _HistogramSet:
+    """Merge every snapshot in ``directory``.
+
+    Snapshots of exited job processes are folded into ``retired.json`` so the
+    directory doesn't grow with every job the worker ever ran.
+    """
+    path = Path(directory)
+    retired_path = path / "retired.json"
+    retired = _load_snapshot(retired_path) if retired_path.exists() else _HistogramSet()
+    live = _HistogramSet()
+    dead: list[Path] = []
+
+    for snapshot in path.glob("[0-9]*.json"):
+        try:
+            histograms = _load_snapshot(snapshot)
+        except (OSError, ValueError):
+            continue
+        if _pid_alive(int(snapshot.stem)):
+            live.merge(histograms)
+        else:
+            retired.merge(histograms)
+            dead.append(snapshot)
+
+    if dead:
+        _write_histograms(retired_path, retired)
+        for snapshot in dead:
+            snapshot.unlink(missing_ok=True)
+
+    merged = _HistogramSet()
+    merged.merge(retired)
+    merged.merge(live)
+    return merged
+
+
+def _write_histograms(path: Path, histograms: _HistogramSet) -> None:
+    _write_text(path, _dump_histograms(histograms))
+
+
+def _dump_histograms(histograms: _HistogramSet) -> str:
+    return json.dumps({s: h.to_dict() for s, h in histograms.stages.items()})
+
+
+def _write_text(path: Path, text: str) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.tmp")
+    tmp.write_text(text)
+    tmp.replace(path)
+
+
+def render_prometheus(histograms: _HistogramSet) -> str:
+    lines = [
+        "# HELP therapist_turn_latency_seconds Per-stage latency of user turns"
+        " and the lag of job event loops",
+        "# TYPE therapist_turn_latency_seconds summary",
+    ]
+    for stage, hist in histograms.stages.items():
+        for q in QUANTILES:
+            lines.append(
+                f'therapist_turn_latency_seconds{{stage="{stage}",quantile="{q}"}} '
+                f"{hist.percentile(q):.6f}"
+            )
+        lines.append(
+            f'therapist_turn_latency_seconds_sum{{stage="{stage}"}} {hist.total:.6f}'
+        )
+        lines.append(
+            f'therapist_turn_latency_seconds_count{{stage="{stage}"}} {hist.count}'
+        )
+    return "\n".join(lines) + "\n"
+
+
+def serve_latency_metrics(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Serve the merged latency percentiles of this worker on ``/metrics``.
+
+    Must be called in the worker's main process before it spawns job
+    processes, they inherit the snapshot directory through the environment.
+    """
+    directory = os.environ.setdefault(
+        METRICS_DIR_ENV,
+        tempfile.mkdtemp(prefix="therapist-latency-"),
+    )
+    lock = threading.Lock()
+
+    class _Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            if self.path not in ("/metrics", "/metrics.json"):
+                self.send_error(404)
+                return
+            with lock:
+                histograms = collect_snapshots(directory)
+            if self.path == "/metrics.json":
+                body, content_type = (
+                    json.dumps(_summarize(histograms)),
+                    "application/json",
+                )
+            else:
+                body, content_type = (
+                    render_prometheus(histograms),
+                    "text/plain; version=0.0.4",
+                )
+            payload = body.encode()
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format: str, *args: Any) -> None:  # noqa: A002
+            pass
+
+    server = ThreadingHTTPServer((host, port), _Handler)
+    threading.Thread(
+        target=server.serve_forever, name="latency_metrics", daemon=True
+    ).start()
+    logger.info("serving turn latency metrics on http://%s:%d/metrics", host, port)
+    return server
@@ -0,0 +1,183 @@
+"""Logging that stays off the event loop.
+
+In a job process every record is formatted and pickled by livekit's IPC
+handler on the thread that logged it, which for the agent is the event loop.
+``install`` moves that work to a thread:
+
+- the process's root handlers move behind a bounded queue. Logging only
+  enqueues the record, its message is formatted later by the listener
+  thread, so log with ``%``-style arguments, not f-strings. Records that don't
+  fit in the queue are dropped and counted instead of blocking.
+- records below WARNING are sampled per category, the logger and message
+  template, by ``SamplingFilter``. A record that passes carries the number of
+  records of its category dropped before it in ``sampled_out``.
+
+The handler behind the queue sends records to the worker's main process, which
+formats them: as JSON lines under ``start``, colored text under ``dev``. Extra
+attributes of a record, ``sampled_out`` and the room and job livekit sets from
+``ctx.log_context_fields``, end up as fields of the JSON output.
+
+``log_metrics`` logs pipeline metrics events, sampled before the record is even
+built, since most turns emit several of them.
+"""
+
+from __future__ import annotations
+
+import atexit
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+
+from livekit.agents import metrics
+
+# records waiting for the listener thread, more are dropped
+MAX_QUEUED_RECORDS = 10_000
+# records per second and category below WARNING, and the burst allowed
+SAMPLE_RATE = 5.0
+SAMPLE_BURST = 20.0
+# metrics events of each kind, ~one turn's worth every 5s
+METRICS_SAMPLE_RATE = 0.2
+# categories a sampler keeps buckets for, the least recently used go first
+MAX_SAMPLED_CATEGORIES = 1024
+
+_metrics_logger = logging.getLogger("agent.metrics")
+
+
+class RateSampler:
+    """Token bucket per category: ``rate`` per second, up to ``burst`` at once.
+
+    Buckets are kept for the ``max_categories`` categories used last, a
+    category seen again after that starts with a full bucket.
+    """
+
+    def __init__(
+        self,
+        rate: float = SAMPLE_RATE,
+        burst: float = SAMPLE_BURST,
+        *,
+        max_categories: int = MAX_SAMPLED_CATEGORIES,
+    ) -> None:
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self._max_categories = max_categories
+        self._buckets: OrderedDict[str, tuple[float, float, int]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def allow(self, category: str) -> int | None:
+        """Number of dropped records before this one if it may pass, else None."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, last, dropped = self._buckets.get(category, (self.burst, now, 0))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            if tokens < 1.0:
+                self._buckets[category] = (tokens, now, dropped + 1)
+                allowed = None
+            else:
+                self._buckets[category] = (tokens - 1.0, now, 0)
+                allowed = dropped
+            self._buckets.move_to_end(category)
+            if len(self._buckets) > self._max_categories:
+                self._buckets.popitem(last=False)
+            return allowed
+
+
+class SamplingFilter(logging.Filter):
+    """Samples records below WARNING per logger and message template."""
+
+    def __init__(self, sampler: RateSampler | None = None) -> None:
+        super().__init__()
+        self.sampler = RateSampler() if sampler is None else sampler
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        dropped = self.sampler.allow(f"{record.name}:{record.msg}")
+        if dropped is None:
+            return False
+        if dropped:
+            record.sampled_out = dropped
+        return True
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """Enqueues records as they are, formatting is left to the listener thread."""
+
+    def __init__(self, queue_: queue.Queue[Any]) -> None:
+        super().__init__(queue_)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_listener: logging.handlers.QueueListener | None = None
+
+
+def install(
+    *,
+    sampler: RateSampler | None = None,
+    max_queued: int = MAX_QUEUED_RECORDS,
+) -> NonBlockingQueueHandler | None:
+    """Move the root logger's handlers behind a queue, once per process.
+
+    Returns the queue handler, or None if it was already installed.
+    """
+    global _listener
+    if _listener is not None:
+        return None
+
+    root = logging.getLogger()
+    handlers = list(root.handlers)
+    handler = NonBlockingQueueHandler(queue.Queue(max_queued))
+    handler.addFilter(SamplingFilter(sampler))
+    for h in handlers:
+        root.removeHandler(h)
+    root.addHandler(handler)
+
+    # the original handlers still filter by their own levels
+    _listener = logging.handlers.QueueListener(
+        handler.queue, *handlers, respect_handler_level=True
+    )
+    _listener.start()
+    atexit.register(uninstall)
+    return handler
+
+
+def uninstall() -> None:
+    """Write what is queued and give the root logger its handlers back."""
+    global _listener
+    if _listener is None:
+        return
+    listener, _listener = _listener, None
+    listener.stop()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler, NonBlockingQueueHandler):
+            root.removeHandler(handler)
+    for handler in listener.handlers:
+        root.addHandler(handler)
+
+
+_metrics_sampler = RateSampler(METRICS_SAMPLE_RATE, burst=1.0)
+
+
+def log_metrics(event: metrics.AgentMetrics) -> None:
+    """``metrics.log_metrics``, sampled per kind of metrics."""
+    if not _metrics_logger.isEnabledFor(logging.INFO):
+        return
+    if _metrics_sampler.allow(type(event).__name__) is None:
+        return
+    metrics.log_metrics(event, logger=_metrics_logger)
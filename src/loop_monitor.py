@@ -0,0 +1,234 @@
+"""Event-loop lag and stall diagnostics for a job.
+
+Audio, tool calls and publishing of a session all run on the job's event loop,
+so anything that blocks it - a synchronous call, a large payload encoded in
+place, a slow inference step - is heard as choppy audio. ``LoopMonitor`` makes
+those stalls visible:
+
+- a heartbeat task wakes up every ``interval`` and records how late it is.
+  That lag goes to the session's latency profiler as the ``loop_lag`` stage,
+  so it is exported with the turn latency percentiles, see latency.py.
+- a watchdog thread notices when the heartbeat is overdue by more than the
+  stall threshold (``LOOP_STALL_THRESHOLD_MS``, default 100) and takes a
+  snapshot of the loop thread's stack while it is still blocked.
+- once the loop is back, the stall is logged with its duration, its stack and
+  what it is attributed to: the tool running in it if any, else the innermost
+  pipeline stage (``stt``, ``llm``, ``tts``, ``vad``, ``turn_detection``) or
+  module of this agent found in the stack.
+
+``summary`` has the lag percentiles and the stalls per stage, it is logged with
+the session's usage when the job ends.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from collections.abc import Callable, Iterable
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any
+
+from latency import QUANTILES, LatencyHistogram
+
+logger = logging.getLogger("agent")
+
+LOOP_STALL_ENV = "LOOP_STALL_THRESHOLD_MS"
+
+# how often the heartbeat checks in
+HEARTBEAT_INTERVAL = 0.05
+DEFAULT_STALL_THRESHOLD = 0.1
+# stalls kept for the summary, and frames kept of each stack
+MAX_STALLS = 50
+MAX_STACK_FRAMES = 20
+
+_SRC_DIR = str(Path(__file__).resolve().parent)
+# pipeline stages by the livekit package or plugin module their code is in
+_STAGE_PATHS = (
+    ("turn_detection", ("turn_detector",)),
+    ("stt", ("stt",)),
+    ("tts", ("tts",)),
+    ("llm", ("llm",)),
+    ("vad", ("vad", "silero")),
+)
+
+
+@dataclass(frozen=True)
+class LoopStall:
+    """The event loop not running anything else for ``duration`` seconds."""
+
+    # wall clock time the loop last ran the heartbeat before the stall
+    started: float
+    duration: float
+    stage: str
+    # "file:line in function" of the loop thread's frames, innermost last,
+    # empty if the stall ended before the watchdog saw it
+    stack: tuple[str, ...]
+
+
+def attribute(stack: traceback.StackSummary, tool_names: Iterable[str] = ()) -> str:
+    """What a stalled loop was doing, from the stack of its thread."""
+    tools = set(tool_names)
+    for frame in reversed(stack):
+        if frame.name in tools:
+            return f"tool:{frame.name}"
+
+    in_pipeline = False
+    for frame in reversed(stack):
+        path = Path(frame.filename)
+        if str(path.parent) == _SRC_DIR:
+            return path.stem
+        parts = path.with_suffix("").parts
+        if "livekit" not in parts:
+            continue
+        package = parts[parts.index("livekit") + 1 :]
+        for stage, names in _STAGE_PATHS:
+            if any(name in package for name in names):
+                return stage
+        in_pipeline = in_pipeline or "voice" in package
+    return "pipeline" if in_pipeline else "unknown"
+
+
+def stall_threshold() -> float:
+    """The stall threshold in seconds, from ``LOOP_STALL_ENV``."""
+    raw = os.getenv(LOOP_STALL_ENV)
+    try:
+        return float(raw) / 1000 if raw else DEFAULT_STALL_THRESHOLD
+    except ValueError:
+        logger.warning("invalid %s=%r, using the default", LOOP_STALL_ENV, raw)
+        return DEFAULT_STALL_THRESHOLD
+
+
+class LoopMonitor:
+    """Samples the lag of the running event loop and records its stalls.
+
+    Args:
+        tool_names: Functions that stalls are attributed to as tools.
+        on_lag: Called on the loop with every lag sample, in seconds.
+        threshold: Lag in seconds from which the loop counts as stalled.
+        interval: Seconds between heartbeats.
+    """
+
+    def __init__(
+        self,
+        *,
+        tool_names: Iterable[str] = (),
+        on_lag: Callable[[float], None] | None = None,
+        threshold: float | None = None,
+        interval: float = HEARTBEAT_INTERVAL,
+    ) -> None:
+        self.lag = LatencyHistogram()
+        self.stalls: deque[LoopStall] = deque(maxlen=MAX_STALLS)
+        self.stall_count = 0
+        self.stall_time = 0.0
+        self._tool_names = frozenset(tool_names)
+        self._on_lag = on_lag
+        self._threshold = stall_threshold() if threshold is None else threshold
+        self._interval = interval
+        self._beat = 0.0
+        self._loop_thread: int | None = None
+        # (beat, stack) of the stall the watchdog saw last
+        self._snapshot: tuple[float, traceback.StackSummary] | None = None
+        self._heartbeat: asyncio.Task[None] | None = None
+        self._stopped = threading.Event()
+        self._watchdog: threading.Thread | None = None
+
+    def start(self) -> None:
+        """Start monitoring the running loop, call it from the loop."""
+        if self._heartbeat is not None:
+            return
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._heartbeat = asyncio.get_running_loop().create_task(
+            self._run_heartbeat(), name="loop_monitor_heartbeat"
+        )
+        self._watchdog = threading.Thread(
+            target=self._watch, name="loop_monitor_watchdog", daemon=True
+        )
+        self._watchdog.start()
+
+    async def aclose(self) -> None:
+        self._stopped.set()
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._heartbeat
+        if self._watchdog is not None:
+            # the watchdog may be mid-dump, don't block the loop it watches
+            await asyncio.to_thread(self._watchdog.join)
+
+    def summary(self) -> dict[str, Any]:
+        by_stage: dict[str, dict[str, Any]] = {}
+        for stall in self.stalls:
+            entry = by_stage.setdefault(stall.stage, {"count": 0, "total": 0.0})
+            entry["count"] += 1
+            entry["total"] = round(entry["total"] + stall.duration, 4)
+        return {
+            "lag": {
+                "count": self.lag.count,
+                **{
+                    f"p{round(q * 100)}": round(self.lag.percentile(q), 4)
+                    for q in QUANTILES
+                },
+                "max": round(self.lag.max, 4),
+            },
+            "stalls": self.stall_count,
+            "stall_time": round(self.stall_time, 4),
+            # of the last MAX_STALLS
+            "stages": dict(sorted(by_stage.items(), key=lambda s: -s[1]["total"])),
+        }
+
+    async def _run_heartbeat(self) -> None:
+        while True:
+            await asyncio.sleep(self._interval)
+            now = time.monotonic()
+            lag = max(now - self._beat - self._interval, 0.0)
+            beat, self._beat = self._beat, now
+            self.lag.record(lag)
+            if self._on_lag is not None:
+                self._on_lag(lag)
+            if lag >= self._threshold:
+                self._record_stall(beat, lag)
+
+    def _record_stall(self, beat: float, duration: float) -> None:
+        snapshot = self._snapshot
+        stack = snapshot[1] if snapshot is not None and snapshot[0] == beat else None
+        stall = LoopStall(
+            started=time.time() - (time.monotonic() - beat),
+            duration=duration,
+            stage=attribute(stack, self._tool_names) if stack else "unknown",
+            stack=tuple(
+                f"{f.filename}:{f.lineno} in {f.name}"
+                for f in (stack or [])[-MAX_STACK_FRAMES:]
+            ),
+        )
+        self.stalls.append(stall)
+        self.stall_count += 1
+        self.stall_time += duration
+        logger.warning(
+            "event loop stalled for %.0fms in %s",
+            duration * 1000,
+            stall.stage,
+            extra={"loop_stall": asdict(stall)},
+        )
+
+    def _watch(self) -> None:
+        # checks often enough to catch the loop within half a threshold
+        check = min(self._interval, self._threshold / 2)
+        while not self._stopped.wait(check):
+            beat = self._beat
+            overdue = time.monotonic() - beat - self._interval
+            if overdue < self._threshold / 2:
+                continue
+            if self._snapshot is not None and self._snapshot[0] == beat:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is not None:
+                self._snapshot = (beat, traceback.extract_stack(frame))
@@ -1,3 +1,21 @@
+"""System prompt of the Therapist agent.
+
+The prompt is split for provider-side prefix caching. ``THERAPIST_PROMPT`` holds
+everything the model needs on every turn and is sent first on every request,
+followed by the tool definitions and the append-only chat history. Providers
+cache the longest previously seen prefix of a request, so as long as this text
+is byte-for-byte identical across requests the whole static part is only billed
+and processed once per cache window. Never format per-session data (names,
+dates, tracked values) into it, add that to the chat context instead.
+
+Sections the model needs only occasionally live in ``PROMPT_SECTIONS`` and are
+retrieved with the ``get_guidance`` tool when a conversation calls for them.
+"""
+
+import hashlib
+import re
+from typing import Literal, Optional
+
 THERAPIST_PROMPT = """
 CORE IDENTITY
 You are a compassionate AI therapy companion specializing in chronic pain and sleep disorders. You provide evidence-based therapeutic support, active listening, and practical coping strategies. You are NOT a replacement for professional medical care but serve as a supportive tool between therapy sessions.
@@ -95,6 +113,32 @@ MOOD TRACKING - Use assess_mood_and_functioning tool IMMEDIATELY when patient:
 - Mentions social engagement or emotional coping
 Example triggers: "feeling down", "low energy", "good day today", "couldn't do much"
 
+ON-DEMAND GUIDANCE
+Use the get_guidance tool to look up detailed guidance when you need it, instead of improvising:
+- response_templates: sample responses for pain flares, sleep difficulties and emotional overwhelm
+- conversation_enders: supportive closing lines, use when the session is wrapping up
+- techniques: CBT, ACT and mindfulness techniques to integrate
+- session_data: what to note during a session and cover in a weekly summary
+
+IMPORTANT REMINDERS
+Never promise to "cure" or "fix" chronic conditions
+Acknowledge the expertise patients have about their own bodies
+Respect treatment decisions made with healthcare providers
+Maintain hope while being realistic about chronic condition management
+Document everything for continuity of care
+Know your limitations and refer appropriately
+
+"""
+
+# Changes whenever the static prompt does, so requests with a new prompt don't
+# compete for the cache entries of the old one
+PROMPT_CACHE_KEY = (
+    "therapist-" + hashlib.sha256(THERAPIST_PROMPT.encode()).hexdigest()[:12]
+)
+
+# Retrieved on demand through the get_guidance tool, they are not part of the
+# cached prefix and only cost tokens in the conversations that need them
+SESSION_DATA_GUIDANCE = """
 Additional Session Data:
 Primary topics discussed (pain management, sleep, emotions, relationships, etc.)
 Coping strategies suggested/discussed
@@ -106,7 +150,9 @@ Trend analysis of pain/sleep/mood metrics
 Most effective interventions noted by patient
 Goals progress if any were set
 Therapy session preparation notes for provider
+"""
 
+TECHNIQUES_GUIDANCE = """
 EVIDENCE-BASED TECHNIQUES TO INTEGRATE
 Cognitive Behavioral Techniques:
 Thought challenging: "What evidence do we have for/against this thought?"
@@ -120,7 +166,9 @@ Mindfulness-Based Interventions:
 Body scan meditations for pain awareness
 Breathing techniques for anxiety and pain management
 Present-moment awareness exercises
+"""
 
+RESPONSE_TEMPLATES_GUIDANCE = """
 SAMPLE RESPONSE TEMPLATES
 Pain Flare Response:
 "I hear that you're experiencing a pain flare right now, and that sounds really difficult. Pain flares can feel overwhelming. Let's take a moment to breathe together - would you like to try the 4-7-8 breathing technique we've practiced? Also, I'm wondering - are you able to find any position that brings even slight relief, or is there a part of your body that feels neutral right now?"
@@ -130,20 +178,74 @@ Sleep Difficulty Response:
 
 Emotional Overwhelm Response:
 "It makes complete sense that you're feeling overwhelmed. Living with chronic conditions means dealing with uncertainty and challenges that others might not understand. Your feelings are valid. What has helped you feel even slightly more grounded during difficult emotional moments in the past?"
+"""
 
+CONVERSATION_ENDERS_GUIDANCE = """
 CONVERSATION ENDERS
 Supportive Closings:
 "Thank you for sharing with me today. Your strength in managing these challenges is evident."
 "I'm here whenever you need support. You don't have to face this alone."
 "Remember, healing isn't linear - be patient with yourself as you navigate this journey."
 "What's one small thing you can do for yourself today, even if it's just acknowledging how hard you're working?"
-
-IMPORTANT REMINDERS
-Never promise to "cure" or "fix" chronic conditions
-Acknowledge the expertise patients have about their own bodies
-Respect treatment decisions made with healthcare providers
-Maintain hope while being realistic about chronic condition management
-Document everything for continuity of care
-Know your limitations and refer appropriately
-
-"""
\ No newline at end of file
+"""
+
+
+def _quoted_lines(text: str, heading: str, until: Optional[str] = None) -> list[str]:
+    start = text.index(heading)
+    end = text.index(until, start) if until else len(text)
+    return re.findall(r'"([^"]+)"', text[start:end])
+
+
+# Lines the model is given to say word for word. Their audio is synthesized once
+# and played from a cache, see tts_cache.py.
+SPOKEN_TEMPLATES = (
+    *_quoted_lines(THERAPIST_PROMPT, "Opening (Every Session):", "Check-in"),
+    *_quoted_lines(THERAPIST_PROMPT, "Red Flags", "Scope Limitations"),
+    *_quoted_lines(CONVERSATION_ENDERS_GUIDANCE, "Supportive Closings:"),
+)
+
+# Spoken by the safety fast path without waiting on the model, see safety.py
+SAFETY_REFERRALS = {
+    "suicidal_ideation": _quoted_lines(
+        THERAPIST_PROMPT, "Suicidal ideation:", "Self-harm mentions:"
+    )[0],
+    "self_harm": _quoted_lines(THERAPIST_PROMPT, "Self-harm mentions:", "Medication")[
+        0
+    ],
+}
+
+GuidanceTopic = Literal[
+    "response_templates", "conversation_enders", "techniques", "session_data"
+]
+
+PROMPT_SECTIONS: dict[str, str] = {
+    "response_templates": RESPONSE_TEMPLATES_GUIDANCE,
+    "conversation_enders": CONVERSATION_ENDERS_GUIDANCE,
+    "techniques": TECHNIQUES_GUIDANCE,
+    "session_data": SESSION_DATA_GUIDANCE,
+}
+
+# Added to a single request after the fast path recorded values from the
+# patient's words, see extraction.py. It goes after the user message, so the
+# cached prefix is unaffected.
+EXTRACTED_METRICS_NOTE = """
+Already recorded from the patient's last message:
+{recorded}
+Do not call these tools just to record the same values again. Call one only if \
+the patient also gave details that are missing here, that completes the same \
+record instead of adding another.
+""".strip()
+
+# appended to a tracking tool's result when its acknowledgement was spoken
+ACKNOWLEDGED_NOTE = (
+    'The patient has already heard "{phrase}". Do not confirm the recording '
+    "again, continue the conversation."
+)
+
+# Added to the request of the turn in which the safety fast path spoke a
+# referral, see safety.py
+SAFETY_REFERRAL_NOTE = """
+While the patient was speaking you already said: "{referral}"
+Do not repeat it. Stay with the patient, acknowledge what they shared and gently \
+check that they are safe right now.
+""".strip()
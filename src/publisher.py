@@ -0,0 +1,241 @@
+"""Non-blocking publisher for tracking messages sent over the room data channel.
+
+Function tools hand their messages to a ``TrackingPublisher`` and return right
+away. A background task coalesces everything queued within a short linger
+window (in practice: the tool calls of one LLM turn) into a single framed batch
+packet and publishes it, retrying with exponential backoff on failure.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import json
+import logging
+import time
+from collections import deque
+from collections.abc import Callable
+from dataclasses import dataclass
+from typing import Any
+
+logger = logging.getLogger("agent")
+
+# LiveKit drops reliable data packets above ~15 KiB, keep some headroom
+MAX_PACKET_BYTES = 14_000
+
+
+def encode_json_packets(
+    messages: list[dict[str, Any]], max_bytes: int = MAX_PACKET_BYTES
+) -> list[bytes]:
+    """Encode messages as JSON packets, framing several into one ``batch`` packet.
+
+    A single message is sent as-is so older clients keep working. Batches are
+    split so that no packet exceeds ``max_bytes``.
+    """
+    encoded = [json.dumps(m, separators=(",", ":")).encode() for m in messages]
+    if len(encoded) == 1:
+        return encoded
+
+    packets: list[bytes] = []
+    head, tail = b'{"type":"batch","messages":[', b"]}"
+    current: list[bytes] = []
+    size = len(head) + len(tail)
+    for item in encoded:
+        if current and size + len(item) + 1 > max_bytes:
+            packets.append(head + b",".join(current) + tail)
+            current, size = [], len(head) + len(tail)
+        current.append(item)
+        size += len(item) + 1
+    if len(current) == 1:
+        packets.append(current[0])
+    elif current:
+        packets.append(head + b",".join(current) + tail)
+    return packets
+
+
+@dataclass
+class PublisherStats:
+    queue_depth: int = 0
+    max_queue_depth: int = 0
+    messages_published: int = 0
+    packets_published: int = 0
+    messages_dropped: int = 0
+    packets_failed: int = 0
+    retries: int = 0
+    flushes: int = 0
+    last_flush_latency: float = 0.0
+    max_flush_latency: float = 0.0
+    total_flush_latency: float = 0.0
+
+    @property
+    def avg_flush_latency(self) -> float:
+        return self.total_flush_latency / self.flushes if self.flushes else 0.0
+
+
+class TrackingPublisher:
+    """Per-session queue of data-channel messages flushed by a background task.
+
+    Args:
+        room: Room whose local participant publishes the packets. It is resolved
+            lazily so the publisher can be created before the room is connected.
+        max_queue: Maximum number of pending messages. When full, the oldest
+            message is dropped so the dashboard keeps the freshest data.
+        linger: Seconds to wait after the first message of a flush so that
+            messages produced by the same turn end up in one packet.
+        max_retries: Number of retries for a packet before it is dropped.
+        retry_backoff: Initial retry delay in seconds, doubled on every attempt.
+        encoder: Turns a list of messages into the packets to publish.
+    """
+
+    def __init__(
+        self,
+        room: Any,
+        *,
+        max_queue: int = 256,
+        linger: float = 0.05,
+        max_retries: int = 3,
+        retry_backoff: float = 0.1,
+        topic: str = "",
+        encoder: Callable[[list[dict[str, Any]]], list[bytes]] = encode_json_packets,
+    ) -> None:
+        self._room = room
+        self._max_queue = max_queue
+        self._linger = linger
+        self._max_retries = max_retries
+        self._retry_backoff = retry_backoff
+        self._topic = topic
+        self._encoder = encoder
+
+        self._pending: deque[tuple[float, dict[str, Any]]] = deque()
+        self._wake = asyncio.Event()
+        self._task: asyncio.Task[None] | None = None
+        self._closing = False
+        self.stats = PublisherStats()
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._pending)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="tracking_publisher")
+
+    def publish(self, message: dict[str, Any]) -> bool:
+        """Queue a message without waiting on the network.
+
+        Returns False if the publisher is closed or an older message had to be
+        dropped to make room.
+        """
+        if self._closing:
+            logger.warning("publisher closed, dropping %s message", message.get("type"))
+            self.stats.messages_dropped += 1
+            return False
+
+        dropped = False
+        if len(self._pending) >= self._max_queue:
+            _, old = self._pending.popleft()
+            self.stats.messages_dropped += 1
+            dropped = True
+            logger.warning("publisher queue full, dropped %s message", old.get("type"))
+
+        self._pending.append((time.perf_counter(), message))
+        self.stats.queue_depth = len(self._pending)
+        self.stats.max_queue_depth = max(self.stats.max_queue_depth, len(self._pending))
+        self._wake.set()
+        return not dropped
+
+    async def flush(self) -> None:
+        """Publish everything queued so far, bypassing the linger window."""
+        while self._pending:
+            batch = list(self._pending)
+            self._pending.clear()
+            self.stats.queue_depth = 0
+            await self._send(batch)
+
+    async def aclose(self, timeout: float = 2.0) -> None:
+        """Stop accepting messages and drain the queue, waiting up to ``timeout``."""
+        if self._closing:
+            return
+        self._closing = True
+        self._wake.set()
+        if self._task is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(self._task), timeout)
+            except asyncio.TimeoutError:
+                logger.warning(
+                    "publisher drain timed out with %d messages pending",
+                    len(self._pending),
+                )
+                self._task.cancel()
+                with contextlib.suppress(asyncio.CancelledError):
+                    await self._task
+
+        s = self.stats
+        logger.info(
+            "publisher stats: %d messages in %d packets, %d dropped, %d failed, "
+            "%d retries, max queue %d, flush latency avg %.1fms max %.1fms",
+            s.messages_published,
+            s.packets_published,
+            s.messages_dropped,
+            s.packets_failed,
+            s.retries,
+            s.max_queue_depth,
+            s.avg_flush_latency * 1000,
+            s.max_flush_latency * 1000,
+        )
+
+    async def _run(self) -> None:
+        while True:
+            await self._wake.wait()
+            self._wake.clear()
+            if self._linger > 0 and not self._closing:
+                await asyncio.sleep(self._linger)
+            await self.flush()
+            if self._closing:
+                return
+
+    async def _send(self, batch: list[tuple[float, dict[str, Any]]]) -> None:
+        messages = [m for _, m in batch]
+        try:
+            packets = self._encoder(messages)
+        except Exception:
+            logger.exception("failed to encode %d tracking messages", len(messages))
+            self.stats.messages_dropped += len(messages)
+            return
+
+        sent_all = True
+        for packet in packets:
+            if not await self._send_packet(packet):
+                sent_all = False
+
+        latency = time.perf_counter() - batch[0][0]
+        s = self.stats
+        s.flushes += 1
+        s.last_flush_latency = latency
+        s.max_flush_latency = max(s.max_flush_latency, latency)
+        s.total_flush_latency += latency
+        if sent_all:
+            s.messages_published += len(messages)
+
+    async def _send_packet(self, packet: bytes) -> bool:
+        delay = self._retry_backoff
+        for attempt in range(self._max_retries + 1):
+            try:
+                await self._room.local_participant.publish_data(
+                    packet, reliable=True, topic=self._topic
+                )
+                self.stats.packets_published += 1
+                return True
+            except Exception as e:
+                if attempt == self._max_retries:
+                    self.stats.packets_failed += 1
+                    logger.error(
+                        "failed to publish tracking packet after %d attempts: %s",
+                        attempt + 1,
+                        e,
+                    )
+                    return False
+                self.stats.retries += 1
+                await asyncio.sleep(delay)
+                delay *= 2
+        return False
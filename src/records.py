@@ -0,0 +1,345 @@
+"""Typed tracking records, shared by the tools, the store, the publisher and reports.
+
+A record is a ``PainAssessment``, ``SleepQuality`` or ``MoodAssessment``: a
+slotted class with one attribute per field of its message type, checked when
+it's built. Ratings are whole numbers from 1 to 10, hours slept are between 0
+and 24, and so on, see the ``FIELDS`` of each type. A value out of range
+raises ``InvalidRecordError`` before anything is persisted or published, so a
+tool can hand the error back to the LLM.
+
+``to_data`` is the canonical form of a record: a dict keyed like the frontend's
+tracking types, fields in schema order, absent values left out. The agent
+builds it once per record and the same dict is persisted and published; the
+binary wire schemas in ``wire.py`` are derived from ``FIELDS``. The record
+types are re-declared by ``react-frontend/lib/tracking-types.ts``, changes here
+need to go there too.
+
+``RecordBuffer`` keeps a session's records as columns for the session report:
+an ``array('d')`` per numeric field, NaN where a record has no value.
+"""
+
+from __future__ import annotations
+
+import math
+from array import array
+from collections.abc import Iterator, Mapping
+from dataclasses import dataclass
+from typing import Any, ClassVar, TypeVar
+
+# text fields are free-form, but not essays
+MAX_TEXT_LENGTH = 500
+
+_Record = TypeVar("_Record", bound="TrackingRecord")
+
+
+class InvalidRecordError(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class RecordField:
+    """One field of a record type.
+
+    ``kind`` is how the field is encoded on the wire: ``u8``, ``u16``, ``centi``
+    (two decimals) or ``str``. Numeric values must be within ``low`` and
+    ``high``, and whole numbers unless the kind is ``centi``.
+    """
+
+    # key in the record's data, as sent to the frontend
+    name: str
+    attr: str
+    kind: str
+    low: float = 0
+    high: float = 0
+
+    @property
+    def numeric(self) -> bool:
+        return self.kind != "str"
+
+    def check(self, value: Any) -> Any:
+        """``value`` as stored in a record, None if absent."""
+        if value is None:
+            return None
+        if not self.numeric:
+            if not isinstance(value, str):
+                raise InvalidRecordError(f"{self.attr} must be text, got {value!r}")
+            value = value.strip()
+            if len(value) > MAX_TEXT_LENGTH:
+                raise InvalidRecordError(
+                    f"{self.attr} must be at most {MAX_TEXT_LENGTH} characters"
+                )
+            return value or None
+
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise InvalidRecordError(f"{self.attr} must be a number, got {value!r}")
+        if not self.low <= value <= self.high:
+            raise InvalidRecordError(
+                f"{self.attr} must be between {self.low:g} and {self.high:g},"
+                f" got {value:g}"
+            )
+        if self.kind == "centi":
+            return round(float(value), 2)
+        if value != int(value):
+            raise InvalidRecordError(
+                f"{self.attr} must be a whole number, got {value:g}"
+            )
+        return int(value)
+
+
+class TrackingRecord:
+    """Base of the record types, built from keyword arguments named like ``attr``.
+
+    Raises InvalidRecordError if a value is out of range or has the wrong type.
+    """
+
+    MESSAGE_TYPE: ClassVar[str]
+    FIELDS: ClassVar[tuple[RecordField, ...]]
+    __slots__ = ()
+
+    def __init__(self, **values: Any) -> None:
+        for field in self.FIELDS:
+            setattr(self, field.attr, field.check(values.pop(field.attr, None)))
+        if values:
+            raise InvalidRecordError(
+                f"unknown {self.MESSAGE_TYPE} fields: {', '.join(sorted(values))}"
+            )
+
+    @classmethod
+    def from_data(cls: type[_Record], data: Mapping[str, Any]) -> _Record:
+        """The record of ``data`` in its canonical form, see ``to_data``."""
+        names = {field.name: field.attr for field in cls.FIELDS}
+        unknown = [name for name in data if name not in names]
+        if unknown:
+            raise InvalidRecordError(
+                f"unknown {cls.MESSAGE_TYPE} fields: {', '.join(sorted(unknown))}"
+            )
+        return cls(**{names[name]: value for name, value in data.items()})
+
+    def to_data(self) -> dict[str, Any]:
+        """The record's values keyed by field name, absent ones left out."""
+        data = {}
+        for field in self.FIELDS:
+            value = getattr(self, field.attr)
+            if value is not None:
+                data[field.name] = value
+        return data
+
+    def completed(self: _Record, other: TrackingRecord) -> _Record:
+        """A copy with the values this record lacks taken from ``other``."""
+        completed = object.__new__(type(self))
+        for field in self.FIELDS:
+            value = getattr(self, field.attr)
+            if value is None:
+                value = getattr(other, field.attr)
+            setattr(completed, field.attr, value)
+        return completed
+
+    def refines(self, other: TrackingRecord) -> bool:
+        """Whether this record only repeats or adds to ``other``'s values.
+
+        False for another message type, or if any value both records have
+        differs, e.g. a pain report for another location.
+        """
+        if type(other) is not type(self):
+            return False
+        for field in self.FIELDS:
+            mine = getattr(self, field.attr)
+            theirs = getattr(other, field.attr)
+            if mine is None or theirs is None:
+                continue
+            if field.numeric and mine != theirs:
+                return False
+            if not field.numeric and mine.casefold() != theirs.casefold():
+                return False
+        return True
+
+    def describe(self) -> str:
+        return ", ".join(f"{name} {value}" for name, value in self.to_data().items())
+
+    def __eq__(self, other: object) -> bool:
+        if type(other) is not type(self):
+            return NotImplemented
+        return all(getattr(self, f.attr) == getattr(other, f.attr) for f in self.FIELDS)
+
+    def __repr__(self) -> str:
+        values = ", ".join(f"{f.attr}={getattr(self, f.attr)!r}" for f in self.FIELDS)
+        return f"{type(self).__name__}({values})"
+
+
+def _rating(name: str, attr: str) -> RecordField:
+    return RecordField(name, attr, "u8", 1, 10)
+
+
+def _text(name: str, attr: str) -> RecordField:
+    return RecordField(name, attr, "str")
+
+
+class PainAssessment(TrackingRecord):
+    MESSAGE_TYPE = "pain_assessment"
+    FIELDS = (
+        _rating("painLevel", "pain_level"),
+        _text("location", "location"),
+        _text("quality", "quality"),
+        _text("triggers", "triggers"),
+        _text("copingStrategies", "coping_strategies"),
+    )
+    __slots__ = tuple(f.attr for f in FIELDS)
+
+    pain_level: int | None
+    location: str | None
+    quality: str | None
+    triggers: str | None
+    coping_strategies: str | None
+
+
+class SleepQuality(TrackingRecord):
+    MESSAGE_TYPE = "sleep_quality"
+    FIELDS = (
+        _rating("sleepQuality", "sleep_quality"),
+        RecordField("hoursSlept", "hours_slept", "centi", 0, 24),
+        RecordField("sleepOnsetMinutes", "sleep_onset_minutes", "u16", 0, 24 * 60),
+        RecordField("wakeUps", "wake_ups", "u8", 0, 50),
+        _text("sleepFactors", "sleep_factors"),
+    )
+    __slots__ = tuple(f.attr for f in FIELDS)
+
+    sleep_quality: int | None
+    hours_slept: float | None
+    sleep_onset_minutes: int | None
+    wake_ups: int | None
+    sleep_factors: str | None
+
+
+class MoodAssessment(TrackingRecord):
+    MESSAGE_TYPE = "mood_assessment"
+    FIELDS = (
+        _rating("moodRating", "mood_rating"),
+        _rating("energyLevel", "energy_level"),
+        _rating("dailyActivitiesCompletion", "daily_activities_completion"),
+        _rating("socialEngagement", "social_engagement"),
+        _text("emotionalCoping", "emotional_coping"),
+    )
+    __slots__ = tuple(f.attr for f in FIELDS)
+
+    mood_rating: int | None
+    energy_level: int | None
+    daily_activities_completion: int | None
+    social_engagement: int | None
+    emotional_coping: str | None
+
+
+RECORD_TYPES: dict[str, type[TrackingRecord]] = {
+    cls.MESSAGE_TYPE: cls for cls in (PainAssessment, SleepQuality, MoodAssessment)
+}
+
+
+def record_from_data(message_type: str, data: Mapping[str, Any]) -> TrackingRecord:
+    """The record of a ``{"type", "data"}`` message's type and data."""
+    cls = RECORD_TYPES.get(message_type)
+    if cls is None:
+        raise InvalidRecordError(f"unknown message type {message_type!r}")
+    return cls.from_data(data)
+
+
+class _Table:
+    """The columns of one record type."""
+
+    __slots__ = ("columns", "ids", "record_type", "rows", "ts")
+
+    def __init__(self, record_type: type[TrackingRecord]) -> None:
+        self.record_type = record_type
+        self.ids: list[str] = []
+        self.rows: dict[str, int] = {}
+        self.ts = array("d")
+        self.columns: dict[str, array[float] | list[str | None]] = {
+            f.name: array("d") if f.numeric else [] for f in record_type.FIELDS
+        }
+
+
+class RecordBuffer:
+    """A session's records as columns, one table per message type.
+
+    Adding a record under an id that is already there replaces its row, like a
+    later message with the same id updates the record in the frontend.
+    """
+
+    def __init__(self) -> None:
+        self._tables: dict[str, _Table] = {}
+
+    def add(self, record: TrackingRecord, ts: float, record_id: str) -> None:
+        table = self._tables.get(record.MESSAGE_TYPE)
+        if table is None:
+            table = self._tables[record.MESSAGE_TYPE] = _Table(type(record))
+
+        row = table.rows.get(record_id)
+        if row is None:
+            table.rows[record_id] = len(table.ids)
+            table.ids.append(record_id)
+            table.ts.append(ts)
+            for field in record.FIELDS:
+                value = getattr(record, field.attr)
+                if field.numeric:
+                    value = math.nan if value is None else value
+                table.columns[field.name].append(value)
+            return
+
+        table.ts[row] = ts
+        for field in record.FIELDS:
+            value = getattr(record, field.attr)
+            if field.numeric:
+                value = math.nan if value is None else value
+            table.columns[field.name][row] = value
+
+    def __len__(self) -> int:
+        return sum(len(table.ids) for table in self._tables.values())
+
+    @property
+    def message_types(self) -> list[str]:
+        """Message types with records, in the order they were first added."""
+        return list(self._tables)
+
+    def timestamps(self, message_type: str) -> array[float]:
+        table = self._tables.get(message_type)
+        return table.ts if table is not None else array("d")
+
+    def column(self, message_type: str, name: str) -> array[float] | list[str | None]:
+        """The values of field ``name``, NaN or None for records without one.
+
+        Raises KeyError if the message type has no such field.
+        """
+        table = self._tables.get(message_type)
+        if table is not None:
+            return table.columns[name]
+        field = next(
+            (f for f in RECORD_TYPES[message_type].FIELDS if f.name == name), None
+        )
+        if field is None:
+            raise KeyError(name)
+        return array("d") if field.numeric else []
+
+    def __iter__(self) -> Iterator[tuple[str, float, TrackingRecord]]:
+        """``(record_id, ts, record)`` of every record, per message type."""
+        for table in self._tables.values():
+            for row, record_id in enumerate(table.ids):
+                record = object.__new__(table.record_type)
+                for field in table.record_type.FIELDS:
+                    value = table.columns[field.name][row]
+                    if field.numeric:
+                        value = None if math.isnan(value) else value
+                        if value is not None and field.kind != "centi":
+                            value = int(value)
+                    setattr(record, field.attr, value)
+                yield record_id, table.ts[row], record
+
+    def summary(self) -> dict[str, dict[str, Any]]:
+        """Count of records per message type, and the average of every numeric field."""
+        summary = {}
+        for message_type, table in self._tables.items():
+            averages = {}
+            for name, column in table.columns.items():
+                if isinstance(column, array):
+                    values = [v for v in column if not math.isnan(v)]
+                    if values:
+                        averages[name] = round(sum(values) / len(values), 1)
+            summary[message_type] = {"count": len(table.ids), "averages": averages}
+        return summary
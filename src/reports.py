@@ -0,0 +1,388 @@
+"""Session reports for provider review, written after the session ends.
+
+When a job shuts down it hands a ``SessionData`` snapshot - who, when, the
+transcript and the session's ``RecordBuffer`` - to the process's
+``ReportWriter``. Everything else happens on the writer's thread, after the
+tracking store committed the session's records:
+
+- the session's records are summarized per kind from the buffer's columns,
+  with the coping strategies the patient mentioned (without a buffer they are
+  read back from the store),
+- the week's trend of every headline metric is computed from the daily rollups
+  with ``analytics.py``, like the tracking summary the agent gives the LLM
+  (mean, change against the previous week, slope per day),
+- the transcript is reduced to engagement counts, the topics discussed and the
+  red flags raised. The transcript itself is not kept.
+
+The report is a JSON file, next to it an ``.npz`` file holds the session's
+numeric values as columns (``ts``, ``kind``, ``metric``, ``value``) for
+analysis across sessions. Both go to ``SESSION_REPORTS_DIR`` (default
+``./session-reports``), one directory per patient.
+
+Shutdown callbacks enqueue with ``submit_report`` and then wait, off the
+event loop and for at most ``EXIT_TIMEOUT``, until the report is written: job
+processes end with ``os._exit``, so the writer's daemon thread dies with them
+and ``atexit`` handlers never run. The queue is bounded, a report that doesn't
+fit is dropped with a warning rather than delaying teardown, and the thread
+runs at a lower CPU priority so reports never compete with live sessions of
+the same worker.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import atexit
+import contextlib
+import json
+import logging
+import os
+import queue
+import re
+import sys
+import threading
+from collections.abc import Sequence
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+from analytics import DailyMetrics, trend_slopes
+from records import RECORD_TYPES, InvalidRecordError, RecordBuffer, record_from_data
+from safety import find_red_flag
+from store import DailyRollup, ReadOnlyStore, StoredRecord
+from trends import DEFAULT_METRICS
+
+logger = logging.getLogger("agent")
+
+REPORTS_DIR_ENV = "SESSION_REPORTS_DIR"
+
+# reports waiting for the writer thread, more are dropped
+MAX_PENDING_REPORTS = 16
+# added to the writer thread's nice value
+WRITER_NICENESS = 10
+# how long a job waits at shutdown for its report to be written
+EXIT_TIMEOUT = 10.0
+
+TREND_DAYS = 7
+
+TOPICS = {
+    "pain": ("pain", "ache", "aching", "hurts", "hurt", "sore", "flare", "migraine"),
+    "sleep": ("sleep", "slept", "asleep", "insomnia", "tired", "nap", "night"),
+    "emotions": (
+        "mood",
+        "sad",
+        "anxious",
+        "anxiety",
+        "stress",
+        "stressed",
+        "angry",
+        "lonely",
+        "depressed",
+        "worried",
+        "frustrated",
+    ),
+    "relationships": (
+        "family",
+        "partner",
+        "husband",
+        "wife",
+        "friend",
+        "friends",
+        "kids",
+        "children",
+        "mother",
+        "father",
+    ),
+    "activity": ("walk", "walking", "exercise", "work", "job", "stretching", "yoga"),
+    "medication": ("medication", "medicine", "pills", "dose", "prescription"),
+}
+
+# free-text record fields that name what the patient does to cope
+COPING_FIELDS = ("copingStrategies", "emotionalCoping")
+
+_WORD = re.compile(r"[a-z']+")
+_UNSAFE_PATH = re.compile(r"[^A-Za-z0-9_.-]+")
+
+
+@dataclass(frozen=True)
+class SessionData:
+    """What a report is built from, taken when the session ends."""
+
+    room: str
+    patient_id: str
+    started: float
+    ended: float
+    # the patient's local date at the end of the session
+    today: str
+    # (role, text) of every user and assistant message
+    transcript: tuple[tuple[str, str], ...]
+    store_path: str | None = None
+    # the session's records, read back from the store if not given
+    records: RecordBuffer | None = None
+
+
+def build_report(
+    session: SessionData,
+    records: RecordBuffer,
+    rollups: Sequence[DailyRollup],
+) -> dict[str, Any]:
+    patient_lines = [text for role, text in session.transcript if role == "user"]
+    patient_words = [_WORD.findall(line.lower()) for line in patient_lines]
+
+    topics = {}
+    for topic, keywords in TOPICS.items():
+        mentions = sum(w in keywords for words in patient_words for w in words)
+        if mentions:
+            topics[topic] = mentions
+
+    coping: list[str] = []
+    for _, _, record in records:
+        data = record.to_data()
+        for field in COPING_FIELDS:
+            value = data.get(field)
+            if value and value not in coping:
+                coping.append(value)
+
+    risk_flags = sorted(
+        {flag.category for line in patient_lines if (flag := find_red_flag(line))}
+    )
+
+    return {
+        "room": session.room,
+        "patient_id": session.patient_id,
+        "started": datetime.fromtimestamp(session.started, timezone.utc).isoformat(),
+        "duration_s": round(session.ended - session.started),
+        "engagement": {
+            "patient_turns": len(patient_lines),
+            "agent_turns": len(session.transcript) - len(patient_lines),
+            "patient_words": sum(len(words) for words in patient_words),
+        },
+        "topics": dict(sorted(topics.items(), key=lambda t: -t[1])),
+        "risk_flags": risk_flags,
+        "records": records.summary(),
+        "coping_strategies": coping,
+        "trends": weekly_trends(rollups, date.fromisoformat(session.today)),
+    }
+
+
+def weekly_trends(
+    rollups: Sequence[DailyRollup],
+    today: date,
+    metrics: Sequence[str] = DEFAULT_METRICS,
+    days: int = TREND_DAYS,
+) -> dict[str, dict[str, Any]]:
+    """Trend of ``metrics`` over the ``days`` up to ``today``, against the period before.
+
+    ``rollups`` are of one patient and should cover both periods. Metrics
+    without data in the last period are left out.
+    """
+    start = today - timedelta(days=days - 1)
+    # the previous period, then this one
+    daily = DailyMetrics.from_rollups(
+        rollups, start - timedelta(days=days), 2 * days, metrics
+    )
+    if not daily.patients:
+        return {}
+    counts = daily.counts[0]
+    totals = np.nan_to_num(daily.means[0]) * counts
+    slopes = trend_slopes(daily.last(days).means, min_days=2)[0]
+
+    trends = {}
+    for i, metric in enumerate(daily.metrics):
+        current = [
+            r
+            for r in rollups
+            if f"{r.kind}.{r.metric}" == metric
+            and start.isoformat() <= r.day <= today.isoformat()
+        ]
+        if not current:
+            continue
+        mean = totals[days:, i].sum() / counts[days:, i].sum()
+        trend: dict[str, Any] = {
+            "days": len(current),
+            "mean": round(float(mean), 1),
+            "min": min(r.min for r in current),
+            "max": max(r.max for r in current),
+            "previous_mean": None,
+            "change": None,
+            "slope_per_day": None,
+        }
+        if counts[:days, i].any():
+            previous = totals[:days, i].sum() / counts[:days, i].sum()
+            trend["previous_mean"] = round(float(previous), 1)
+            trend["change"] = round(float(mean - previous), 1)
+        if not np.isnan(slopes[i]):
+            trend["slope_per_day"] = round(float(slopes[i]), 2)
+        trends[metric] = trend
+    return trends
+
+
+def record_columns(records: RecordBuffer) -> dict[str, np.ndarray]:
+    """The numeric values of ``records`` as columns, one row per value, by time."""
+    ts, kinds, metrics, values = [], [], [], []
+    for kind in records.message_types:
+        kind_ts = np.frombuffer(records.timestamps(kind), dtype=np.float64)
+        for field in RECORD_TYPES[kind].FIELDS:
+            if not field.numeric:
+                continue
+            column = np.frombuffer(records.column(kind, field.name), dtype=np.float64)
+            present = ~np.isnan(column)
+            ts.append(kind_ts[present])
+            values.append(column[present])
+            kinds += [kind] * int(present.sum())
+            metrics += [field.name] * int(present.sum())
+
+    ts_column = np.concatenate(ts) if ts else np.empty(0)
+    order = np.argsort(ts_column, kind="stable")
+    return {
+        "ts": ts_column[order],
+        "kind": np.array(kinds, dtype=str)[order],
+        "metric": np.array(metrics, dtype=str)[order],
+        "value": (np.concatenate(values) if values else np.empty(0))[order],
+    }
+
+
+def _buffer(stored: Sequence[StoredRecord]) -> RecordBuffer:
+    records = RecordBuffer()
+    for record in stored:
+        try:
+            records.add(
+                record_from_data(record.kind, record.data),
+                record.ts,
+                record.record_id or str(record.seq),
+            )
+        except InvalidRecordError as e:
+            logger.warning("skipping stored record %d: %s", record.seq, e)
+    return records
+
+
+class ReportWriter:
+    """Builds and writes session reports on a background thread.
+
+    Args:
+        directory: Where reports go, in a subdirectory per patient.
+        max_pending: Reports that can wait for the thread, more are dropped.
+    """
+
+    def __init__(
+        self, directory: str, *, max_pending: int = MAX_PENDING_REPORTS
+    ) -> None:
+        self.directory = Path(directory)
+        self._queue: queue.Queue[SessionData | None] = queue.Queue(max_pending)
+        self._thread = threading.Thread(
+            target=self._run, name="session_report_writer", daemon=True
+        )
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, session: SessionData) -> bool:
+        """Queue a report, returns False if it was dropped. Never blocks."""
+        try:
+            self._queue.put_nowait(session)
+        except queue.Full:
+            logger.warning("report queue full, dropping the report of %s", session.room)
+            return False
+        return True
+
+    def join(self, timeout: float | None = None) -> bool:
+        """Wait until every queued report is written, False on timeout."""
+        with self._queue.all_tasks_done:
+            return self._queue.all_tasks_done.wait_for(
+                lambda: not self._queue.unfinished_tasks, timeout
+            )
+
+    def close(self, timeout: float = EXIT_TIMEOUT) -> None:
+        """Write what is queued, waiting at most ``timeout`` seconds."""
+        if not self._thread.is_alive():
+            return
+        with contextlib.suppress(queue.Full):
+            self._queue.put(None, timeout=timeout)
+        self._thread.join(timeout)
+
+    def _run(self) -> None:
+        # per-thread on Linux, elsewhere it would renice the whole process
+        if sys.platform == "linux":
+            with contextlib.suppress(OSError):
+                tid = threading.get_native_id()
+                os.setpriority(
+                    os.PRIO_PROCESS,
+                    tid,
+                    os.getpriority(os.PRIO_PROCESS, tid) + WRITER_NICENESS,
+                )
+
+        while True:
+            session = self._queue.get()
+            try:
+                if session is None:
+                    return
+                self._write(session)
+            except Exception:
+                logger.exception("failed to write the report of %s", session.room)
+            finally:
+                self._queue.task_done()
+
+    def _write(self, session: SessionData) -> None:
+        records = session.records
+        rollups: list[DailyRollup] = []
+        if session.store_path is not None:
+            store = ReadOnlyStore(session.store_path)
+            try:
+                if records is None:
+                    records = _buffer(
+                        store.range_sync(
+                            session.patient_id, session.started, session.ended
+                        )
+                    )
+                today = date.fromisoformat(session.today)
+                rollups = store.rollups_sync(
+                    session.patient_id,
+                    (today - timedelta(days=2 * TREND_DAYS - 1)).isoformat(),
+                    session.today,
+                )
+            finally:
+                store.close()
+
+        if records is None:
+            records = RecordBuffer()
+        report = build_report(session, records, rollups)
+
+        directory = self.directory / _UNSAFE_PATH.sub("_", session.patient_id)
+        directory.mkdir(parents=True, exist_ok=True)
+        started = datetime.fromtimestamp(session.started, timezone.utc)
+        stem = f"{started:%Y%m%dT%H%M%SZ}-{_UNSAFE_PATH.sub('_', session.room)}"
+        (directory / f"{stem}.json").write_text(
+            json.dumps(report, separators=(",", ":"))
+        )
+        np.savez_compressed(directory / f"{stem}.npz", **record_columns(records))
+        logger.info("session report written to %s", directory / stem)
+
+
+_writer: ReportWriter | None = None
+_writer_lock = threading.Lock()
+
+
+def report_writer() -> ReportWriter:
+    """The process's report writer, started on first use."""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = ReportWriter(os.getenv(REPORTS_DIR_ENV, "session-reports"))
+        return _writer
+
+
+async def submit_report(session: SessionData, timeout: float = EXIT_TIMEOUT) -> bool:
+    """Queue the report of ``session`` and wait at most ``timeout`` for it.
+
+    Meant for shutdown callbacks, the wait runs in a thread so the job's
+    event loop keeps going. Returns False if the report was dropped or isn't
+    written yet.
+    """
+    writer = report_writer()
+    if not writer.submit(session):
+        return False
+    if not await asyncio.to_thread(writer.join, timeout):
+        logger.warning("report of %s not written after %.0fs", session.room, timeout)
+        return False
+    return True
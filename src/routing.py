@@ -0,0 +1,457 @@
+"""Latency-aware routing of the voice pipeline across provider backends.
+
+Each stage can be configured with several backends in order of preference
+(``LLM_BACKENDS``, ``STT_BACKENDS``, ``TTS_BACKENDS``, see ``parse_backends``).
+The router of a stage tracks the health of every backend - an EWMA of its time
+to first response and of its error rate - and:
+
+- sends each request to the first healthy backend,
+- hedges: when no first response arrived within the stage's latency SLO, the
+  same request also goes to the next backend, whichever answers first is used
+  and the other request is cancelled,
+- fails over at once when a backend errors before its first response.
+
+A backend that errors or stays slow is marked unhealthy and only used when no
+other backend is left, except for one probe request every ``PROBE_INTERVAL``
+that lets it recover. Once the first response is out a request stays on its
+backend, an error after that propagates like it would without routing.
+
+LLM and TTS requests are routed this way. Speech recognition is one
+continuous stream per session that can't be hedged, several STT backends are
+combined with livekit's ``stt.FallbackAdapter`` (see components.py), which
+switches when the active stream fails.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import dataclasses
+import logging
+import time
+from collections.abc import AsyncIterator, Callable, Sequence
+from dataclasses import dataclass
+from typing import Any, Generic, Protocol, TypeVar
+
+from livekit.agents import APIConnectionError, APIConnectOptions, llm, tts, utils
+from livekit.agents.types import (
+    DEFAULT_API_CONNECT_OPTIONS,
+    NOT_GIVEN,
+    NotGivenOr,
+)
+
+logger = logging.getLogger("agent")
+
+LLM_BACKENDS_ENV = "LLM_BACKENDS"
+STT_BACKENDS_ENV = "STT_BACKENDS"
+TTS_BACKENDS_ENV = "TTS_BACKENDS"
+
+# time to the first token / first audio a backend is expected to stay within
+LLM_TTFT_SLO = 1.5
+TTS_TTFB_SLO = 0.6
+
+# weight of the newest sample in the moving averages
+EWMA_ALPHA = 0.3
+MAX_ERROR_RATE = 0.5
+# an unhealthy backend gets a request again after this long, to see if it recovered
+PROBE_INTERVAL = 30.0
+
+
+@dataclass(frozen=True)
+class BackendSpec:
+    """One backend of a stage, as configured: ``provider:model[@base_url]``."""
+
+    provider: str
+    model: str
+    base_url: str | None = None
+
+    def __str__(self) -> str:
+        spec = f"{self.provider}:{self.model}"
+        return f"{spec}@{self.base_url}" if self.base_url else spec
+
+
+def parse_backends(value: str, default: str) -> list[BackendSpec]:
+    """Backends in ``value``, comma separated, or the ``default`` backend if it's empty."""
+    specs = []
+    for item in (value or default).split(","):
+        item = item.strip()
+        if not item:
+            continue
+        backend, _, base_url = item.partition("@")
+        provider, sep, model = backend.partition(":")
+        if not sep or not provider or not model:
+            raise ValueError(f"invalid backend {item!r}, expected provider:model[@url]")
+        specs.append(BackendSpec(provider, model, base_url or None))
+    return specs
+
+
+class BackendHealth:
+    """Moving averages of a backend's first-response latency and error rate."""
+
+    def __init__(self, label: str, slo: float) -> None:
+        self.label = label
+        self.slo = slo
+        self.latency: float | None = None
+        self.error_rate = 0.0
+        self.requests = 0
+        self.hedged = 0
+        self._last_attempt = 0.0
+
+    @property
+    def healthy(self) -> bool:
+        return self.error_rate <= MAX_ERROR_RATE and (
+            self.latency is None or self.latency <= 2 * self.slo
+        )
+
+    def due_for_probe(self) -> bool:
+        return time.monotonic() - self._last_attempt >= PROBE_INTERVAL
+
+    def attempted(self) -> None:
+        self.requests += 1
+        self._last_attempt = time.monotonic()
+
+    def record(self, latency: float | None = None, *, error: bool = False) -> None:
+        """A first response after ``latency`` seconds, or an error."""
+        self.error_rate += EWMA_ALPHA * (float(error) - self.error_rate)
+        if latency is not None:
+            self.latency = (
+                latency
+                if self.latency is None
+                else self.latency + EWMA_ALPHA * (latency - self.latency)
+            )
+
+    def summary(self) -> dict[str, Any]:
+        return {
+            "healthy": self.healthy,
+            "latency": round(self.latency, 3) if self.latency is not None else None,
+            "error_rate": round(self.error_rate, 3),
+            "requests": self.requests,
+            "hedged": self.hedged,
+        }
+
+
+class _Stream(Protocol):
+    def __aiter__(self) -> AsyncIterator[Any]: ...
+
+    async def __anext__(self) -> Any: ...
+
+    async def aclose(self) -> None: ...
+
+
+B = TypeVar("B")
+S = TypeVar("S", bound=_Stream)
+
+
+class Router(Generic[B]):
+    """Picks, hedges and fails over between the backends of one stage."""
+
+    def __init__(
+        self, backends: Sequence[B], labels: Sequence[str], slo: float
+    ) -> None:
+        if not backends:
+            raise ValueError("at least one backend is required")
+        self.backends = list(backends)
+        self.health = [BackendHealth(label, slo) for label in labels]
+        self.slo = slo
+
+    def order(self) -> list[int]:
+        """Backends to try, healthy ones and those due for a probe first."""
+        usable = [
+            i for i, h in enumerate(self.health) if h.healthy or h.due_for_probe()
+        ]
+        return usable + [i for i in range(len(self.backends)) if i not in usable]
+
+    async def first_response(self, start: Callable[[B], S]) -> tuple[int, S, Any]:
+        """Start a request with ``start``, hedged and failed over as needed.
+
+        Returns the index of the backend that answered first, its stream and
+        the first item of it. The caller owns the stream.
+        """
+        order = self.order()
+        attempts: dict[asyncio.Task[Any], tuple[int, S, float]] = {}
+
+        def _attempt() -> None:
+            i = order.pop(0)
+            stream = start(self.backends[i])
+            self.health[i].attempted()
+            task = asyncio.ensure_future(stream.__anext__())
+            attempts[task] = (i, stream, time.perf_counter())
+
+        async def _cancel(task: asyncio.Task[Any], *, lost: bool) -> None:
+            i, stream, started = attempts.pop(task)
+            if lost:
+                # slower than the winner, which is all we know about its latency
+                self.health[i].record(time.perf_counter() - started)
+            await utils.aio.cancel_and_wait(task)
+            await stream.aclose()
+
+        _attempt()
+        try:
+            while attempts:
+                # the next backend is hedged once the newest attempt is past the SLO
+                *_, (_, _, last_started) = attempts.values()
+                timeout = (
+                    max(0.0, last_started + self.slo - time.perf_counter())
+                    if order
+                    else None
+                )
+                done, _ = await asyncio.wait(
+                    attempts, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    i, _, _ = next(iter(attempts.values()))
+                    self.health[i].hedged += 1
+                    logger.info(
+                        "%s is past the %.0fms SLO, hedging",
+                        self.health[i].label,
+                        self.slo * 1000,
+                    )
+                    _attempt()
+                    continue
+
+                for task in done:
+                    i, stream, started = attempts.pop(task)
+                    if task.exception() is None:
+                        self.health[i].record(time.perf_counter() - started)
+                        for other in list(attempts):
+                            await _cancel(other, lost=True)
+                        return i, stream, task.result()
+
+                    self.health[i].record(error=True)
+                    logger.warning(
+                        "%s failed before responding",
+                        self.health[i].label,
+                        exc_info=task.exception(),
+                    )
+                    await stream.aclose()
+                if order and not attempts:
+                    _attempt()
+        except BaseException:
+            for task in list(attempts):
+                await _cancel(task, lost=False)
+            raise
+
+        raise APIConnectionError(
+            f"all backends failed ({', '.join(h.label for h in self.health)})"
+        )
+
+    def summary(self) -> dict[str, dict[str, Any]]:
+        return {h.label: h.summary() for h in self.health}
+
+
+class RoutedLLM(llm.LLM):
+    """LLM that routes every request across ``backends``, see ``Router``."""
+
+    def __init__(
+        self,
+        backends: Sequence[llm.LLM],
+        *,
+        labels: Sequence[str] | None = None,
+        ttft_slo: float = LLM_TTFT_SLO,
+    ) -> None:
+        super().__init__()
+        self.router = Router(
+            backends, labels or [f"{b.label}:{b.model}" for b in backends], ttft_slo
+        )
+
+    @property
+    def model(self) -> str:
+        return self.router.backends[0].model
+
+    def chat(
+        self,
+        *,
+        chat_ctx: llm.ChatContext,
+        tools: list[llm.FunctionTool | llm.RawFunctionTool] | None = None,
+        conn_options: APIConnectOptions = DEFAULT_API_CONNECT_OPTIONS,
+        parallel_tool_calls: NotGivenOr[bool] = NOT_GIVEN,
+        tool_choice: NotGivenOr[llm.ToolChoice] = NOT_GIVEN,
+        extra_kwargs: NotGivenOr[dict[str, Any]] = NOT_GIVEN,
+    ) -> llm.LLMStream:
+        return _RoutedLLMStream(
+            self,
+            chat_ctx=chat_ctx,
+            tools=tools or [],
+            conn_options=conn_options,
+            parallel_tool_calls=parallel_tool_calls,
+            tool_choice=tool_choice,
+            extra_kwargs=extra_kwargs,
+        )
+
+    def prewarm(self) -> None:
+        for backend in self.router.backends:
+            backend.prewarm()
+
+    async def aclose(self) -> None:
+        for backend in self.router.backends:
+            await backend.aclose()
+
+
+class _RoutedLLMStream(llm.LLMStream):
+    def __init__(
+        self,
+        routed: RoutedLLM,
+        *,
+        chat_ctx: llm.ChatContext,
+        tools: list[llm.FunctionTool | llm.RawFunctionTool],
+        conn_options: APIConnectOptions,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(
+            routed, chat_ctx=chat_ctx, tools=tools, conn_options=conn_options
+        )
+        self._router = routed.router
+        self._kwargs = kwargs
+
+    async def _run(self) -> None:
+        def _start(backend: llm.LLM) -> llm.LLMStream:
+            return backend.chat(
+                chat_ctx=self._chat_ctx,
+                tools=self._tools,
+                # the router fails over instead of retrying the same backend
+                conn_options=dataclasses.replace(self._conn_options, max_retry=0),
+                **self._kwargs,
+            )
+
+        i, stream, chunk = await self._router.first_response(_start)
+        try:
+            self._event_ch.send_nowait(chunk)
+            async for chunk in stream:
+                self._event_ch.send_nowait(chunk)
+        except Exception:
+            self._router.health[i].record(error=True)
+            raise
+        finally:
+            await stream.aclose()
+
+
+class RoutedTTS(tts.TTS):
+    """Streaming TTS that routes every request across ``backends``, see ``Router``.
+
+    The backends must produce audio in the same format.
+    """
+
+    def __init__(
+        self,
+        backends: Sequence[tts.TTS],
+        *,
+        labels: Sequence[str] | None = None,
+        ttfb_slo: float = TTS_TTFB_SLO,
+    ) -> None:
+        primary = backends[0]
+        for backend in backends:
+            if not backend.capabilities.streaming:
+                raise ValueError(f"{backend.label} does not support streaming")
+            if (backend.sample_rate, backend.num_channels) != (
+                primary.sample_rate,
+                primary.num_channels,
+            ):
+                raise ValueError(f"{backend.label} has a different audio format")
+        super().__init__(
+            capabilities=tts.TTSCapabilities(streaming=True),
+            sample_rate=primary.sample_rate,
+            num_channels=primary.num_channels,
+        )
+        self.router = Router(backends, labels or [b.label for b in backends], ttfb_slo)
+
+    def synthesize(
+        self,
+        text: str,
+        *,
+        conn_options: APIConnectOptions = DEFAULT_API_CONNECT_OPTIONS,
+    ) -> tts.ChunkedStream:
+        # whole phrases synthesized off the critical path, see tts_cache.py
+        backend = self.router.backends[self.router.order()[0]]
+        return backend.synthesize(text, conn_options=conn_options)
+
+    def stream(
+        self, *, conn_options: APIConnectOptions = DEFAULT_API_CONNECT_OPTIONS
+    ) -> tts.SynthesizeStream:
+        return _RoutedSynthesizeStream(tts=self, conn_options=conn_options)
+
+    def prewarm(self) -> None:
+        for backend in self.router.backends:
+            backend.prewarm()
+
+    async def aclose(self) -> None:
+        for backend in self.router.backends:
+            await backend.aclose()
+
+
+class _RoutedSynthesizeStream(tts.SynthesizeStream):
+    def __init__(self, *, tts: RoutedTTS, conn_options: APIConnectOptions) -> None:
+        super().__init__(tts=tts, conn_options=conn_options)
+        self._router = tts.router
+
+    async def _run(self, output_emitter: tts.AudioEmitter) -> None:
+        output_emitter.initialize(
+            request_id=utils.shortuuid(),
+            sample_rate=self._tts.sample_rate,
+            num_channels=self._tts.num_channels,
+            mime_type="audio/pcm",
+            stream=True,
+        )
+        output_emitter.start_segment(segment_id=utils.shortuuid())
+
+        # what was pushed so far, replayed to a hedged request (None is a flush)
+        pushed: list[str | None] = []
+        ended = False
+        targets: list[tts.SynthesizeStream] = []
+
+        def _start(backend: tts.TTS) -> tts.SynthesizeStream:
+            stream = backend.stream(
+                conn_options=dataclasses.replace(self._conn_options, max_retry=0)
+            )
+            for data in pushed:
+                if data is None:
+                    stream.flush()
+                else:
+                    stream.push_text(data)
+            if ended:
+                stream.end_input()
+            targets.append(stream)
+            return stream
+
+        first_text = asyncio.Event()
+
+        async def _forward_input() -> None:
+            nonlocal ended
+            async for data in self._input_ch:
+                if isinstance(data, str):
+                    self._mark_started()
+                    pushed.append(data)
+                    first_text.set()
+                    for stream in targets:
+                        stream.push_text(data)
+                else:
+                    pushed.append(None)
+                    for stream in targets:
+                        stream.flush()
+            ended = True
+            first_text.set()
+            for stream in targets:
+                stream.end_input()
+
+        input_task = asyncio.create_task(_forward_input())
+        stream: tts.SynthesizeStream | None = None
+        try:
+            # the time to first audio only counts once there is text to speak
+            await first_text.wait()
+            if not any(pushed):
+                await input_task
+                return
+
+            i, stream, audio = await self._router.first_response(_start)
+            targets[:] = [stream]
+            try:
+                output_emitter.push(audio.frame.data.tobytes())
+                async for audio in stream:
+                    output_emitter.push(audio.frame.data.tobytes())
+            except Exception:
+                self._router.health[i].record(error=True)
+                raise
+            await input_task
+        finally:
+            await utils.aio.cancel_and_wait(input_task)
+            if stream is not None:
+                await stream.aclose()
+        output_emitter.end_segment()
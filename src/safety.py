@@ -0,0 +1,297 @@
+"""Fast path for the safety protocol's red flags.
+
+Left to the LLM, a patient mentioning suicidal thoughts or self-harm gets the
+referral only after end-of-turn detection, the LLM's time to first token and
+speech synthesis, like any other turn. ``SafetyMonitor`` scans every interim
+transcript instead. On a red flag it interrupts whatever the agent is saying
+and speaks the protocol's referral as soon as the patient pauses, from audio
+cached at prewarm (see tts_cache.py), without waiting on the LLM. The LLM is
+told the referral was given and continues the conversation from there.
+
+Unlike the metric extraction, matching prefers recall: a referral nobody
+needed is far cheaper than one that is missed. A flag is ignored only when a
+negation directly governs it in the same clause ("I'm not suicidal", "I would
+never hurt myself"): "I don't know, I want to die" and "I have never felt so
+suicidal" are red flags.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import re
+import time
+from collections import deque
+from collections.abc import Callable, Iterable, Iterator
+from dataclasses import dataclass
+from typing import Generic, TypeVar
+
+from livekit.agents import AgentSession
+from livekit.agents.voice import AgentStateChangedEvent, UserStateChangedEvent
+
+from prompts import SAFETY_REFERRALS
+from tts_cache import AudioCache, play, split_sentences
+
+logger = logging.getLogger("agent")
+
+RED_FLAGS = {
+    "suicidal_ideation": (
+        "suicide",
+        "suicidal",
+        "kill myself",
+        "killing myself",
+        "killed myself",
+        "end my life",
+        "ending my life",
+        "ended my life",
+        "take my own life",
+        "taking my own life",
+        "took my own life",
+        "want to die",
+        "wanted to die",
+        "wanna die",
+        "wish i was dead",
+        "wish i were dead",
+        "wished i was dead",
+        "wished i were dead",
+        "better off dead",
+        "end it all",
+        "ending it all",
+        "no reason to live",
+        "not worth living",
+        "don't want to live",
+        "don't want to be here anymore",
+        "do not want to live",
+        "do not want to be here anymore",
+        "didn't want to live",
+        "did not want to live",
+        "no longer want to live",
+        "no longer want to be here",
+    ),
+    "self_harm": (
+        "self harm",
+        "hurt myself",
+        "hurting myself",
+        "harm myself",
+        "harming myself",
+        "harmed myself",
+        "cut myself",
+        "cutting myself",
+        "burn myself",
+        "burning myself",
+        "burned myself",
+        "burnt myself",
+    ),
+}
+
+# words that, governing a flag, mean the patient is saying the opposite
+NEGATIONS = frozenset({"not", "never", "no", "don't", "won't", "wouldn't", "isn't"})
+# words that may stand between a negation and the flag it governs: "not going
+# to hurt myself", "never really wanted to die"
+_VERB_CHAIN = frozenset(
+    {"going", "gonna", "to", "ever", "really", "actually", "feel", "feeling"}
+)
+# a negation doesn't reach past these: "I don't know, I want to die"
+_CLAUSE_BREAK = re.compile(r"[,.;:!?]+|\b(?:but|and)\b")
+
+# after a referral the LLM handles the topic, the fast path doesn't repeat it
+REFERRAL_COOLDOWN = 120.0
+
+_NON_WORD = re.compile(r"[^a-z0-9']+")
+
+T = TypeVar("T")
+
+
+def _words(text: str) -> list[str]:
+    return _NON_WORD.sub(" ", text.lower().replace("-", " ")).split()
+
+
+@dataclass(frozen=True)
+class RedFlag:
+    category: str
+    phrase: str
+
+
+class PhraseMatcher(Generic[T]):
+    """Aho-Corasick automaton over whole words, finds every phrase in one pass."""
+
+    def __init__(self, phrases: dict[str, T]) -> None:
+        """``phrases`` maps each phrase to the value reported when it matches."""
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        self._out: list[list[tuple[int, T]]] = [[]]
+
+        for phrase, value in phrases.items():
+            words = _words(phrase)
+            state = 0
+            for word in words:
+                if word not in self._goto[state]:
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                    self._goto[state][word] = len(self._goto) - 1
+                state = self._goto[state][word]
+            self._out[state].append((len(words), value))
+
+        # breadth-first, so the failure state of every parent is known first
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for word, child in self._goto[state].items():
+                queue.append(child)
+                fail = self._fail[state]
+                while fail and word not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(word, 0)
+                if self._fail[child] == child:
+                    self._fail[child] = 0
+                self._out[child] += self._out[self._fail[child]]
+
+    def find(self, words: Iterable[str]) -> Iterator[tuple[int, T]]:
+        """``(index of the first word, value)`` of every phrase in ``words``."""
+        state = 0
+        for i, word in enumerate(words):
+            while state and word not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(word, 0)
+            for length, value in self._out[state]:
+                yield i - length + 1, value
+
+
+_MATCHER = PhraseMatcher(
+    {
+        phrase: RedFlag(category, phrase)
+        for category, phrases in RED_FLAGS.items()
+        for phrase in phrases
+    }
+)
+
+
+def _negated(words: list[str], start: int) -> bool:
+    """Whether a negation governs the phrase starting at ``words[start]``."""
+    for word in reversed(words[:start]):
+        if word in NEGATIONS:
+            return True
+        if word not in _VERB_CHAIN:
+            return False
+    return False
+
+
+def find_red_flag(transcript: str) -> RedFlag | None:
+    """The first red flag in ``transcript`` that isn't negated."""
+    for clause in _CLAUSE_BREAK.split(transcript.lower()):
+        words = _words(clause)
+        for start, flag in _MATCHER.find(words):
+            if not _negated(words, start):
+                return flag
+    return None
+
+
+class SafetyMonitor:
+    """Speaks the safety referral for red flags in the patient's interim transcripts.
+
+    Feed it every ``user_input_transcribed`` event. ``on_referral`` is called
+    with the red flag and the seconds from the patient's pause, or from the
+    detection if the patient had already stopped speaking, to the first audio
+    of the referral.
+    """
+
+    def __init__(
+        self,
+        session: AgentSession,
+        cache: AudioCache,
+        voice: str,
+        *,
+        on_referral: Callable[[RedFlag, float], None] | None = None,
+        cooldown: float = REFERRAL_COOLDOWN,
+    ) -> None:
+        self._session = session
+        self._cache = cache
+        self._voice = voice
+        self._on_referral = on_referral
+        self._cooldown = cooldown
+        self._last_referral = -cooldown
+        self._given: str | None = None
+        self._task: asyncio.Task[None] | None = None
+
+    def on_transcript(self, transcript: str) -> None:
+        if self._task is not None and not self._task.done():
+            return
+        if time.monotonic() - self._last_referral < self._cooldown:
+            return
+        flag = find_red_flag(transcript)
+        if flag is None:
+            return
+
+        logger.warning("red flag in transcript: %s", flag.category)
+        self._last_referral = time.monotonic()
+        # whatever the agent is saying or about to say is no longer appropriate
+        self._session.interrupt(force=True)
+        self._task = asyncio.create_task(self._refer(flag))
+
+    def take_referral(self) -> str | None:
+        """The referral given since the last call, to tell the LLM about."""
+        given, self._given = self._given, None
+        return given
+
+    async def aclose(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    async def _refer(self, flag: RedFlag) -> None:
+        referral = SAFETY_REFERRALS[flag.category]
+        loop = asyncio.get_running_loop()
+        paused = loop.create_future()
+        speaking = loop.create_future()
+        handle = None
+
+        def _on_user_state(ev: UserStateChangedEvent) -> None:
+            if ev.new_state != "speaking" and not paused.done():
+                paused.set_result(time.perf_counter())
+
+        def _on_agent_state(ev: AgentStateChangedEvent) -> None:
+            if (
+                ev.new_state == "speaking"
+                and handle is not None
+                and self._session.current_speech is handle
+                and not speaking.done()
+            ):
+                speaking.set_result(time.perf_counter())
+
+        self._session.on("user_state_changed", _on_user_state)
+        self._session.on("agent_state_changed", _on_agent_state)
+        try:
+            # don't talk over the patient, start the moment they pause
+            if self._session.user_state == "speaking":
+                await paused
+            started = paused.result() if paused.done() else time.perf_counter()
+
+            frames = [
+                self._cache.get(self._voice, s) for s in split_sentences(referral)
+            ]
+            if all(f is not None for f in frames):
+                audio = play([frame for sentence in frames for frame in sentence])
+                handle = self._session.say(
+                    referral, audio=audio, allow_interruptions=False
+                )
+            else:
+                handle = self._session.say(referral, allow_interruptions=False)
+            self._given = referral
+
+            first_audio = await asyncio.wait_for(speaking, timeout=10.0)
+        except asyncio.TimeoutError:
+            logger.warning("no audio of the safety referral after 10s")
+            return
+        finally:
+            self._session.off("user_state_changed", _on_user_state)
+            self._session.off("agent_state_changed", _on_agent_state)
+
+        response_time = first_audio - started
+        logger.info(
+            "safety referral for %s started %.0fms after the pause",
+            flag.category,
+            response_time * 1000,
+        )
+        if self._on_referral is not None:
+            self._on_referral(flag, response_time)
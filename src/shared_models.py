@@ -0,0 +1,13 @@
+"""Models loaded once per worker and shared by all of its job processes.
+
+In high-density mode the worker's fork server imports this module before it
+forks any job process (see density.py). The weights are then loaded once and
+shared copy-on-write by every process forked from it, instead of each process
+loading its own copy at prewarm. Nothing else should import it, in the worker's
+main process it would only cost memory.
+"""
+
+from livekit.plugins import silero
+
+# the ONNX session runs single-threaded, so it is safe to use after a fork
+vad = silero.VAD.load()
@@ -0,0 +1,202 @@
+"""What the worker imports before it is ready, and what that costs.
+
+``agent.py`` is imported by the worker's main process and again by every job
+process, so it only imports what all of them need. Plugins are imported where
+they are used:
+
+- the worker's main process only imports the turn detector, whose model runs in
+  the worker's inference process.
+- job processes import the plugins of the configured pipeline at prewarm (see
+  ``components.pipeline_plugins``). With the forkserver context the fork server
+  imports them before it forks the first job process, so every process
+  inherits them.
+- ``download-files`` and ``console``, which runs the job in the worker's own
+  process, import all of them up front: livekit only registers plugins
+  imported on the main thread, and ``download-files`` only knows registered
+  ones.
+
+``python src/agent.py profile-startup`` reports where a cold start spends its
+time: the import time of every module and the time until prewarm is done.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+from collections.abc import Sequence
+from dataclasses import dataclass
+
+from livekit.agents import Plugin, WorkerOptions
+
+from components import import_plugins, pipeline_plugins
+
+logger = logging.getLogger("agent")
+
+# plugins the worker's main process needs: the turn detector registers the
+# model of the worker's inference process
+WORKER_PLUGINS = ("livekit.plugins.turn_detector.multilingual",)
+# commands that need every plugin of the pipeline in the main process
+EAGER_COMMANDS = frozenset({"download-files", "console"})
+
+PROFILE_COMMAND = "profile-startup"
+
+# Run in a fresh interpreter with -X importtime: import the agent like the
+# worker does, then prewarm like a job process started from scratch.
+_PROFILE_SCRIPT = """
+import json, sys, time
+started = float(sys.argv[1])
+marks = {}
+import agent
+marks["import agent"] = time.monotonic() - started
+import startup
+startup.import_plugins(startup.WORKER_PLUGINS)
+marks["worker plugins"] = time.monotonic() - started
+from livekit.agents import JobExecutorType, JobProcess
+proc = JobProcess(
+    executor_type=JobExecutorType.PROCESS, user_arguments=None, http_proxy=None
+)
+agent.prewarm(proc)
+marks["prewarm"] = time.monotonic() - started
+timings = proc.userdata["components"].timings
+print(json.dumps({"marks": marks, "prewarm": timings}))
+"""
+
+
+class PreloadPlugin(Plugin):
+    """Only registered for the fork server to import ``package``."""
+
+    def __init__(self, package: str) -> None:
+        super().__init__(f"therapist-{package}", "1.0.0", package, logger)
+
+
+def import_worker_plugins(options: WorkerOptions, command: str | None) -> None:
+    """Import the plugins the worker's main process needs to run ``command``.
+
+    Must be called on the main thread before the worker starts.
+    """
+    plugins = pipeline_plugins()
+    if command in EAGER_COMMANDS:
+        import_plugins(plugins)
+        return
+
+    import_plugins(WORKER_PLUGINS)
+    if options.multiprocessing_context == "forkserver":
+        for package in plugins:
+            if package not in WORKER_PLUGINS:
+                Plugin.register_plugin(PreloadPlugin(package))
+
+
+@dataclass(frozen=True)
+class ImportTime:
+    """One line of ``python -X importtime``, times in seconds."""
+
+    module: str
+    # how deep in the imports of another module it was imported
+    depth: int
+    self_time: float
+    cumulative: float
+
+
+def parse_importtime(output: str) -> list[ImportTime]:
+    """The imports in the stderr of ``python -X importtime``."""
+    imports = []
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|", 2)
+        if not self_us.strip().isdigit():
+            # the header
+            continue
+        module = name.strip()
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        imports.append(
+            ImportTime(module, depth, int(self_us) / 1e6, int(cumulative_us) / 1e6)
+        )
+    return imports
+
+
+def profile_startup(argv: Sequence[str] = ()) -> int:
+    """``profile-startup``: print the import times and time to prewarm."""
+    parser = argparse.ArgumentParser(
+        prog=f"agent.py {PROFILE_COMMAND}",
+        description="Report the import time per module and the time until"
+        " prewarm is done, in a fresh interpreter.",
+    )
+    parser.add_argument(
+        "--top", type=int, default=20, help="modules to show (default: %(default)s)"
+    )
+    parser.add_argument(
+        "--depth",
+        type=int,
+        default=1,
+        help="rank the modules imported up to this deep in the imports of"
+        " another module by their cumulative time (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--self",
+        dest="by_self",
+        action="store_true",
+        help="rank every module by its own import time instead",
+    )
+    args = parser.parse_args(argv)
+
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        filter(
+            None, [os.path.dirname(os.path.abspath(__file__)), env.get("PYTHONPATH")]
+        )
+    )
+    # clients are built at prewarm but never used, any key will do
+    for key in ("OPENAI_API_KEY", "DEEPGRAM_API_KEY"):
+        env.setdefault(key, PROFILE_COMMAND)
+
+    started = time.monotonic()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _PROFILE_SCRIPT, str(started)],
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        errors = [
+            line
+            for line in result.stderr.splitlines()
+            if not line.startswith("import time:")
+        ]
+        print("\n".join(errors), file=sys.stderr)
+        return result.returncode
+
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    imports = parse_importtime(result.stderr)
+    marks = report["marks"]
+    print(f"cold start until prewarm is done: {marks['prewarm'] * 1000:.0f}ms")
+    previous = 0.0
+    for name, at in marks.items():
+        print(f"  {name:<16} {(at - previous) * 1000:>7.0f}ms")
+        previous = at
+    stages = ", ".join(
+        f"{k} {v * 1000:.0f}ms" for k, v in report["prewarm"].items() if k != "total"
+    )
+    print(f"  prewarm stages: {stages}")
+
+    if args.by_self:
+        ranked = sorted(imports, key=lambda i: i.self_time, reverse=True)
+        print(f"\nslowest modules of {len(imports)} (self ms, cumulative ms)")
+    else:
+        ranked = sorted(
+            (i for i in imports if i.depth <= args.depth),
+            key=lambda i: i.cumulative,
+            reverse=True,
+        )
+        print("\nslowest imports (self ms, cumulative ms)")
+    for entry in ranked[: args.top]:
+        print(
+            f"  {entry.self_time * 1000:>8.1f} {entry.cumulative * 1000:>8.1f}"
+            f"  {'  ' * entry.depth}{entry.module}"
+        )
+    return 0
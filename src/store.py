@@ -0,0 +1,522 @@
+"""Agent-side persistent store for tracking records.
+
+Records live in an append-only SQLite log in WAL mode. Every record gets a
+monotonically increasing ``seq`` and is indexed by ``(patient_id, ts)``, so
+range queries for one patient are an index seek plus a scan of the matching
+rows, independent of how much history other patients have.
+
+A record can be updated by appending it again with the same ``record_id``,
+queries only return the latest version of each record. Since every version
+gets a new ``seq``, the records that changed after a given ``seq`` are what a
+client that has seen everything up to it is missing (see sync.py). ``store_id``
+tells databases apart, seqs of one don't mean anything in another.
+
+Every numeric field is also rolled up per patient and day (count, sum, min and
+max) in the same transaction that appends the record, so trend queries read
+one row per day and metric no matter how many records there are. Days are
+local to the patient's timezone at the time of the record.
+
+Appends never block the event loop: they are handed to a writer thread that
+group-commits everything queued within ``commit_interval`` in one transaction.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timezone, tzinfo
+from typing import Any
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+logger = logging.getLogger("agent")
+
+# participant attribute with the patient's IANA timezone, days are local to it
+TIMEZONE_ATTRIBUTE = "tracking.timezone"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    patient_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    ts REAL NOT NULL,
+    data TEXT NOT NULL,
+    record_id TEXT,
+    day TEXT
+);
+CREATE INDEX IF NOT EXISTS records_patient_ts ON records (patient_id, ts);
+CREATE INDEX IF NOT EXISTS records_patient_seq ON records (patient_id, seq);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS daily_rollups (
+    patient_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    day TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    total REAL NOT NULL,
+    min REAL NOT NULL,
+    max REAL NOT NULL,
+    PRIMARY KEY (patient_id, kind, metric, day)
+) WITHOUT ROWID;
+"""
+
+# databases created before records had ids and days
+_MIGRATIONS = {
+    "record_id": "ALTER TABLE records ADD COLUMN record_id TEXT",
+    "day": "ALTER TABLE records ADD COLUMN day TEXT",
+}
+
+_ROLLUP = """
+INSERT INTO daily_rollups (patient_id, kind, metric, day, count, total, min, max)
+VALUES (?, ?, ?, ?, 1, ?, ?, ?)
+ON CONFLICT (patient_id, kind, metric, day) DO UPDATE SET
+    count = count + 1,
+    total = total + excluded.total,
+    min = min(min, excluded.min),
+    max = max(max, excluded.max)
+"""
+
+_LATEST = (
+    "NOT EXISTS (SELECT 1 FROM records n"
+    " WHERE n.record_id = r.record_id AND n.seq > r.seq)"
+)
+
+_RECORD_ID_INDEX = """
+CREATE INDEX IF NOT EXISTS records_record_id ON records (record_id)
+WHERE record_id IS NOT NULL
+"""
+
+
+@dataclass(frozen=True)
+class StoredRecord:
+    seq: int
+    patient_id: str
+    kind: str
+    ts: float
+    data: dict[str, Any]
+    record_id: str | None = None
+
+
+@dataclass(frozen=True)
+class DailyRollup:
+    patient_id: str
+    kind: str
+    metric: str
+    day: str
+    count: int
+    total: float
+    min: float
+    max: float
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count
+
+
+@dataclass
+class _PendingAppend:
+    patient_id: str
+    kind: str
+    ts: float
+    day: str
+    data: str
+    metrics: dict[str, float]
+    record_id: str | None
+    future: asyncio.Future[int] | None
+    loop: asyncio.AbstractEventLoop | None
+
+
+class TrackingStore:
+    """Append-only tracking log with per-patient time-range queries.
+
+    Args:
+        path: SQLite database file, ``":memory:"`` is not supported since reads
+            and writes use separate connections.
+        commit_interval: Seconds the writer waits for more appends before it
+            commits a group.
+        max_group: Maximum number of records committed in one transaction.
+    """
+
+    def __init__(
+        self, path: str, *, commit_interval: float = 0.05, max_group: int = 256
+    ) -> None:
+        self._path = path
+        self._commit_interval = commit_interval
+        self._max_group = max_group
+        self._queue: queue.SimpleQueue[_PendingAppend | None] = queue.SimpleQueue()
+        self._closed = False
+
+        with sqlite3.connect(path) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(records)")}
+            for column, migration in _MIGRATIONS.items():
+                if column not in columns:
+                    conn.execute(migration)
+            conn.execute(_RECORD_ID_INDEX)
+            _backfill_rollups(conn)
+            conn.execute(
+                "INSERT OR IGNORE INTO meta (key, value) VALUES ('store_id', ?)",
+                (uuid.uuid4().hex,),
+            )
+            (self.store_id,) = conn.execute(
+                "SELECT value FROM meta WHERE key = 'store_id'"
+            ).fetchone()
+        conn.close()
+
+        self._reader = sqlite3.connect(path, check_same_thread=False)
+        self._reader_lock = threading.Lock()
+        self._writer = threading.Thread(
+            target=self._write_loop, name="tracking_store_writer", daemon=True
+        )
+        self._writer.start()
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    def append(
+        self,
+        patient_id: str,
+        kind: str,
+        data: dict[str, Any],
+        ts: float | None = None,
+        record_id: str | None = None,
+        tz: tzinfo | None = None,
+    ) -> asyncio.Future[int] | None:
+        """Queue a record for the next group commit.
+
+        Appending with the ``record_id`` of an earlier record replaces it, pass
+        the earlier ``ts`` to keep its place in the history. ``tz`` is the
+        patient's timezone the record's day is rolled up in, UTC by default.
+
+        When called from an event loop, returns a future resolved with the
+        record's ``seq`` once it is durable. Callers that don't need the seq can
+        ignore it, the append is committed either way.
+        """
+        if self._closed:
+            raise RuntimeError("tracking store is closed")
+
+        try:
+            loop: asyncio.AbstractEventLoop | None = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        future = loop.create_future() if loop else None
+        ts = time.time() if ts is None else ts
+        self._queue.put(
+            _PendingAppend(
+                patient_id=patient_id,
+                kind=kind,
+                ts=ts,
+                day=datetime.fromtimestamp(ts, tz or timezone.utc).date().isoformat(),
+                data=json.dumps(data, separators=(",", ":")),
+                metrics=_numeric_fields(data),
+                record_id=record_id,
+                future=future,
+                loop=loop,
+            )
+        )
+        return future
+
+    async def range(
+        self,
+        patient_id: str,
+        start: float,
+        end: float | None = None,
+        kind: str | None = None,
+    ) -> list[StoredRecord]:
+        """Latest versions of the records of ``patient_id`` with ``start <= ts < end``, oldest first."""
+        return await asyncio.to_thread(self.range_sync, patient_id, start, end, kind)
+
+    def range_sync(
+        self,
+        patient_id: str,
+        start: float,
+        end: float | None = None,
+        kind: str | None = None,
+    ) -> list[StoredRecord]:
+        with self._reader_lock:
+            return _select_range(self._reader, patient_id, start, end, kind)
+
+    async def changes(
+        self, patient_id: str, after_seq: int, limit: int = 200
+    ) -> list[StoredRecord]:
+        """Latest versions of the records of ``patient_id`` changed after ``after_seq``.
+
+        Ordered by ``seq``, at most ``limit`` of them.
+        """
+        return await asyncio.to_thread(self.changes_sync, patient_id, after_seq, limit)
+
+    def changes_sync(
+        self, patient_id: str, after_seq: int, limit: int = 200
+    ) -> list[StoredRecord]:
+        sql = (
+            "SELECT seq, patient_id, kind, ts, data, record_id FROM records r"
+            f" WHERE patient_id = ? AND seq > ? AND {_LATEST} ORDER BY seq LIMIT ?"
+        )
+        with self._reader_lock:
+            rows = self._reader.execute(sql, (patient_id, after_seq, limit)).fetchall()
+        return [
+            StoredRecord(seq, pid, k, ts, json.loads(data), record_id)
+            for seq, pid, k, ts, data, record_id in rows
+        ]
+
+    async def rollups(
+        self,
+        patient_id: str,
+        start_day: str,
+        end_day: str,
+        kind: str | None = None,
+    ) -> list[DailyRollup]:
+        """Daily rollups of ``patient_id`` from ``start_day`` to ``end_day`` inclusive.
+
+        Days are ISO dates (``YYYY-MM-DD``) in the patient's timezone.
+        """
+        return await asyncio.to_thread(
+            self.rollups_sync, patient_id, start_day, end_day, kind
+        )
+
+    def rollups_sync(
+        self,
+        patient_id: str,
+        start_day: str,
+        end_day: str,
+        kind: str | None = None,
+    ) -> list[DailyRollup]:
+        with self._reader_lock:
+            return _select_rollups(self._reader, patient_id, start_day, end_day, kind)
+
+    async def aclose(self) -> None:
+        """Commit everything queued so far and close the database."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        await asyncio.to_thread(self._writer.join)
+        with self._reader_lock:
+            self._reader.close()
+
+    def _write_loop(self) -> None:
+        conn = sqlite3.connect(self._path)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        try:
+            closing = False
+            while not closing:
+                item = self._queue.get()
+                if item is None:
+                    break
+                group = [item]
+                deadline = time.monotonic() + self._commit_interval
+                while len(group) < self._max_group:
+                    try:
+                        item = self._queue.get(
+                            timeout=max(0.0, deadline - time.monotonic())
+                        )
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        closing = True
+                        break
+                    group.append(item)
+                self._commit(conn, group)
+        finally:
+            conn.close()
+
+    def _commit(self, conn: sqlite3.Connection, group: list[_PendingAppend]) -> None:
+        try:
+            with conn:
+                seqs = [_insert(conn, p) for p in group]
+        except sqlite3.Error as e:
+            logger.error("failed to commit %d tracking records: %s", len(group), e)
+            for p in group:
+                if p.future is not None and p.loop is not None:
+                    _resolve(p.loop, _set_exception, p.future, e)
+            return
+
+        for p, seq in zip(group, seqs):
+            if p.future is not None and p.loop is not None:
+                _resolve(p.loop, _set_result, p.future, seq)
+
+
+def patient_id_for(participant: Any) -> str:
+    """Stable patient id of a participant: the identity its token was issued for.
+
+    The frontend's connection-details route issues tokens for the patient id it
+    keeps in an HttpOnly cookie. Attributes aren't used: a participant can set
+    its own, and would be served the history of any patient id it knows.
+    """
+    return participant.identity
+
+
+def patient_timezone_for(participant: Any) -> tzinfo:
+    """Timezone a participant's frontend reported, UTC if none or unknown."""
+    name = participant.attributes.get(TIMEZONE_ATTRIBUTE)
+    if name:
+        try:
+            return ZoneInfo(name)
+        except (ZoneInfoNotFoundError, ValueError):
+            logger.debug("unknown patient timezone %r, using UTC", name)
+    return timezone.utc
+
+
+class ReadOnlyStore:
+    """Blocking queries on a tracking database, from outside the job that writes it.
+
+    Opened read-only, for work done after the job's ``TrackingStore`` closed,
+    such as session reports (see reports.py).
+    """
+
+    def __init__(self, path: str) -> None:
+        self._conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+
+    def range_sync(
+        self,
+        patient_id: str,
+        start: float,
+        end: float | None = None,
+        kind: str | None = None,
+    ) -> list[StoredRecord]:
+        return _select_range(self._conn, patient_id, start, end, kind)
+
+    def rollups_sync(
+        self,
+        patient_id: str,
+        start_day: str,
+        end_day: str,
+        kind: str | None = None,
+    ) -> list[DailyRollup]:
+        return _select_rollups(self._conn, patient_id, start_day, end_day, kind)
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+def _select_range(
+    conn: sqlite3.Connection,
+    patient_id: str,
+    start: float,
+    end: float | None = None,
+    kind: str | None = None,
+) -> list[StoredRecord]:
+    sql = (
+        "SELECT seq, patient_id, kind, ts, data, record_id FROM records r"
+        f" WHERE patient_id = ? AND ts >= ? AND {_LATEST}"
+    )
+    args: list[Any] = [patient_id, start]
+    if end is not None:
+        sql += " AND ts < ?"
+        args.append(end)
+    if kind is not None:
+        sql += " AND kind = ?"
+        args.append(kind)
+    sql += " ORDER BY ts, seq"
+    return [
+        StoredRecord(seq, pid, k, ts, json.loads(data), record_id)
+        for seq, pid, k, ts, data, record_id in conn.execute(sql, args).fetchall()
+    ]
+
+
+def _select_rollups(
+    conn: sqlite3.Connection,
+    patient_id: str,
+    start_day: str,
+    end_day: str,
+    kind: str | None = None,
+) -> list[DailyRollup]:
+    sql = (
+        "SELECT patient_id, kind, metric, day, count, total, min, max"
+        " FROM daily_rollups WHERE patient_id = ? AND day >= ? AND day <= ?"
+    )
+    args: list[Any] = [patient_id, start_day, end_day]
+    if kind is not None:
+        sql += " AND kind = ?"
+        args.append(kind)
+    sql += " ORDER BY kind, metric, day"
+    return [DailyRollup(*row) for row in conn.execute(sql, args).fetchall()]
+
+
+def _numeric_fields(data: dict[str, Any]) -> dict[str, float]:
+    return {
+        name: value
+        for name, value in data.items()
+        if isinstance(value, (int, float)) and not isinstance(value, bool)
+    }
+
+
+def _insert(conn: sqlite3.Connection, p: _PendingAppend) -> int:
+    previous = None
+    if p.record_id is not None:
+        previous = conn.execute(
+            "SELECT day FROM records WHERE record_id = ? ORDER BY seq DESC LIMIT 1",
+            (p.record_id,),
+        ).fetchone()
+    seq = conn.execute(
+        "INSERT INTO records (patient_id, kind, ts, data, record_id, day) VALUES (?, ?, ?, ?, ?, ?)",
+        (p.patient_id, p.kind, p.ts, p.data, p.record_id, p.day),
+    ).lastrowid
+
+    if previous is None:
+        for metric, value in p.metrics.items():
+            conn.execute(
+                _ROLLUP, (p.patient_id, p.kind, metric, p.day, value, value, value)
+            )
+    else:
+        # min and max can't be taken back, rebuild the days the record was on
+        for day in {previous[0], p.day}:
+            _rebuild_rollups(conn, p.patient_id, p.kind, day)
+    return seq
+
+
+def _rebuild_rollups(
+    conn: sqlite3.Connection, patient_id: str, kind: str, day: str
+) -> None:
+    conn.execute(
+        "DELETE FROM daily_rollups WHERE patient_id = ? AND kind = ? AND day = ?",
+        (patient_id, kind, day),
+    )
+    rows = conn.execute(
+        f"SELECT data FROM records r WHERE patient_id = ? AND kind = ? AND day = ? AND {_LATEST}",
+        (patient_id, kind, day),
+    )
+    for (data,) in rows.fetchall():
+        for metric, value in _numeric_fields(json.loads(data)).items():
+            conn.execute(_ROLLUP, (patient_id, kind, metric, day, value, value, value))
+
+
+def _backfill_rollups(conn: sqlite3.Connection) -> None:
+    # records from before rollups existed, their days are in UTC
+    groups = conn.execute(
+        "SELECT DISTINCT patient_id, kind, date(ts, 'unixepoch') FROM records"
+        " WHERE day IS NULL"
+    ).fetchall()
+    if not groups:
+        return
+    conn.execute("UPDATE records SET day = date(ts, 'unixepoch') WHERE day IS NULL")
+    for patient_id, kind, day in groups:
+        _rebuild_rollups(conn, patient_id, kind, day)
+    logger.info("rolled up %d days of earlier tracking records", len(groups))
+
+
+def _resolve(loop: asyncio.AbstractEventLoop, fn: Any, *args: Any) -> None:
+    # the job's loop may already be closed when the last group commits
+    with contextlib.suppress(RuntimeError):
+        loop.call_soon_threadsafe(fn, *args)
+
+
+def _set_result(future: asyncio.Future[int], seq: int) -> None:
+    if not future.done():
+        future.set_result(seq)
+
+
+def _set_exception(future: asyncio.Future[int], exc: BaseException) -> None:
+    if not future.done():
+        future.set_exception(exc)
+        # nobody may be awaiting appends, don't log "exception never retrieved"
+        future.exception()
@@ -0,0 +1,109 @@
+"""Delta sync of tracking history between the agent's store and a dashboard.
+
+The dashboard keeps a high-water mark: the ``store_id`` of the agent's store
+and the highest ``seq`` it has synced from it. On join it asks for what changed
+since (``{"store": "…", "after": 1234}``) and gets the records back in chunks:
+
+    {"store": "…", "records": [{"seq": 1240, "id": "…", "type": "pain_assessment",
+     "ts": 1760000000.0, "data": {…}}, …], "next": 1262, "more": false}
+
+It repeats the request with ``after`` set to ``next`` while ``more`` is true.
+Every version of a record gets a new seq and only the latest version is sent,
+so a reconnect costs bytes proportional to what changed, not to the history.
+A different ``store`` (a new database) restarts the sync from the beginning.
+
+Records stream to the dashboard live as well, the client upserts by record id
+so a record it receives both ways is only kept once.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+from typing import Any
+
+from livekit import rtc
+
+from store import StoredRecord, TrackingStore, patient_id_for
+
+logger = logging.getLogger("agent")
+
+SYNC_RPC_METHOD = "tracking.sync"
+
+# leaves headroom below the 15KiB RPC payload limit for the envelope
+MAX_CHUNK_BYTES = 12 * 1024
+
+_PAGE = 100
+
+
+def _record_message(record: StoredRecord) -> dict[str, Any]:
+    return {
+        "seq": record.seq,
+        # records from before they had ids are identified by their seq
+        "id": record.record_id or f"seq-{record.seq}",
+        "type": record.kind,
+        "ts": record.ts,
+        "data": record.data,
+    }
+
+
+async def sync_chunk(
+    store: TrackingStore,
+    patient_id: str,
+    after: int,
+    max_bytes: int = MAX_CHUNK_BYTES,
+) -> dict[str, Any]:
+    """Records of ``patient_id`` changed after seq ``after``, up to about ``max_bytes``."""
+    records: list[dict[str, Any]] = []
+    size = 0
+    next_seq = after
+    more = False
+    while not more:
+        page = await store.changes(patient_id, next_seq, _PAGE)
+        for record in page:
+            message = _record_message(record)
+            message_size = len(json.dumps(message, separators=(",", ":"))) + 1
+            if records and size + message_size > max_bytes:
+                more = True
+                break
+            records.append(message)
+            size += message_size
+            next_seq = record.seq
+        if len(page) < _PAGE:
+            break
+
+    return {"store": store.store_id, "records": records, "next": next_seq, "more": more}
+
+
+def register_sync_rpc(room: rtc.Room, store: TrackingStore) -> None:
+    """Serve ``SYNC_RPC_METHOD`` to the room's patients, each gets their own records."""
+
+    async def _handler(data: rtc.RpcInvocationData) -> str:
+        participant = room.remote_participants.get(data.caller_identity)
+        if participant is None:
+            raise rtc.RpcError(
+                rtc.RpcError.ErrorCode.APPLICATION_ERROR, "unknown participant"
+            )
+
+        try:
+            request = json.loads(data.payload or "{}")
+            after = int(request.get("after") or 0)
+        except (ValueError, TypeError, AttributeError) as e:
+            raise rtc.RpcError(
+                rtc.RpcError.ErrorCode.APPLICATION_ERROR, f"invalid request: {e}"
+            ) from e
+        if request.get("store") != store.store_id:
+            # seqs of another store mean nothing here, send everything
+            after = 0
+
+        patient_id = patient_id_for(participant)
+        chunk = await sync_chunk(store, patient_id, after)
+        logger.debug(
+            "synced %d tracking records after seq %d to %s",
+            len(chunk["records"]),
+            after,
+            patient_id,
+        )
+        return json.dumps(chunk, separators=(",", ":"))
+
+    room.local_participant.register_rpc_method(SYNC_RPC_METHOD, _handler)
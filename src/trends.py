@@ -0,0 +1,109 @@
+"""Trend series for the dashboard, served over RPC from the daily rollups.
+
+The dashboard asks for a period (``{"period": "30d"}``) and gets one point per
+day and metric, already bucketed in the patient's timezone:
+
+    {"start": "2026-09-18", "days": 30, "series": {
+        "pain_assessment.painLevel": {
+            "count": [0, 2, ...], "mean": [null, 5.5, ...],
+            "min": [null, 4, ...], "max": [null, 7, ...]}}}
+
+Series are column-oriented so 90 days of the default metrics stay far below the
+RPC payload limit. The cost of a request depends on the number of days, not on
+how much history the patient has.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+from collections.abc import Sequence
+from datetime import date, datetime, timedelta
+from typing import Any
+
+from livekit import rtc
+
+from store import TrackingStore, patient_id_for, patient_timezone_for
+
+logger = logging.getLogger("agent")
+
+TRENDS_RPC_METHOD = "tracking.trends"
+
+PERIODS = {"7d": 7, "30d": 30, "90d": 90}
+
+# the headline metric of every record kind, as charted by the dashboard
+DEFAULT_METRICS = (
+    "pain_assessment.painLevel",
+    "sleep_quality.sleepQuality",
+    "mood_assessment.moodRating",
+)
+
+# keeps the response of the longest period within the RPC payload limit
+MAX_METRICS = 6
+
+
+async def trend_series(
+    store: TrackingStore,
+    patient_id: str,
+    days: int,
+    today: date,
+    metrics: Sequence[str] = DEFAULT_METRICS,
+) -> dict[str, Any]:
+    """Per-day count, mean, min and max of ``metrics`` for the ``days`` up to ``today``."""
+    start = today - timedelta(days=days - 1)
+    series: dict[str, dict[str, list[Any]]] = {
+        metric: {
+            "count": [0] * days,
+            "mean": [None] * days,
+            "min": [None] * days,
+            "max": [None] * days,
+        }
+        for metric in metrics
+    }
+
+    rollups = await store.rollups(patient_id, start.isoformat(), today.isoformat())
+    for rollup in rollups:
+        points = series.get(f"{rollup.kind}.{rollup.metric}")
+        if points is None:
+            continue
+        i = (date.fromisoformat(rollup.day) - start).days
+        points["count"][i] = rollup.count
+        points["mean"][i] = round(rollup.mean, 1)
+        points["min"][i] = rollup.min
+        points["max"][i] = rollup.max
+
+    return {"start": start.isoformat(), "days": days, "series": series}
+
+
+def register_trends_rpc(room: rtc.Room, store: TrackingStore) -> None:
+    """Serve ``TRENDS_RPC_METHOD`` to the room's patients, each gets their own data."""
+
+    async def _handler(data: rtc.RpcInvocationData) -> str:
+        participant = room.remote_participants.get(data.caller_identity)
+        if participant is None:
+            raise rtc.RpcError(
+                rtc.RpcError.ErrorCode.APPLICATION_ERROR, "unknown participant"
+            )
+
+        try:
+            request = json.loads(data.payload or "{}")
+            days = PERIODS[request.get("period", "7d")]
+            metrics = request.get("metrics") or list(DEFAULT_METRICS)
+            if not (
+                isinstance(metrics, list)
+                and len(metrics) <= MAX_METRICS
+                and all(isinstance(m, str) and "." in m for m in metrics)
+            ):
+                raise ValueError(f"invalid metrics {metrics!r}")
+        except (ValueError, KeyError, AttributeError) as e:
+            raise rtc.RpcError(
+                rtc.RpcError.ErrorCode.APPLICATION_ERROR, f"invalid request: {e}"
+            ) from e
+
+        today = datetime.now(patient_timezone_for(participant)).date()
+        result = await trend_series(
+            store, patient_id_for(participant), days, today, metrics
+        )
+        return json.dumps(result, separators=(",", ":"))
+
+    room.local_participant.register_rpc_method(TRENDS_RPC_METHOD, _handler)
@@ -0,0 +1,424 @@
+"""Cache of synthesized speech, so phrases said again and again are synthesized once.
+
+Entries are content-addressed by the voice and the exact text and hold the
+decoded audio frames, ready to be played out. They are kept in a memory LRU
+shared by every session of the job process and, with a directory, as WAV
+files shared by the worker's processes and kept across restarts. Both are
+bounded by the size of the audio they hold and evict the least recently used
+phrase first. The disk bound is enforced from each process' own view of the
+directory, so it is approximate when several processes write to it.
+
+``CachedTTS`` wraps the session's streaming TTS. Text is streamed on to the
+provider as it arrives, except while it can still turn out to be one of a
+fixed set of phrases (the prompt's greetings, safety referrals and closings).
+A sentence that completes one of them is played from the cache, so it costs
+no provider round trip and its first audio is ready at once.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import hashlib
+import logging
+import os
+import re
+import wave
+from collections import OrderedDict
+from collections.abc import AsyncIterator, Iterable, Sequence
+
+from livekit import rtc
+from livekit.agents import APIConnectOptions, tts, utils
+from livekit.agents.types import DEFAULT_API_CONNECT_OPTIONS
+
+logger = logging.getLogger("agent")
+
+TTS_CACHE_DIR_ENV = "TTS_CACHE_DIR"
+
+DEFAULT_MAX_BYTES = 16 * 1024 * 1024
+DEFAULT_MAX_DISK_BYTES = 256 * 1024 * 1024
+
+_FRAME_MS = 200
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+class AudioCache:
+    """LRU of synthesized audio by voice and text, bounded in bytes."""
+
+    def __init__(
+        self,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        *,
+        directory: str | None = None,
+        max_disk_bytes: int = DEFAULT_MAX_DISK_BYTES,
+    ) -> None:
+        self.max_bytes = max_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.directory = directory
+        self.size = 0
+        self.disk_size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[tuple[str, str], list[rtc.AudioFrame]] = (
+            OrderedDict()
+        )
+        # file name -> size, least recently used first
+        self._files: OrderedDict[str, int] = OrderedDict()
+        if directory is not None:
+            self._scan(directory)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: tuple[str, str]) -> bool:
+        return key in self._entries or _file_name(*key) in self._files
+
+    def get(self, voice: str, text: str) -> list[rtc.AudioFrame] | None:
+        frames = self._load(voice, text)
+        if frames is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return frames
+
+    def put(self, voice: str, text: str, frames: Sequence[rtc.AudioFrame]) -> None:
+        frames = list(frames)
+        self._remember(voice, text, frames)
+        if self.directory is not None and frames:
+            self._write(_file_name(voice, text), frames)
+
+    def preload(self, voice: str, texts: Iterable[str]) -> int:
+        """Read the cached audio of ``texts`` from disk into memory, returns the count."""
+        return sum(self._load(voice, text) is not None for text in texts)
+
+    async def synthesize(
+        self, tts_: tts.TTS, voice: str, text: str
+    ) -> list[rtc.AudioFrame]:
+        """The cached audio of ``text``, synthesized with ``tts_`` on a miss."""
+        if (frames := self.get(voice, text)) is not None:
+            return frames
+
+        async with tts_.synthesize(text) as stream:
+            frames = [ev.frame async for ev in stream]
+        self.put(voice, text, frames)
+        return frames
+
+    def _load(self, voice: str, text: str) -> list[rtc.AudioFrame] | None:
+        if (frames := self._entries.get((voice, text))) is not None:
+            self._entries.move_to_end((voice, text))
+            return frames
+
+        name = _file_name(voice, text)
+        if name not in self._files:
+            return None
+        try:
+            frames = self._read(name)
+        except (OSError, EOFError, wave.Error) as e:
+            logger.debug("dropping unreadable cached audio %s: %s", name, e)
+            self._unlink(name)
+            return None
+        self._remember(voice, text, frames)
+        return frames
+
+    def _remember(self, voice: str, text: str, frames: list[rtc.AudioFrame]) -> None:
+        size = _frames_size(frames)
+        if size > self.max_bytes:
+            logger.debug("not caching %d bytes of audio for %r", size, text)
+            return
+
+        if (old := self._entries.pop((voice, text), None)) is not None:
+            self.size -= _frames_size(old)
+        self._entries[(voice, text)] = frames
+        self.size += size
+        while self.size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= _frames_size(evicted)
+
+    def _scan(self, directory: str) -> None:
+        os.makedirs(directory, exist_ok=True)
+        files = []
+        for entry in os.scandir(directory):
+            if entry.name.endswith(".wav") and entry.is_file():
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name, stat.st_size))
+        for _, name, size in sorted(files):
+            self._files[name] = size
+            self.disk_size += size
+
+    def _read(self, name: str) -> list[rtc.AudioFrame]:
+        assert self.directory is not None
+        path = os.path.join(self.directory, name)
+        with wave.open(path, "rb") as f:
+            sample_rate, num_channels = f.getframerate(), f.getnchannels()
+            data = f.readframes(f.getnframes())
+        # touched so the directory's own LRU order survives a restart
+        os.utime(path)
+        self._files.move_to_end(name)
+
+        chunker = utils.audio.AudioByteStream(
+            sample_rate,
+            num_channels,
+            samples_per_channel=sample_rate * _FRAME_MS // 1000,
+        )
+        return chunker.write(data) + chunker.flush()
+
+    def _write(self, name: str, frames: list[rtc.AudioFrame]) -> None:
+        assert self.directory is not None
+        path = os.path.join(self.directory, name)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        try:
+            with wave.open(tmp, "wb") as f:
+                f.setnchannels(frames[0].num_channels)
+                f.setsampwidth(2)
+                f.setframerate(frames[0].sample_rate)
+                for frame in frames:
+                    f.writeframes(frame.data.tobytes())
+            # other processes never see a partly written file
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning("failed to write cached audio %s: %s", name, e)
+            with contextlib.suppress(OSError):
+                os.unlink(tmp)
+            return
+
+        self.disk_size -= self._files.pop(name, 0)
+        self._files[name] = size = os.path.getsize(path)
+        self.disk_size += size
+        while self.disk_size > self.max_disk_bytes and len(self._files) > 1:
+            self._unlink(next(iter(self._files)))
+
+    def _unlink(self, name: str) -> None:
+        assert self.directory is not None
+        self.disk_size -= self._files.pop(name, 0)
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(os.path.join(self.directory, name))
+
+
+class CachedTTS(tts.TTS):
+    """Streaming TTS that plays ``phrases`` from an ``AudioCache``."""
+
+    def __init__(
+        self,
+        inner: tts.TTS,
+        model: str,
+        cache: AudioCache,
+        phrases: Iterable[str] = (),
+    ) -> None:
+        if not inner.capabilities.streaming:
+            raise ValueError(f"{inner.label} does not support streaming")
+        super().__init__(
+            capabilities=inner.capabilities,
+            sample_rate=inner.sample_rate,
+            num_channels=inner.num_channels,
+        )
+        self._inner = inner
+        self._label = inner.label
+        self.cache = cache
+        # the provider, model and output format are all part of the audio's address
+        self.voice = f"{inner.label}/{model}/{inner.sample_rate}"
+        self.phrases = frozenset(
+            sentence for phrase in phrases for sentence in split_sentences(phrase)
+        )
+        self._prefixes = frozenset(
+            phrase[:i] for phrase in self.phrases for i in range(1, len(phrase) + 1)
+        )
+
+    def preload(self) -> int:
+        """Read the phrases cached on disk into memory, returns the count."""
+        return self.cache.preload(self.voice, self.phrases)
+
+    async def fill(self) -> None:
+        """Synthesize the phrases missing from the cache, one at a time."""
+        for phrase in sorted(self.phrases):
+            if (self.voice, phrase) in self.cache:
+                continue
+            try:
+                await self.cache.synthesize(self._inner, self.voice, phrase)
+            except Exception as e:
+                logger.warning("failed to synthesize phrase %r: %s", phrase, e)
+                return
+
+    def synthesize(
+        self,
+        text: str,
+        *,
+        conn_options: APIConnectOptions = DEFAULT_API_CONNECT_OPTIONS,
+    ) -> tts.ChunkedStream:
+        return self._inner.synthesize(text, conn_options=conn_options)
+
+    def stream(
+        self, *, conn_options: APIConnectOptions = DEFAULT_API_CONNECT_OPTIONS
+    ) -> tts.SynthesizeStream:
+        return _CachedSynthesizeStream(tts=self, conn_options=conn_options)
+
+    def prewarm(self) -> None:
+        self._inner.prewarm()
+
+    async def aclose(self) -> None:
+        await self._inner.aclose()
+
+
+class _CachedSynthesizeStream(tts.SynthesizeStream):
+    def __init__(self, *, tts: CachedTTS, conn_options: APIConnectOptions) -> None:
+        super().__init__(tts=tts, conn_options=conn_options)
+        self._cached_tts = tts
+
+    async def _run(self, output_emitter: tts.AudioEmitter) -> None:
+        output_emitter.initialize(
+            request_id=utils.shortuuid(),
+            sample_rate=self._cached_tts.sample_rate,
+            num_channels=self._cached_tts.num_channels,
+            mime_type="audio/pcm",
+            stream=True,
+        )
+        output_emitter.start_segment(segment_id=utils.shortuuid())
+
+        # cached audio or a provider stream, in the order they are to be played
+        parts: utils.aio.Chan[list[rtc.AudioFrame] | tts.SynthesizeStream] = (
+            utils.aio.Chan()
+        )
+
+        async def _route_input() -> None:
+            router = _PhraseRouter(self._cached_tts.phrases, self._cached_tts._prefixes)
+            stream: tts.SynthesizeStream | None = None
+
+            def _route(pieces: list[tuple[bool, str]]) -> None:
+                nonlocal stream
+                for is_phrase, text in pieces:
+                    frames = (
+                        self._cached_tts.cache.get(self._cached_tts.voice, text)
+                        if is_phrase
+                        else None
+                    )
+                    if frames is not None:
+                        if stream is not None:
+                            stream.end_input()
+                            stream = None
+                        parts.send_nowait(frames)
+                        continue
+
+                    if is_phrase:
+                        text += " "
+                    if stream is None:
+                        stream = self._cached_tts._inner.stream(
+                            conn_options=self._conn_options
+                        )
+                        parts.send_nowait(stream)
+                    stream.push_text(text)
+
+            try:
+                async for data in self._input_ch:
+                    if isinstance(data, str):
+                        self._mark_started()
+                        _route(router.push(data))
+                    else:
+                        break
+                _route(router.flush())
+                if stream is not None:
+                    stream.end_input()
+            finally:
+                parts.close()
+
+        async def _forward_audio() -> None:
+            async for part in parts:
+                if isinstance(part, list):
+                    for frame in part:
+                        output_emitter.push(frame.data.tobytes())
+                    continue
+                async with part:
+                    async for ev in part:
+                        output_emitter.push(ev.frame.data.tobytes())
+
+        tasks = [
+            asyncio.create_task(_route_input()),
+            asyncio.create_task(_forward_audio()),
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            await utils.aio.cancel_and_wait(*tasks)
+            # provider streams that were never forwarded
+            while not parts.empty():
+                if not isinstance(part := parts.recv_nowait(), list):
+                    await part.aclose()
+        output_emitter.end_segment()
+
+
+class _PhraseRouter:
+    """Splits streamed text into known phrases and the text around them.
+
+    Text is held back only while the sentence it starts can still be one of
+    the phrases, everything else is returned as soon as it is pushed.
+    """
+
+    def __init__(self, phrases: frozenset[str], prefixes: frozenset[str]) -> None:
+        self._phrases = phrases
+        self._prefixes = prefixes
+        self._held = ""
+        self._passing = False
+        self._sentence_ending = False
+
+    def push(self, text: str) -> list[tuple[bool, str]]:
+        """Pieces of text that are ready, as ``(is_phrase, text)``."""
+        pieces: list[tuple[bool, str]] = []
+        passed = ""
+        for c in _normalize(text):
+            if self._passing:
+                passed += c
+                if c in ".!?":
+                    self._sentence_ending = True
+                elif c.isspace() and self._sentence_ending:
+                    self._passing = False
+                else:
+                    self._sentence_ending = False
+                continue
+
+            candidate = (self._held + c).lstrip()
+            if c.isspace() and self._held.strip() in self._phrases:
+                if passed:
+                    pieces.append((False, passed))
+                    passed = ""
+                pieces.append((True, self._held.strip()))
+                self._held = ""
+            elif not candidate or candidate in self._prefixes:
+                self._held += c
+            else:
+                passed += self._held + c
+                self._held = ""
+                self._passing = True
+                self._sentence_ending = c in ".!?"
+
+        if passed:
+            pieces.append((False, passed))
+        return pieces
+
+    def flush(self) -> list[tuple[bool, str]]:
+        """The held back text, at the end of the input."""
+        held, self._held = self._held, ""
+        self._passing = self._sentence_ending = False
+        if held.strip() in self._phrases:
+            return [(True, held.strip())]
+        return [(False, held)] if held else []
+
+
+def split_sentences(text: str) -> list[str]:
+    """Sentences of ``text`` as the cache stores them."""
+    return [s for s in _SENTENCE_END.split(_normalize(text).strip()) if s]
+
+
+async def play(frames: Sequence[rtc.AudioFrame]) -> AsyncIterator[rtc.AudioFrame]:
+    """Cached frames as the audio stream ``AgentSession.say`` expects."""
+    for frame in frames:
+        yield frame
+
+
+def _normalize(text: str) -> str:
+    return text.replace("\u2019", "'")
+
+
+def _file_name(voice: str, text: str) -> str:
+    return hashlib.sha256(f"{voice}\0{text}".encode()).hexdigest() + ".wav"
+
+
+def _frames_size(frames: Sequence[rtc.AudioFrame]) -> int:
+    return sum(len(frame.data) * 2 for frame in frames)
@@ -0,0 +1,236 @@
+"""Compact binary wire format for tracking messages.
+
+Every packet starts with ``WIRE_MAGIC`` and ``WIRE_VERSION``, followed by a
+message count and the messages themselves. A message is its schema's type id,
+its record id as a ``str`` (empty if it has none) and its fields in schema
+order:
+
+- ``u8`` / ``u16``: unsigned little-endian integers
+- ``centi``: ``u16`` fixed point with two decimals (e.g. hours slept)
+- ``str``: varint byte length followed by UTF-8 bytes
+
+Numeric fields a record doesn't have yet are encoded as the largest value of
+their kind and decoded as absent, empty strings stand for absent text fields.
+
+The schemas below are derived from the record types in ``records.py``, and
+mirrored by ``TRACKING_WIRE_SCHEMA`` in
+``react-frontend/lib/tracking-types.ts``; field order is part of the format, so
+any change there needs a new ``WIRE_VERSION``.
+
+Clients advertise the codecs they can decode in the ``CODEC_ATTRIBUTE``
+participant attribute. JSON stays the fallback for clients that don't, and for
+message types that have no binary schema.
+"""
+
+from __future__ import annotations
+
+import struct
+from collections.abc import Iterable
+from dataclasses import dataclass
+from typing import Any
+
+from livekit import rtc
+
+from publisher import MAX_PACKET_BYTES, encode_json_packets
+from records import MoodAssessment, PainAssessment, SleepQuality
+
+# JSON packets always start with "{" (0x7B), so the first byte tells them apart
+WIRE_MAGIC = 0xA7
+WIRE_VERSION = 2
+
+CODEC_ATTRIBUTE = "tracking.codecs"
+CODEC_BINARY = f"bin{WIRE_VERSION}"
+CODEC_JSON = "json"
+
+_U8 = struct.Struct("<B")
+_U16 = struct.Struct("<H")
+_ABSENT = {"u8": 0xFF, "u16": 0xFFFF, "centi": 0xFFFF}
+
+
+@dataclass(frozen=True)
+class MessageSchema:
+    type_id: int
+    message_type: str
+    fields: tuple[tuple[str, str], ...]
+
+
+SCHEMAS: dict[str, MessageSchema] = {
+    schema.message_type: schema
+    for schema in (
+        MessageSchema(
+            type_id,
+            record_type.MESSAGE_TYPE,
+            tuple((field.name, field.kind) for field in record_type.FIELDS),
+        )
+        for type_id, record_type in (
+            (1, PainAssessment),
+            (2, SleepQuality),
+            (3, MoodAssessment),
+        )
+    )
+}
+SCHEMAS_BY_ID: dict[int, MessageSchema] = {s.type_id: s for s in SCHEMAS.values()}
+
+
+class WireFormatError(ValueError):
+    pass
+
+
+def _write_varint(out: bytearray, value: int) -> None:
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(buf: bytes, pos: int) -> tuple[int, int]:
+    value = shift = 0
+    while True:
+        if pos >= len(buf):
+            raise WireFormatError("truncated varint")
+        byte = buf[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def _write_str(out: bytearray, value: str) -> None:
+    raw = value.encode()
+    _write_varint(out, len(raw))
+    out += raw
+
+
+def _read_str(buf: bytes, pos: int) -> tuple[str, int]:
+    length, pos = _read_varint(buf, pos)
+    if pos + length > len(buf):
+        raise WireFormatError("truncated string")
+    return buf[pos : pos + length].decode(), pos + length
+
+
+def _encode_message(out: bytearray, message: dict[str, Any]) -> None:
+    schema = SCHEMAS.get(message.get("type", ""))
+    if schema is None:
+        raise WireFormatError(f"no binary schema for {message.get('type')!r}")
+
+    data = message.get("data") or {}
+    out.append(schema.type_id)
+    _write_str(out, message.get("id") or "")
+    for name, kind in schema.fields:
+        value = data.get(name)
+        try:
+            if kind == "str":
+                _write_str(out, value or "")
+                continue
+            if value is None:
+                number = _ABSENT[kind]
+            else:
+                number = round(float(value) * 100) if kind == "centi" else int(value)
+                if number >= _ABSENT[kind]:
+                    raise ValueError("out of range")
+            out += (_U8 if kind == "u8" else _U16).pack(number)
+        except (struct.error, TypeError, ValueError) as e:
+            raise WireFormatError(f"{schema.message_type}.{name}={value!r}: {e}") from e
+
+
+def encode_binary_packets(
+    messages: list[dict[str, Any]], max_bytes: int = MAX_PACKET_BYTES
+) -> list[bytes]:
+    """Encode messages into binary packets of at most ``max_bytes`` each.
+
+    Raises WireFormatError if a message has no schema or a value doesn't fit.
+    """
+    packets: list[bytes] = []
+    body = bytearray()
+    count = 0
+
+    def _finish() -> None:
+        packet = bytearray((WIRE_MAGIC, WIRE_VERSION))
+        _write_varint(packet, count)
+        packets.append(bytes(packet + body))
+
+    for message in messages:
+        encoded = bytearray()
+        _encode_message(encoded, message)
+        # 2 header bytes plus up to 3 bytes of count varint
+        if count and len(body) + len(encoded) + 5 > max_bytes:
+            _finish()
+            body, count = bytearray(), 0
+        body += encoded
+        count += 1
+    if count:
+        _finish()
+    return packets
+
+
+def decode_packet(packet: bytes) -> list[dict[str, Any]]:
+    """Decode a binary packet back into ``{"type", "id", "data"}`` messages."""
+    if len(packet) < 3 or packet[0] != WIRE_MAGIC:
+        raise WireFormatError("not a binary tracking packet")
+    if packet[1] != WIRE_VERSION:
+        raise WireFormatError(f"unsupported wire version {packet[1]}")
+
+    count, pos = _read_varint(packet, 2)
+    messages = []
+    for _ in range(count):
+        schema = SCHEMAS_BY_ID.get(packet[pos]) if pos < len(packet) else None
+        if schema is None:
+            raise WireFormatError(f"unknown message type at byte {pos}")
+        pos += 1
+        data: dict[str, Any] = {}
+        try:
+            record_id, pos = _read_str(packet, pos)
+            for name, kind in schema.fields:
+                if kind == "str":
+                    data[name], pos = _read_str(packet, pos)
+                    continue
+                struct_ = _U8 if kind == "u8" else _U16
+                (value,) = struct_.unpack_from(packet, pos)
+                pos += struct_.size
+                if value != _ABSENT[kind]:
+                    data[name] = value / 100 if kind == "centi" else value
+        except struct.error as e:
+            raise WireFormatError(f"truncated {schema.message_type}") from e
+        message: dict[str, Any] = {"type": schema.message_type, "data": data}
+        if record_id:
+            message["id"] = record_id
+        messages.append(message)
+    return messages
+
+
+def supports_binary(codecs: str | None) -> bool:
+    return bool(codecs) and CODEC_BINARY in codecs.split(",")
+
+
+class NegotiatedEncoder:
+    """Packet encoder that picks the codec every remote participant understands.
+
+    Data packets are broadcast, so binary is only used once every remote
+    participant has advertised it. Batches that can't be encoded in binary fall
+    back to JSON.
+    """
+
+    def __init__(self, room: Any) -> None:
+        self._room = room
+
+    def codec(self) -> str:
+        participants: Iterable[Any] = self._room.remote_participants.values()
+        clients = [
+            p
+            for p in participants
+            if p.kind != rtc.ParticipantKind.PARTICIPANT_KIND_AGENT
+        ]
+        if clients and all(
+            supports_binary(p.attributes.get(CODEC_ATTRIBUTE)) for p in clients
+        ):
+            return CODEC_BINARY
+        return CODEC_JSON
+
+    def __call__(self, messages: list[dict[str, Any]]) -> list[bytes]:
+        if self.codec() == CODEC_BINARY:
+            try:
+                return encode_binary_packets(messages)
+            except WireFormatError:
+                pass
+        return encode_json_packets(messages)
@@ -0,0 +1,244 @@
+"""Offline benchmark of the audio input chain: CPU per second of audio, per stage.
+
+Pushes recorded WAV files through the stages a patient's microphone goes
+through in a room (see src/audio_input.py) and reports what each of them
+costs:
+
+    python tests/audio_bench.py recordings/*.wav --noise-cancellation webrtc
+
+The audio is framed like the room input hands it to the session: mono, 24kHz,
+50ms frames. Then, one stage at a time and wrapped by the same
+``AudioProfiler`` as in the agent:
+
+- ``noise_cancellation``: the ``--noise-cancellation`` option, and the VAD gets
+  its output. LiveKit Cloud's models (``bvc``, ``bvc-telephony``, ``nc``) run in
+  the native SDK on a connected track, they are reported as unavailable.
+- ``vad``: silero, loaded like at prewarm.
+- ``turn_detection``: the multilingual model run in this process once per end
+  of speech the VAD found, on a short canned exchange, since there is no
+  transcript. Skipped if its files weren't downloaded
+  (``uv run src/agent.py download-files``).
+
+``cpu_per_audio_s`` is the CPU time of the process while the stage ran, its
+inference threads included, per second of audio: 0.02 means a core handles
+the stage for 50 rooms. The time percentiles and backlog are those of the
+stage's ``StageStats``; all the audio is pushed at once, so the VAD's backlog
+is how far behind it falls without the real-time pacing of a room.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import contextlib
+import json
+import time
+import wave
+from collections.abc import Iterator
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+from livekit import rtc
+from livekit.agents import utils, vad
+from livekit.plugins import silero
+
+from audio_input import (
+    NOISE_CANCELLATION_OPTIONS,
+    AudioProfiler,
+    StageStats,
+    select_noise_cancellation,
+)
+
+SAMPLE_RATE = 24000
+FRAME_MS = 50
+# what the patient said before every end of speech, for the turn detector
+TURN_CONTEXT = [
+    {"role": "assistant", "content": "How did you sleep last night?"},
+    {"role": "user", "content": "Not great, I woke up a few times and my back hurt"},
+]
+
+
+@dataclass
+class StageResult:
+    audio_seconds: float
+    cpu_seconds: float
+    wall_seconds: float
+    stats: StageStats | None = None
+    # why the stage didn't run
+    unavailable: str | None = None
+
+    def to_dict(self) -> dict[str, Any]:
+        if self.unavailable is not None:
+            return {"unavailable": self.unavailable}
+        return {
+            "cpu_per_audio_s": round(self.cpu_seconds / self.audio_seconds, 4)
+            if self.audio_seconds
+            else None,
+            "cpu_s": round(self.cpu_seconds, 3),
+            "wall_s": round(self.wall_seconds, 3),
+            **(self.stats.summary() if self.stats is not None else {}),
+        }
+
+
+class _Clock:
+    def __init__(self) -> None:
+        self.cpu = time.process_time()
+        self.wall = time.perf_counter()
+
+    def result(self, audio_seconds: float, stats: StageStats | None) -> StageResult:
+        return StageResult(
+            audio_seconds=audio_seconds,
+            cpu_seconds=time.process_time() - self.cpu,
+            wall_seconds=time.perf_counter() - self.wall,
+            stats=stats,
+        )
+
+
+def read_wav(path: Path) -> Iterator[rtc.AudioFrame]:
+    """The frames of a 16-bit WAV file, mono at ``SAMPLE_RATE`` in ``FRAME_MS`` frames."""
+    with wave.open(str(path), "rb") as wav:
+        if wav.getsampwidth() != 2:
+            raise ValueError(f"{path}: only 16-bit PCM is supported")
+        channels = wav.getnchannels()
+        rate = wav.getframerate()
+        pcm = np.frombuffer(wav.readframes(wav.getnframes()), dtype="<i2")
+    if channels > 1:
+        pcm = pcm.reshape(-1, channels).mean(axis=1).astype("<i2")
+
+    resampler = rtc.AudioResampler(rate, SAMPLE_RATE)
+    framer = utils.audio.AudioByteStream(
+        SAMPLE_RATE, 1, samples_per_channel=SAMPLE_RATE * FRAME_MS // 1000
+    )
+    # resampled a second at a time, like the stream does as the track plays
+    for start in range(0, len(pcm), rate):
+        chunk = pcm[start : start + rate]
+        for resampled in resampler.push(
+            rtc.AudioFrame(chunk.tobytes(), rate, 1, len(chunk))
+        ):
+            yield from framer.push(resampled.data)
+    for resampled in resampler.flush():
+        yield from framer.push(resampled.data)
+    yield from framer.flush()
+
+
+def bench_noise_cancellation(
+    frames: list[rtc.AudioFrame], option: str, profiler: AudioProfiler
+) -> tuple[list[rtc.AudioFrame], StageResult]:
+    audio_seconds = sum(f.duration for f in frames)
+    if option in ("bvc", "bvc-telephony", "nc"):
+        return frames, StageResult(
+            audio_seconds, 0.0, 0.0, unavailable="runs natively on a connected track"
+        )
+    processor = profiler.noise_cancellation(select_noise_cancellation(option))
+    if processor is None:
+        return frames, StageResult(audio_seconds, 0.0, 0.0, unavailable="disabled")
+
+    clock = _Clock()
+    processed = []
+    for frame in frames:
+        # as the stream does, a frame that fails to process is passed on as is
+        try:
+            processed.append(processor._process(frame))
+        except Exception:
+            processed.append(frame)
+    processor._close()
+    return processed, clock.result(audio_seconds, profiler.stages["noise_cancellation"])
+
+
+async def bench_vad(
+    frames: list[rtc.AudioFrame], model: vad.VAD, profiler: AudioProfiler
+) -> tuple[int, StageResult]:
+    """The ends of speech the VAD found in ``frames``, and what it took."""
+    profiled = profiler.vad(model)
+    clock = _Clock()
+    stream = profiled.stream()
+    for frame in frames:
+        stream.push_frame(frame)
+    stream.end_input()
+    ends_of_speech = 0
+    async for ev in stream:
+        if ev.type == vad.VADEventType.END_OF_SPEECH:
+            ends_of_speech += 1
+    result = clock.result(sum(f.duration for f in frames), profiler.stages["vad"])
+    await stream.aclose()
+    return ends_of_speech, result
+
+
+def bench_turn_detector(predictions: int, audio_seconds: float) -> StageResult:
+    from livekit.plugins.turn_detector.multilingual import _EUORunnerMultilingual
+
+    runner = _EUORunnerMultilingual()
+    try:
+        runner.initialize()
+    except RuntimeError:
+        return StageResult(
+            audio_seconds, 0.0, 0.0, unavailable="model files not downloaded"
+        )
+
+    stats = StageStats()
+    stats.audio_seconds = audio_seconds
+    data = json.dumps({"chat_ctx": TURN_CONTEXT}).encode()
+    clock = _Clock()
+    for _ in range(predictions):
+        started = time.perf_counter()
+        runner.run(data)
+        stats.times.record(time.perf_counter() - started)
+        stats.frames += 1
+    return clock.result(audio_seconds, stats)
+
+
+async def run_bench(
+    paths: list[Path], *, noise_cancellation: str, turn_detector: bool = True
+) -> dict[str, Any]:
+    """Runs the files through the chain, the report's stages are summed over them."""
+    frames = [frame for path in paths for frame in read_wav(path)]
+    audio_seconds = sum(f.duration for f in frames)
+    profiler = AudioProfiler()
+
+    frames, nc_result = bench_noise_cancellation(frames, noise_cancellation, profiler)
+    ends_of_speech, vad_result = await bench_vad(frames, silero.VAD.load(), profiler)
+    profiler.detach()
+    stages = {"noise_cancellation": nc_result, "vad": vad_result}
+    if turn_detector:
+        stages["turn_detection"] = bench_turn_detector(ends_of_speech, audio_seconds)
+
+    return {
+        "files": len(paths),
+        "audio_s": round(audio_seconds, 2),
+        "noise_cancellation": noise_cancellation,
+        "ends_of_speech": ends_of_speech,
+        "stages": {name: result.to_dict() for name, result in stages.items()},
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("wavs", type=Path, nargs="+", help="16-bit PCM WAV files")
+    parser.add_argument(
+        "--noise-cancellation",
+        choices=NOISE_CANCELLATION_OPTIONS,
+        default="webrtc",
+        help="(default: %(default)s)",
+    )
+    parser.add_argument(
+        "--no-turn-detector",
+        action="store_true",
+        help="skip the turn detector",
+    )
+    args = parser.parse_args()
+
+    report = asyncio.run(
+        run_bench(
+            args.wavs,
+            noise_cancellation=args.noise_cancellation,
+            turn_detector=not args.no_turn_detector,
+        )
+    )
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    with contextlib.suppress(KeyboardInterrupt):
+        main()
@@ -0,0 +1,21 @@
+"""Small builders shared by the test modules."""
+
+from __future__ import annotations
+
+from datetime import datetime, timezone, tzinfo
+
+from livekit import rtc
+
+
+def silent_frames(samples: int) -> list[rtc.AudioFrame]:
+    """One frame of ``samples`` samples of silence at 24kHz, as a TTS emits."""
+    return [
+        rtc.AudioFrame.create(
+            sample_rate=24000, num_channels=1, samples_per_channel=samples
+        )
+    ]
+
+
+def timestamp(day: int, hour: int, tz: tzinfo = timezone.utc) -> float:
+    """Unix time of ``hour`` o'clock on a day of October 2026 in ``tz``."""
+    return datetime(2026, 10, day, hour, tzinfo=tz).timestamp()
@@ -0,0 +1,451 @@
+"""Load test: how many concurrent therapy rooms one worker sustains.
+
+Ramps up the number of concurrent simulated rooms and reports, for every
+stage, the throughput, the per-stage turn latency percentiles, the lag of the
+event loops and what stalled them (see loop_monitor.py), and the CPU and
+memory of the process tree:
+
+    python tests/loadtest.py --ramp 10,25,50,100 --processes 4
+
+Every room is a replay.py session: ``Therapist`` in a real ``AgentSession``
+with the scripted LLM, STT and TTS, here answering with realistic delays, a
+microphone that streams synthetic audio in real time and a patient who takes
+``--think`` seconds before every turn. Nothing touches the network.
+
+The rooms of a stage are spread over ``--processes`` processes, like a worker
+spreads jobs over its job processes, each running its rooms on one event loop
+(``0`` runs them in this process). livekit runs one job per process, so with
+fewer processes than rooms the loop lag is an upper bound.
+
+The ramp stops after the first stage whose e2e p95 is more than
+``--max-slowdown`` times that of the first stage, or where rooms failed.
+``max_sustained_rooms`` and the CPU and memory per room above the idle
+baseline are the numbers to tune ``WorkerOptions`` (``load_threshold``,
+``job_memory_warn_mb``) and the ``DENSITY_SESSION_*`` estimates of density.py
+from.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import contextlib
+import json
+import multiprocessing as mp
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any
+
+import psutil
+from replay import (
+    CONVERSATIONS_DIR,
+    ConversationScript,
+    SessionResult,
+    SyntheticAudioInput,
+    load_scripts,
+    replay_session,
+)
+
+from latency import QUANTILES, LatencyHistogram
+from loop_monitor import LoopMonitor
+
+_MB = 1024 * 1024
+# turn latency stages, from the fields of latency.TurnLatency
+_TURN_STAGES = {
+    "e2e": "e2e",
+    "eou": "eou_delay",
+    "transcription": "transcription_delay",
+    "llm_ttft": "llm_ttft",
+    "tts_ttfb": "tts_ttfb",
+    "tools": "tool_time",
+}
+
+
+@dataclass(frozen=True)
+class RoomConfig:
+    """How the simulated rooms behave."""
+
+    llm_ttft: float = 0.35
+    tts_ttfb: float = 0.2
+    think_time: float = 2.0
+    vad: bool = False
+    turn_timeout: float = 30.0
+
+
+@dataclass
+class HostResult:
+    """The rooms one process ran."""
+
+    sessions: list[SessionResult] = field(default_factory=list)
+    failures: int = 0
+    loop_lag: LatencyHistogram = field(default_factory=LatencyHistogram)
+    # event loop stalls per stage they are attributed to, see loop_monitor.py
+    loop_stalls: dict[str, int] = field(default_factory=dict)
+
+
+@dataclass
+class StageReport:
+    rooms: int
+    processes: int
+    duration_s: float
+    turns: int
+    turns_per_second: float
+    failed_rooms: int
+    # p50/p95/p99 in milliseconds, per pipeline stage
+    latency_ms: dict[str, dict[str, float]]
+    loop_lag_ms: dict[str, float]
+    loop_stalls: dict[str, int]
+    cpus: float
+    cpus_peak: float
+    rss_mb: float
+    pss_mb: float
+    cpus_per_room: float
+    pss_mb_per_room: float
+    degraded: bool = False
+
+
+@dataclass
+class LoadReport:
+    baseline_cpus: float
+    baseline_rss_mb: float
+    baseline_pss_mb: float
+    stages: list[StageReport] = field(default_factory=list)
+    max_sustained_rooms: int = 0
+
+    def to_dict(self) -> dict[str, Any]:
+        return asdict(self)
+
+
+async def host_rooms(
+    rooms: range,
+    config: RoomConfig,
+    scripts: list[ConversationScript],
+    db_path: str,
+) -> HostResult:
+    """Run ``rooms`` concurrently on this event loop."""
+    result = HostResult()
+    monitor = LoopMonitor(on_lag=result.loop_lag.record)
+    monitor.start()
+    vad = None
+    if config.vad:
+        from livekit.plugins import silero
+
+        vad = silero.VAD.load()
+
+    async def _room(index: int) -> SessionResult:
+        # patients don't all join at once
+        await asyncio.sleep(random.Random(index).uniform(0, config.think_time))
+        return await replay_session(
+            scripts[index % len(scripts)],
+            db_path=db_path,
+            llm_ttft=config.llm_ttft,
+            tts_ttfb=config.tts_ttfb,
+            turn_timeout=config.turn_timeout,
+            audio_input=SyntheticAudioInput(seed=index),
+            vad=vad,
+            think_time=config.think_time,
+        )
+
+    try:
+        for session in await asyncio.gather(
+            *(_room(i) for i in rooms), return_exceptions=True
+        ):
+            if isinstance(session, BaseException):
+                result.failures += 1
+                print(f"room failed: {session!r}", file=sys.stderr)
+            else:
+                result.sessions.append(session)
+    finally:
+        await monitor.aclose()
+    for stall in monitor.stalls:
+        result.loop_stalls[stall.stage] = result.loop_stalls.get(stall.stage, 0) + 1
+    return result
+
+
+def _host_process(
+    rooms: range, config: RoomConfig, scripts: list[ConversationScript], db_path: str
+) -> HostResult:
+    return asyncio.run(host_rooms(rooms, config, scripts, db_path))
+
+
+def _warm_up(seconds: float) -> int:
+    # holds the process long enough for every other one to get a task too
+    time.sleep(seconds)
+    return os.getpid()
+
+
+class _ResourceSampler:
+    """CPUs and memory of this process and its children, sampled on a thread."""
+
+    def __init__(self, interval: float = 0.5) -> None:
+        self._interval = interval
+        self._root = psutil.Process()
+        self._procs: dict[int, psutil.Process] = {}
+        self._samples: list[tuple[float, int, int]] = []
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def sample(self) -> tuple[float, int, int]:
+        cpus = 0.0
+        rss = pss = 0
+        alive: dict[int, psutil.Process] = {}
+        for proc in [self._root, *self._root.children(recursive=True)]:
+            # cpu_percent is relative to the last call on the same object
+            proc = self._procs.get(proc.pid, proc)
+            try:
+                cpus += proc.cpu_percent(None) / 100
+                info = proc.memory_full_info()
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+            rss += info.rss
+            pss += getattr(info, "pss", info.rss)
+            alive[proc.pid] = proc
+        self._procs = alive
+        return cpus, rss, pss
+
+    def start(self) -> None:
+        self.sample()
+        self._samples = []
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> list[tuple[float, int, int]]:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self._samples or [self.sample()]
+
+    def _run(self) -> None:
+        while not self._stop.wait(self._interval):
+            self._samples.append(self.sample())
+
+
+async def run_stage(
+    rooms: int,
+    *,
+    config: RoomConfig,
+    scripts: list[ConversationScript],
+    db_path: str,
+    pool: Executor | None,
+    processes: int,
+    sampler: _ResourceSampler,
+    baseline: tuple[float, int, int],
+) -> StageReport:
+    """Run ``rooms`` concurrent rooms to the end of their scripts."""
+    loop = asyncio.get_running_loop()
+    hosts = max(processes, 1)
+    bounds = [rooms * i // hosts for i in range(hosts + 1)]
+    shares = [range(bounds[i], bounds[i + 1]) for i in range(hosts)]
+
+    sampler.start()
+    start = time.perf_counter()
+    try:
+        if pool is None:
+            results = [await host_rooms(shares[0], config, scripts, db_path)]
+        else:
+            results = await asyncio.gather(
+                *(
+                    loop.run_in_executor(
+                        pool, _host_process, share, config, scripts, db_path
+                    )
+                    for share in shares
+                    if share
+                )
+            )
+    finally:
+        duration = time.perf_counter() - start
+        samples = sampler.stop()
+
+    sessions = [s for r in results for s in r.sessions]
+    loop_lag = LatencyHistogram()
+    loop_stalls: dict[str, int] = {}
+    for r in results:
+        loop_lag.merge(r.loop_lag)
+        for stage, count in r.loop_stalls.items():
+            loop_stalls[stage] = loop_stalls.get(stage, 0) + count
+    turns = sum(len(s.turn_latencies) for s in sessions)
+    cpus = sum(s[0] for s in samples) / len(samples)
+    rss = max(s[1] for s in samples)
+    pss = max(s[2] for s in samples)
+    return StageReport(
+        rooms=rooms,
+        processes=processes,
+        duration_s=round(duration, 2),
+        turns=turns,
+        turns_per_second=round(turns / duration, 2),
+        failed_rooms=sum(r.failures for r in results),
+        latency_ms=_latency_percentiles(sessions),
+        loop_lag_ms={
+            **{
+                f"p{round(q * 100)}": round(loop_lag.percentile(q) * 1000, 2)
+                for q in QUANTILES
+            },
+            "max": round(loop_lag.max * 1000, 2),
+        },
+        loop_stalls=dict(sorted(loop_stalls.items(), key=lambda s: -s[1])),
+        cpus=round(cpus, 3),
+        cpus_peak=round(max(s[0] for s in samples), 3),
+        rss_mb=round(rss / _MB, 1),
+        pss_mb=round(pss / _MB, 1),
+        cpus_per_room=round(max(cpus - baseline[0], 0.0) / rooms, 4),
+        pss_mb_per_room=round(max(pss - baseline[2], 0) / rooms / _MB, 2),
+    )
+
+
+def _latency_percentiles(
+    sessions: list[SessionResult],
+) -> dict[str, dict[str, float]]:
+    histograms = {stage: LatencyHistogram() for stage in _TURN_STAGES}
+    for session in sessions:
+        for turn in session.turn_latencies:
+            for stage, key in _TURN_STAGES.items():
+                if stage == "tools" and not turn["tool_calls"]:
+                    continue
+                if turn[key] is not None:
+                    histograms[stage].record(turn[key])
+    return {
+        stage: {
+            f"p{round(q * 100)}": round(hist.percentile(q) * 1000, 1) for q in QUANTILES
+        }
+        for stage, hist in histograms.items()
+        if hist.count
+    }
+
+
+async def run_ramp(
+    stages: list[int],
+    *,
+    directory: str,
+    processes: int = 1,
+    config: RoomConfig | None = None,
+    scripts: list[ConversationScript] | None = None,
+    max_slowdown: float = 1.5,
+    baseline_seconds: float = 2.0,
+) -> LoadReport:
+    """Run every stage in turn, until turn latency degrades or rooms fail."""
+    config = config or RoomConfig()
+    scripts = scripts or load_scripts()
+    db_path = f"{directory}/tracking.db"
+    sampler = _ResourceSampler()
+
+    with contextlib.ExitStack() as stack:
+        pool = None
+        if processes:
+            pool = stack.enter_context(
+                ProcessPoolExecutor(processes, mp_context=mp.get_context("spawn"))
+            )
+            # start and import every process before the baseline is taken
+            loop = asyncio.get_running_loop()
+            await asyncio.gather(
+                *(loop.run_in_executor(pool, _warm_up, 1.0) for _ in range(processes))
+            )
+
+        sampler.start()
+        await asyncio.sleep(baseline_seconds)
+        idle = sampler.stop()
+        baseline = (
+            sum(s[0] for s in idle) / len(idle),
+            max(s[1] for s in idle),
+            max(s[2] for s in idle),
+        )
+        report = LoadReport(
+            baseline_cpus=round(baseline[0], 3),
+            baseline_rss_mb=round(baseline[1] / _MB, 1),
+            baseline_pss_mb=round(baseline[2] / _MB, 1),
+        )
+
+        reference: float | None = None
+        for rooms in stages:
+            stage = await run_stage(
+                rooms,
+                config=config,
+                scripts=scripts,
+                db_path=db_path,
+                pool=pool,
+                processes=processes,
+                sampler=sampler,
+                baseline=baseline,
+            )
+            e2e = stage.latency_ms.get("e2e", {}).get("p95")
+            if reference is None:
+                reference = e2e
+            stage.degraded = bool(
+                stage.failed_rooms
+                or e2e is None
+                or (reference and e2e > reference * max_slowdown)
+            )
+            report.stages.append(stage)
+            print(_stage_line(stage), file=sys.stderr)
+            if stage.degraded:
+                break
+            report.max_sustained_rooms = rooms
+    return report
+
+
+def _stage_line(stage: StageReport) -> str:
+    e2e = stage.latency_ms.get("e2e", {})
+    return (
+        f"{stage.rooms:>4} rooms: {stage.turns_per_second:>7.2f} turns/s,"
+        f" e2e p50 {e2e.get('p50', 0):.0f}ms p95 {e2e.get('p95', 0):.0f}ms,"
+        f" loop lag p99 {stage.loop_lag_ms['p99']:.1f}ms,"
+        f" {sum(stage.loop_stalls.values())} stalls,"
+        f" {stage.cpus:.2f} cpus, {stage.pss_mb:.0f}MB"
+        f"{', degraded' if stage.degraded else ''}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--ramp",
+        default="5,10,25,50",
+        help="concurrent rooms of every stage (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="processes the rooms are spread over, 0 for this one"
+        " (default: %(default)s)",
+    )
+    parser.add_argument("--scripts", type=Path, default=CONVERSATIONS_DIR)
+    parser.add_argument("--think", type=float, default=RoomConfig.think_time)
+    parser.add_argument("--llm-ttft", type=float, default=RoomConfig.llm_ttft)
+    parser.add_argument("--tts-ttfb", type=float, default=RoomConfig.tts_ttfb)
+    parser.add_argument(
+        "--vad", action="store_true", help="run the Silero VAD on every room's audio"
+    )
+    parser.add_argument("--max-slowdown", type=float, default=1.5)
+    args = parser.parse_args()
+
+    config = RoomConfig(
+        llm_ttft=args.llm_ttft,
+        tts_ttfb=args.tts_ttfb,
+        think_time=args.think,
+        vad=args.vad,
+    )
+    with tempfile.TemporaryDirectory() as directory:
+        report = asyncio.run(
+            run_ramp(
+                [int(n) for n in args.ramp.split(",")],
+                directory=directory,
+                processes=args.processes,
+                config=config,
+                scripts=load_scripts(args.scripts),
+                max_slowdown=args.max_slowdown,
+            )
+        )
+    print(json.dumps(report.to_dict(), indent=2))
+
+
+if __name__ == "__main__":
+    with contextlib.suppress(KeyboardInterrupt):
+        main()
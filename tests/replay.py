@@ -0,0 +1,798 @@
+"""Offline replay harness for the Therapist agent.
+
+Drives ``Therapist`` through a real ``AgentSession`` with deterministic local
+stand-ins for the LLM, STT and TTS, replaying the conversation scripts in
+``tests/conversations``. Nothing touches the network, so the same scripts can
+run in CI to catch performance regressions of the agent before deploy:
+
+    python tests/replay.py --sessions 20
+
+``--logging sync`` logs at INFO through a handler that formats and pickles
+every record on the event loop, like livekit's handler of job processes does,
+``--logging queued`` through the same handler behind logs.py.
+``logging_ms_per_turn`` is the time the event loop spent in logging calls.
+
+A script is a list of user turns, each with the LLM responses of that turn in
+order. Turns are matched by what the user said, so it must be unique within a
+script. A response is either text, or tool calls followed by the response the
+LLM gives once their outputs are in the chat context:
+
+    {"name": "...", "turns": [
+        {"user": "I slept badly", "responses": [
+            {"tool_calls": [{"name": "track_sleep_quality", "arguments": {...}}]},
+            {"text": "Thanks, I noted that."}
+        ]}
+    ]}
+"""
+
+from __future__ import annotations
+
+import argparse
+import array
+import asyncio
+import contextlib
+import copy
+import json
+import logging
+import pickle
+import random
+import statistics
+import tempfile
+import time
+import tracemalloc
+import uuid
+from collections.abc import Iterator
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any
+
+from livekit import rtc
+from livekit.agents import (
+    DEFAULT_API_CONNECT_OPTIONS,
+    AgentSession,
+    APIConnectOptions,
+    FunctionToolsExecutedEvent,
+    MetricsCollectedEvent,
+    llm,
+    metrics,
+    stt,
+    tts,
+    utils,
+)
+from livekit.agents.types import NOT_GIVEN, NotGivenOr
+from livekit.agents.vad import VAD
+from livekit.agents.voice import io
+
+import logs
+from agent import Therapist
+from context import ContextManager
+from latency import LatencyProfiler
+from publisher import TrackingPublisher
+from store import TrackingStore
+from wire import (
+    CODEC_ATTRIBUTE,
+    CODEC_BINARY,
+    CODEC_JSON,
+    NegotiatedEncoder,
+    decode_packet,
+)
+
+CONVERSATIONS_DIR = Path(__file__).parent / "conversations"
+SAMPLE_RATE = 24000
+_CHARS_PER_TOKEN = 4
+_SUMMARY = "The patient described their pain, sleep and mood and tried coping ideas."
+
+
+@dataclass
+class ConversationScript:
+    name: str
+    turns: list[dict[str, Any]]
+
+    @classmethod
+    def load(cls, path: Path) -> ConversationScript:
+        data = json.loads(path.read_text())
+        return cls(name=data["name"], turns=data["turns"])
+
+    def turn_for(self, user_input: str) -> dict[str, Any] | None:
+        return next((t for t in self.turns if t["user"] == user_input), None)
+
+    @property
+    def tool_names(self) -> set[str]:
+        return {
+            call["name"]
+            for turn in self.turns
+            for response in turn["responses"]
+            for call in response.get("tool_calls", [])
+        }
+
+
+def load_scripts(directory: Path = CONVERSATIONS_DIR) -> list[ConversationScript]:
+    return [ConversationScript.load(p) for p in sorted(directory.glob("*.json"))]
+
+
+class ScriptedLLM(llm.LLM):
+    """Answers from a conversation script instead of a model.
+
+    The response is picked from the chat context (which user turn it is and how
+    many tool calls that turn already made), not from a cursor, so speculative
+    requests from preemptive generation don't desynchronize the script.
+    """
+
+    def __init__(
+        self,
+        script: ConversationScript,
+        *,
+        ttft: float = 0.0,
+        token_delay: float = 0.0,
+        fallback: str = "Take your time, I'm listening.",
+    ) -> None:
+        super().__init__()
+        self.script = script
+        self.fallback = fallback
+        self.ttft = ttft
+        self.token_delay = token_delay
+        self.requests = 0
+        self._last_prompt = ""
+
+    def chat(
+        self,
+        *,
+        chat_ctx: llm.ChatContext,
+        tools: list[llm.FunctionTool | llm.RawFunctionTool] | None = None,
+        conn_options: APIConnectOptions = DEFAULT_API_CONNECT_OPTIONS,
+        parallel_tool_calls: NotGivenOr[bool] = NOT_GIVEN,
+        tool_choice: NotGivenOr[llm.ToolChoice] = NOT_GIVEN,
+        extra_kwargs: NotGivenOr[dict[str, Any]] = NOT_GIVEN,
+    ) -> llm.LLMStream:
+        self.requests += 1
+        return _ScriptedLLMStream(
+            self, chat_ctx=chat_ctx, tools=tools or [], conn_options=conn_options
+        )
+
+    def prompt_usage(
+        self,
+        chat_ctx: llm.ChatContext,
+        tools: list[llm.FunctionTool | llm.RawFunctionTool],
+    ) -> tuple[int, int]:
+        """Estimated prompt tokens of a request and how many a provider would cache.
+
+        Mimics OpenAI's prefix cache: the longest prefix shared with the previous
+        request is cached once it reaches 1024 tokens, in 128 token blocks. A
+        regression that rewrites earlier parts of the prompt shows up as a drop
+        in the benchmark's cache hit rate.
+        """
+        schemas = [
+            llm.utils.build_strict_openai_schema(t)
+            for t in tools
+            if llm.is_function_tool(t)
+        ]
+        prompt = json.dumps(schemas) + json.dumps(chat_ctx.to_dict())
+        shared = next(
+            (i for i, (a, b) in enumerate(zip(prompt, self._last_prompt)) if a != b),
+            min(len(prompt), len(self._last_prompt)),
+        )
+        self._last_prompt = prompt
+
+        cached = shared // _CHARS_PER_TOKEN
+        cached = cached // 128 * 128 if cached >= 1024 else 0
+        return len(prompt) // _CHARS_PER_TOKEN, cached
+
+    def response_for(self, chat_ctx: llm.ChatContext) -> dict[str, Any]:
+        items = chat_ctx.items
+        # matched by text, earlier turns may have been summarized away
+        last_user = next(
+            (
+                i
+                for i in range(len(items) - 1, -1, -1)
+                if items[i].type == "message" and items[i].role == "user"
+            ),
+            None,
+        )
+        turn = (
+            self.script.turn_for(items[last_user].text_content or "")
+            if last_user is not None
+            else None
+        )
+        if turn is None:
+            return {"text": self.fallback}
+
+        calls = sum(1 for item in items[last_user:] if item.type == "function_call")
+        responses = turn["responses"]
+        for response in responses:
+            if calls <= 0:
+                return response
+            calls -= len(response.get("tool_calls", []))
+        return responses[-1]
+
+
+class _ScriptedLLMStream(llm.LLMStream):
+    _llm: ScriptedLLM
+
+    async def _run(self) -> None:
+        response = self._llm.response_for(self._chat_ctx)
+        request_id = utils.shortuuid("replay_")
+        prompt_tokens, cached_tokens = self._llm.prompt_usage(
+            self._chat_ctx, self._tools
+        )
+        await asyncio.sleep(self._llm.ttft)
+
+        for call in response.get("tool_calls", []):
+            self._event_ch.send_nowait(
+                llm.ChatChunk(
+                    id=request_id,
+                    delta=llm.ChoiceDelta(
+                        role="assistant",
+                        tool_calls=[
+                            llm.FunctionToolCall(
+                                name=call["name"],
+                                arguments=json.dumps(call["arguments"]),
+                                call_id=utils.shortuuid("call_"),
+                            )
+                        ],
+                    ),
+                )
+            )
+
+        words = response.get("text", "").split()
+        for i, word in enumerate(words):
+            if i:
+                await asyncio.sleep(self._llm.token_delay)
+            self._event_ch.send_nowait(
+                llm.ChatChunk(
+                    id=request_id,
+                    delta=llm.ChoiceDelta(
+                        role="assistant", content=word if not i else f" {word}"
+                    ),
+                )
+            )
+
+        self._event_ch.send_nowait(
+            llm.ChatChunk(
+                id=request_id,
+                usage=llm.CompletionUsage(
+                    completion_tokens=len(words) + len(response.get("tool_calls", [])),
+                    prompt_tokens=prompt_tokens,
+                    prompt_cached_tokens=cached_tokens,
+                    total_tokens=prompt_tokens + len(words),
+                ),
+            )
+        )
+
+
+class ScriptedSTT(stt.STT):
+    """Streaming STT that emits the transcripts it is told to, ignoring the audio."""
+
+    def __init__(self) -> None:
+        super().__init__(
+            capabilities=stt.STTCapabilities(streaming=True, interim_results=True)
+        )
+        self._streams: set[_ScriptedSTTStream] = set()
+        self._stream_ready = asyncio.Event()
+
+    async def wait_for_stream(self) -> None:
+        await self._stream_ready.wait()
+
+    def transcribe(self, text: str) -> None:
+        """Emit ``text`` as one complete utterance of the user."""
+        for stream in self._streams:
+            stream.emit_utterance(text)
+
+    async def _recognize_impl(
+        self,
+        buffer: utils.AudioBuffer,
+        *,
+        language: NotGivenOr[str] = NOT_GIVEN,
+        conn_options: APIConnectOptions,
+    ) -> stt.SpeechEvent:
+        raise NotImplementedError("the replay harness only streams")
+
+    def stream(
+        self,
+        *,
+        language: NotGivenOr[str] = NOT_GIVEN,
+        conn_options: APIConnectOptions = DEFAULT_API_CONNECT_OPTIONS,
+    ) -> stt.RecognizeStream:
+        stream = _ScriptedSTTStream(stt=self, conn_options=conn_options)
+        self._streams.add(stream)
+        self._stream_ready.set()
+        return stream
+
+
+class _ScriptedSTTStream(stt.RecognizeStream):
+    _stt: ScriptedSTT
+
+    def emit_utterance(self, text: str) -> None:
+        alternatives = [stt.SpeechData(language="en", text=text, confidence=1.0)]
+        for event_type in (
+            stt.SpeechEventType.START_OF_SPEECH,
+            stt.SpeechEventType.INTERIM_TRANSCRIPT,
+            stt.SpeechEventType.FINAL_TRANSCRIPT,
+            stt.SpeechEventType.END_OF_SPEECH,
+        ):
+            self._event_ch.send_nowait(
+                stt.SpeechEvent(type=event_type, alternatives=alternatives)
+            )
+
+    async def _run(self) -> None:
+        try:
+            async for _ in self._input_ch:
+                pass
+        finally:
+            self._stt._streams.discard(self)
+
+
+class SilentTTS(tts.TTS):
+    """Synthesizes silence, ``seconds_per_char`` long per character of text."""
+
+    def __init__(self, *, ttfb: float = 0.0, seconds_per_char: float = 0.001) -> None:
+        super().__init__(
+            capabilities=tts.TTSCapabilities(streaming=False),
+            sample_rate=SAMPLE_RATE,
+            num_channels=1,
+        )
+        self.ttfb = ttfb
+        self.seconds_per_char = seconds_per_char
+        self.characters = 0
+
+    def synthesize(
+        self,
+        text: str,
+        *,
+        conn_options: APIConnectOptions = DEFAULT_API_CONNECT_OPTIONS,
+    ) -> tts.ChunkedStream:
+        self.characters += len(text)
+        return _SilentChunkedStream(
+            tts=self, input_text=text, conn_options=conn_options
+        )
+
+
+class _SilentChunkedStream(tts.ChunkedStream):
+    _tts: SilentTTS
+
+    async def _run(self, output_emitter: tts.AudioEmitter) -> None:
+        output_emitter.initialize(
+            request_id=utils.shortuuid("replay_"),
+            sample_rate=SAMPLE_RATE,
+            num_channels=1,
+            mime_type="audio/pcm",
+        )
+        await asyncio.sleep(self._tts.ttfb)
+        samples = int(len(self._input_text) * self._tts.seconds_per_char * SAMPLE_RATE)
+        output_emitter.push(bytes(2 * max(samples, 1)))
+        output_emitter.flush()
+
+
+class NullAudioOutput(io.AudioOutput):
+    """Audio sink that "plays" every segment instantly."""
+
+    def __init__(self) -> None:
+        super().__init__(
+            label="NullAudioOutput",
+            capabilities=io.AudioOutputCapabilities(pause=True),
+            sample_rate=SAMPLE_RATE,
+        )
+        self._pushed: float | None = None
+        self.frames = 0
+
+    async def capture_frame(self, frame: rtc.AudioFrame) -> None:
+        await super().capture_frame(frame)
+        self._pushed = (self._pushed or 0.0) + frame.duration
+        self.frames += 1
+
+    def flush(self) -> None:
+        super().flush()
+        self._finish(interrupted=False)
+
+    def clear_buffer(self) -> None:
+        self._finish(interrupted=True)
+
+    def _finish(self, *, interrupted: bool) -> None:
+        # only segments that captured audio count as played out
+        if self._pushed is not None:
+            self.on_playback_finished(
+                playback_position=self._pushed, interrupted=interrupted
+            )
+            self._pushed = None
+
+
+class SilentAudioInput(io.AudioInput):
+    """Microphone that never produces audio, the ScriptedSTT doesn't need any."""
+
+    def __init__(self) -> None:
+        super().__init__(label="SilentAudioInput")
+        self._closed = asyncio.Event()
+
+    async def __anext__(self) -> rtc.AudioFrame:
+        await self._closed.wait()
+        raise StopAsyncIteration
+
+    def close(self) -> None:
+        self._closed.set()
+
+
+class SyntheticAudioInput(io.AudioInput):
+    """Microphone that streams quiet noise in real time, like a patient's track.
+
+    The ScriptedSTT ignores it, but the session still forwards every frame to
+    the STT stream and the VAD, which is what audio costs a job.
+    """
+
+    def __init__(self, *, frame_ms: int = 20, seed: int = 0) -> None:
+        super().__init__(label="SyntheticAudioInput")
+        self._closed = False
+        self._samples = SAMPLE_RATE * frame_ms // 1000
+        self._interval = frame_ms / 1000
+        self._next_at: float | None = None
+        # a second of noise, played in a loop
+        rng = random.Random(seed)
+        self._noise = array.array(
+            "h", (rng.randint(-64, 64) for _ in range(SAMPLE_RATE))
+        ).tobytes()
+        self._offset = 0
+        self.frames = 0
+
+    async def __anext__(self) -> rtc.AudioFrame:
+        if self._closed:
+            raise StopAsyncIteration
+        now = time.monotonic()
+        self._next_at = (self._next_at or now) + self._interval
+        await asyncio.sleep(self._next_at - now)
+        if self._closed:
+            raise StopAsyncIteration
+
+        size = self._samples * 2
+        if self._offset + size > len(self._noise):
+            self._offset = 0
+        data = self._noise[self._offset : self._offset + size]
+        self._offset += size
+        self.frames += 1
+        return rtc.AudioFrame(data, SAMPLE_RATE, 1, self._samples)
+
+    def close(self) -> None:
+        self._closed = True
+
+
+class _RecordingParticipant:
+    def __init__(self) -> None:
+        self.packets = 0
+        self.bytes = 0
+        # messages with the id of an earlier one update that record
+        self.record_ids: set[str] = set()
+
+    async def publish_data(self, payload: bytes, *, reliable: bool, topic: str) -> None:
+        self.packets += 1
+        self.bytes += len(payload)
+        self.record_ids.update(m["id"] for m in decode_packet(payload) if "id" in m)
+
+
+@dataclass
+class SessionResult:
+    script: str
+    turns: int
+    duration: float
+    # CPU time of the event loop's thread
+    loop_cpu: float
+    llm_requests: int
+    tool_calls: int
+    tool_time: float
+    tools: set[str] = field(default_factory=set)
+    messages_published: int = 0
+    packets_published: int = 0
+    bytes_published: int = 0
+    flushes: int = 0
+    flush_time: float = 0.0
+    records_published: int = 0
+    records_stored: int = 0
+    # tracking tool calls that changed nothing and weren't written
+    duplicate_records: int = 0
+    context_compactions: int = 0
+    turn_latencies: list[dict[str, Any]] = field(default_factory=list)
+    peak_memory: int | None = None
+
+
+async def replay_session(
+    script: ConversationScript,
+    *,
+    db_path: str,
+    llm_ttft: float = 0.0,
+    tts_ttfb: float = 0.0,
+    max_context_tokens: int = 3000,
+    turn_timeout: float = 10.0,
+    logging_mode: str = "none",
+    audio_input: SilentAudioInput | SyntheticAudioInput | None = None,
+    vad: VAD | None = None,
+    think_time: float = 0.0,
+) -> SessionResult:
+    """Replay one conversation through a fresh session, like one job would run it.
+
+    The user waits ``think_time`` seconds before every turn.
+    """
+    scripted_stt = ScriptedSTT()
+    scripted_llm = ScriptedLLM(script, ttft=llm_ttft)
+    audio_input = audio_input or SilentAudioInput()
+    participant = SimpleNamespace(
+        identity=f"patient-{uuid.uuid4().hex[:8]}", attributes={}
+    )
+    local_participant = _RecordingParticipant()
+    # the dashboard advertises the binary wire format, like the current frontend
+    room = SimpleNamespace(
+        local_participant=local_participant,
+        remote_participants={
+            participant.identity: SimpleNamespace(
+                kind=rtc.ParticipantKind.PARTICIPANT_KIND_STANDARD,
+                attributes={CODEC_ATTRIBUTE: f"{CODEC_BINARY},{CODEC_JSON}"},
+            )
+        },
+    )
+    publisher = TrackingPublisher(room, encoder=NegotiatedEncoder(room))
+    store = TrackingStore(db_path)
+    profiler = LatencyProfiler(snapshot_interval=float("inf"))
+    tools: set[str] = set()
+    tool_calls = 0
+    tool_time = 0.0
+
+    session = AgentSession(
+        llm=scripted_llm,
+        stt=scripted_stt,
+        tts=SilentTTS(ttfb=tts_ttfb),
+        vad=vad,
+        turn_detection="stt",
+        min_endpointing_delay=0.0,
+        preemptive_generation=True,
+    )
+    session.input.audio = audio_input
+    session.output.audio = NullAudioOutput()
+
+    @session.on("metrics_collected")
+    def _on_metrics_collected(ev: MetricsCollectedEvent) -> None:
+        if logging_mode == "sync":
+            metrics.log_metrics(ev.metrics)
+        else:
+            logs.log_metrics(ev.metrics)
+        profiler.on_metrics(ev.metrics)
+
+    @session.on("function_tools_executed")
+    def _on_function_tools_executed(ev: FunctionToolsExecutedEvent) -> None:
+        nonlocal tool_calls, tool_time
+        profiler.on_tools_executed(ev)
+        tool_calls += len(ev.function_calls)
+        tools.update(c.name for c in ev.function_calls)
+        outputs = [o for o in ev.function_call_outputs if o is not None]
+        if outputs:
+            tool_time += max(o.created_at for o in outputs) - min(
+                c.created_at for c in ev.function_calls
+            )
+
+    agent = Therapist()
+    agent.set_publisher(publisher)
+    agent.set_store(store)
+    agent.set_participant(participant)
+    publisher.start()
+    context_manager = ContextManager(
+        session,
+        agent,
+        ScriptedLLM(ConversationScript("summary", []), fallback=_SUMMARY),
+        max_tokens=max_context_tokens,
+        target_tokens=max_context_tokens // 2,
+        records=agent.tracked_records,
+    )
+    context_manager.start()
+
+    start = time.perf_counter()
+    cpu_start = time.thread_time()
+    try:
+        await session.start(agent)
+        await asyncio.wait_for(scripted_stt.wait_for_stream(), turn_timeout)
+        for turn in script.turns:
+            replied = asyncio.Event()
+
+            def _on_speech(ev: Any, replied: asyncio.Event = replied) -> None:
+                if ev.new_state == "listening" and ev.old_state == "speaking":
+                    replied.set()
+
+            if think_time:
+                await asyncio.sleep(think_time)
+            session.on("agent_state_changed", _on_speech)
+            scripted_stt.transcribe(turn["user"])
+            try:
+                await asyncio.wait_for(replied.wait(), turn_timeout)
+            finally:
+                session.off("agent_state_changed", _on_speech)
+        duration = time.perf_counter() - start
+        loop_cpu = time.thread_time() - cpu_start
+    finally:
+        audio_input.close()
+        await context_manager.aclose()
+        await session.aclose()
+        agent.flush_tracking()
+        await publisher.aclose()
+        await store.aclose()
+
+    records = TrackingStore(db_path)
+    try:
+        stored = len(await records.range(participant.identity, 0))
+    finally:
+        await records.aclose()
+
+    return SessionResult(
+        script=script.name,
+        turns=len(script.turns),
+        duration=duration,
+        loop_cpu=loop_cpu,
+        llm_requests=scripted_llm.requests,
+        tool_calls=tool_calls,
+        tool_time=tool_time,
+        tools=tools,
+        messages_published=publisher.stats.messages_published,
+        packets_published=publisher.stats.packets_published,
+        bytes_published=local_participant.bytes,
+        flushes=publisher.stats.flushes,
+        flush_time=publisher.stats.total_flush_latency,
+        records_published=len(local_participant.record_ids),
+        records_stored=stored,
+        duplicate_records=agent.tracking_stats.duplicates,
+        context_compactions=context_manager.compactions,
+        turn_latencies=[asdict(t) for t in profiler.turns],
+    )
+
+
+@dataclass
+class BenchmarkReport:
+    sessions: int
+    turns: int
+    turns_per_second: float
+    tool_calls: int
+    tool_overhead_ms: float
+    publish_latency_ms: float
+    bytes_per_message: float
+    e2e_p50_ms: float
+    prompt_tokens_per_turn: float
+    prompt_cache_hit_rate: float
+    memory_per_session_kb: float
+    loop_cpu_ms_per_turn: float
+    logging_ms_per_turn: float = 0.0
+
+    def to_dict(self) -> dict[str, Any]:
+        return asdict(self)
+
+
+def summarize(results: list[SessionResult], peak_memory: int) -> BenchmarkReport:
+    turns = sum(r.turns for r in results)
+    tool_calls = sum(r.tool_calls for r in results)
+    messages = sum(r.messages_published for r in results)
+    latencies = [t for r in results for t in r.turn_latencies]
+    e2e = [t["e2e"] for t in latencies if t["e2e"] is not None]
+    prompt_tokens = sum(t["prompt_tokens"] for t in latencies)
+    cached_tokens = sum(t["prompt_cached_tokens"] for t in latencies)
+    return BenchmarkReport(
+        sessions=len(results),
+        turns=turns,
+        turns_per_second=round(turns / sum(r.duration for r in results), 2),
+        tool_calls=tool_calls,
+        tool_overhead_ms=round(
+            sum(r.tool_time for r in results) / max(tool_calls, 1) * 1000, 3
+        ),
+        publish_latency_ms=round(
+            sum(r.flush_time for r in results)
+            / max(sum(r.flushes for r in results), 1)
+            * 1000,
+            3,
+        ),
+        bytes_per_message=round(
+            sum(r.bytes_published for r in results) / max(messages, 1), 1
+        ),
+        e2e_p50_ms=round(statistics.median(e2e) * 1000, 2) if e2e else 0.0,
+        prompt_tokens_per_turn=round(prompt_tokens / max(len(latencies), 1), 1),
+        prompt_cache_hit_rate=round(cached_tokens / max(prompt_tokens, 1), 3),
+        memory_per_session_kb=round(peak_memory / 1024, 1),
+        loop_cpu_ms_per_turn=round(sum(r.loop_cpu for r in results) / turns * 1000, 3),
+    )
+
+
+class _IPCLikeHandler(logging.Handler):
+    """Formats and pickles records like livekit's handler of job processes."""
+
+    def emit(self, record: logging.LogRecord) -> None:
+        record = copy.copy(record)
+        record.msg = self.format(record)
+        record.args = None
+        record.exc_info = None
+        pickle.dumps(record)
+
+
+@contextlib.contextmanager
+def _benchmark_logging(mode: str) -> Iterator[list[float]]:
+    """Logging set up for ``mode``, yields the seconds spent logging so far."""
+    spent = [0.0]
+    if mode == "none":
+        yield spent
+        return
+
+    root = logging.getLogger()
+    handler = _IPCLikeHandler()
+    level = root.level
+    root.addHandler(handler)
+    root.setLevel(logging.INFO)
+    if mode == "queued":
+        logs.install()
+
+    log = logging.Logger._log
+
+    def _timed_log(self: logging.Logger, *args: Any, **kwargs: Any) -> None:
+        start = time.perf_counter()
+        try:
+            log(self, *args, **kwargs)
+        finally:
+            spent[0] += time.perf_counter() - start
+
+    logging.Logger._log = _timed_log  # type: ignore[method-assign]
+    try:
+        yield spent
+    finally:
+        logging.Logger._log = log  # type: ignore[method-assign]
+        logs.uninstall()
+        root.removeHandler(handler)
+        root.setLevel(level)
+
+
+async def run_benchmark(
+    scripts: list[ConversationScript],
+    *,
+    sessions: int = 5,
+    directory: str,
+    logging_mode: str = "none",
+) -> BenchmarkReport:
+    """Replay every script ``sessions`` times, then once more to measure memory.
+
+    Memory is measured in a separate pass, tracemalloc slows down everything
+    it traces and would skew the throughput numbers.
+    """
+    results: list[SessionResult] = []
+    with _benchmark_logging(logging_mode) as logging_time:
+        for i in range(sessions):
+            for script in scripts:
+                results.append(
+                    await replay_session(
+                        script,
+                        db_path=f"{directory}/bench-{i}.db",
+                        logging_mode=logging_mode,
+                    )
+                )
+
+    peak = 0
+    for script in scripts:
+        tracemalloc.start()
+        try:
+            await replay_session(script, db_path=f"{directory}/memory.db")
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+        finally:
+            tracemalloc.stop()
+
+    report = summarize(results, peak)
+    report.logging_ms_per_turn = round(logging_time[0] / report.turns * 1000, 3)
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=5)
+    parser.add_argument("--scripts", type=Path, default=CONVERSATIONS_DIR)
+    parser.add_argument("--logging", choices=("none", "sync", "queued"), default="none")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        report = asyncio.run(
+            run_benchmark(
+                load_scripts(args.scripts),
+                sessions=args.sessions,
+                directory=directory,
+                logging_mode=args.logging,
+            )
+        )
+    print(json.dumps(report.to_dict(), indent=2))
+
+
+if __name__ == "__main__":
+    with contextlib.suppress(KeyboardInterrupt):
+        main()
@@ -0,0 +1,49 @@
+import asyncio
+from types import SimpleNamespace
+
+from helpers import silent_frames
+
+from acknowledgements import ACKNOWLEDGEMENTS, Acknowledger
+from tts_cache import AudioCache
+
+
+class _TTS:
+    def __init__(self) -> None:
+        self.synthesized: list[str] = []
+
+    def synthesize(self, text: str) -> "_Stream":
+        self.synthesized.append(text)
+        return _Stream()
+
+
+class _Stream:
+    async def __aenter__(self) -> "_Stream":
+        return self
+
+    async def __aexit__(self, *exc: object) -> None:
+        pass
+
+    async def __aiter__(self):
+        for frame in silent_frames(240):
+            yield SimpleNamespace(frame=frame)
+
+
+async def test_acknowledgements_are_spoken_once_cached() -> None:
+    tts = _TTS()
+    said = []
+    session = SimpleNamespace(say=lambda text, **kwargs: said.append(text))
+    acknowledger = Acknowledger(tts, "voice", AudioCache())
+
+    # nothing cached yet, the tool result is not delayed by synthesis
+    assert acknowledger.acknowledge(session, "log_pain_assessment") is None
+    await asyncio.sleep(0.01)
+    assert tts.synthesized == list(ACKNOWLEDGEMENTS.values())
+
+    phrase = acknowledger.acknowledge(session, "log_pain_assessment")
+    assert phrase == ACKNOWLEDGEMENTS["log_pain_assessment"]
+    assert said == [phrase]
+    assert acknowledger.acknowledge(session, "get_guidance") is None
+
+    acknowledger.start()
+    await acknowledger.aclose()
+    assert len(tts.synthesized) == len(ACKNOWLEDGEMENTS)
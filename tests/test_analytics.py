@@ -0,0 +1,111 @@
+from datetime import date, timedelta
+
+import numpy as np
+import pytest
+
+from analytics import (
+    DailyMetrics,
+    anomalies,
+    lagged_correlation,
+    patient_facts,
+    rolling_mean,
+    trend_slopes,
+)
+from store import DailyRollup
+
+START = date(2026, 10, 1)
+
+
+def _rollups(patient: str, kind: str, metric: str, values) -> list[DailyRollup]:
+    return [
+        DailyRollup(
+            patient, kind, metric, (START + timedelta(days=i)).isoformat(), 1, v, v, v
+        )
+        for i, v in enumerate(values)
+        if v is not None
+    ]
+
+
+def test_rollups_become_arrays() -> None:
+    rollups = [
+        *_rollups("b", "pain_assessment", "painLevel", [4, None, 6]),
+        *_rollups("a", "pain_assessment", "painLevel", [7]),
+        # two records on one day
+        DailyRollup("a", "sleep_quality", "sleepQuality", "2026-10-03", 2, 9, 3, 6),
+        # outside the period
+        DailyRollup("a", "sleep_quality", "sleepQuality", "2026-09-30", 1, 1, 1, 1),
+    ]
+    daily = DailyMetrics.from_rollups(rollups, START, 3)
+
+    assert daily.patients == ("a", "b")
+    assert daily.metrics == ("pain_assessment.painLevel", "sleep_quality.sleepQuality")
+    np.testing.assert_array_equal(
+        daily.means[:, :, 0], [[7, np.nan, np.nan], [4, np.nan, 6]]
+    )
+    assert daily.means[0, 2, 1] == 4.5
+    assert daily.summary(0) == {
+        "pain_assessment": {"count": 1, "averages": {"painLevel": 7.0}},
+        "sleep_quality": {"count": 2, "averages": {"sleepQuality": 4.5}},
+    }
+    assert daily.last(1).summary(1) == {
+        "pain_assessment": {"count": 1, "averages": {"painLevel": 6.0}}
+    }
+
+
+def test_batch_matches_per_patient_loops() -> None:
+    rng = np.random.default_rng(7)
+    values = rng.integers(1, 11, size=(50, 28, 3)).astype(float)
+    values[rng.random(values.shape) < 0.3] = np.nan
+
+    means = rolling_mean(values, 7)
+    slopes = trend_slopes(values)
+    r, n = lagged_correlation(values[:, :, 0], values[:, :, 1], lag=1)
+
+    for p in range(50):
+        for m in range(3):
+            series = values[p, :, m]
+            for d in range(28):
+                window = series[max(0, d - 6) : d + 1]
+                expected = np.nanmean(window) if (~np.isnan(window)).any() else np.nan
+                np.testing.assert_allclose(means[p, d, m], expected)
+
+            days = np.flatnonzero(~np.isnan(series))
+            np.testing.assert_allclose(
+                slopes[p, m], np.polyfit(days, series[days], 1)[0]
+            )
+
+        x, y = values[p, :-1, 0], values[p, 1:, 1]
+        pairs = ~np.isnan(x) & ~np.isnan(y)
+        assert n[p] == pairs.sum()
+        np.testing.assert_allclose(r[p], np.corrcoef(x[pairs], y[pairs])[0, 1])
+
+
+def test_anomalies_need_history_and_distance() -> None:
+    values = np.array([[5, 5, 6, 5, 5, 9, 6, np.nan, 2]], dtype=float)[:, :, None]
+    flags, baseline = anomalies(values)
+    assert list(np.flatnonzero(flags[0, :, 0])) == [5, 8]
+    assert baseline[0, 5, 0] == pytest.approx(5.2)
+    # too little history
+    assert not anomalies(values[:, 4:])[0].any()
+
+
+def test_facts_for_the_llm() -> None:
+    pain = [8, 7, 7, 6, 6, 5, 5, 4, 4, 3]
+    # poor sleep on the nights before the worse days
+    sleep = [3, 4, 4, 5, 5, 6, 6, 7, 7, 8]
+    mood = [6, 5, 6, 5, 6, 5, 6, 5, 6, 1]
+    rollups = [
+        *_rollups("a", "pain_assessment", "painLevel", pain),
+        *_rollups("a", "sleep_quality", "sleepQuality", sleep),
+        *_rollups("a", "mood_assessment", "moodRating", mood),
+    ]
+    facts = patient_facts(DailyMetrics.from_rollups(rollups, START, 10), 0)
+
+    assert "pain level went down by about 4.6 points over the last 10 days" in facts
+    assert any(
+        f.startswith(
+            "after nights with better sleep quality, pain level tends to be lower"
+        )
+        for f in facts
+    )
+    assert "mood of 1 on 2026-10-10 was unusually low (usually about 5.6)" in facts
@@ -0,0 +1,136 @@
+import math
+import wave
+from array import array
+
+import pytest
+from audio_bench import run_bench
+from livekit import rtc
+from livekit.plugins import silero
+
+from audio_input import (
+    NOISE_CANCELLATION_ENV,
+    AudioProfiler,
+    WebRTCNoiseSuppression,
+    select_noise_cancellation,
+)
+
+SAMPLE_RATE = 24000
+
+
+def tone(seconds: float, sample_rate: int = SAMPLE_RATE) -> array:
+    return array(
+        "h",
+        (
+            int(4000 * math.sin(2 * math.pi * 220 * i / sample_rate))
+            for i in range(int(seconds * sample_rate))
+        ),
+    )
+
+
+def frames(seconds: float, frame_ms: int = 50) -> list[rtc.AudioFrame]:
+    samples = tone(seconds)
+    size = SAMPLE_RATE * frame_ms // 1000
+    return [
+        rtc.AudioFrame(samples[i : i + size].tobytes(), SAMPLE_RATE, 1, size)
+        for i in range(0, len(samples), size)
+    ]
+
+
+class FailingProcessor(WebRTCNoiseSuppression):
+    def _process(self, frame: rtc.AudioFrame) -> rtc.AudioFrame:
+        raise RuntimeError("no credentials")
+
+
+def test_noise_cancellation_is_timed_per_frame() -> None:
+    profiler = AudioProfiler()
+    processor = profiler.noise_cancellation(WebRTCNoiseSuppression())
+    for frame in frames(1.0):
+        processed = processor._process(frame)
+        assert processed.samples_per_channel == frame.samples_per_channel
+        assert processed.sample_rate == SAMPLE_RATE
+
+    failing = AudioProfiler()
+    processor = failing.noise_cancellation(FailingProcessor())
+    with pytest.raises(RuntimeError):
+        processor._process(frames(0.05)[0])
+
+    stats = profiler.summary()["noise_cancellation"]
+    assert stats["frames"] == 20
+    assert stats["audio_s"] == 1.0
+    assert 0 < stats["time_ms"]["p50"] <= stats["time_ms"]["max"]
+    assert stats["dropped"] == 0
+    assert failing.summary()["noise_cancellation"]["dropped"] == 1
+
+
+def test_native_noise_cancellation_is_not_wrapped(monkeypatch) -> None:
+    monkeypatch.setenv(NOISE_CANCELLATION_ENV, "bvc-telephony")
+    option = select_noise_cancellation()
+    assert isinstance(option, rtc.NoiseCancellationOptions)
+    profiler = AudioProfiler()
+    assert profiler.noise_cancellation(option) is option
+    assert profiler.noise_cancellation(select_noise_cancellation("none")) is None
+    assert profiler.summary() == {}
+
+    monkeypatch.setenv(NOISE_CANCELLATION_ENV, "krisp")
+    assert isinstance(select_noise_cancellation(), rtc.NoiseCancellationOptions)
+
+
+async def test_vad_inference_and_backlog_are_recorded() -> None:
+    profiler = AudioProfiler()
+    inner = silero.VAD.load()
+    model = profiler.vad(inner)
+    forwarded = []
+    model.on("metrics_collected", forwarded.append)
+
+    stream = model.stream()
+    for frame in frames(2.0):
+        stream.push_frame(frame)
+    stream.end_input()
+    async for _ in stream:
+        pass
+    await stream.aclose()
+
+    stats = profiler.summary()["vad"]
+    assert stats["frames"] == 40
+    assert stats["audio_s"] == 2.0
+    assert stats["time_ms"]["max"] > 0
+    # everything was pushed before the first inference
+    assert stats["max_backlog"] > 1.5
+    assert forwarded
+
+    # the VAD is shared by the worker's sessions
+    profiler.detach()
+    count = len(forwarded)
+    inner.emit("metrics_collected", object())
+    assert len(forwarded) == count
+
+
+async def test_turn_detector_predictions_are_timed() -> None:
+    class Detector:
+        async def predict_end_of_turn(self, chat_ctx, *, timeout=None) -> float:
+            return 0.9
+
+    profiler = AudioProfiler()
+    detector = profiler.turn_detection(Detector())
+    assert await detector.predict_end_of_turn(None, timeout=1.0) == 0.9
+    assert profiler.summary()["turn_detection"]["frames"] == 1
+
+
+async def test_bench_reports_cpu_per_audio_second(tmp_path) -> None:
+    path = tmp_path / "patient.wav"
+    with wave.open(str(path), "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(16000)
+        wav.writeframes(tone(3.0, 16000).tobytes())
+
+    report = await run_bench(
+        [path, path], noise_cancellation="webrtc", turn_detector=False
+    )
+
+    assert report["audio_s"] == 6.0
+    for stage in ("noise_cancellation", "vad"):
+        stats = report["stages"][stage]
+        assert stats["frames"] == 120
+        assert 0 < stats["cpu_per_audio_s"] < 1
+    assert "turn_detection" not in report["stages"]
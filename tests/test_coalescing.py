@@ -0,0 +1,81 @@
+import asyncio
+
+from coalescing import TrackingCoalescer
+from records import PainAssessment, SleepQuality, TrackingRecord
+
+
+class _Writes(list):
+    def __call__(self, record: TrackingRecord, record_id: str, ts: float) -> None:
+        self.append((record_id, record))
+
+
+async def test_repeated_records_update_one_record() -> None:
+    writes = _Writes()
+    coalescer = TrackingCoalescer(writes, window=60)
+
+    first = coalescer.submit(PainAssessment(pain_level=6), confirmation="level 6")
+    again = coalescer.submit(PainAssessment(pain_level=6), confirmation="again")
+    located = coalescer.submit(PainAssessment(location="neck"), confirmation="neck")
+    sleep = coalescer.submit(SleepQuality(hours_slept=7))
+
+    assert again.duplicate and again.confirmation == "level 6"
+    assert not located.duplicate
+    assert located.record_id == first.record_id != sleep.record_id
+    assert writes == [
+        (first.record_id, PainAssessment(pain_level=6)),
+        (first.record_id, PainAssessment(pain_level=6, location="neck")),
+        (sleep.record_id, SleepQuality(hours_slept=7)),
+    ]
+    assert coalescer.stats.submitted == 4
+    assert coalescer.stats.written == 3
+    assert coalescer.stats.merged == coalescer.stats.duplicates == 1
+
+
+async def test_conflicting_reports_are_written_separately() -> None:
+    writes = _Writes()
+    coalescer = TrackingCoalescer(writes, window=60)
+
+    back = coalescer.submit(PainAssessment(pain_level=7, location="lower back"))
+    neck = coalescer.submit(PainAssessment(pain_level=4, location="neck"))
+    # completes the report it refines, not the latest one
+    detail = coalescer.submit(PainAssessment(pain_level=7, quality="dull"))
+
+    assert back.record_id != neck.record_id
+    assert detail.record_id == back.record_id
+    assert writes == [
+        (back.record_id, PainAssessment(pain_level=7, location="lower back")),
+        (neck.record_id, PainAssessment(pain_level=4, location="neck")),
+        (
+            back.record_id,
+            PainAssessment(pain_level=7, location="lower back", quality="dull"),
+        ),
+    ]
+
+
+async def test_records_after_the_window_are_new() -> None:
+    writes = _Writes()
+    coalescer = TrackingCoalescer(writes, window=0)
+
+    coalescer.submit(PainAssessment(pain_level=6))
+    coalescer.submit(PainAssessment(pain_level=6))
+
+    assert len({record_id for record_id, _ in writes}) == 2
+
+
+async def test_writes_over_the_rate_are_held_and_merged() -> None:
+    writes = _Writes()
+    coalescer = TrackingCoalescer(writes, window=60, rate=20, burst=1)
+
+    coalescer.submit(PainAssessment(pain_level=6))
+    coalescer.submit(PainAssessment(pain_level=7))
+    coalescer.submit(PainAssessment(pain_level=7, quality="dull"))
+    assert len(writes) == 1
+    assert coalescer.stats.deferred == 1
+
+    await asyncio.sleep(0.1)
+    assert writes[1][1] == PainAssessment(pain_level=7, quality="dull")
+
+    coalescer.submit(PainAssessment(pain_level=8))
+    coalescer.submit(PainAssessment(pain_level=9))
+    coalescer.flush()
+    assert [record.pain_level for _, record in writes] == [6, 7, 8, 9]
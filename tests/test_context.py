@@ -0,0 +1,148 @@
+import pytest
+from livekit.agents import AgentSession
+from livekit.agents.llm import ChatContext, ChatMessage
+from replay import ConversationScript, ScriptedLLM, load_scripts, replay_session
+
+from agent import Therapist
+from context import SUMMARY_ITEM_ID, ContextManager
+
+TURNS = [
+    {
+        "user": f"Turn {i}: the pain has been constant and it wears me down "
+        "in the evenings when I try to relax.",
+        "responses": [
+            {
+                "tool_calls": [
+                    {
+                        "name": "log_pain_assessment",
+                        "arguments": {
+                            "pain_level": i,
+                            "pain_location": "back",
+                            "pain_quality": "dull",
+                            "triggers": "",
+                            "coping_strategies": "",
+                        },
+                    }
+                ]
+            },
+            {"text": "That sounds really difficult, I hear you. " * 4},
+        ],
+    }
+    for i in range(1, 9)
+]
+
+
+@pytest.mark.asyncio
+async def test_old_turns_are_summarized_and_tool_results_pinned() -> None:
+    summary_llm = ScriptedLLM(
+        ConversationScript("summary", []), fallback="Patient has constant back pain."
+    )
+    async with AgentSession(
+        llm=ScriptedLLM(ConversationScript("test", TURNS))
+    ) as session:
+        agent = Therapist()
+        manager = ContextManager(
+            session,
+            agent,
+            summary_llm,
+            max_tokens=300,
+            target_tokens=150,
+            min_recent_turns=2,
+            records=agent.tracked_records,
+        )
+        manager.start()
+        await session.start(agent)
+
+        for turn in TURNS:
+            await session.run(user_input=turn["user"])
+            if manager._task is not None:
+                await manager._task
+
+        await manager.aclose()
+
+    assert manager.compactions >= 1
+    assert manager.history_tokens <= 300
+    items = agent.chat_ctx.items
+    assert items[0].role == "system"
+    summary = agent.chat_ctx.get_by_id(SUMMARY_ITEM_ID)
+    assert summary is not None and items.index(summary) == 1
+    assert "Patient has constant back pain." in summary.text_content
+    assert (
+        "pain_assessment: painLevel 1, location back, quality dull"
+        in summary.text_content
+    )
+    # the newest turns are kept verbatim
+    assert items[-1].role == "assistant"
+    assert any(
+        i.type == "message" and i.text_content == TURNS[-1]["user"] for i in items
+    )
+
+
+@pytest.mark.asyncio
+async def test_extracted_values_are_pinned() -> None:
+    # stated plainly, recorded by the fast path without a tool call
+    turns = [
+        {
+            "user": "My sleep was terrible, maybe a 3 out of 10.",
+            "responses": [{"text": "I'm sorry, that sounds exhausting. " * 4}],
+        },
+        *(
+            {
+                "user": f"Turn {i}: evenings are the hardest, I can't settle down.",
+                "responses": [
+                    {"text": "That sounds really difficult, I hear you. " * 4}
+                ],
+            }
+            for i in range(5)
+        ),
+    ]
+    summary_llm = ScriptedLLM(
+        ConversationScript("summary", []), fallback="Patient sleeps badly."
+    )
+    async with AgentSession(
+        llm=ScriptedLLM(ConversationScript("test", turns))
+    ) as session:
+        agent = Therapist()
+        manager = ContextManager(
+            session,
+            agent,
+            summary_llm,
+            max_tokens=200,
+            target_tokens=100,
+            min_recent_turns=2,
+            records=agent.tracked_records,
+        )
+        manager.start()
+        await session.start(agent)
+
+        for turn in turns:
+            # text input doesn't run the fast path, see test_agent.py
+            message = ChatMessage(role="user", content=[turn["user"]])
+            await agent.on_user_turn_completed(ChatContext.empty(), message)
+            await session.run(user_input=turn["user"])
+            if manager._task is not None:
+                await manager._task
+
+        await manager.aclose()
+
+    assert manager.compactions >= 1
+    first = turns[0]["user"]
+    items = agent.chat_ctx.items
+    assert not any(i.type == "message" and i.text_content == first for i in items)
+    summary = agent.chat_ctx.get_by_id(SUMMARY_ITEM_ID)
+    assert "sleep_quality: sleepQuality 3" in summary.text_content
+
+
+async def test_long_replay_keeps_prompt_bounded(tmp_path) -> None:
+    (script,) = [s for s in load_scripts() if s.name == "long_flare_session"]
+    result = await replay_session(
+        script, db_path=str(tmp_path / "tracking.db"), max_context_tokens=400
+    )
+
+    assert result.context_compactions >= 1
+    unbounded = await replay_session(
+        script, db_path=str(tmp_path / "tracking.db"), max_context_tokens=10**6
+    )
+    assert unbounded.context_compactions == 0
+    last_turn = result.turn_latencies[-1]["prompt_tokens"]
+    assert last_turn < unbounded.turn_latencies[-1]["prompt_tokens"]
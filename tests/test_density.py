@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+import pickle
+
+from livekit.agents import Plugin, WorkerOptions
+
+import density
+from density import DensityConfig, SessionLoadMonitor, high_density_options
+
+_MB = 1024 * 1024
+
+
+class _Sampler:
+    def __init__(self) -> None:
+        self.cpu = 0.0
+        self.memory = 0
+
+    def __call__(self, with_memory: bool) -> tuple[float, int | None]:
+        return self.cpu, self.memory if with_memory else None
+
+
+def _monitor(sampler: _Sampler, **config: float) -> SessionLoadMonitor:
+    return SessionLoadMonitor(
+        DensityConfig(**config),
+        sample=sampler,
+        cpu_count=4,
+        memory_total=4096 * _MB,
+        memory_interval=0,
+    )
+
+
+def test_load_follows_measured_session_cost() -> None:
+    sampler = _Sampler()
+    sampler.cpu, sampler.memory = 0.2, 400 * _MB
+    monitor = _monitor(sampler)
+    for _ in range(20):
+        monitor.update(0)
+    assert abs(monitor.baseline_cpu - 0.2) < 0.01
+
+    # sessions turn out to be cheaper on CPU and heavier on memory than assumed
+    sampler.cpu, sampler.memory = 0.2 + 4 * 0.05, 400 * _MB + 4 * 300 * _MB
+    for _ in range(50):
+        load = monitor.update(4)
+    assert abs(monitor.session_cpu - 0.05) < 0.01
+    assert abs(monitor.session_memory / _MB - 300) < 5
+    # memory bound: (0.8 * 4096 - 400) / 300
+    assert monitor.max_sessions == 9
+    # 4 of 9 sessions, but the measured memory use is the tighter bound
+    assert abs(load - 1600 / (0.8 * 4096)) < 0.01
+
+
+def test_admission_reserves_room_until_the_next_sample() -> None:
+    sampler = _Sampler()
+    monitor = _monitor(sampler, session_memory_mb=1000)
+    monitor.update(0)
+    assert monitor.max_sessions == 3
+
+    assert [monitor.admit() for _ in range(4)] == [True, True, True, False]
+
+    # one of them is running by now, the other two have given up
+    sampler.memory = 1000 * _MB
+    monitor.update(1)
+    assert [monitor.admit() for _ in range(3)] == [True, True, False]
+
+    capped = _monitor(_Sampler(), max_sessions=1)
+    capped.update(0)
+    assert capped.admit()
+    assert not capped.admit()
+
+
+def test_high_density_options() -> None:
+    options = WorkerOptions(entrypoint_fnc=print, multiprocessing_context="forkserver")
+    registered = list(Plugin.registered_plugins)
+    try:
+        dense = high_density_options(options, DensityConfig(idle_processes=4))
+        preloaded = [p.package for p in Plugin.registered_plugins[len(registered) :]]
+    finally:
+        Plugin.registered_plugins[:] = registered
+
+    assert preloaded == list(density.PRELOAD_MODULES)
+    assert dense.load_fnc is density._load_fnc
+    assert dense.request_fnc is density._request_fnc
+    assert dense.load_threshold == 1.0
+    assert dense.num_idle_processes == 4
+    assert dense.entrypoint_fnc is print
+    # the job executor pickles the options' functions into the job processes
+    pickle.dumps(dense.load_fnc)
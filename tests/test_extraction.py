@@ -0,0 +1,83 @@
+import pytest
+from replay import ConversationScript, replay_session
+
+from extraction import extract_metrics
+
+
+@pytest.mark.parametrize(
+    ("text", "expected"),
+    [
+        (
+            "My pain is a 7 today, mostly a sharp ache in my lower back.",
+            {
+                "pain_assessment": {
+                    "painLevel": 7,
+                    "location": "lower back",
+                    "quality": "sharp",
+                }
+            },
+        ),
+        ("Pain's been around 4 out of 10.", {"pain_assessment": {"painLevel": 4}}),
+        (
+            "I'd rate my pain a 6, no, more like a 7.",
+            {"pain_assessment": {"painLevel": 7}},
+        ),
+        ("I got 6 hours sleep last night", {"sleep_quality": {"hoursSlept": 6}}),
+        (
+            "I slept about six and a half hours and woke up three times.",
+            {"sleep_quality": {"hoursSlept": 6.5, "wakeUps": 3}},
+        ),
+        (
+            "My sleep was terrible, maybe a 3 out of 10.",
+            {"sleep_quality": {"sleepQuality": 3}},
+        ),
+        (
+            "Mood is a three, energy a two.",
+            {"mood_assessment": {"moodRating": 3, "energyLevel": 2}},
+        ),
+    ],
+)
+def test_stated_values_are_extracted(text: str, expected: dict) -> None:
+    assert {e.message_type: e.data for e in extract_metrics(text)} == expected
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "Hi there, I'm feeling okay today.",
+        "My pain started 3 days ago.",
+        "If my pain gets to an 8 I take my meds.",
+        "My pain level used to be a 2.",
+        "My pain is a 12.",
+        "I woke up twice.",
+        "I had 3 hours of meetings today.",
+        "I got 2 hours of work done.",
+        "My pain was a 9 yesterday.",
+        "My pain was 8 this morning but now it is a 4.",
+    ],
+)
+def test_nothing_is_extracted_without_a_plain_statement(text: str) -> None:
+    assert extract_metrics(text) == []
+
+
+def test_hours_of_something_else_are_not_sleep() -> None:
+    extracted = extract_metrics("I had 2 hours of physio, pain is a 4.")
+    assert {e.message_type: e.data for e in extracted} == {
+        "pain_assessment": {"painLevel": 4}
+    }
+
+
+async def test_stated_rating_is_recorded_without_a_tool_call(tmp_path) -> None:
+    script = ConversationScript(
+        "fast_path",
+        [
+            {
+                "user": "My pain is a six today, mostly in my neck.",
+                "responses": [{"text": "I'm sorry your neck is bothering you."}],
+            }
+        ],
+    )
+    result = await replay_session(script, db_path=str(tmp_path / "tracking.db"))
+
+    assert result.tool_calls == 0
+    assert result.records_published == result.records_stored == 1
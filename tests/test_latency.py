@@ -0,0 +1,153 @@
+import json
+import os
+import random
+import threading
+import urllib.request
+
+from livekit.agents import metrics
+from livekit.agents.llm import FunctionCall, FunctionCallOutput
+from livekit.agents.voice import FunctionToolsExecutedEvent
+
+import latency
+from latency import LatencyHistogram, LatencyProfiler, serve_latency_metrics
+from safety import RedFlag
+
+
+def test_histogram_percentiles_are_accurate() -> None:
+    rng = random.Random(0)
+    samples = [rng.lognormvariate(-1, 0.5) for _ in range(10_000)]
+    hist = LatencyHistogram()
+    for s in samples:
+        hist.record(s)
+
+    samples.sort()
+    for q in (0.5, 0.95, 0.99):
+        exact = samples[int(q * len(samples)) - 1]
+        assert abs(hist.percentile(q) - exact) / exact < 0.02
+
+    restored = LatencyHistogram.from_dict(json.loads(json.dumps(hist.to_dict())))
+    assert restored.percentile(0.95) == hist.percentile(0.95)
+
+
+def _turn(profiler: LatencyProfiler, stopped_at: float) -> None:
+    profiler.on_metrics(
+        metrics.EOUMetrics(
+            timestamp=stopped_at + 0.5,
+            end_of_utterance_delay=0.5,
+            transcription_delay=0.2,
+            on_user_turn_completed_delay=0.0,
+            last_speaking_time=stopped_at,
+            speech_id="speech_1",
+        )
+    )
+    profiler.on_metrics(
+        metrics.LLMMetrics(
+            label="llm",
+            request_id="req_1",
+            timestamp=stopped_at + 1.0,
+            duration=0.5,
+            ttft=0.3,
+            cancelled=False,
+            completion_tokens=10,
+            prompt_tokens=100,
+            prompt_cached_tokens=80,
+            total_tokens=110,
+            tokens_per_second=20,
+            speech_id="speech_1",
+        )
+    )
+    call = FunctionCall(
+        call_id="call_1",
+        name="log_pain_assessment",
+        arguments="{}",
+        created_at=stopped_at + 0.9,
+    )
+    output = FunctionCallOutput(
+        call_id="call_1", output="ok", is_error=False, created_at=stopped_at + 1.0
+    )
+    profiler.on_tools_executed(
+        FunctionToolsExecutedEvent(
+            function_calls=[call], function_call_outputs=[output]
+        )
+    )
+    # first audio at stopped_at + 2.0
+    profiler.on_metrics(
+        metrics.TTSMetrics(
+            label="tts",
+            request_id="req_2",
+            timestamp=stopped_at + 3.0,
+            ttfb=0.2,
+            duration=1.2,
+            audio_duration=3.0,
+            cancelled=False,
+            characters_count=40,
+            streamed=True,
+            speech_id="speech_2",
+        )
+    )
+
+
+def test_profiler_joins_stages_into_turn() -> None:
+    profiler = LatencyProfiler()
+    _turn(profiler, stopped_at=1000.0)
+
+    (turn,) = profiler.turns
+    assert turn.llm_ttft == 0.3
+    assert turn.tool_calls == 1
+    assert abs(turn.tool_time - 0.1) < 1e-6
+    assert abs(turn.e2e - 2.0) < 1e-6
+    assert turn.prompt_tokens == 100
+    assert turn.prompt_cached_tokens == 80
+
+    summary = profiler.summary()
+    assert summary["e2e"]["count"] == 1
+    assert summary["prompt"]["cache_hit_rate"] == 0.8
+
+
+def test_endpoint_merges_process_snapshots(tmp_path, monkeypatch) -> None:
+    monkeypatch.setenv(latency.METRICS_DIR_ENV, str(tmp_path))
+    monkeypatch.setattr(latency, "_process_histograms", latency._HistogramSet())
+    profiler = LatencyProfiler()
+    _turn(profiler, stopped_at=1000.0)
+    profiler.write_snapshot()
+
+    # a job process that already exited
+    dead = latency._HistogramSet()
+    dead.record("e2e", 4.0)
+    latency._write_histograms(tmp_path / f"{2**22 + 7}.json", dead)
+
+    server = serve_latency_metrics(0)
+    try:
+        base = f"http://127.0.0.1:{server.server_address[1]}"
+        with urllib.request.urlopen(f"{base}/metrics.json") as resp:
+            summary = json.load(resp)
+        with urllib.request.urlopen(f"{base}/metrics") as resp:
+            text = resp.read().decode()
+    finally:
+        server.shutdown()
+
+    assert summary["e2e"]["count"] == 2
+    assert 'therapist_turn_latency_seconds_count{stage="e2e"} 2' in text
+    assert sorted(os.listdir(tmp_path)) == [f"{os.getpid()}.json", "retired.json"]
+
+
+async def test_snapshots_are_written_off_the_event_loop(tmp_path, monkeypatch) -> None:
+    monkeypatch.setenv(latency.METRICS_DIR_ENV, str(tmp_path))
+    monkeypatch.setattr(latency, "_process_histograms", latency._HistogramSet())
+    threads = []
+    write = latency._write_text
+
+    def write_text(path, text) -> None:
+        threads.append(threading.current_thread())
+        write(path, text)
+
+    monkeypatch.setattr(latency, "_write_text", write_text)
+    profiler = LatencyProfiler()
+    profiler.on_safety_referral(RedFlag("self_harm", "hurt myself"), 0.5)
+    _turn(profiler, stopped_at=1000.0)
+    await profiler.awrite_snapshot()
+
+    assert threads and threading.main_thread() not in threads
+    snapshot = json.loads((tmp_path / f"{os.getpid()}.json").read_text())
+    assert snapshot["safety"]["count"] == 1
+    assert snapshot["e2e"]["count"] == 1
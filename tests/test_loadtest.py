@@ -0,0 +1,26 @@
+from loadtest import RoomConfig, run_ramp
+from replay import load_scripts
+
+
+async def test_ramp_reports_every_stage(tmp_path) -> None:
+    scripts = [s for s in load_scripts() if len(s.turns) <= 5]
+    report = await run_ramp(
+        [1, 3],
+        directory=str(tmp_path),
+        processes=0,
+        config=RoomConfig(llm_ttft=0.01, tts_ttfb=0.01, think_time=0.05),
+        scripts=scripts,
+        max_slowdown=100,
+        baseline_seconds=0.2,
+    )
+
+    assert [s.rooms for s in report.stages] == [1, 3]
+    assert report.max_sustained_rooms == 3
+    for stage in report.stages:
+        assert stage.failed_rooms == 0
+        assert stage.turns > 0
+        assert stage.turns_per_second > 0
+        assert {"e2e", "llm_ttft", "tts_ttfb"} <= stage.latency_ms.keys()
+        assert stage.latency_ms["llm_ttft"]["p50"] >= 10
+        assert stage.loop_lag_ms["max"] >= stage.loop_lag_ms["p50"]
+        assert stage.rss_mb > 0
@@ -0,0 +1,94 @@
+import json
+import logging
+import threading
+
+from livekit.agents.cli.log import JsonFormatter
+
+import logs
+from logs import RateSampler, SamplingFilter
+
+
+def _record(msg: str, *args, level: int = logging.INFO) -> logging.LogRecord:
+    return logging.LogRecord("agent", level, __file__, 1, msg, args, None)
+
+
+def test_sampling_per_category() -> None:
+    sampling = SamplingFilter(RateSampler(rate=0.0, burst=2))
+    passed = [sampling.filter(_record("tick %d", i)) for i in range(5)]
+    assert passed == [True, True, False, False, False]
+    # another template is another category, warnings always pass
+    assert sampling.filter(_record("tock %d", 1))
+    assert sampling.filter(_record("tick %d", 6, level=logging.WARNING))
+
+    sampling.sampler.rate = 1e9
+    record = _record("tick %d", 7)
+    assert sampling.filter(record)
+    assert record.sampled_out == 3
+
+
+def test_sampler_keeps_the_categories_used_last() -> None:
+    sampler = RateSampler(rate=0.0, burst=1, max_categories=2)
+    assert sampler.allow("a") == 0
+    assert sampler.allow("b") == 0
+    assert sampler.allow("a") is None
+    # a new category evicts "b", used least recently
+    assert sampler.allow("c") == 0
+    assert len(sampler) == 2
+    assert sampler.allow("b") == 0
+    assert sampler.allow("c") is None
+
+    sampling = SamplingFilter(RateSampler(max_categories=8))
+    for i in range(100):
+        # pre-formatted messages, every one its own template
+        sampling.filter(_record(f"heard {i} words"))
+    assert len(sampling.sampler) == 8
+
+
+def test_json_lines_carry_sampling_and_context_fields() -> None:
+    sampling = SamplingFilter(RateSampler(rate=1e9, burst=1))
+    sampling.filter(_record("pain level %s", 6))
+    sampling.sampler.rate = 0.0
+    sampling.filter(_record("pain level %s", 6))
+    sampling.sampler.rate = 1e9
+    record = _record("pain level %s", 7)
+    assert sampling.filter(record)
+    # set by livekit from ctx.log_context_fields
+    record.room = "room-1"
+    record.job_id = "AJ_1"
+
+    # what the worker's main process writes under `start`
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry["message"] == "pain level 7"
+    assert entry["level"] == "INFO"
+    assert entry["room"] == "room-1"
+    assert entry["job_id"] == "AJ_1"
+    assert entry["sampled_out"] == 1
+
+
+def test_records_are_formatted_off_the_logging_thread() -> None:
+    formatted: list[tuple[str, str]] = []
+
+    class _Handler(logging.Handler):
+        def emit(self, record: logging.LogRecord) -> None:
+            formatted.append((self.format(record), threading.current_thread().name))
+
+    root = logging.getLogger()
+    handler = _Handler()
+    level = root.level
+    root.addHandler(handler)
+    root.setLevel(logging.INFO)
+    try:
+        queue_handler = logs.install()
+        assert queue_handler is not None
+        assert root.handlers == [queue_handler]
+        assert logs.install() is None
+
+        logging.getLogger("agent").info("recorded %s", "sleep")
+    finally:
+        logs.uninstall()
+        root.removeHandler(handler)
+        root.setLevel(level)
+
+    assert formatted == [("recorded sleep", formatted[0][1])]
+    assert formatted[0][1] != threading.current_thread().name
+    assert handler not in root.handlers
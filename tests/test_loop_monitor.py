@@ -0,0 +1,47 @@
+import asyncio
+import time
+import traceback
+
+from loop_monitor import LoopMonitor, attribute
+
+
+def log_pain_assessment() -> None:
+    # stands in for a tool that blocks the loop
+    time.sleep(0.3)
+
+
+async def test_stall_is_captured_and_attributed_to_the_tool() -> None:
+    lags: list[float] = []
+    monitor = LoopMonitor(
+        tool_names=["log_pain_assessment"], on_lag=lags.append, threshold=0.1
+    )
+    monitor.start()
+    await asyncio.sleep(0.2)
+    log_pain_assessment()
+    await asyncio.sleep(0.2)
+    await monitor.aclose()
+
+    assert monitor.stall_count == 1
+    (stall,) = monitor.stalls
+    assert stall.stage == "tool:log_pain_assessment"
+    assert stall.duration >= 0.25
+    assert any("in log_pain_assessment" in line for line in stall.stack)
+    assert len(lags) == monitor.lag.count > 2
+    summary = monitor.summary()
+    assert summary["stalls"] == 1
+    assert summary["stages"]["tool:log_pain_assessment"]["count"] == 1
+    assert summary["lag"]["max"] >= 0.25
+
+
+def test_stack_attributed_to_pipeline_stage() -> None:
+    def frames(*paths: str) -> traceback.StackSummary:
+        return traceback.StackSummary.from_list(
+            [(path, 1, "f", None) for path in paths]
+        )
+
+    lib = "/venv/site-packages/livekit"
+    voice = f"{lib}/agents/voice/agent_activity.py"
+    assert attribute(frames(voice, f"{lib}/plugins/openai/tts.py")) == "tts"
+    assert attribute(frames(voice, f"{lib}/agents/utils/aio/chan.py")) == "pipeline"
+    assert attribute(frames(voice, "/usr/lib/python3.11/json/encoder.py")) == "pipeline"
+    assert attribute(frames("/usr/lib/python3.11/json/encoder.py")) == "unknown"
@@ -0,0 +1,94 @@
+import asyncio
+import json
+
+from publisher import TrackingPublisher, encode_json_packets
+
+
+class _FakeParticipant:
+    def __init__(self, failures: int = 0, delay: float = 0.0) -> None:
+        self.packets: list[bytes] = []
+        self._failures = failures
+        self._delay = delay
+
+    async def publish_data(self, payload: bytes, *, reliable: bool, topic: str) -> None:
+        await asyncio.sleep(self._delay)
+        if self._failures:
+            self._failures -= 1
+            raise RuntimeError("data channel unavailable")
+        self.packets.append(payload)
+
+
+class _FakeRoom:
+    def __init__(self, participant: _FakeParticipant) -> None:
+        self.local_participant = participant
+
+
+def _message(i: int) -> dict:
+    return {"type": "pain_assessment", "data": {"painLevel": i}}
+
+
+async def test_publish_does_not_wait_on_network() -> None:
+    participant = _FakeParticipant(delay=1.0)
+    publisher = TrackingPublisher(_FakeRoom(participant))
+    publisher.start()
+
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    assert publisher.publish(_message(1))
+    assert loop.time() - start < 0.01
+    assert publisher.queue_depth == 1
+
+    await publisher.aclose(timeout=0.01)
+
+
+async def test_same_turn_messages_are_coalesced() -> None:
+    participant = _FakeParticipant()
+    publisher = TrackingPublisher(_FakeRoom(participant), linger=0.02)
+    publisher.start()
+
+    for i in range(3):
+        publisher.publish(_message(i))
+    await publisher.aclose()
+
+    assert len(participant.packets) == 1
+    frame = json.loads(participant.packets[0])
+    assert frame["type"] == "batch"
+    assert [m["data"]["painLevel"] for m in frame["messages"]] == [0, 1, 2]
+    assert publisher.stats.messages_published == 3
+    assert publisher.stats.max_queue_depth == 3
+
+
+async def test_failed_packets_are_retried() -> None:
+    participant = _FakeParticipant(failures=2)
+    publisher = TrackingPublisher(_FakeRoom(participant), linger=0, retry_backoff=0.001)
+    publisher.start()
+
+    publisher.publish(_message(7))
+    await publisher.aclose()
+
+    assert json.loads(participant.packets[0]) == _message(7)
+    assert publisher.stats.retries == 2
+    assert publisher.stats.packets_failed == 0
+
+
+async def test_full_queue_drops_oldest() -> None:
+    publisher = TrackingPublisher(_FakeRoom(_FakeParticipant()), max_queue=2)
+
+    publisher.publish(_message(1))
+    publisher.publish(_message(2))
+    assert not publisher.publish(_message(3))
+
+    assert publisher.queue_depth == 2
+    assert publisher.stats.messages_dropped == 1
+
+
+def test_batches_are_split_below_packet_limit() -> None:
+    messages = [{"type": "mood_assessment", "data": {"note": "x" * 100}}] * 20
+    packets = encode_json_packets(messages, max_bytes=600)
+
+    assert all(len(p) <= 600 for p in packets)
+    decoded = []
+    for p in packets:
+        frame = json.loads(p)
+        decoded.extend(frame["messages"] if frame["type"] == "batch" else [frame])
+    assert decoded == messages
@@ -0,0 +1,97 @@
+import math
+
+import pytest
+
+from records import (
+    InvalidRecordError,
+    MoodAssessment,
+    PainAssessment,
+    RecordBuffer,
+    SleepQuality,
+    record_from_data,
+)
+from reports import record_columns
+
+
+def test_canonical_data_round_trip() -> None:
+    sleep = SleepQuality(
+        sleep_quality=4, hours_slept=6.5, wake_ups=0, sleep_factors="  "
+    )
+    assert sleep.to_data() == {"sleepQuality": 4, "hoursSlept": 6.5, "wakeUps": 0}
+    assert record_from_data("sleep_quality", sleep.to_data()) == sleep
+
+
+@pytest.mark.parametrize(
+    "values",
+    [
+        {"pain_level": 0},
+        {"pain_level": 11},
+        {"pain_level": 6.5},
+        {"pain_level": "7"},
+        {"pain_level": True},
+        {"location": "x" * 501},
+        {"pain": 7},
+    ],
+)
+def test_invalid_values_are_rejected(values: dict) -> None:
+    with pytest.raises(InvalidRecordError):
+        PainAssessment(**values)
+
+
+def test_negative_hours_are_rejected() -> None:
+    with pytest.raises(InvalidRecordError, match="hours_slept"):
+        record_from_data("sleep_quality", {"hoursSlept": -1})
+    with pytest.raises(InvalidRecordError):
+        record_from_data("weather", {})
+
+
+def test_completed_keeps_the_values_it_has() -> None:
+    extracted = PainAssessment(pain_level=6, location="neck")
+    stated = PainAssessment(pain_level=7, quality="dull")
+    assert stated.completed(extracted) == PainAssessment(
+        pain_level=7, location="neck", quality="dull"
+    )
+
+
+def test_refines_only_without_conflicting_values() -> None:
+    held = PainAssessment(pain_level=7, location="Lower back")
+    assert PainAssessment(location="lower back", quality="dull").refines(held)
+    assert not PainAssessment(pain_level=4).refines(held)
+    assert not PainAssessment(location="neck").refines(held)
+    assert not SleepQuality(sleep_quality=7).refines(held)
+
+
+def test_buffer_columns() -> None:
+    records = RecordBuffer()
+    records.add(PainAssessment(pain_level=6), 2.0, "pain-1")
+    records.add(MoodAssessment(mood_rating=5, emotional_coping="journaling"), 1.0, "m")
+    # the same id replaces the row
+    records.add(PainAssessment(pain_level=7, location="neck"), 3.0, "pain-1")
+    records.add(PainAssessment(pain_level=3), 4.0, "pain-2")
+
+    assert len(records) == 3
+    assert list(records.column("pain_assessment", "painLevel")) == [7.0, 3.0]
+    assert records.column("pain_assessment", "location") == ["neck", None]
+    assert math.isnan(records.column("mood_assessment", "energyLevel")[0])
+    assert list(records.column("sleep_quality", "hoursSlept")) == []
+    with pytest.raises(KeyError):
+        records.column("pain_assessment", "sleepQuality")
+    # the same without a table for the type yet
+    with pytest.raises(KeyError):
+        records.column("sleep_quality", "painLevel")
+    assert [(record_id, ts) for record_id, ts, _ in records] == [
+        ("pain-1", 3.0),
+        ("pain-2", 4.0),
+        ("m", 1.0),
+    ]
+    assert next(iter(records))[2] == PainAssessment(pain_level=7, location="neck")
+    assert records.summary() == {
+        "pain_assessment": {"count": 2, "averages": {"painLevel": 5.0}},
+        "mood_assessment": {"count": 1, "averages": {"moodRating": 5.0}},
+    }
+
+    columns = record_columns(records)
+    assert list(columns["ts"]) == [1.0, 3.0, 4.0]
+    assert list(columns["metric"]) == ["moodRating", "painLevel", "painLevel"]
+    assert list(columns["value"]) == [5.0, 7.0, 3.0]
+    assert len(record_columns(RecordBuffer())["value"]) == 0
@@ -0,0 +1,38 @@
+from replay import load_scripts, replay_session, run_benchmark
+
+TRACKING_TOOLS = {
+    "log_pain_assessment",
+    "track_sleep_quality",
+    "assess_mood_and_functioning",
+}
+
+
+async def test_scripts_replay_every_tracking_tool(tmp_path) -> None:
+    scripts = load_scripts()
+    assert set().union(*(s.tool_names for s in scripts)) >= TRACKING_TOOLS
+
+    for script in scripts:
+        result = await replay_session(script, db_path=str(tmp_path / "tracking.db"))
+
+        assert result.tools == script.tool_names
+        tracked = sum(1 for name in script.tool_names if name in TRACKING_TOOLS)
+        assert result.messages_published >= tracked
+        # records extracted from the transcript were completed, not duplicated
+        assert result.records_published == tracked
+        assert result.records_stored == result.records_published
+        # every turn was joined into a latency record, first audio included
+        assert len(result.turn_latencies) == result.turns
+        assert all(t["e2e"] is not None for t in result.turn_latencies)
+
+
+async def test_benchmark_budgets(tmp_path) -> None:
+    # Generous budgets, the fakes answer instantly so anything close to these
+    # means the agent itself got slower or leaks per session
+    report = await run_benchmark(load_scripts(), sessions=2, directory=str(tmp_path))
+
+    assert report.turns_per_second > 5
+    assert report.tool_overhead_ms < 50
+    assert report.bytes_per_message < 100
+    # the static prompt and history must stay an append-only, cacheable prefix
+    assert report.prompt_cache_hit_rate > 0.5
+    assert report.memory_per_session_kb < 8 * 1024
@@ -0,0 +1,112 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import time
+
+import numpy as np
+import pytest
+from helpers import timestamp
+
+from reports import REPORTS_DIR_ENV, ReportWriter, SessionData, submit_report
+from store import TrackingStore
+
+
+async def test_report_from_committed_records(tmp_path) -> None:
+    store = TrackingStore(str(tmp_path / "tracking.db"))
+    # the previous week, then a pain level going down over this one
+    store.append("patient-a", "pain_assessment", {"painLevel": 8}, timestamp(5, 9))
+    for day, level in ((11, 7), (13, 6), (15, 5)):
+        store.append(
+            "patient-a", "pain_assessment", {"painLevel": level}, timestamp(day, 9)
+        )
+    store.append(
+        "patient-a",
+        "pain_assessment",
+        {"painLevel": 4, "location": "back", "copingStrategies": "heat pad"},
+        timestamp(17, 9),
+    )
+    store.append("patient-a", "sleep_quality", {"sleepQuality": 6}, timestamp(17, 9))
+    await store.aclose()
+
+    session = SessionData(
+        room="room-1",
+        patient_id="patient-a",
+        started=timestamp(17, 8),
+        ended=timestamp(17, 10),
+        today="2026-10-17",
+        transcript=(
+            ("assistant", "How are you today?"),
+            ("user", "My back pain is a four, and I slept badly again."),
+            ("assistant", "Thanks for telling me."),
+            ("user", "I'm not suicidal, just tired of the pain."),
+        ),
+        store_path=store.path,
+    )
+    writer = ReportWriter(str(tmp_path / "reports"))
+    assert writer.submit(session)
+    writer.join()
+    writer.close()
+
+    (report_path,) = (tmp_path / "reports" / "patient-a").glob("*.json")
+    report = json.loads(report_path.read_text())
+    assert report["duration_s"] == 7200
+    assert report["engagement"] == {
+        "patient_turns": 2,
+        "agent_turns": 2,
+        "patient_words": 19,
+    }
+    assert report["topics"] == {"pain": 2, "sleep": 2}
+    assert report["risk_flags"] == []
+    assert report["records"]["pain_assessment"] == {
+        "count": 1,
+        "averages": {"painLevel": 4.0},
+    }
+    assert report["coping_strategies"] == ["heat pad"]
+
+    pain = report["trends"]["pain_assessment.painLevel"]
+    assert pain["days"] == 4
+    assert pain["mean"] == 5.5
+    assert pain["previous_mean"] == 8.0
+    assert pain["change"] == -2.5
+    assert pain["slope_per_day"] == pytest.approx(-0.5)
+    assert report["trends"]["sleep_quality.sleepQuality"]["slope_per_day"] is None
+
+    columns = np.load(report_path.with_suffix(".npz"))
+    assert list(columns["metric"]) == ["painLevel", "sleepQuality"]
+    assert list(columns["value"]) == [4.0, 6.0]
+
+
+def test_full_queue_drops_reports(tmp_path) -> None:
+    writer = ReportWriter(str(tmp_path), max_pending=1)
+    writer.close()
+    session = SessionData("room", "patient", 0.0, 1.0, "2026-10-17", ())
+    # nothing consumes the queue anymore
+    assert writer.submit(session)
+    assert not writer.submit(session)
+
+
+def _job(directory: str, session: SessionData) -> None:
+    os.environ[REPORTS_DIR_ENV] = directory
+    write = ReportWriter._write
+
+    def slow_write(self: ReportWriter, session: SessionData) -> None:
+        time.sleep(0.5)
+        write(self, session)
+
+    ReportWriter._write = slow_write
+    asyncio.run(submit_report(session))
+    # job processes end without running atexit handlers
+    os._exit(0)
+
+
+def test_report_is_written_before_the_job_exits(tmp_path) -> None:
+    session = SessionData("room-1", "patient-a", 0.0, 1.0, "2026-10-17", ())
+    process = multiprocessing.get_context("spawn").Process(
+        target=_job, args=(str(tmp_path), session)
+    )
+    process.start()
+    process.join(30)
+
+    assert process.exitcode == 0
+    assert list((tmp_path / "patient-a").glob("*.json"))
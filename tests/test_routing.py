@@ -0,0 +1,192 @@
+import asyncio
+import json
+from collections.abc import AsyncIterator
+
+import pytest
+from aiohttp import web
+from livekit import rtc
+from livekit.agents import APIConnectionError, llm, tts
+from livekit.plugins import openai
+
+from routing import RoutedLLM, RoutedTTS, Router, parse_backends
+
+
+def test_parse_backends() -> None:
+    specs = parse_backends(
+        " openai:gpt-4o-mini, openai:llama-3.1-8b@http://localhost:8000/v1", ""
+    )
+    assert [str(s) for s in specs] == [
+        "openai:gpt-4o-mini",
+        "openai:llama-3.1-8b@http://localhost:8000/v1",
+    ]
+    assert parse_backends("", "deepgram:nova-3")[0].model == "nova-3"
+    with pytest.raises(ValueError):
+        parse_backends("gpt-4o-mini", "")
+
+
+_MOCK = web.AppKey("mock", dict)
+
+
+async def _completions(request: web.Request) -> web.StreamResponse:
+    """OpenAI-compatible streamed chat completion, behaviour set by the app."""
+    mock = request.app[_MOCK]
+    delay, status, text = mock["delay"], mock["status"], mock["text"]
+    mock["requests"] += 1
+    if status != 200:
+        return web.json_response({"error": {"message": "unavailable"}}, status=status)
+    await asyncio.sleep(delay)
+
+    response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+    await response.prepare(request)
+    for word in text.split(" "):
+        chunk = {
+            "id": "chatcmpl-1",
+            "object": "chat.completion.chunk",
+            "created": 0,
+            "model": "mock",
+            "choices": [{"index": 0, "delta": {"content": word + " "}}],
+        }
+        await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+    await response.write(b"data: [DONE]\n\n")
+    return response
+
+
+async def _server(
+    *, delay: float = 0.0, status: int = 200, text: str
+) -> tuple[web.AppRunner, dict, str]:
+    app = web.Application()
+    app[_MOCK] = {"delay": delay, "status": status, "text": text, "requests": 0}
+    app.router.add_post("/v1/chat/completions", _completions)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, app[_MOCK], f"http://127.0.0.1:{port}/v1"
+
+
+async def _chat(model: llm.LLM) -> str:
+    chat_ctx = llm.ChatContext()
+    chat_ctx.add_message(role="user", content="How did I sleep?")
+    text = ""
+    async with model.chat(chat_ctx=chat_ctx) as stream:
+        async for chunk in stream:
+            if chunk.delta and chunk.delta.content:
+                text += chunk.delta.content
+    return text.strip()
+
+
+async def test_slow_backend_is_hedged() -> None:
+    slow, slow_mock, slow_url = await _server(delay=1.0, text="slow reply")
+    fast, fast_mock, fast_url = await _server(text="fast reply")
+    backends = [
+        openai.LLM(model="mock", base_url=slow_url, api_key="x"),
+        openai.LLM(model="mock", base_url=fast_url, api_key="x"),
+    ]
+    routed = RoutedLLM(backends, labels=["slow", "fast"], ttft_slo=0.1)
+    try:
+        assert await _chat(routed) == "fast reply"
+        assert slow_mock["requests"] == fast_mock["requests"] == 1
+        slow_health, fast_health = routed.router.health
+        assert slow_health.hedged == 1
+        assert fast_health.latency < slow_health.latency
+    finally:
+        await routed.aclose()
+        await slow.cleanup()
+        await fast.cleanup()
+
+
+async def test_failing_backend_fails_over() -> None:
+    broken, broken_mock, broken_url = await _server(status=500, text="")
+    ok, ok_mock, ok_url = await _server(text="still here")
+    backends = [
+        openai.LLM(model="mock", base_url=broken_url, api_key="x"),
+        openai.LLM(model="mock", base_url=ok_url, api_key="x"),
+    ]
+    routed = RoutedLLM(backends, labels=["broken", "ok"], ttft_slo=5.0)
+    try:
+        for _ in range(4):
+            assert await _chat(routed) == "still here"
+        broken_health = routed.router.health[0]
+        # unhealthy after a few errors, then skipped until it's due for a probe
+        assert not broken_health.healthy
+        assert routed.router.order() == [1, 0]
+        assert broken_mock["requests"] < ok_mock["requests"] == 4
+    finally:
+        await routed.aclose()
+        await broken.cleanup()
+        await ok.cleanup()
+
+
+async def test_all_backends_failing_raises() -> None:
+    class _Failing:
+        def __aiter__(self) -> AsyncIterator[str]:
+            return self
+
+        async def __anext__(self) -> str:
+            raise APIConnectionError("down")
+
+        async def aclose(self) -> None:
+            pass
+
+    router = Router(["a", "b"], ["a", "b"], slo=1.0)
+    with pytest.raises(APIConnectionError):
+        await router.first_response(lambda _: _Failing())
+    assert all(h.error_rate > 0 for h in router.health)
+
+
+class _StreamingTTS(tts.TTS):
+    """Streams one frame per pushed word after ``delay``."""
+
+    def __init__(self, delay: float) -> None:
+        super().__init__(
+            capabilities=tts.TTSCapabilities(streaming=True),
+            sample_rate=24000,
+            num_channels=1,
+        )
+        self.delay = delay
+        self.texts: list[str] = []
+
+    def synthesize(self, text, *, conn_options=None):
+        raise NotImplementedError
+
+    def stream(self, *, conn_options=None):
+        return _Stream(tts=self, conn_options=conn_options)
+
+
+class _Stream(tts.SynthesizeStream):
+    async def _run(self, output_emitter: tts.AudioEmitter) -> None:
+        output_emitter.initialize(
+            request_id="r",
+            sample_rate=24000,
+            num_channels=1,
+            mime_type="audio/pcm",
+            stream=True,
+        )
+        output_emitter.start_segment(segment_id="s")
+        await asyncio.sleep(self._tts.delay)
+        async for data in self._input_ch:
+            if isinstance(data, str):
+                self._tts.texts.append(data)
+                frame = rtc.AudioFrame.create(24000, 1, 240)
+                output_emitter.push(frame.data.tobytes())
+        output_emitter.end_segment()
+
+
+async def test_tts_hedge_replays_pushed_text() -> None:
+    slow, fast = _StreamingTTS(delay=1.0), _StreamingTTS(delay=0.0)
+    routed = RoutedTTS([slow, fast], labels=["slow", "fast"], ttfb_slo=0.05)
+
+    stream = routed.stream()
+    stream.push_text("Good ")
+    stream.push_text("morning. ")
+    await asyncio.sleep(0.1)
+    stream.push_text("How are you?")
+    stream.end_input()
+    frames = [audio async for audio in stream]
+    await stream.aclose()
+
+    assert len(frames) > 0
+    # the hedge got what was pushed before it started, and everything after
+    assert fast.texts == ["Good ", "morning. ", "How are you?"]
+    assert routed.router.health[0].hedged == 1
@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from livekit import rtc
+from livekit.agents.voice import AgentStateChangedEvent, UserStateChangedEvent
+
+from latency import LatencyProfiler
+from prompts import SAFETY_REFERRALS
+from safety import PhraseMatcher, SafetyMonitor, find_red_flag
+from tts_cache import AudioCache, split_sentences
+
+
+@pytest.mark.parametrize(
+    ("transcript", "category"),
+    [
+        ("honestly I just want to end it all", "suicidal_ideation"),
+        ("some nights I think about killing myself", "suicidal_ideation"),
+        ("I don't want to live like this anymore", "suicidal_ideation"),
+        ("I've been cutting myself again", "self_harm"),
+        ("the self-harm urges are back", "self_harm"),
+        ("I'm not suicidal, just exhausted", None),
+        ("I don't know, I want to die", "suicidal_ideation"),
+        ("I have never felt so suicidal", "suicidal_ideation"),
+        ("no one would care if I killed myself", "suicidal_ideation"),
+        ("I no longer want to live", "suicidal_ideation"),
+        ("I wish I was dead", "suicidal_ideation"),
+        ("I would never hurt myself", None),
+        ("I'm not going to hurt myself, but my back is killing me", None),
+        ("my pain is a seven and I slept badly", None),
+    ],
+)
+def test_red_flags(transcript: str, category: str | None) -> None:
+    flag = find_red_flag(transcript)
+    assert (flag.category if flag else None) == category
+
+
+def test_matcher_finds_overlapping_phrases() -> None:
+    matcher = PhraseMatcher({"a b": 1, "b c d": 2, "c": 3, "a b c d e": 4})
+    found = sorted(matcher.find(["x", "a", "b", "c", "d", "e"]))
+    assert found == [(1, 1), (1, 4), (2, 2), (3, 3)]
+
+
+class _Session(rtc.EventEmitter):
+    def __init__(self) -> None:
+        super().__init__()
+        self.user_state = "speaking"
+        self.current_speech = None
+        self.interrupted = 0
+        self.said: list[tuple[str, bool]] = []
+
+    def interrupt(self, *, force: bool = False) -> None:
+        self.interrupted += 1
+
+    def say(self, text: str, *, audio=None, allow_interruptions: bool = True):
+        self.said.append((text, audio is not None))
+        self.current_speech = SimpleNamespace(text=text)
+        asyncio.get_running_loop().call_later(0.02, self._speak)
+        return self.current_speech
+
+    def _speak(self) -> None:
+        self.emit(
+            "agent_state_changed",
+            AgentStateChangedEvent(old_state="listening", new_state="speaking"),
+        )
+
+
+async def test_referral_is_spoken_when_the_patient_pauses() -> None:
+    cache = AudioCache()
+    referral = SAFETY_REFERRALS["suicidal_ideation"]
+    for sentence in split_sentences(referral):
+        cache.put("voice", sentence, [rtc.AudioFrame.create(24000, 1, 240)])
+
+    session = _Session()
+    profiler = LatencyProfiler()
+    monitor = SafetyMonitor(
+        session, cache, "voice", on_referral=profiler.on_safety_referral
+    )
+
+    monitor.on_transcript("I keep thinking I'd be better off dead")
+    assert session.interrupted == 1
+    await asyncio.sleep(0.01)
+    # still speaking, the referral waits for a pause
+    assert session.said == []
+
+    session.user_state = "listening"
+    session.emit(
+        "user_state_changed",
+        UserStateChangedEvent(old_state="speaking", new_state="listening"),
+    )
+    await asyncio.sleep(0.05)
+
+    assert session.said == [(referral, True)]
+    assert monitor.take_referral() == referral
+    assert monitor.take_referral() is None
+    assert profiler.summary()["safety"]["count"] == 1
+    assert 0.01 < profiler.summary()["safety"]["p50"] < 0.05
+
+    # the LLM takes the topic from here
+    monitor.on_transcript("I want to die")
+    assert session.interrupted == 1
+    await monitor.aclose()
@@ -0,0 +1,65 @@
+import sys
+
+import pytest
+from livekit.agents import Plugin, WorkerOptions
+
+from components import BASE_PLUGINS, pipeline_plugins
+from routing import LLM_BACKENDS_ENV, STT_BACKENDS_ENV, TTS_BACKENDS_ENV
+from startup import (
+    WORKER_PLUGINS,
+    PreloadPlugin,
+    import_worker_plugins,
+    parse_importtime,
+)
+
+IMPORTTIME = """\
+import time: self [us] | cumulative | imported package
+import time:       229 |        229 |   _io
+import time:      1663 |       8258 | analytics
+import time:       500 |     308507 |   components
+import time:       300 |        300 |     routing
+some warning logged in between
+"""
+
+
+def test_importtime_lines() -> None:
+    imports = parse_importtime(IMPORTTIME)
+    assert [(i.module, i.depth) for i in imports] == [
+        ("_io", 1),
+        ("analytics", 0),
+        ("components", 1),
+        ("routing", 2),
+    ]
+    assert imports[2].self_time == pytest.approx(0.0005)
+    assert imports[2].cumulative == pytest.approx(0.308507)
+
+
+def test_plugins_of_the_configured_pipeline(monkeypatch: pytest.MonkeyPatch) -> None:
+    assert pipeline_plugins() == [*BASE_PLUGINS, "livekit.plugins.deepgram"]
+
+    monkeypatch.setenv(STT_BACKENDS_ENV, "openai:gpt-4o-mini-transcribe")
+    monkeypatch.setenv(TTS_BACKENDS_ENV, "openai:tts-1")
+    assert pipeline_plugins() == list(BASE_PLUGINS)
+
+    monkeypatch.setenv(LLM_BACKENDS_ENV, "unknown:model")
+    assert pipeline_plugins() == list(BASE_PLUGINS)
+
+
+@pytest.mark.parametrize("context", ["forkserver", "spawn"])
+def test_the_worker_leaves_plugins_to_job_processes(context: str) -> None:
+    options = WorkerOptions(entrypoint_fnc=print, multiprocessing_context=context)
+    registered = list(Plugin.registered_plugins)
+    try:
+        import_worker_plugins(options, "start")
+        added = [
+            p.package
+            for p in Plugin.registered_plugins[len(registered) :]
+            if isinstance(p, PreloadPlugin)
+        ]
+    finally:
+        Plugin.registered_plugins[:] = registered
+
+    assert all(module in sys.modules for module in WORKER_PLUGINS)
+    preloaded = [m for m in pipeline_plugins() if m not in WORKER_PLUGINS]
+    # only the fork server imports them
+    assert added == (preloaded if context == "forkserver" else [])
@@ -0,0 +1,83 @@
+import sqlite3
+import time
+from datetime import datetime, timedelta, timezone
+
+from analytics import DailyMetrics
+from store import TrackingStore
+
+
+async def test_append_assigns_increasing_seq(tmp_path) -> None:
+    store = TrackingStore(str(tmp_path / "tracking.db"))
+    futures = [
+        store.append("patient-a", "pain_assessment", {"painLevel": level})
+        for level in (3, 5, 7)
+    ]
+    seqs = [await f for f in futures]
+    await store.aclose()
+
+    assert seqs == sorted(seqs)
+    assert len(set(seqs)) == 3
+
+
+async def test_range_filters_by_patient_time_and_kind(tmp_path) -> None:
+    path = str(tmp_path / "tracking.db")
+    store = TrackingStore(path)
+    now = time.time()
+    store.append("patient-a", "pain_assessment", {"painLevel": 4}, ts=now - 10 * 86400)
+    store.append("patient-a", "pain_assessment", {"painLevel": 6}, ts=now - 86400)
+    store.append("patient-a", "sleep_quality", {"hoursSlept": 6.5}, ts=now - 3600)
+    store.append("patient-b", "pain_assessment", {"painLevel": 9}, ts=now - 3600)
+    await store.aclose()
+
+    # history survives reopening the log
+    store = TrackingStore(path)
+    week = await store.range("patient-a", now - 7 * 86400)
+    pain = await store.range("patient-a", now - 30 * 86400, kind="pain_assessment")
+    # days are rolled up in UTC by default
+    start = datetime.fromtimestamp(now, timezone.utc).date() - timedelta(days=30)
+    rollups = await store.rollups(
+        "patient-a", start.isoformat(), (start + timedelta(days=31)).isoformat()
+    )
+    await store.aclose()
+
+    assert [r.kind for r in week] == ["pain_assessment", "sleep_quality"]
+    assert [r.data["painLevel"] for r in pain] == [4, 6]
+    # what get_tracking_summary reports
+    assert DailyMetrics.from_rollups(rollups, start, 32).summary(0) == {
+        "pain_assessment": {"count": 2, "averages": {"painLevel": 5.0}},
+        "sleep_quality": {"count": 1, "averages": {"hoursSlept": 6.5}},
+    }
+
+
+async def test_append_with_record_id_updates_the_record(tmp_path) -> None:
+    path = str(tmp_path / "tracking.db")
+    # a log written before records had ids
+    with sqlite3.connect(path) as conn:
+        conn.execute(
+            "CREATE TABLE records (seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " patient_id TEXT NOT NULL, kind TEXT NOT NULL, ts REAL NOT NULL,"
+            " data TEXT NOT NULL)"
+        )
+        conn.execute(
+            "INSERT INTO records (patient_id, kind, ts, data) VALUES (?, ?, ?, ?)",
+            ("patient-a", "pain_assessment", time.time() - 60, '{"painLevel": 3}'),
+        )
+    conn.close()
+
+    store = TrackingStore(path)
+    now = time.time()
+    store.append("patient-a", "pain_assessment", {"painLevel": 7}, now, "r1")
+    await store.append(
+        "patient-a",
+        "pain_assessment",
+        {"painLevel": 7, "location": "neck"},
+        now,
+        "r1",
+    )
+    records = await store.range("patient-a", now - 3600)
+    await store.aclose()
+
+    assert [(r.record_id, r.data) for r in records] == [
+        (None, {"painLevel": 3}),
+        ("r1", {"painLevel": 7, "location": "neck"}),
+    ]
@@ -0,0 +1,89 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+from livekit import rtc
+
+from store import TrackingStore
+from sync import SYNC_RPC_METHOD, register_sync_rpc, sync_chunk
+
+
+async def test_chunks_resume_from_the_high_water_mark(tmp_path) -> None:
+    store = TrackingStore(str(tmp_path / "tracking.db"))
+    for level in range(1, 11):
+        store.append(
+            "patient-a", "pain_assessment", {"painLevel": level}, 1000.0 + level
+        )
+    await store.append("patient-b", "pain_assessment", {"painLevel": 9})
+
+    levels = []
+    after = 0
+    chunks = 0
+    while True:
+        chunk = await sync_chunk(store, "patient-a", after, max_bytes=300)
+        chunks += 1
+        levels += [r["data"]["painLevel"] for r in chunk["records"]]
+        after = chunk["next"]
+        if not chunk["more"]:
+            break
+    assert levels == list(range(1, 11))
+    assert chunks > 1
+
+    # only what changed since is sent, updates as their latest version
+    await store.append("patient-a", "sleep_quality", {"hoursSlept": 6}, 2000.0, "r1")
+    await store.append(
+        "patient-a", "sleep_quality", {"hoursSlept": 6, "sleepQuality": 5}, 2000.0, "r1"
+    )
+    chunk = await sync_chunk(store, "patient-a", after)
+    await store.aclose()
+
+    assert [(r["id"], r["data"]) for r in chunk["records"]] == [
+        ("r1", {"hoursSlept": 6, "sleepQuality": 5})
+    ]
+    assert not chunk["more"]
+
+
+async def test_sync_rpc_restarts_for_another_store(tmp_path) -> None:
+    path = str(tmp_path / "tracking.db")
+    store = TrackingStore(path)
+    await store.append("patient-a", "mood_assessment", {"moodRating": 6})
+    await store.append("patient-b", "mood_assessment", {"moodRating": 2})
+
+    handlers = {}
+    # an attribute the participant set itself doesn't get it another's history
+    patient = SimpleNamespace(
+        identity="patient-a", attributes={"tracking.patientId": "patient-b"}
+    )
+    room = SimpleNamespace(
+        remote_participants={"patient-a": patient},
+        local_participant=SimpleNamespace(register_rpc_method=handlers.__setitem__),
+    )
+    register_sync_rpc(room, store)
+
+    async def _sync(caller: str, request: dict) -> dict:
+        data = rtc.RpcInvocationData(
+            request_id="1",
+            caller_identity=caller,
+            payload=json.dumps(request),
+            response_timeout=5.0,
+        )
+        return json.loads(await handlers[SYNC_RPC_METHOD](data))
+
+    first = await _sync("patient-a", {})
+    assert [r["data"] for r in first["records"]] == [{"moodRating": 6}]
+    caught_up = await _sync(
+        "patient-a", {"store": first["store"], "after": first["next"]}
+    )
+    assert caught_up["records"] == []
+    # a high-water mark from some other database doesn't skip anything
+    other = await _sync("patient-a", {"store": "elsewhere", "after": first["next"]})
+    assert len(other["records"]) == 1
+
+    with pytest.raises(rtc.RpcError):
+        await _sync("someone-else", {})
+    await store.aclose()
+
+    # the store keeps its id when it is reopened
+    reopened = TrackingStore(path)
+    assert reopened.store_id == first["store"]
+    await reopened.aclose()
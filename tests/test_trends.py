@@ -0,0 +1,132 @@
+import json
+import sqlite3
+import time
+from datetime import date
+from types import SimpleNamespace
+from zoneinfo import ZoneInfo
+
+import pytest
+from helpers import timestamp
+from livekit import rtc
+
+from store import TIMEZONE_ATTRIBUTE, TrackingStore
+from trends import TRENDS_RPC_METHOD, register_trends_rpc, trend_series
+
+TODAY = date(2026, 10, 17)
+
+
+async def test_rollups_follow_appends_and_updates(tmp_path) -> None:
+    store = TrackingStore(str(tmp_path / "tracking.db"))
+    for day, level in ((15, 4), (15, 7), (17, 5)):
+        store.append(
+            "patient-a", "pain_assessment", {"painLevel": level}, timestamp(day, 9)
+        )
+    store.append(
+        "patient-a", "pain_assessment", {"painLevel": 3}, timestamp(16, 9), "r1"
+    )
+    # completing the record replaces its values in the day's rollup
+    await store.append(
+        "patient-a",
+        "pain_assessment",
+        {"painLevel": 8, "location": "neck"},
+        timestamp(16, 9),
+        "r1",
+    )
+
+    result = await trend_series(store, "patient-a", 7, TODAY)
+    await store.aclose()
+
+    assert result["start"] == "2026-10-11"
+    pain = result["series"]["pain_assessment.painLevel"]
+    assert pain["count"] == [0, 0, 0, 0, 2, 1, 1]
+    assert pain["mean"] == [None, None, None, None, 5.5, 8, 5]
+    assert pain["min"][4:] == [4, 8, 5]
+    assert pain["max"][4:] == [7, 8, 5]
+    assert result["series"]["mood_assessment.moodRating"]["count"] == [0] * 7
+
+
+async def test_days_are_local_to_the_patient(tmp_path) -> None:
+    tokyo = ZoneInfo("Asia/Tokyo")
+    store = TrackingStore(str(tmp_path / "tracking.db"))
+    # 23:00 in Tokyo is still the 16th there, the 16th 14:00 in UTC
+    await store.append(
+        "patient-a",
+        "sleep_quality",
+        {"sleepQuality": 6},
+        timestamp(16, 23, tokyo),
+        tz=tokyo,
+    )
+    rollups = await store.rollups("patient-a", "2026-10-01", "2026-10-31")
+    await store.aclose()
+
+    assert [(r.day, r.metric, r.count) for r in rollups] == [
+        ("2026-10-16", "sleepQuality", 1)
+    ]
+
+
+async def test_existing_records_are_rolled_up(tmp_path) -> None:
+    path = str(tmp_path / "tracking.db")
+    with sqlite3.connect(path) as conn:
+        conn.execute(
+            "CREATE TABLE records (seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " patient_id TEXT NOT NULL, kind TEXT NOT NULL, ts REAL NOT NULL,"
+            " data TEXT NOT NULL)"
+        )
+        conn.executemany(
+            "INSERT INTO records (patient_id, kind, ts, data) VALUES (?, ?, ?, ?)",
+            [
+                ("patient-a", "mood_assessment", timestamp(14, 8), '{"moodRating": 4}'),
+                (
+                    "patient-a",
+                    "mood_assessment",
+                    timestamp(14, 20),
+                    '{"moodRating": 6}',
+                ),
+            ],
+        )
+    conn.close()
+
+    store = TrackingStore(path)
+    rollups = await store.rollups("patient-a", "2026-10-14", "2026-10-14")
+    await store.aclose()
+
+    assert [(r.metric, r.count, r.mean, r.min, r.max) for r in rollups] == [
+        ("moodRating", 2, 5, 4, 6)
+    ]
+
+
+async def test_trends_rpc_serves_the_callers_history(tmp_path) -> None:
+    store = TrackingStore(str(tmp_path / "tracking.db"))
+    await store.append("patient-a", "pain_assessment", {"painLevel": 6}, time.time())
+    await store.append("patient-b", "pain_assessment", {"painLevel": 2}, time.time())
+
+    handlers = {}
+    patient = SimpleNamespace(
+        identity="patient-a",
+        attributes={"tracking.patientId": "patient-b", TIMEZONE_ATTRIBUTE: "UTC"},
+    )
+    room = SimpleNamespace(
+        remote_participants={"patient-a": patient},
+        local_participant=SimpleNamespace(register_rpc_method=handlers.__setitem__),
+    )
+    register_trends_rpc(room, store)
+    handler = handlers[TRENDS_RPC_METHOD]
+
+    def _call(caller: str, payload: str) -> rtc.RpcInvocationData:
+        return rtc.RpcInvocationData(
+            request_id="1",
+            caller_identity=caller,
+            payload=payload,
+            response_timeout=5.0,
+        )
+
+    response = json.loads(await handler(_call("patient-a", '{"period": "30d"}')))
+    assert response["days"] == 30
+    assert len(response["series"]) == 3
+    assert response["series"]["pain_assessment.painLevel"]["mean"][-1] == 6
+
+    with pytest.raises(rtc.RpcError):
+        await handler(_call("patient-a", '{"period": "1y"}'))
+    with pytest.raises(rtc.RpcError):
+        await handler(_call("someone-else", "{}"))
+    await store.aclose()
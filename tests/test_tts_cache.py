@@ -0,0 +1,115 @@
+import pytest
+from helpers import silent_frames
+from livekit.agents import tts, utils
+
+from tts_cache import AudioCache, CachedTTS, _PhraseRouter
+
+GREETING = "Hello, I'm glad you're here. How are you feeling right now?"
+
+
+class _StreamingTTS(tts.TTS):
+    """100ms of silence per word, records the text it was given."""
+
+    def __init__(self) -> None:
+        super().__init__(
+            capabilities=tts.TTSCapabilities(streaming=True),
+            sample_rate=24000,
+            num_channels=1,
+        )
+        self.streamed: list[str] = []
+
+    def synthesize(self, text, *, conn_options=None):
+        raise NotImplementedError
+
+    def stream(self, *, conn_options=None) -> tts.SynthesizeStream:
+        return _Stream(tts=self, conn_options=conn_options)
+
+
+class _Stream(tts.SynthesizeStream):
+    async def _run(self, output_emitter: tts.AudioEmitter) -> None:
+        output_emitter.initialize(
+            request_id="fake",
+            sample_rate=24000,
+            num_channels=1,
+            mime_type="audio/pcm",
+            stream=True,
+        )
+        output_emitter.start_segment(segment_id="fake")
+        text = ""
+        async for data in self._input_ch:
+            if not isinstance(data, str):
+                break
+            text += data
+        self._tts.streamed.append(text)
+        output_emitter.push(bytes(4800 * len(text.split())))
+        output_emitter.end_segment()
+
+
+def test_cache_evicts_least_recently_used() -> None:
+    cache = AudioCache(max_bytes=2000)
+    cache.put("voice", "a", silent_frames(400))
+    cache.put("voice", "b", silent_frames(400))
+    assert cache.get("voice", "a") is not None
+    cache.put("voice", "c", silent_frames(400))
+
+    assert ("voice", "a") in cache
+    assert ("voice", "b") not in cache
+    assert cache.size == 1600
+    # too large to ever fit
+    cache.put("voice", "d", silent_frames(2000))
+    assert ("voice", "d") not in cache
+
+
+def test_disk_cache_survives_restarts_and_is_bounded(tmp_path) -> None:
+    directory = str(tmp_path)
+    cache = AudioCache(directory=directory, max_disk_bytes=20_000)
+    cache.put("voice", "a", silent_frames(4800))
+    cache.put("voice", "b", silent_frames(4800))
+
+    restarted = AudioCache(directory=directory, max_disk_bytes=20_000)
+    frames = restarted.get("voice", "a")
+    assert sum(f.samples_per_channel for f in frames) == 4800
+    # "b" is now the least recently used file
+    restarted.put("voice", "c", silent_frames(4800))
+
+    on_disk = AudioCache(directory=directory)
+    assert ("voice", "a") in on_disk
+    assert ("voice", "b") not in on_disk
+    assert ("voice", "c") in on_disk
+    assert restarted.disk_size <= 20_000
+
+
+def test_router_holds_back_only_possible_phrases() -> None:
+    phrases = frozenset({"Your safety matters.", "Thank you."})
+    prefixes = frozenset(p[:i] for p in phrases for i in range(1, len(p) + 1))
+    router = _PhraseRouter(phrases, prefixes)
+
+    assert router.push("I hear you") == [(False, "I hear you")]
+    assert router.push(". Your safety") == [(False, ". ")]
+    assert router.push(" matters. That") == [
+        (True, "Your safety matters."),
+        (False, "That"),
+    ]
+    assert router.push(" is all. Thank") == [(False, " is all. ")]
+    assert router.push(" you.") == []
+    assert router.flush() == [(True, "Thank you.")]
+
+
+async def test_cached_sentences_are_not_sent_to_the_provider() -> None:
+    inner = _StreamingTTS()
+    cache = AudioCache()
+    cached_tts = CachedTTS(inner, "model", cache, [GREETING])
+    assert len(cached_tts.phrases) == 2
+    cache.put(cached_tts.voice, "Hello, I'm glad you're here.", silent_frames(4800))
+
+    stream = cached_tts.stream()
+    tokens = ["Hello", ",", " I\u2019m", " glad", " you're", " here", ".", " How"]
+    for token in [*tokens, " did", " you", " sleep", "?"]:
+        stream.push_text(token)
+    stream.end_input()
+    frames = [ev.frame async for ev in stream]
+    await stream.aclose()
+
+    assert inner.streamed == ["How did you sleep?"]
+    # 200ms of cached audio and 4 streamed words
+    assert utils.audio.calculate_audio_duration(frames) == pytest.approx(0.6)
@@ -0,0 +1,133 @@
+import json
+import re
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+from livekit import rtc
+
+from publisher import encode_json_packets
+from wire import (
+    CODEC_ATTRIBUTE,
+    SCHEMAS,
+    WIRE_MAGIC,
+    NegotiatedEncoder,
+    WireFormatError,
+    decode_packet,
+    encode_binary_packets,
+)
+
+MESSAGES = [
+    {
+        "type": "pain_assessment",
+        "id": "pain-1",
+        "data": {
+            "painLevel": 7,
+            "location": "lower back",
+            "quality": "dull",
+            "triggers": "sitting",
+            "copingStrategies": "heat therapy",
+        },
+    },
+    {
+        "type": "sleep_quality",
+        "id": "sleep-1",
+        "data": {
+            "sleepQuality": 4,
+            "hoursSlept": 6.25,
+            "sleepOnsetMinutes": 45,
+            "wakeUps": 3,
+            "sleepFactors": "pain flare",
+        },
+    },
+    {
+        "type": "mood_assessment",
+        "id": "mood-1",
+        "data": {
+            "moodRating": 5,
+            "energyLevel": 3,
+            "dailyActivitiesCompletion": 6,
+            "socialEngagement": 2,
+            "emotionalCoping": "journaling",
+        },
+    },
+]
+
+
+def test_binary_round_trip_is_smaller_than_json() -> None:
+    (packet,) = encode_binary_packets(MESSAGES)
+
+    assert packet[0] == WIRE_MAGIC
+    assert decode_packet(packet) == MESSAGES
+    assert len(packet) < len(encode_json_packets(MESSAGES)[0]) / 2
+
+
+def test_binary_packets_are_split() -> None:
+    packets = encode_binary_packets(MESSAGES * 10, max_bytes=200)
+
+    assert len(packets) > 1
+    assert all(len(p) <= 200 for p in packets)
+    assert [m for p in packets for m in decode_packet(p)] == MESSAGES * 10
+
+
+def test_absent_fields_round_trip() -> None:
+    partial = [
+        {"type": "sleep_quality", "id": "a1", "data": {"hoursSlept": 6.5}},
+        {"type": "mood_assessment", "data": {"moodRating": 5, "energyLevel": 3}},
+    ]
+    (packet,) = encode_binary_packets(partial)
+
+    decoded = decode_packet(packet)
+    assert decoded[0] == {
+        "type": "sleep_quality",
+        "id": "a1",
+        "data": {"hoursSlept": 6.5, "sleepFactors": ""},
+    }
+    assert decoded[1]["data"] == {
+        "moodRating": 5,
+        "energyLevel": 3,
+        "emotionalCoping": "",
+    }
+
+
+def test_out_of_range_values_are_rejected() -> None:
+    for level in (300, 255):
+        message = {"type": "pain_assessment", "data": {"painLevel": level}}
+        with pytest.raises(WireFormatError):
+            encode_binary_packets([message])
+
+
+def _room(*codecs: str) -> SimpleNamespace:
+    participants = {
+        f"user-{i}": SimpleNamespace(
+            kind=rtc.ParticipantKind.PARTICIPANT_KIND_STANDARD,
+            attributes={CODEC_ATTRIBUTE: c} if c else {},
+        )
+        for i, c in enumerate(codecs)
+    }
+    return SimpleNamespace(remote_participants=participants)
+
+
+def test_negotiation_falls_back_to_json() -> None:
+    assert NegotiatedEncoder(_room("bin2,json")).codec() == "bin2"
+    assert NegotiatedEncoder(_room("bin2,json", "")).codec() == "json"
+    assert NegotiatedEncoder(_room()).codec() == "json"
+
+    unknown = [{"type": "session_note", "data": {"text": "hello"}}]
+    (packet,) = NegotiatedEncoder(_room("bin2"))(unknown)
+    assert json.loads(packet) == unknown[0]
+
+
+def test_schema_matches_frontend() -> None:
+    ts = (
+        Path(__file__).parents[1] / "react-frontend" / "lib" / "tracking-types.ts"
+    ).read_text()
+    blocks = re.findall(
+        r"typeId: (\d+),\s*type: '(\w+)',\s*fields: \[(.*?)\],\s*\}", ts, re.DOTALL
+    )
+
+    frontend = {
+        message_type: (int(type_id), tuple(re.findall(r"\['(\w+)', '(\w+)'\]", body)))
+        for type_id, message_type, body in blocks
+    }
+    assert frontend == {s.message_type: (s.type_id, s.fields) for s in SCHEMAS.values()}